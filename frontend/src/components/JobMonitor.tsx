@@ -488,7 +488,7 @@ export default function JobMonitor({ jobId, onSelectJob }: Props) {
                           {item.step_timings && item.status === 'completed' && (
                             <div className="item-timings">
                               {Object.entries(item.step_timings)
-                                .filter(([k]) => k !== 'total')
+                                .filter(([k]) => k !== 'total' && !k.startsWith('cache_'))
                                 .map(([step, secs]) => (
                                   <span key={step} className="timing-chip">
                                     {step.replace(/_/g, ' ')}: {secs}s
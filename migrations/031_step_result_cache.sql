@@ -0,0 +1,19 @@
+-- Migration 031: Content-addressed cache of pipeline step outputs
+-- Keyed per tenant by sha256(step, input bytes, step parameters); the cached
+-- bytes live in the outputs container under {tenant}/cache/{step}/{key}.
+
+CREATE TABLE IF NOT EXISTS step_cache_entries (
+    tenant_id VARCHAR NOT NULL,
+    cache_key VARCHAR(64) NOT NULL,
+    step VARCHAR(50) NOT NULL,
+    blob_path VARCHAR(500) NOT NULL,
+    size_bytes INTEGER,
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    last_used_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (tenant_id, cache_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_step_cache_expires_at ON step_cache_entries(expires_at);
+CREATE INDEX IF NOT EXISTS idx_step_cache_tenant_last_used ON step_cache_entries(tenant_id, last_used_at);
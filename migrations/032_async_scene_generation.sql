@@ -0,0 +1,11 @@
+-- Migration 032: Asynchronous (submit-and-callback) scene generation
+-- An item whose scene edit was queued at the provider keeps the provider's
+-- request id and the state needed to resume the pipeline once the result
+-- arrives (via the fal webhook or the pipeline worker's poller).
+
+ALTER TABLE job_items ADD COLUMN IF NOT EXISTS provider_request_id VARCHAR(100);
+ALTER TABLE job_items ADD COLUMN IF NOT EXISTS provider_submitted_at TIMESTAMP;
+ALTER TABLE job_items ADD COLUMN IF NOT EXISTS pending_state JSON;
+
+CREATE INDEX IF NOT EXISTS idx_job_items_provider_request_id
+    ON job_items(provider_request_id) WHERE provider_request_id IS NOT NULL;
@@ -0,0 +1,26 @@
+-- Migration 033: Incremental job item counters
+-- Job status used to be derived by loading and counting every job_items row
+-- after each item transition.  Workers now adjust these counters in the
+-- same transaction as the item change and derive the job status from them.
+
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS items_total INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS items_completed INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS items_failed INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS items_processing INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill existing jobs (later drift: scripts/repair_job_counters.py)
+UPDATE jobs j SET
+    items_total = c.total,
+    items_completed = c.completed,
+    items_failed = c.failed,
+    items_processing = c.processing
+FROM (
+    SELECT job_id,
+           COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE status = 'completed') AS completed,
+           COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+           COUNT(*) FILTER (WHERE status = 'processing') AS processing
+    FROM job_items
+    GROUP BY job_id
+) c
+WHERE c.job_id = j.id;
@@ -0,0 +1,12 @@
+-- Migration 034: Coalesced export triggering
+-- Workers used to send an export message after every item; the export
+-- worker then rescanned the job's items until the last one.  The
+-- transaction that turns a job terminal now sets this flag (conditionally,
+-- so exactly once) and sends a single export message.
+
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS export_requested_at TIMESTAMP;
+
+-- Jobs already exported or finished before this migration need no new trigger
+UPDATE jobs SET export_requested_at = COALESCE(updated_at, now())
+WHERE export_requested_at IS NULL
+  AND (export_blob_path IS NOT NULL OR status IN ('completed', 'failed', 'partial'));
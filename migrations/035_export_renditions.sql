@@ -0,0 +1,21 @@
+-- Migration 035: Cached format-export renditions
+-- Each item output's resized/encoded rendition for a preset is kept in the
+-- outputs container under {tenant}/jobs/{job}/items/{item}/renditions/, so
+-- repeat format exports only render presets they have not seen before.
+-- version fingerprints the preset spec and rendition engine.
+
+CREATE TABLE IF NOT EXISTS export_renditions (
+    item_id VARCHAR NOT NULL,
+    preset_key VARCHAR(50) NOT NULL,
+    version VARCHAR(32) NOT NULL,
+    tenant_id VARCHAR NOT NULL,
+    job_id VARCHAR NOT NULL,
+    source_blob_path VARCHAR(500) NOT NULL,
+    blob_path VARCHAR(500) NOT NULL,
+    size_bytes INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (item_id, preset_key, version)
+);
+
+CREATE INDEX IF NOT EXISTS idx_export_renditions_job_id ON export_renditions(job_id);
+CREATE INDEX IF NOT EXISTS idx_export_renditions_tenant_id ON export_renditions(tenant_id);
@@ -0,0 +1,19 @@
+-- Migration 036: Background blob deletion queue
+-- Retention cleanup, GDPR erasure and cache eviction enqueue the blobs they
+-- orphan here instead of deleting them one by one inside the request; the
+-- blob deleter (shared.blob_deletion) claims rows whose available_at has
+-- passed, deletes them with batch calls and removes the rows.  Failures are
+-- retried with backoff (attempts / last_error).
+
+CREATE TABLE IF NOT EXISTS blob_deletions (
+    id BIGSERIAL PRIMARY KEY,
+    container VARCHAR(63) NOT NULL,
+    blob_path VARCHAR(1024) NOT NULL,
+    reason VARCHAR(50),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    enqueued_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    available_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_blob_deletions_available_at ON blob_deletions(available_at, id);
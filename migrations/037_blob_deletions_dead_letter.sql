@@ -0,0 +1,11 @@
+-- Migration 037: Dead-letter state for the blob deletion queue
+-- Deletions that fail BLOB_DELETION_MAX_ATTEMPTS times used to be dropped
+-- with only a log line, leaving (possibly GDPR-erased) data in storage.
+-- They are now kept with dead_lettered_at set, skipped by the deleter and
+-- reported by GET /v1/admin/blob-deletions until requeued.
+
+ALTER TABLE blob_deletions ADD COLUMN IF NOT EXISTS dead_lettered_at TIMESTAMP;
+
+DROP INDEX IF EXISTS idx_blob_deletions_available_at;
+CREATE INDEX IF NOT EXISTS idx_blob_deletions_available_at
+    ON blob_deletions(available_at, id) WHERE dead_lettered_at IS NULL;
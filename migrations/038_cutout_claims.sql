@@ -0,0 +1,11 @@
+-- Migration 038: Leases on computing shared bg-removal cutouts
+-- Sibling items fanned out from one source image compute its cutout once.
+-- The first worker inserts (or takes over an expired) row here in a short
+-- transaction, computes and uploads without holding a connection, then
+-- deletes the row; the others poll for the uploaded blob meanwhile.
+
+CREATE TABLE IF NOT EXISTS cutout_claims (
+    blob_path VARCHAR(1024) PRIMARY KEY,
+    owner VARCHAR(64) NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
@@ -0,0 +1,7 @@
+-- Migration 039: Claim resumes of finished provider requests
+-- The fal webhook and every pipeline worker's poller may see the same
+-- request finish.  Whoever flips provider_resume_enqueued_at (NULL, or
+-- older than SCENE_GEN_RESUME_RETRY_SECONDS) with a conditional UPDATE
+-- enqueues the resume; the others skip it.
+
+ALTER TABLE job_items ADD COLUMN IF NOT EXISTS provider_resume_enqueued_at TIMESTAMP;
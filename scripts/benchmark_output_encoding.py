@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Output Encoding Benchmark
+=========================
+Compares encode time and byte size of every output encoding policy
+(shared.output_encoding) on a product-shot-like image or your own file.
+
+Usage:
+    python scripts/benchmark_output_encoding.py                     # synthetic 2048x2048 image
+    python scripts/benchmark_output_encoding.py --image output.png  # real pipeline output
+    python scripts/benchmark_output_encoding.py --size 4096 --repeat 5
+
+Run from the repo root with src/shared on PYTHONPATH.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "shared"))
+
+from shared.output_encoding import POLICIES, encode_image, get_output_encoding  # noqa: E402
+
+
+def synthetic_product_shot(size: int) -> Image.Image:
+    """Gradient backdrop, soft shadow and a textured product — compresses like a real output."""
+    img = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    img = Image.merge("RGB", [c.point(lambda v, k=k: 180 + (v * (k + 1)) // 12) for k, c in enumerate(img.split())])
+    draw = ImageDraw.Draw(img)
+    shadow = Image.new("L", img.size, 0)
+    ImageDraw.Draw(shadow).ellipse(
+        (size * 0.25, size * 0.72, size * 0.75, size * 0.82), fill=120,
+    )
+    img.paste((60, 60, 60), mask=shadow.filter(ImageFilter.GaussianBlur(size // 60)))
+    draw.rounded_rectangle((size * 0.3, size * 0.2, size * 0.7, size * 0.78), radius=size // 20,
+                           fill=(200, 40, 50))
+    for i in range(0, size, max(size // 64, 1)):
+        draw.line((size * 0.3, size * 0.2 + i * 0.58, size * 0.7, size * 0.2 + i * 0.58),
+                  fill=(170 + i % 60, 30, 40), width=2)
+    draw.text((size * 0.38, size * 0.45), "OPAL", fill=(255, 255, 255))
+    return img
+
+
+def benchmark(image: Image.Image, repeat: int = 3) -> list[dict]:
+    """Best-of-*repeat* encode time and size for every policy."""
+    rows = []
+    for name in POLICIES:
+        enc = get_output_encoding(name)
+        timings = []
+        data = b""
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            data = encode_image(image, enc)
+            timings.append(time.perf_counter() - t0)
+        rows.append({
+            "policy": name,
+            "encoder": enc.name,
+            "seconds": min(timings),
+            "bytes": len(data),
+        })
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", type=Path, help="Image to encode (default: synthetic)")
+    parser.add_argument("--size", type=int, default=2048, help="Synthetic image edge in px")
+    parser.add_argument("--repeat", type=int, default=3, help="Encodes per policy (best time reported)")
+    args = parser.parse_args()
+
+    image = Image.open(args.image) if args.image else synthetic_product_shot(args.size)
+    image.load()
+    print(f"Image: {image.size[0]}x{image.size[1]} {image.mode}")
+
+    rows = benchmark(image, repeat=args.repeat)
+    baseline = next(r for r in rows if r["policy"] == "png-max")
+    print(f"{'policy':<15}{'encoder':<15}{'time (ms)':>11}{'size (KB)':>12}{'vs png-max':>13}")
+    for r in rows:
+        print(
+            f"{r['policy']:<15}{r['encoder']:<15}{r['seconds'] * 1000:>11.1f}"
+            f"{r['bytes'] / 1024:>12.1f}{r['bytes'] / baseline['bytes']:>12.0%} "
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
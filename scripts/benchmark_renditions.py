@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Rendition Benchmark
+===================
+Renders every export preset (shared.export_presets.PRESETS) for a batch of
+images three ways and checks the results agree:
+
+  per-preset   resize_image() per item x preset (decode + full resize each)
+  decode-once  shared.renditions.render_presets, one process
+  pool         shared.renditions.RenditionPool across --workers processes
+
+Usage:
+    python scripts/benchmark_renditions.py                      # 4 synthetic 3000x3000 images
+    python scripts/benchmark_renditions.py --image output.png --items 8
+    python scripts/benchmark_renditions.py --size 5000 --workers 8
+
+Run from the repo root with src/shared on PYTHONPATH.
+"""
+
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageStat
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "shared"))
+
+from benchmark_output_encoding import synthetic_product_shot  # noqa: E402
+from shared.export_presets import PRESETS  # noqa: E402
+from shared.image_resize import resize_image  # noqa: E402
+from shared.renditions import RenditionPool, render_presets  # noqa: E402
+
+
+def max_mean_diff(a: bytes, b: bytes) -> float:
+    """Largest per-channel mean absolute difference between two encoded images."""
+    ia = Image.open(io.BytesIO(a)).convert("RGBA")
+    ib = Image.open(io.BytesIO(b)).convert("RGBA")
+    if ia.size != ib.size:
+        return float("inf")
+    return max(ImageStat.Stat(ImageChops.difference(ia, ib)).mean)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", type=Path, help="Source image (default: synthetic)")
+    parser.add_argument("--size", type=int, default=3000, help="Synthetic image edge in px")
+    parser.add_argument("--items", type=int, default=4, help="Images per batch")
+    parser.add_argument("--workers", type=int, default=0, help="Pool processes (0 = one per CPU)")
+    args = parser.parse_args()
+
+    image = Image.open(args.image) if args.image else synthetic_product_shot(args.size).convert("RGBA")
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    data = buf.getvalue()
+    presets = list(PRESETS.values())
+    print(f"Image: {image.size[0]}x{image.size[1]} {image.mode}, {args.items} items x {len(presets)} presets")
+
+    t0 = time.perf_counter()
+    baseline = [{p.key: resize_image(data, p) for p in presets} for _ in range(args.items)]
+    per_preset = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    single = [render_presets(data, presets) for _ in range(args.items)]
+    decode_once = time.perf_counter() - t0
+
+    pool = RenditionPool(args.workers)
+    try:
+        list(pool.render_many([(0, data)], presets[:1]))  # start the workers outside the timing
+        t0 = time.perf_counter()
+        pooled = [r for _, r in pool.render_many(((n, data) for n in range(args.items)),
+                                                  presets, total=args.items)]
+        parallel = time.perf_counter() - t0
+    finally:
+        pool.shutdown()
+
+    print(f"{'mode':<14}{'seconds':>10}{'speedup':>10}")
+    for name, seconds in (("per-preset", per_preset), ("decode-once", decode_once),
+                          (f"pool x{pool.workers}", parallel)):
+        print(f"{name:<14}{seconds:>10.2f}{per_preset / seconds:>9.1f}x")
+
+    print(f"\n{'preset':<18}{'size':>11}{'max mean diff':>15}")
+    worst = 0.0
+    for p in presets:
+        diff = max(max_mean_diff(baseline[0][p.key], single[0][p.key]),
+                   max_mean_diff(baseline[0][p.key], pooled[0][p.key]))
+        worst = max(worst, diff)
+        print(f"{p.key:<18}{p.width:>5}x{p.height:<5}{diff:>15.3f}")
+    return 0 if worst < 1.0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Pixel Events Load Test
+======================
+Fires concurrent POST /v1/ab-tests/pixel-events batches at one web API
+worker and reports throughput and latency, to compare the sync and async
+database paths (run once per build against the same database).
+
+Start a single worker so the number is per worker:
+    uvicorn web_api.main:app --workers 1 --port 8080
+
+Usage:
+    python scripts/loadtest_pixel_events.py --pixel-key pk_... --product-id 123
+    python scripts/loadtest_pixel_events.py --pixel-key pk_... --concurrency 64 --duration 30
+
+Environment:
+    OPAL_API_URL   – API base URL (default: http://localhost:8080/v1)
+
+Use an integration with a running test on --product-id and no monthly event
+limit, otherwise batches are dropped before they reach the database.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+EVENT_TYPES = ("view", "view", "view", "add_to_cart", "conversion")
+
+
+def make_batch(product_id: str, size: int) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    events = []
+    for _ in range(size):
+        event_type = random.choice(EVENT_TYPES)
+        event = {"event_type": event_type, "product_id": product_id, "timestamp": now}
+        if event_type == "conversion":
+            event["revenue_cents"] = random.randint(500, 5000)
+        events.append(event)
+    return {"shop_domain": "loadtest.myshopify.com", "events": events}
+
+
+async def worker(client: httpx.AsyncClient, args, deadline: float, latencies: list, errors: list) -> None:
+    headers = {"X-Pixel-Key": args.pixel_key}
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        try:
+            r = await client.post("/ab-tests/pixel-events", json=make_batch(args.product_id, args.batch_size),
+                                  headers=headers)
+            if r.status_code != 202:
+                errors.append(r.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - t0)
+
+
+async def run(args) -> int:
+    latencies: list[float] = []
+    errors: list = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=30, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(worker(client, args, deadline, latencies, errors)
+                               for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    if not latencies:
+        print(f"No successful requests ({len(errors)} errors: {errors[:5]})")
+        return 1
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"{len(latencies)} requests in {elapsed:.1f}s with {args.concurrency} concurrent clients, "
+          f"{args.batch_size} events each")
+    print(f"Throughput: {len(latencies) / elapsed:.1f} req/s ({len(latencies) * args.batch_size / elapsed:.0f} events/s)")
+    print(f"Latency ms: p50 {pct(0.50):.1f}  p95 {pct(0.95):.1f}  p99 {pct(0.99):.1f}  max {latencies[-1] * 1000:.1f}")
+    if errors:
+        print(f"Errors: {len(errors)} (first: {errors[:5]})")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("OPAL_API_URL", "http://localhost:8080/v1"))
+    parser.add_argument("--pixel-key", required=True, help="X-Pixel-Key of an active integration")
+    parser.add_argument("--product-id", default="1", help="Product with a running A/B test")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run")
+    parser.add_argument("--batch-size", type=int, default=10, help="Events per request (max 50)")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Repair job item counters
+========================
+Recounts jobs.items_total / items_completed / items_failed /
+items_processing from job_items for jobs whose counters drifted (e.g. after
+a bulk UPDATE that bypassed the ORM hooks in shared.job_counters), then
+re-derives each repaired job's status.
+
+Usage:
+    python scripts/repair_job_counters.py                 # every job
+    python scripts/repair_job_counters.py --job job_123   # specific job(s)
+
+Run from the repo root with src/shared on PYTHONPATH and DATABASE_URL set.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "shared"))
+
+from shared.db_sqlalchemy import repair_job_counters  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--job", action="append", dest="jobs", help="job id (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    repaired = repair_job_counters(args.jobs, batch_size=args.batch_size)
+    for job_id in repaired:
+        print(f"  repaired {job_id}")
+    print(f"Repaired counters on {len(repaired)} job(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
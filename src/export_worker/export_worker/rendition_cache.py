@@ -0,0 +1,131 @@
+"""
+Persistent cache of per-item export renditions.
+
+A format export used to resize every item for every requested preset, even
+if the same job had been exported to those platforms minutes earlier.
+Renditions are now stored next to the item output
+(``{tenant}/jobs/{job}/items/{item}/renditions/{preset}-{version}.{ext}``)
+and indexed in ``export_renditions``, keyed by item, preset key and preset
+version (shared.renditions.rendition_version).  An entry only counts while
+the item's output blob is the one it was rendered from, so a reprocessed
+item renders afresh.  Rows and blobs go away with the job
+(delete_job_cascade) or the tenant (GDPR delete).
+
+Usage:
+    cache = RenditionCache(job_id, tenant_id, presets)
+    cache.load(items)
+    cache.missing_for(item)         # presets still to render
+    cache.store(item, preset, data) # uploaded in the background
+    cache.close()                   # wait for uploads, record the index rows
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Sequence
+
+from shared.db_sqlalchemy import get_export_renditions, put_export_renditions
+from shared.export_presets import ExportPreset
+from shared.renditions import rendition_version
+from shared.storage import build_rendition_blob_path, upload_blob
+
+LOG = logging.getLogger(__name__)
+
+
+def rendition_extension(preset: ExportPreset) -> str:
+    return "png" if preset.bg_color == "transparent" else "jpg"
+
+
+class RenditionCache:
+    """Cached renditions of one job's items for a set of presets."""
+
+    def __init__(self, job_id: str, tenant_id: str, presets: Sequence[ExportPreset],
+                 enabled: bool = True, upload_concurrency: int = 4):
+        self.job_id = job_id
+        self.tenant_id = tenant_id
+        self.presets = list(presets)
+        self.enabled = enabled
+        self.versions = {p.key: rendition_version(p) for p in self.presets}
+        self._cached: Dict[str, Dict[str, str]] = {}
+        self._uploads: List[Future] = []
+        self._records: List[dict] = []
+        self._lock = threading.Lock()
+        self._executor = (
+            ThreadPoolExecutor(max_workers=max(1, upload_concurrency), thread_name_prefix="rendition-ul")
+            if enabled else None
+        )
+        # Rendered bytes waiting for upload are bounded like the download window
+        self._max_pending = 4 * max(1, upload_concurrency)
+
+    def load(self, items) -> None:
+        """Look up cached renditions for *items* (one query)."""
+        if not self.enabled:
+            return
+        try:
+            rows = get_export_renditions(self.job_id, self.versions)
+        except Exception as e:
+            LOG.warning("Rendition cache lookup failed for job=%s: %s", self.job_id, e)
+            return
+        for item in items:
+            cached = {
+                key: row["blob_path"]
+                for (item_id, key), row in rows.items()
+                if item_id == item.id and row["source_blob_path"] == item.output_blob_path
+            }
+            if cached:
+                self._cached[item.id] = cached
+
+    def cached_for(self, item) -> Dict[str, str]:
+        """{preset_key: blob_path} of *item*'s usable cached renditions."""
+        return dict(self._cached.get(item.id, {}))
+
+    def forget(self, item, preset_key: str) -> None:
+        """Drop an entry whose blob could not be read (it is rendered again)."""
+        self._cached.get(item.id, {}).pop(preset_key, None)
+
+    def missing_for(self, item) -> List[ExportPreset]:
+        cached = self._cached.get(item.id, {})
+        return [p for p in self.presets if p.key not in cached]
+
+    def store(self, item, preset: ExportPreset, data: bytes) -> None:
+        """Upload a fresh rendition in the background; indexed on close()."""
+        if not self.enabled:
+            return
+        version = self.versions[preset.key]
+        ext = rendition_extension(preset)
+        blob_path = build_rendition_blob_path(self.tenant_id, self.job_id, item.id, preset.key, version, ext)
+        record = {
+            "item_id": item.id,
+            "preset_key": preset.key,
+            "version": version,
+            "tenant_id": self.tenant_id,
+            "job_id": self.job_id,
+            "source_blob_path": item.output_blob_path,
+            "blob_path": blob_path,
+            "size_bytes": len(data),
+        }
+        content_type = "image/png" if ext == "png" else "image/jpeg"
+        self._uploads = [f for f in self._uploads if not f.done()]
+        if len(self._uploads) >= self._max_pending:
+            self._uploads[0].result()
+        self._uploads.append(self._executor.submit(self._upload, record, data, content_type))
+
+    def _upload(self, record: dict, data: bytes, content_type: str) -> None:
+        try:
+            upload_blob("outputs", record["blob_path"], data, content_type=content_type)
+        except Exception as e:
+            LOG.warning("Rendition upload failed %s: %s", record["blob_path"], e)
+            return
+        with self._lock:
+            self._records.append(record)
+
+    def close(self) -> None:
+        """Wait for pending uploads and index the renditions that made it."""
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        try:
+            put_export_renditions(self._records)
+        except Exception as e:
+            LOG.warning("Could not index %d renditions for job=%s: %s", len(self._records), self.job_id, e)
+        LOG.info("Stored %d renditions for job=%s", len(self._records), self.job_id)
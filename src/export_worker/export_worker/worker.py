@@ -1,21 +1,42 @@
-import io
 import json
 import logging
 import time
 import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import PurePosixPath
-from azure.servicebus import ServiceBusReceiveMode
+from typing import Any, Callable
 
 from shared.config import settings
 from shared.db import SessionLocal
-from shared.models import Job, JobItem, ItemStatus, JobStatus
-from shared.servicebus import get_client
-from shared.storage import download_blob, upload_blob
-from shared.export_presets import get_preset, ExportPreset
-from shared.image_resize import resize_image
+from shared.models import Job, JobItem, ItemStatus
+from shared.storage import download_blob, open_blob_writer
+from shared.export_presets import get_preset
+from shared.renditions import RenditionPool
+from shared.worker_runtime import QueueWorker
+
+from export_worker.rendition_cache import RenditionCache, rendition_extension
 
 log = logging.getLogger("export_worker")
 
+STORED_SUFFIXES = frozenset({".png", ".jpg", ".jpeg", ".webp", ".avif"})
+
+
+_renditions: RenditionPool | None = None
+
+
+class _NothingDownloaded(Exception):
+    pass
+
+
+def _rendition_pool() -> RenditionPool:
+    """Process pool for format-export resizing, started on first use."""
+    global _renditions
+    if _renditions is None:
+        _renditions = RenditionPool(settings.EXPORT_RENDER_WORKERS)
+    return _renditions
+
 
 def _extract_payload(m) -> dict:
     body = b"".join([b for b in m.body]) if hasattr(m.body, "__iter__") else bytes(m.body)
@@ -31,10 +52,18 @@ def _extract_payload(m) -> dict:
     return {"job_id": text}
 
 
-def _build_zip_filename(item: JobItem) -> str:
-    """Build a descriptive filename for the ZIP entry."""
+def _build_zip_filename(item: "ExportItem") -> str:
+    """Build a descriptive filename for the ZIP entry.
+
+    The extension follows the output blob (its actual encoding), not the
+    uploaded source file.
+    """
     stem = PurePosixPath(item.filename).stem
-    suffix = PurePosixPath(item.filename).suffix or ".png"
+    suffix = (
+        PurePosixPath(item.output_blob_path or "").suffix
+        or PurePosixPath(item.filename).suffix
+        or ".png"
+    )
 
     if item.scene_index is not None:
         label = item.scene_type or f"scene{item.scene_index}"
@@ -42,42 +71,129 @@ def _build_zip_filename(item: JobItem) -> str:
     return f"{stem}{suffix}"
 
 
-def process_export(job_id: str, tenant_id: str) -> None:
-    """Build a ZIP of all completed items for a job."""
+@dataclass(frozen=True)
+class ExportItem:
+    """Detached copy of the JobItem fields an export needs (no session held during I/O)."""
+    id: str
+    filename: str
+    output_blob_path: str
+    scene_index: int | None = None
+    scene_type: str | None = None
+
+    @classmethod
+    def from_model(cls, item: JobItem) -> "ExportItem":
+        return cls(item.id, item.filename, item.output_blob_path, item.scene_index, item.scene_type)
+
+
+def _compress_type(name: str) -> int:
+    # PNG/JPEG/WebP/AVIF are already compressed: deflating them again costs
+    # CPU for ~0% size gain
+    suffix = PurePosixPath(name).suffix.lower()
+    return zipfile.ZIP_STORED if suffix in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+
+
+def _write_entry(zf: zipfile.ZipFile, name: str, data: bytes) -> None:
+    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = _compress_type(name)
+    zf.writestr(info, data)
+
+
+def _download_output(item: ExportItem) -> bytes | None:
+    try:
+        return download_blob("outputs", item.output_blob_path)
+    except Exception as e:
+        log.error("Failed to download blob for item=%s: %s", item.id, e)
+        return None
+
+
+def _fetch_outputs(items: list[ExportItem], concurrency: int,
+                   fetch: Callable[[ExportItem], Any] = _download_output):
+    """Yield (item, fetch(item)) in order, fetching up to *concurrency* items ahead.
+
+    At most ``concurrency`` items' downloads are held in memory at once; the
+    default fetch yields None for a failed download so the export skips
+    just that entry.
+    """
+    concurrency = max(1, concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="export-dl") as pool:
+        pending: deque = deque()
+        queued = iter(items)
+        for item in queued:
+            pending.append((item, pool.submit(fetch, item)))
+            if len(pending) >= concurrency:
+                break
+        while pending:
+            item, future = pending.popleft()
+            data = future.result()
+            nxt = next(queued, None)
+            if nxt is not None:
+                pending.append((nxt, pool.submit(fetch, nxt)))
+            yield item, data
+
+
+def _load_export_items(job_id: str, check_terminal: bool) -> list[ExportItem] | None:
+    """Completed items with outputs, or None if the job is missing/already exported/not done."""
     with SessionLocal() as s:
         job = s.get(Job, job_id)
         if not job:
             log.warning("Job not found: %s", job_id)
-            return
-
-        # Idempotent: already exported
-        if job.export_blob_path:
-            log.info("Export already exists for job=%s at %s", job_id, job.export_blob_path)
-            return
-
-        items = list(job.items)
-        terminal = [it for it in items if it.status in (ItemStatus.completed, ItemStatus.failed)]
-
-        if len(terminal) < len(items):
-            log.info("Job %s not fully done (%d/%d terminal), skipping export",
-                     job_id, len(terminal), len(items))
-            return
-
-        completed = [it for it in items if it.status == ItemStatus.completed and it.output_blob_path]
-        if not completed:
-            log.warning("Job %s has no completed items with output paths", job_id)
-            return
-
-        # Build ZIP in memory
-        buf = io.BytesIO()
-        used_names: dict[str, int] = {}
-
-        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-            for item in completed:
-                try:
-                    data = download_blob("outputs", item.output_blob_path)
-                except Exception as e:
-                    log.error("Failed to download blob for item=%s: %s", item.id, e)
+            return None
+
+        if check_terminal:
+            # Idempotent: already exported
+            if job.export_blob_path:
+                log.info("Export already exists for job=%s at %s", job_id, job.export_blob_path)
+                return None
+
+            terminal = job.items_completed + job.items_failed
+            if terminal < job.items_total:
+                log.info("Job %s not fully done (%d/%d terminal), skipping export",
+                         job_id, terminal, job.items_total)
+                return None
+
+        completed = (
+            s.query(JobItem)
+            .filter(JobItem.job_id == job_id,
+                    JobItem.status == ItemStatus.completed,
+                    JobItem.output_blob_path.isnot(None))
+            .order_by(JobItem.created_at)
+            .all()
+        )
+        return [ExportItem.from_model(it) for it in completed]
+
+
+def _open_export_blob(export_path: str):
+    return open_blob_writer(
+        "exports", export_path, content_type="application/zip",
+        block_size=max(1, settings.EXPORT_BLOCK_SIZE_MB) * 1024 * 1024,
+        concurrency=settings.BLOB_TRANSFER_CONCURRENCY,
+    )
+
+
+def process_export(job_id: str, tenant_id: str) -> None:
+    """Stream a ZIP of all completed items for a job into the exports container.
+
+    Requested once per job by shared.pipeline when the job turns terminal;
+    the checks below keep redeliveries and manual triggers harmless.
+    Outputs are downloaded in parallel and each entry is written straight
+    into a staged block-blob upload, so memory stays bounded by the
+    download window plus one upload block however large the job is.
+    """
+    completed = _load_export_items(job_id, check_terminal=True)
+    if completed is None:
+        return
+    if not completed:
+        log.warning("Job %s has no completed items with output paths", job_id)
+        return
+
+    export_path = f"{tenant_id}/jobs/{job_id}/export.zip"
+    used_names: dict[str, int] = {}
+    entries = 0
+
+    with _open_export_blob(export_path) as out:
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+            for item, data in _fetch_outputs(completed, settings.EXPORT_DOWNLOAD_CONCURRENCY):
+                if data is None:
                     continue
 
                 name = _build_zip_filename(item)
@@ -90,24 +206,31 @@ def process_export(job_id: str, tenant_id: str) -> None:
                 else:
                     used_names[name] = 0
 
-                zf.writestr(name, data)
-                log.info("Added to ZIP: %s (%d bytes)", name, len(data))
+                _write_entry(zf, name, data)
+                entries += 1
+                log.debug("Added to ZIP: %s (%d bytes)", name, len(data))
+        size = out.tell()
 
-        zip_bytes = buf.getvalue()
-        export_path = f"{tenant_id}/jobs/{job_id}/export.zip"
+    log.info("Uploaded export ZIP for job=%s: %s (%d entries, %d bytes)",
+             job_id, export_path, entries, size)
 
-        upload_blob("exports", export_path, zip_bytes, content_type="application/zip")
-        log.info("Uploaded export ZIP for job=%s: %s (%d bytes)", job_id, export_path, len(zip_bytes))
-
-        # Update job record
-        job.export_blob_path = export_path
-        s.commit()
-        log.info("Job %s export_blob_path set to %s", job_id, export_path)
+    # Update job record
+    with SessionLocal() as s:
+        job = s.get(Job, job_id)
+        if job:
+            job.export_blob_path = export_path
+            s.commit()
+    log.info("Job %s export_blob_path set to %s", job_id, export_path)
 
 
 def process_format_export(job_id: str, tenant_id: str, format_keys: list[str]) -> str | None:
     """Build a ZIP with platform-specific resized images in subfolders.
 
+    Streams like process_export: outputs are downloaded in parallel and
+    rendered for every preset on the rendition pool (one decode per image,
+    see shared.renditions), then written in item order.  Renditions from
+    earlier exports of the job are reused (export_worker.rendition_cache):
+    only presets never rendered for an item cost a resize.
     Returns the blob path of the uploaded ZIP, or None on failure.
     """
     presets = []
@@ -119,61 +242,102 @@ def process_format_export(job_id: str, tenant_id: str, format_keys: list[str]) -
         log.warning("No valid format keys for job=%s: %s", job_id, format_keys)
         return None
 
-    with SessionLocal() as s:
-        job = s.get(Job, job_id)
-        if not job:
-            log.warning("Job not found: %s", job_id)
-            return None
+    completed = _load_export_items(job_id, check_terminal=False)
+    if completed is None:
+        return None
+    if not completed:
+        log.warning("Job %s has no completed items", job_id)
+        return None
 
-        completed = [
-            it for it in job.items
-            if it.status == ItemStatus.completed and it.output_blob_path
-        ]
-        if not completed:
-            log.warning("Job %s has no completed items", job_id)
-            return None
+    suffix = "_".join(format_keys[:3])
+    if len(format_keys) > 3:
+        suffix += f"_+{len(format_keys) - 3}"
+    export_path = f"{tenant_id}/jobs/{job_id}/export_{suffix}.zip"
+
+    cache = RenditionCache(job_id, tenant_id, presets, enabled=settings.EXPORT_RENDITION_CACHE,
+                           upload_concurrency=settings.EXPORT_DOWNLOAD_CONCURRENCY)
+    cache.load(completed)
 
-        # Download all output images once
-        image_cache: dict[str, bytes] = {}
-        for item in completed:
+    def fetch(item: ExportItem):
+        """Cached renditions of *item*, plus its output if any preset is missing."""
+        cached = {}
+        for key, path in cache.cached_for(item).items():
             try:
-                image_cache[item.id] = download_blob("outputs", item.output_blob_path)
+                cached[key] = download_blob("outputs", path)
             except Exception as e:
-                log.error("Failed to download blob for item=%s: %s", item.id, e)
+                log.warning("Cached rendition unreadable item=%s preset=%s: %s", item.id, key, e)
+                cache.forget(item, key)
+        source = _download_output(item) if cache.missing_for(item) else None
+        return cached, source
 
-        if not image_cache:
-            log.warning("No images downloaded for job=%s", job_id)
-            return None
+    reused: dict[str, dict[str, bytes]] = {}
+
+    def sources():
+        for item, (cached, source) in _fetch_outputs(completed, settings.EXPORT_DOWNLOAD_CONCURRENCY, fetch):
+            reused[item.id] = cached
+            yield item, source
+
+    exported = 0
+    counts = {"reused": 0, "rendered": 0}
+    try:
+        with _open_export_blob(export_path) as out:
+            with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+                for item, rendered in _rendition_pool().render_many(
+                        sources(), presets, total=len(completed), presets_for=cache.missing_for):
+                    entries = reused.pop(item.id)
+                    counts["reused"] += len(entries)
+                    if isinstance(rendered, Exception):
+                        log.error("Resize failed item=%s: %s", item.id, rendered)
+                    elif rendered:
+                        counts["rendered"] += len(rendered)
+                        for preset in presets:
+                            if preset.key in rendered:
+                                cache.store(item, preset, rendered[preset.key])
+                        entries = {**entries, **rendered}
+                    if not entries:
+                        continue  # download failed (logged) and nothing cached
+                    exported += 1
+                    stem = PurePosixPath(_build_zip_filename(item)).stem
+                    for preset in presets:
+                        if preset.key not in entries:
+                            continue  # logged by the rendition engine
+                        _write_entry(zf, f"{preset.key}/{stem}.{rendition_extension(preset)}",
+                                     entries[preset.key])
+                if not exported:
+                    raise _NothingDownloaded()  # leaves the upload uncommitted
+            size = out.tell()
+    except _NothingDownloaded:
+        log.warning("No images downloaded for job=%s", job_id)
+        return None
+    finally:
+        cache.close()
+
+    log.info("Format export renditions for job=%s: %d reused, %d rendered",
+             job_id, counts["reused"], counts["rendered"])
+    log.info("Format export for job=%s: %s (%d bytes, %d formats)",
+             job_id, export_path, size, len(presets))
+    return export_path
+
+
+def handle_export_message(payload: dict) -> None:
+    job_id = payload.get("job_id")
+    tenant_id = payload.get("tenant_id")
+
+    if not job_id:
+        # Returning completes the message — avoids a poison loop
+        log.warning("Export message without job_id; completing to avoid poison loop.")
+        return
+
+    format_keys = payload.get("format_keys")
+    log.info("Processing export for job_id=%s tenant_id=%s formats=%s",
+             job_id, tenant_id, format_keys)
+
+    if format_keys:
+        process_format_export(job_id, tenant_id or "default", format_keys)
+    else:
+        process_export(job_id, tenant_id or "default")
 
-        # Build ZIP with platform subfolders
-        buf = io.BytesIO()
-        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-            for preset in presets:
-                ext = ".png" if preset.bg_color == "transparent" else ".jpg"
-                for item in completed:
-                    if item.id not in image_cache:
-                        continue
-                    try:
-                        resized = resize_image(image_cache[item.id], preset)
-                    except Exception as e:
-                        log.error("Resize failed item=%s preset=%s: %s", item.id, preset.key, e)
-                        continue
-
-                    zip_name = _build_zip_filename(item)
-                    stem = PurePosixPath(zip_name).stem
-                    entry_path = f"{preset.key}/{stem}{ext}"
-                    zf.writestr(entry_path, resized)
-
-        zip_bytes = buf.getvalue()
-        suffix = "_".join(format_keys[:3])
-        if len(format_keys) > 3:
-            suffix += f"_+{len(format_keys) - 3}"
-        export_path = f"{tenant_id}/jobs/{job_id}/export_{suffix}.zip"
-
-        upload_blob("exports", export_path, zip_bytes, content_type="application/zip")
-        log.info("Format export for job=%s: %s (%d bytes, %d formats)",
-                 job_id, export_path, len(zip_bytes), len(presets))
-        return export_path
+    log.info("Completed export message for job_id=%s", job_id)
 
 
 def main():
@@ -181,46 +345,12 @@ def main():
     log.info("Starting export_worker. exports_queue=%s namespace=%s",
              settings.SERVICEBUS_EXPORTS_QUEUE, settings.SERVICEBUS_NAMESPACE)
 
-    while True:
-        try:
-            with get_client() as client:
-                receiver = client.get_queue_receiver(
-                    queue_name=settings.SERVICEBUS_EXPORTS_QUEUE,
-                    max_wait_time=20,
-                    receive_mode=ServiceBusReceiveMode.PEEK_LOCK,
-                )
-                with receiver:
-                    messages = receiver.receive_messages(max_message_count=10, max_wait_time=20)
-                    for m in messages:
-                        try:
-                            payload = _extract_payload(m)
-                            job_id = payload.get("job_id")
-                            tenant_id = payload.get("tenant_id")
-
-                            if not job_id:
-                                log.warning("Export message without job_id; completing to avoid poison loop.")
-                                receiver.complete_message(m)
-                                continue
-
-                            format_keys = payload.get("format_keys")
-                            log.info("Processing export for job_id=%s tenant_id=%s formats=%s",
-                                     job_id, tenant_id, format_keys)
-
-                            if format_keys:
-                                process_format_export(job_id, tenant_id or "default", format_keys)
-                            else:
-                                process_export(job_id, tenant_id or "default")
-
-                            receiver.complete_message(m)
-                            log.info("Completed export message for job_id=%s", job_id)
-
-                        except Exception:
-                            log.exception("Export processing failed; abandoning message.")
-                            receiver.abandon_message(m)
-
-        except Exception:
-            log.exception("Top-level loop error. Sleeping 5s.")
-            time.sleep(5)
+    QueueWorker(
+        settings.SERVICEBUS_EXPORTS_QUEUE,
+        handle_export_message,
+        max_lock_renewal_duration=600,
+        decode=_extract_payload,
+    ).run_forever()
 
 
 if __name__ == "__main__":
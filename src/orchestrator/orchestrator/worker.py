@@ -1,19 +1,12 @@
 # Updated: 2026-02-19 - Refactored to coordinator: routes jobs to step queues
-import json
-import time
 import logging
 import httpx
-import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
 from tenacity import retry, stop_after_attempt, wait_exponential
-from azure.servicebus import ServiceBusReceiveMode, AutoLockRenewer
 from shared.config import settings
 from shared.db import SessionLocal
 from shared.models import JobItem, ItemStatus
 from shared.storage import build_output_blob_path, generate_read_sas, generate_write_sas
 from shared.servicebus import (
-    get_client,
-    send_export_message,
     send_bg_removal_message,
     send_scene_gen_message,
     send_upscale_message,
@@ -21,34 +14,11 @@ from shared.servicebus import (
 from shared.pipeline import PipelineMessage, ProcessingOptions, finalize_job_status
 from shared.db_sqlalchemy import get_brand_profile, get_job_by_id as get_job_record
 from shared.util import new_id
+from shared.worker_runtime import QueueWorker, start_health_server
 
 LOG = logging.getLogger(__name__)
 
 
-class HealthHandler(BaseHTTPRequestHandler):
-    """Simple health check endpoint for Container Apps probes"""
-    def do_GET(self):
-        if self.path in ('/healthz', '/readyz', '/livez', '/'):
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'OK')
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def log_message(self, format, *args):
-        pass
-
-
-def start_health_server(port=8080):
-    server = HTTPServer(('0.0.0.0', port), HealthHandler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    LOG.info('Health server started on port %d', port)
-    return server
-
-
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=5))
 def _upload_blob(sas_url: str, data: bytes) -> None:
     with httpx.Client(timeout=60) as client:
@@ -82,18 +52,9 @@ def _passthrough(msg: PipelineMessage) -> None:
             s.commit()
             LOG.info('Passthrough complete: %s', msg.item_id)
 
+    # Requests the job's export once the last item lands
     finalize_job_status(msg.job_id)
 
-    try:
-        send_export_message({
-            'tenant_id': msg.tenant_id,
-            'job_id': msg.job_id,
-            'item_id': msg.item_id,
-            'correlation_id': msg.correlation_id,
-        })
-    except Exception as e:
-        LOG.error('Export message failed for passthrough: %s', e)
-
 
 def process_message(data: dict) -> None:
     tenant_id = data['tenant_id']
@@ -206,41 +167,11 @@ def main():
 
     LOG.info('Starting coordination loop...')
 
-    while True:
-        try:
-            with get_client() as client:
-                receiver = client.get_queue_receiver(
-                    queue_name=settings.SERVICEBUS_JOBS_QUEUE,
-                    max_wait_time=20,
-                    receive_mode=ServiceBusReceiveMode.PEEK_LOCK
-                )
-                renewer = AutoLockRenewer()
-
-                with receiver:
-                    messages = receiver.receive_messages(max_message_count=10, max_wait_time=20)
-                    for m in messages:
-                        try:
-                            data = json.loads(str(m))
-                            renewer.register(receiver, m, max_lock_renewal_duration=120)
-
-                            process_message(data)
-
-                            receiver.complete_message(m)
-                            LOG.info('Message completed: %s', data.get('job_id'))
-                        except json.JSONDecodeError as e:
-                            LOG.error('Invalid JSON: %s', e)
-                            receiver.dead_letter_message(m, reason='InvalidJSON', error_description=str(e))
-                        except Exception as e:
-                            LOG.exception('Message processing failed: %s', e)
-                            receiver.abandon_message(m)
-                        finally:
-                            try:
-                                renewer.close()
-                            except Exception as ex:
-                                LOG.warning('Lock renewer close failed: %s', ex)
-        except Exception as e:
-            LOG.exception('Worker loop error: %s', e)
-            time.sleep(5)
+    QueueWorker(
+        settings.SERVICEBUS_JOBS_QUEUE,
+        process_message,
+        max_lock_renewal_duration=120,
+    ).run_forever()
 
 
 if __name__ == '__main__':
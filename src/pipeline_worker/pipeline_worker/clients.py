@@ -12,6 +12,7 @@ from azure.identity import DefaultAzureCredential
 from azure.servicebus import ServiceBusClient, ServiceBusMessage
 from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
 
+from shared import blob_transfer
 from shared.config import settings
 
 LOG = logging.getLogger(__name__)
@@ -87,22 +88,26 @@ def generate_write_sas(container: str, blob_path: str, expiry_minutes: int = 30)
 
 
 def download_blob(sas_url: str) -> bytes:
-    """Download blob using the pooled HTTP client."""
-    r = http_client.get(sas_url)
-    r.raise_for_status()
-    return r.content
+    """Download blob using the pooled HTTP client (parallel ranges when large)."""
+    return blob_transfer.download(http_client, sas_url, **_transfer_options())
 
 
-def upload_blob(sas_url: str, data: bytes) -> None:
-    """Upload blob using the pooled HTTP client."""
-    r = http_client.put(sas_url, content=data, headers={'x-ms-blob-type': 'BlockBlob'})
-    r.raise_for_status()
+def upload_blob(sas_url: str, data: bytes, content_type: str | None = None) -> None:
+    """Upload blob using the pooled HTTP client (parallel blocks when large)."""
+    blob_transfer.upload(http_client, sas_url, data, content_type=content_type, **_transfer_options())
 
 
-def send_export_message(payload: dict) -> None:
-    """Send export message using the singleton Service Bus client."""
+def _transfer_options() -> dict:
+    return {
+        'chunk_size': settings.BLOB_TRANSFER_CHUNK_MB * 1024 * 1024,
+        'concurrency': settings.BLOB_TRANSFER_CONCURRENCY,
+    }
+
+
+def send_job_message(payload: dict) -> None:
+    """Send a jobs-queue message (e.g. an async scene resume) via the singleton client."""
     import json
-    sender = servicebus_client.get_queue_sender(queue_name=settings.SERVICEBUS_EXPORTS_QUEUE)
+    sender = servicebus_client.get_queue_sender(queue_name=settings.SERVICEBUS_JOBS_QUEUE)
     with sender:
         sender.send_messages(ServiceBusMessage(json.dumps(payload)))
-    LOG.info("Sent export message: job_id=%s", payload.get("job_id"))
+    LOG.info("Sent job message: item_id=%s", payload.get("item_id"))
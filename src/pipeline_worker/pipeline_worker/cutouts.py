@@ -0,0 +1,134 @@
+"""
+Shared background-removal cutouts for fanned-out items.
+
+A multi-scene / multi-angle request creates one job item per scene × angle,
+all pointing at the same raw blob.  Background removal only depends on the
+raw image, so it is computed once and stored next to the raw upload's
+outputs (``.../bg/<name>_cutout.png``); every sibling item reuses it.
+
+Concurrent siblings serialize on the cutout path — an in-process lock for
+items on the same worker and a leased claim row across replicas.  The
+claim is taken and released in short transactions, so no database
+connection is held while the cutout is computed; siblings that lose it
+poll for the uploaded blob, and take the claim over if its holder died
+and the lease expired.
+
+Usage:
+    store = SharedCutoutStore(generate_read_sas, generate_write_sas, download_blob, upload_blob)
+    cutout = store.get_or_create(raw_blob_path, lambda: bg_provider.remove_background(raw))
+"""
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+import httpx
+
+from shared.config import settings
+from shared.db_sqlalchemy import claim_cutout, release_cutout_claim
+from shared.storage import build_cutout_blob_path
+
+LOG = logging.getLogger(__name__)
+
+CUTOUT_CONTAINER = "outputs"
+
+
+class SharedCutoutStore:
+    """Get-or-compute store for bg-removed cutouts keyed by raw blob path."""
+
+    def __init__(
+        self,
+        read_url: Callable[..., str],
+        write_url: Callable[..., str],
+        download: Callable[[str], bytes],
+        upload: Callable[[str, bytes], None],
+        claim: Optional[Callable[[str], bool]] = None,
+        release: Optional[Callable[[str], None]] = None,
+        poll_interval: float = settings.CUTOUT_POLL_SECONDS,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        owner = uuid.uuid4().hex
+        self._read_url = read_url
+        self._write_url = write_url
+        self._download = download
+        self._upload = upload
+        self._claim = claim or (lambda path: claim_cutout(path, owner, settings.CUTOUT_CLAIM_LEASE_SECONDS))
+        self._release = release or (lambda path: release_cutout_claim(path, owner))
+        self._poll_interval = poll_interval
+        self._sleep = sleep
+        self._local_locks: Dict[str, list] = {}
+        self._local_guard = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def _local_lock(self, key: str) -> Iterator[None]:
+        # Refcounted so the map only holds locks for cutouts in flight
+        with self._local_guard:
+            entry = self._local_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._local_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._local_locks[key]
+
+    def _fetch(self, path: str) -> Optional[bytes]:
+        try:
+            return self._download(self._read_url(container=CUTOUT_CONTAINER, blob_path=path))
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                return None
+            raise
+
+    def _try_claim(self, path: str) -> bool:
+        try:
+            return self._claim(path)
+        except Exception as e:
+            # Without the database, compute rather than wait on siblings
+            LOG.warning("Failed to claim shared cutout %s, computing anyway: %s", path, e)
+            return True
+
+    def get_or_create(self, raw_blob_path: str, compute: Callable[[], bytes]) -> bytes:
+        """Return the stored cutout for *raw_blob_path*, computing it at most once."""
+        path = build_cutout_blob_path(raw_blob_path)
+        with self._local_lock(path):
+            while True:
+                cached = self._fetch(path)
+                if cached is None and self._try_claim(path):
+                    # The previous holder may have stored it just before releasing
+                    cached = self._fetch(path)
+                    if cached is None:
+                        return self._compute(path, compute)
+                    self._release_claim(path)
+                if cached is not None:
+                    self.hits += 1
+                    LOG.info("Reusing shared cutout %s (%d bytes)", path, len(cached))
+                    return cached
+                self._sleep(self._poll_interval)
+
+    def _compute(self, path: str, compute: Callable[[], bytes]) -> bytes:
+        self.misses += 1
+        try:
+            cutout = compute()
+            try:
+                self._upload(self._write_url(container=CUTOUT_CONTAINER, blob_path=path), cutout)
+                LOG.info("Stored shared cutout %s (%d bytes)", path, len(cutout))
+            except Exception as e:
+                # Siblings will recompute; this item still has its cutout
+                LOG.warning("Failed to store shared cutout %s: %s", path, e)
+            return cutout
+        finally:
+            self._release_claim(path)
+
+    def _release_claim(self, path: str) -> None:
+        try:
+            self._release(path)
+        except Exception as e:
+            # The lease expires on its own
+            LOG.warning("Failed to release shared cutout claim %s: %s", path, e)
@@ -0,0 +1,138 @@
+"""
+Product-image handoff to URL-based edit providers (FLUX.2 Pro Edit).
+
+Edit mode used to upload every bg-removed cutout to ``outputs/_tmp/`` under
+a fresh name, sign two SAS URLs and never delete it — and fal then had to
+download it back out of our storage.  The handoff now:
+
+  • inlines small cutouts as a ``data:`` URI (no upload, no fal download)
+  • stores larger ones content-addressed under ``_tmp/handoff/{sha256}.png``
+    and remembers the signed URL, so sibling scenes/angles of one source
+    image upload it once per replica
+  • leaves cleanup to the ``_tmp/`` lifecycle sweeper
+    (shared.storage.sweep_tmp_blobs)
+
+Usage:
+    handoff = ProductHandoff(generate_read_sas, generate_write_sas, upload_blob)
+    url = handoff(cutout_png)                       # upload_tmp_image callback
+    blob_path, url = handoff.publish(cutout_png)    # when the blob must persist
+"""
+import base64
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from shared.config import settings
+
+LOG = logging.getLogger(__name__)
+
+HANDOFF_CONTAINER = "outputs"
+HANDOFF_PREFIX = "_tmp/handoff"
+
+# A remembered URL is reused while it stays valid at least this long
+# (the provider fetches the image right after the request is sent)
+_URL_MARGIN_SECONDS = 120
+
+
+class ProductHandoff:
+    """Turns product image bytes into a URL a provider can fetch."""
+
+    def __init__(
+        self,
+        read_url: Callable[..., str],
+        write_url: Callable[..., str],
+        upload: Callable[..., None],
+        inline_max_bytes: Optional[int] = None,
+        url_minutes: int = 15,
+        max_entries: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._read_url = read_url
+        self._write_url = write_url
+        self._upload = upload
+        self.inline_max_bytes = (
+            settings.PRODUCT_INLINE_MAX_KB * 1024 if inline_max_bytes is None else inline_max_bytes
+        )
+        self.url_minutes = url_minutes
+        self.max_entries = max_entries
+        self._clock = clock
+        # digest -> (blob_path, url, valid_until)
+        self._urls: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self._guard = threading.Lock()
+        self._digest_locks: Dict[str, list] = {}
+        self.inlined = 0
+        self.uploads = 0
+        self.reused = 0
+
+    def __call__(self, image_bytes: bytes) -> str:
+        """URL for *image_bytes*: a data URI when small, else a signed blob URL."""
+        if len(image_bytes) <= self.inline_max_bytes:
+            self.inlined += 1
+            return "data:image/png;base64," + base64.b64encode(image_bytes).decode("ascii")
+        return self.publish(image_bytes)[1]
+
+    @contextmanager
+    def _digest_lock(self, digest: str) -> Iterator[None]:
+        # Refcounted so concurrent siblings wait for one upload instead of racing
+        with self._guard:
+            entry = self._digest_locks.setdefault(digest, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._digest_locks[digest]
+
+    def _cached(self, digest: str, min_valid_until: float) -> Optional[Tuple[str, str]]:
+        with self._guard:
+            entry = self._urls.get(digest)
+            if entry is None or entry[2] < min_valid_until:
+                return None
+            self._urls.move_to_end(digest)
+            return entry[0], entry[1]
+
+    def publish(self, image_bytes: bytes, expiry_minutes: Optional[int] = None) -> Tuple[str, str]:
+        """Store *image_bytes* (once per content) and return (blob_path, read URL).
+
+        With *expiry_minutes* the URL must stay valid that long (async
+        requests fetched later); a remembered URL expiring sooner triggers a
+        fresh upload + signature, which also resets the blob's sweep age.
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        if expiry_minutes:
+            # Sign with headroom so siblings submitted shortly after can reuse it
+            minutes = expiry_minutes + self.url_minutes
+            needed_until = self._clock() + expiry_minutes * 60
+        else:
+            minutes = self.url_minutes
+            needed_until = self._clock() + _URL_MARGIN_SECONDS
+
+        with self._digest_lock(digest):
+            cached = self._cached(digest, needed_until)
+            if cached is not None:
+                self.reused += 1
+                LOG.info("Reusing product handoff %s", cached[0])
+                return cached
+
+            blob_path = f"{HANDOFF_PREFIX}/{digest}.png"
+            self._upload(
+                self._write_url(container=HANDOFF_CONTAINER, blob_path=blob_path, expiry_minutes=15),
+                image_bytes, content_type="image/png",
+            )
+            url = self._read_url(container=HANDOFF_CONTAINER, blob_path=blob_path, expiry_minutes=minutes)
+            self.uploads += 1
+            LOG.info("Uploaded product handoff %s (%d bytes)", blob_path, len(image_bytes))
+
+            with self._guard:
+                self._urls[digest] = (blob_path, url, self._clock() + minutes * 60)
+                self._urls.move_to_end(digest)
+                while len(self._urls) > self.max_entries:
+                    self._urls.popitem(last=False)
+            return blob_path, url
@@ -0,0 +1,119 @@
+"""
+In-memory image handle passed between pipeline steps.
+
+Steps used to exchange encoded bytes, so a large image was decoded and
+re-encoded 4–6 times per item (BiRefNet PNG encode, detail preservation,
+compositing, Real-ESRGAN, watermark).  An ImageHandle wraps either the
+encoded bytes a remote provider returned or the PIL image a local step
+produced, and converts between the two lazily and at most once:
+
+    handle = ImageHandle.from_bytes(raw_bytes)
+    handle.size                      # header only, no full decode
+    handle.image                     # decoded once, then reused
+    ImageHandle.from_image(img).to_bytes(optimize=True)  # encoded on demand
+"""
+import hashlib
+from io import BytesIO
+from typing import Optional, Tuple, Union
+
+from PIL import Image
+
+from shared.output_encoding import OutputEncoding, encode_image
+
+
+class ImageHandle:
+    """Encoded bytes and/or a decoded PIL image, materialized on demand."""
+
+    __slots__ = ("_data", "_image", "_size")
+
+    def __init__(self, data: Optional[bytes] = None, image: Optional[Image.Image] = None):
+        if data is None and image is None:
+            raise ValueError("ImageHandle needs bytes or an image")
+        self._data = data
+        self._image = image
+        self._size: Optional[Tuple[int, int]] = image.size if image is not None else None
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ImageHandle":
+        return cls(data=data)
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> "ImageHandle":
+        return cls(image=image)
+
+    @classmethod
+    def wrap(cls, value: Union[bytes, Image.Image, "ImageHandle"]) -> "ImageHandle":
+        """Wrap a step result, whichever form the provider returned."""
+        if isinstance(value, ImageHandle):
+            return value
+        if isinstance(value, Image.Image):
+            return cls.from_image(value)
+        return cls.from_bytes(value)
+
+    @property
+    def image(self) -> Image.Image:
+        """The decoded image (decoded from bytes on first access).
+
+        Shared between readers — callers must copy (e.g. ``convert``)
+        before drawing on it.
+        """
+        if self._image is None:
+            img = Image.open(BytesIO(self._data))
+            img.load()
+            self._image = img
+            self._size = img.size
+        return self._image
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height), read from the header when not yet decoded."""
+        if self._size is None:
+            self._size = Image.open(BytesIO(self._data)).size
+        return self._size
+
+    @property
+    def is_encoded(self) -> bool:
+        return self._data is not None
+
+    def to_bytes(self, format: Optional[str] = None, **params) -> bytes:
+        """Encoded bytes.
+
+        Without *format* the source bytes are returned untouched when the
+        handle has them; otherwise the image is encoded (PNG by default) and
+        the result kept for later calls.  An explicit *format* always
+        re-encodes.
+        """
+        if format is None and self._data is not None:
+            return self._data
+        buf = BytesIO()
+        self.image.save(buf, format=format or "PNG", **params)
+        data = buf.getvalue()
+        if format is None:
+            self._data = data
+        return data
+
+    def encode(self, encoding: OutputEncoding) -> bytes:
+        """Encode with an output policy.
+
+        Source bytes already in the policy's (lossless) format are reused
+        as-is instead of being decoded and re-encoded.
+        """
+        if self._data is not None and encoding.lossless and self._source_format() == encoding.pil_format:
+            return self._data
+        return encode_image(self.image, encoding)
+
+    def _source_format(self) -> Optional[str]:
+        try:
+            return Image.open(BytesIO(self._data)).format
+        except Exception:
+            return None
+
+    def fingerprint(self) -> bytes:
+        """Content identity for cache keys: the source bytes when encoded,
+        otherwise a digest of mode, size and pixels (no encode needed)."""
+        if self._data is not None:
+            return self._data
+        img = self._image
+        h = hashlib.sha256(f"{img.mode}:{img.size[0]}x{img.size[1]}:".encode())
+        h.update(img.tobytes())
+        return h.digest()
@@ -0,0 +1,88 @@
+"""
+Per-job context shared by sibling items.
+
+Every item of a job needs the same brand profile, brand style context and
+watermark eligibility.  They used to be fetched separately for each item
+(scene prompt, watermark check and SEO each opened their own sessions);
+``JobContextCache`` loads them once per job (shared.db_sqlalchemy.
+get_job_context) and keeps them for ``ttl`` seconds, so fan-out items of
+one job hit the database once.  A failed load falls back to a context
+with no brand profile and no watermark (not cached, so the next item
+retries) rather than failing the item.
+
+Usage:
+    ctx = job_contexts.get(job_id, tenant_id)
+    if ctx.watermark: ...
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class JobContext:
+    job_id: str
+    tenant_id: str
+    brand_profile: Optional[Dict[str, Any]] = None
+    style_context: Optional[str] = None
+    watermark: bool = False
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "JobContext":
+        return cls(
+            job_id=record["job_id"],
+            tenant_id=record["tenant_id"],
+            brand_profile=record.get("brand_profile"),
+            style_context=record.get("style_context"),
+            watermark=bool(record.get("watermark")),
+        )
+
+
+class JobContextCache:
+    """Bounded TTL cache of JobContext keyed by job id."""
+
+    def __init__(self, loader: Callable[[str, str], Optional[Dict[str, Any]]],
+                 ttl: float = 300.0, max_entries: int = 512,
+                 clock: Callable[[], float] = time.monotonic):
+        self._loader = loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, job_id: str, tenant_id: str) -> JobContext:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry is not None and entry[0] > now and entry[1].tenant_id == tenant_id:
+                self._entries.move_to_end(job_id)
+                self.hits += 1
+                return entry[1]
+
+        # Loaded outside the lock; concurrent siblings may both load once
+        try:
+            record = self._loader(job_id, tenant_id)
+        except Exception as e:
+            LOG.warning("Job context lookup failed for %s, continuing without brand/watermark: %s",
+                        job_id, e)
+            return JobContext(job_id, tenant_id)
+        ctx = JobContext.from_record(record) if record else JobContext(job_id, tenant_id)
+        with self._lock:
+            self.loads += 1
+            self._entries[job_id] = (now + self.ttl, ctx)
+            self._entries.move_to_end(job_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return ctx
+
+    def invalidate(self, job_id: str) -> None:
+        with self._lock:
+            self._entries.pop(job_id, None)
@@ -2,8 +2,9 @@
 In-memory pipeline executor.
 
 Runs bg-removal -> scene-gen -> upscale in a single process with no
-intermediate blob storage or queue hops. Each step receives bytes and
-returns bytes.
+intermediate blob storage or queue hops. Steps pass an ImageHandle, so an
+image is decoded once and only encoded where bytes are actually needed
+(remote provider uploads, caches, the final output).
 
 Scene generation has two modes:
   • Legacy (FLUX-dev): generate background, then PIL-composite product on top
@@ -19,7 +20,11 @@ from typing import Optional, Callable
 from PIL import Image, ImageFilter
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+from shared.output_encoding import DEFAULT_POLICY, POLICIES, encode_image
+
+from pipeline_worker.image_handle import ImageHandle
 from pipeline_worker.retry import TransientError, PermanentError, classify_and_raise
+from pipeline_worker.stages import CPU, IO, stage_for_provider
 
 
 def _detect_image_size(image_bytes: bytes) -> str:
@@ -28,8 +33,10 @@ def _detect_image_size(image_bytes: bytes) -> str:
     Returns one of the fal.ai presets: square_hd, portrait_4_3, portrait_16_9,
     landscape_4_3, landscape_16_9.
     """
-    img = Image.open(BytesIO(image_bytes))
-    w, h = img.size
+    return _image_size_preset(*Image.open(BytesIO(image_bytes)).size)
+
+
+def _image_size_preset(w: int, h: int) -> str:
     ratio = w / h
 
     if ratio > 1.5:
@@ -48,16 +55,32 @@ LOG = logging.getLogger(__name__)
 
 @dataclass
 class PipelineResult:
-    output_bytes: bytes
+    output: ImageHandle
     error: Optional[str] = None
     failed_step: Optional[str] = None
     step_timings: dict = field(default_factory=dict)
+    # Set when the scene edit was queued at the provider: what submit_scene_edit
+    # returned plus the scene cache key.  ``output`` is then the cutout, and the
+    # item is finished later by resume_pipeline.
+    pending: Optional[dict] = None
+
+    @property
+    def output_bytes(self) -> bytes:
+        """Output as PNG (source bytes when unchanged). Workers encode with
+        their job's output policy via ``output.encode(...)`` instead."""
+        return self.output.to_bytes(compress_level=3)
 
 
 def composite_product_on_scene(product_png: bytes, scene_jpg: bytes) -> bytes:
     """Composite transparent product PNG onto generated scene background."""
-    product_img = Image.open(BytesIO(product_png)).convert('RGBA')
-    scene_img = Image.open(BytesIO(scene_jpg)).convert('RGBA')
+    result = composite_product_image(Image.open(BytesIO(product_png)), Image.open(BytesIO(scene_jpg)))
+    return encode_image(result, POLICIES[DEFAULT_POLICY])
+
+
+def composite_product_image(product: Image.Image, scene: Image.Image) -> Image.Image:
+    """Image-level compositing used between pipeline steps (no encode)."""
+    product_img = product.convert('RGBA')
+    scene_img = scene.convert('RGBA')
 
     max_width = int(scene_img.width * 0.6)
     max_height = int(scene_img.height * 0.6)
@@ -66,14 +89,21 @@ def composite_product_on_scene(product_png: bytes, scene_jpg: bytes) -> bytes:
     x = (scene_img.width - product_img.width) // 2
     y = (scene_img.height - product_img.height) // 2
     scene_img.paste(product_img, (x, y), product_img)
-
-    output = BytesIO()
-    scene_img.convert('RGB').save(output, format='PNG', optimize=True)
-    return output.getvalue()
+    return scene_img.convert('RGB')
 
 
 def _preserve_product_details(product_rgba_bytes: bytes, scene_bytes: bytes,
                                erode_px: int = 8, feather_px: int = 6) -> bytes:
+    """Bytes wrapper around _preserve_product_details_image."""
+    result = _preserve_product_details_image(
+        Image.open(BytesIO(product_rgba_bytes)), Image.open(BytesIO(scene_bytes)),
+        erode_px=erode_px, feather_px=feather_px,
+    )
+    return encode_image(result, POLICIES[DEFAULT_POLICY])
+
+
+def _preserve_product_details_image(product_img: Image.Image, scene_img: Image.Image,
+                                    erode_px: int = 8, feather_px: int = 6) -> Image.Image:
     """Composite original product pixels back onto the AI-generated scene.
 
     FLUX.2 Pro Edit produces great scenes but can corrupt fine details like
@@ -83,8 +113,8 @@ def _preserve_product_details(product_rgba_bytes: bytes, scene_bytes: bytes,
       - Edge pixels blend smoothly from original to FLUX's version,
         avoiding hard outline artifacts (especially visible on white products)
     """
-    product = Image.open(BytesIO(product_rgba_bytes)).convert("RGBA")
-    scene = Image.open(BytesIO(scene_bytes)).convert("RGBA")
+    product = product_img.convert("RGBA")
+    scene = scene_img.convert("RGBA")
 
     # Resize product to match scene dimensions (FLUX may change size)
     if product.size != scene.size:
@@ -102,17 +132,22 @@ def _preserve_product_details(product_rgba_bytes: bytes, scene_bytes: bytes,
 
     # Composite: scene as base, original product pixels pasted using feathered mask
     scene.paste(product, (0, 0), eroded_alpha)
+    return scene.convert("RGB")
 
-    output = BytesIO()
-    scene.convert("RGB").save(output, format="PNG", optimize=True)
-    return output.getvalue()
 
+def _run_step(step_name: str, fn, *args, timings: dict | None = None,
+              stages=None, stage: str = IO, **kwargs):
+    """Run a pipeline step with error classification and timing.
 
-def _run_step(step_name: str, fn, *args, timings: dict | None = None, **kwargs):
-    """Run a pipeline step with error classification and timing."""
+    When *stages* is given the step runs on that stage's pool (cpu / io);
+    otherwise it runs inline on the calling thread.
+    """
     t0 = time.monotonic()
     try:
-        result = fn(*args, **kwargs)
+        if stages is not None:
+            result = stages.run(stage, fn, *args, **kwargs)
+        else:
+            result = fn(*args, **kwargs)
         if timings is not None:
             timings[step_name] = round(time.monotonic() - t0, 2)
         return result
@@ -157,6 +192,79 @@ def _build_edit_prompt(scene_prompt: Optional[str], angle_type: Optional[str] =
     )
 
 
+def _accepts_images(provider) -> bool:
+    """Local providers that take/return PIL images skip the encode/decode."""
+    return getattr(provider, "accepts_images", False) is True
+
+
+def _provider_step(step_name: str, provider, image_fn: str, bytes_fn: str,
+                   source: ImageHandle, timings: dict, stages=None) -> ImageHandle:
+    """Call *provider* with a decoded image when it accepts one, else bytes."""
+    if _accepts_images(provider):
+        fn, arg = getattr(provider, image_fn), source.image
+    else:
+        fn, arg = getattr(provider, bytes_fn), source.to_bytes()
+    return ImageHandle.wrap(_run_step(
+        step_name, fn, arg, timings=timings, stages=stages, stage=stage_for_provider(provider),
+    ))
+
+
+def _through_store(run: Callable[[Callable[[], bytes]], bytes],
+                   compute: Callable[[], ImageHandle]) -> ImageHandle:
+    """Route *compute* through a bytes-level get-or-compute store.
+
+    On a miss the computed handle is returned as-is (still decoded); on a
+    hit the stored bytes are wrapped and decoded only if a later step needs
+    pixels.
+    """
+    computed = []
+
+    def _compute() -> bytes:
+        handle = compute()
+        computed.append(handle)
+        return handle.to_bytes()
+
+    data = run(_compute)
+    return computed[0] if computed else ImageHandle.from_bytes(data)
+
+
+def _cached_step(step_cache, step_name: str, source: ImageHandle, params: dict,
+                 compute: Callable[[], ImageHandle], timings: dict) -> ImageHandle:
+    """Run *compute* through *step_cache* when one is configured."""
+    if step_cache is None:
+        return compute()
+    return _through_store(
+        lambda fn: step_cache.run(step_name, source.fingerprint(), params, fn, timings), compute,
+    )
+
+
+def _preserve_details_step(product: ImageHandle, scene: ImageHandle, timings: dict,
+                           stages=None) -> ImageHandle:
+    """Composite original product pixels back to preserve text/labels/details."""
+    LOG.info("Step 2.5/3: Preserving product details (text, labels, patterns)")
+    return ImageHandle.from_image(_run_step(
+        "preserve_details", _preserve_product_details_image,
+        product.image, scene.image, timings=timings,
+        stages=stages, stage=CPU,
+    ))
+
+
+def _upscale_step(current: ImageHandle, upscale: bool, upscale_provider, upscale_enabled: bool,
+                  timings: dict, stages=None, step_cache=None) -> ImageHandle:
+    if upscale and upscale_provider and upscale_enabled:
+        LOG.info("Step 3/3: Upscaling (%s)", upscale_provider.name)
+        return _cached_step(
+            step_cache, "upscale", current, {"provider": upscale_provider.name},
+            lambda: _provider_step(
+                "upscale", upscale_provider, "upscale_image", "upscale",
+                current, timings, stages,
+            ),
+            timings,
+        )
+    LOG.info("Step 3/3: Upscaling — skipped")
+    return current
+
+
 @retry(
     retry=retry_if_exception_type(TransientError),
     stop=stop_after_attempt(3),
@@ -176,28 +284,59 @@ def execute_pipeline(
     saved_background_bytes: Optional[bytes] = None,
     upload_tmp_image: Optional[Callable[[bytes], str]] = None,
     angle_type: Optional[str] = None,
+    stages=None,
+    shared_cutout: Optional[Callable[[Callable[[], bytes]], bytes]] = None,
+    step_cache=None,
+    submit_scene_edit: Optional[Callable[[ImageHandle, str, dict], dict]] = None,
 ) -> PipelineResult:
     """
     Execute the full image processing pipeline in-memory.
 
-    Each enabled step transforms the image bytes sequentially.
-    No intermediate blobs are stored — data stays in memory between steps.
+    Each enabled step transforms the image sequentially.
+    No intermediate blobs are stored — the image stays decoded in memory
+    between steps and is encoded once, when result.output_bytes is read.
     Retries automatically on transient errors (network, 5xx).
 
     Args:
-        upload_tmp_image: Optional callback that uploads bytes to a
-            publicly-accessible URL and returns that URL. Required for
+        upload_tmp_image: Optional callback that turns the product bytes
+            into a URL the provider can fetch (inline data URI or a
+            signed blob URL, see pipeline_worker.handoff). Required for
             edit-mode providers (FLUX.2 Pro Edit) which need to receive
             the product image as a URL.
+        stages: Optional PipelineStages. Local model and PIL steps run on
+            its CPU pool, remote provider calls on its I/O pool, so
+            concurrent items overlap instead of each blocking a thread.
+        shared_cutout: Optional get-or-compute callback for the bg-removed
+            cutout.  Items fanned out from one source image pass the same
+            store so background removal runs once for all of them.
+        step_cache: Optional StepCache.  bg_removal, scene_edit and upscale
+            outputs are looked up by input hash + parameters first; a hit
+            skips the provider call.  Hit/miss counts land in step_timings.
+        submit_scene_edit: Optional callback ``(product, prompt, gen_kwargs)
+            -> dict`` that queues the edit-mode scene generation at the
+            provider instead of waiting for it.  On a cache miss the
+            pipeline stops there and returns ``result.pending``; the worker
+            finishes the item with resume_pipeline once the result arrives.
     """
-    current_bytes = raw_bytes
+    raw = ImageHandle.from_bytes(raw_bytes)
+    current = raw
     timings: dict[str, float] = {}
     pipeline_start = time.monotonic()
 
     # Step 1: Background removal
     if remove_background and bg_provider:
         LOG.info("Step 1/3: Background removal (%s)", bg_provider.name)
-        current_bytes = _run_step("bg_removal", bg_provider.remove_background, current_bytes, timings=timings)
+        def _remove_background():
+            return _cached_step(
+                step_cache, "bg_removal", raw, {"provider": bg_provider.name},
+                lambda: _provider_step(
+                    "bg_removal", bg_provider, "remove_background_image", "remove_background",
+                    raw, timings, stages,
+                ),
+                timings,
+            )
+
+        current = _through_store(shared_cutout, _remove_background) if shared_cutout else _remove_background()
     else:
         LOG.info("Step 1/3: Background removal — skipped")
 
@@ -215,37 +354,47 @@ def execute_pipeline(
             edit_prompt = _build_edit_prompt(scene_prompt, angle_type=angle_type)
 
             # Save bg-removed product for detail preservation after scene gen
-            product_rgba_bytes = current_bytes
+            product = current
 
             # Match output dimensions to input image orientation
-            image_size = _detect_image_size(raw_bytes)
+            image_size = _image_size_preset(*raw.size)
             LOG.info("Detected input orientation → image_size=%s", image_size)
 
-            # Upload bg-removed product so the API can fetch it
-            if upload_tmp_image:
-                product_url = _run_step(
-                    "upload_product", upload_tmp_image, current_bytes, timings=timings,
+            def _scene_edit():
+                # Upload bg-removed product so the API can fetch it
+                if upload_tmp_image:
+                    product_url = _run_step(
+                        "upload_product", upload_tmp_image, product.to_bytes(), timings=timings,
+                        stages=stages, stage=IO,
+                    )
+                    gen_kwargs = {"image_urls": [product_url], "image_size": image_size}
+                else:
+                    LOG.warning("No upload_tmp_image callback — edit mode without image reference")
+                    gen_kwargs = {"image_size": image_size}
+
+                return ImageHandle.from_bytes(_run_step(
+                    "scene_edit", img_gen_provider.generate, edit_prompt, timings=timings,
+                    stages=stages, stage=IO, **gen_kwargs,
+                ))
+
+            # Never cached: each scene of a job (and each re-run) is a new
+            # generation, while siblings share the same cutout and prompt
+            if submit_scene_edit is not None:
+                pending = _run_step(
+                    "scene_submit", submit_scene_edit, product, edit_prompt,
+                    {"image_size": image_size}, timings=timings, stages=stages, stage=IO,
                 )
-                gen_kwargs = {"image_urls": [product_url], "image_size": image_size}
-            else:
-                LOG.warning("No upload_tmp_image callback — edit mode without image reference")
-                gen_kwargs = {"image_size": image_size}
-
-            current_bytes = _run_step(
-                "scene_edit", img_gen_provider.generate, edit_prompt, timings=timings, **gen_kwargs,
-            )
+                timings["total"] = round(time.monotonic() - pipeline_start, 2)
+                LOG.info("Scene edit queued (%s) — pipeline parked", pending.get("request_id"))
+                return PipelineResult(output=product, step_timings=timings, pending=pending)
+            current = _scene_edit()
 
-            # Composite original product pixels back to preserve text/labels/details
-            LOG.info("Step 2.5/3: Preserving product details (text, labels, patterns)")
-            current_bytes = _run_step(
-                "preserve_details", _preserve_product_details,
-                product_rgba_bytes, current_bytes, timings=timings,
-            )
+            current = _preserve_details_step(product, current, timings, stages)
         else:
             # --- Legacy mode: generate background, then PIL composite -----
             if saved_background_bytes:
                 LOG.info("Step 2/3: Using saved background image (%d bytes)", len(saved_background_bytes))
-                scene_bytes = saved_background_bytes
+                scene = ImageHandle.from_bytes(saved_background_bytes)
             else:
                 LOG.info("Step 2/3: Scene generation (%s)", img_gen_provider.name)
                 prompt = scene_prompt or (
@@ -267,19 +416,59 @@ def execute_pipeline(
                         gen_kwargs["fal_endpoint"] = fal_ep
                 except Exception:
                     pass
-                scene_bytes = _run_step("scene_gen", img_gen_provider.generate, prompt, timings=timings, **gen_kwargs)
-            current_bytes = _run_step("composite", composite_product_on_scene, current_bytes, scene_bytes, timings=timings)
+                scene = ImageHandle.from_bytes(_run_step(
+                    "scene_gen", img_gen_provider.generate, prompt, timings=timings,
+                    stages=stages, stage=IO, **gen_kwargs,
+                ))
+            current = ImageHandle.from_image(_run_step(
+                "composite", composite_product_image, current.image, scene.image, timings=timings,
+                stages=stages, stage=CPU,
+            ))
     else:
         LOG.info("Step 2/3: Scene generation — skipped")
 
     # Step 3: Upscaling
-    if upscale and upscale_provider and upscale_enabled:
-        LOG.info("Step 3/3: Upscaling (%s)", upscale_provider.name)
-        current_bytes = _run_step("upscale", upscale_provider.upscale, current_bytes, timings=timings)
-    else:
-        LOG.info("Step 3/3: Upscaling — skipped")
+    current = _upscale_step(current, upscale, upscale_provider, upscale_enabled,
+                            timings, stages, step_cache)
 
     timings["total"] = round(time.monotonic() - pipeline_start, 2)
     LOG.info("Pipeline timings: %s", timings)
 
-    return PipelineResult(output_bytes=current_bytes, step_timings=timings)
+    return PipelineResult(output=current, step_timings=timings)
+
+
+@retry(
+    retry=retry_if_exception_type(TransientError),
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(min=2, max=30),
+    reraise=True,
+)
+def resume_pipeline(
+    product_bytes: bytes,
+    scene_bytes: bytes,
+    upscale: bool,
+    upscale_provider=None,
+    upscale_enabled: bool = True,
+    stages=None,
+    step_cache=None,
+    timings: Optional[dict] = None,
+) -> PipelineResult:
+    """Finish a pipeline whose scene edit ran asynchronously.
+
+    Picks up where execute_pipeline parked: detail preservation with the
+    cutout, then upscaling.  *timings* are the step timings recorded before
+    the submit; ``total`` adds the resumed part (time spent queued at the
+    provider is left to the caller).
+    """
+    timings = dict(timings or {})
+    resume_start = time.monotonic()
+    product = ImageHandle.from_bytes(product_bytes)
+
+    current = _preserve_details_step(product, ImageHandle.from_bytes(scene_bytes), timings, stages)
+    current = _upscale_step(current, upscale, upscale_provider, upscale_enabled,
+                            timings, stages, step_cache)
+
+    timings["total"] = round(timings.get("total", 0) + time.monotonic() - resume_start, 2)
+    LOG.info("Resumed pipeline timings: %s", timings)
+
+    return PipelineResult(output=current, step_timings=timings)
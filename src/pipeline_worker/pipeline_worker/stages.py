@@ -0,0 +1,163 @@
+"""
+Stage pools for pipelined item execution.
+
+Without stages every item runs bg-removal -> scene-gen -> upscale as one
+blocking chain on its worker thread, so the CPU-bound model steps
+(BiRefNet, Real-ESRGAN, compositing) sit idle while fal.ai is generating.
+
+With stages each step is handed to the pool that matches its cost:
+  • cpu  — local model inference and PIL work, sized to the core count
+  • io   — remote provider calls and uploads, sized for many waiting calls
+
+Items flow between stages through bounded queues: submitting to a full
+stage blocks the item's thread until a slot frees up (backpressure), so
+item B's bg-removal occupies the CPU while item A waits on FLUX.
+
+An item runs one step at a time, so a stage never has more than
+WORKER_CONCURRENCY items in it.  Stage sizes are derived from it (io: one
+worker per in-flight item, cpu: that or the core count, whichever is
+smaller) and explicit sizes above it are capped; the queue only comes
+into play for a stage smaller than WORKER_CONCURRENCY.
+
+Each stage tracks busy time, so utilization per stage can be reported:
+    stages = PipelineStages.from_settings()
+    result = execute_pipeline(..., stages=stages)
+    stages.snapshot()  # {'cpu': {'utilization': 0.93, ...}, 'io': {...}}
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from shared.config import settings
+
+LOG = logging.getLogger(__name__)
+
+CPU = "cpu"
+IO = "io"
+
+
+class Stage:
+    """A fixed-size pool fronted by a bounded queue."""
+
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"stage-{name}")
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._reset_counters()
+
+    def _reset_counters(self) -> None:
+        self._window_start = time.monotonic()
+        self._busy_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._tasks = 0
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run *fn* on this stage's pool and block until it returns.
+
+        Blocks before submitting when the stage already holds
+        ``workers + queue_size`` items.
+        """
+        self._slots.acquire()
+        try:
+            with self._lock:
+                self._queued += 1
+            return self._pool.submit(self._timed, time.monotonic(), fn, args, kwargs).result()
+        finally:
+            self._slots.release()
+
+    def _timed(self, enqueued_at: float, fn: Callable, args, kwargs) -> Any:
+        started = time.monotonic()
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._wait_seconds += started - enqueued_at
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._busy_seconds += time.monotonic() - started
+                self._tasks += 1
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Any]:
+        """Utilization since the last reset: busy time / (workers x elapsed)."""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._window_start, 1e-9)
+            stats = {
+                "workers": self.workers,
+                "active": self._active,
+                "queued": self._queued,
+                "tasks": self._tasks,
+                "utilization": round(min(self._busy_seconds / (self.workers * elapsed), 1.0), 3),
+                "avg_wait_s": round(self._wait_seconds / self._tasks, 3) if self._tasks else 0.0,
+            }
+            if reset:
+                self._reset_counters()
+        return stats
+
+
+def _stage_size(name: str, configured: int, default: int, in_flight: int) -> int:
+    """Configured size (0 = *default*), capped at the items that can be in flight."""
+    if configured > in_flight:
+        LOG.warning("Stage %s: %d workers but WORKER_CONCURRENCY=%d items in flight — using %d",
+                    name, configured, in_flight, in_flight)
+        return in_flight
+    return configured or default
+
+
+class PipelineStages:
+    """CPU and I/O stages shared by every item a worker processes."""
+
+    def __init__(self, cpu_workers: int, io_workers: int, queue_size: int):
+        self.stages = {
+            CPU: Stage(CPU, cpu_workers, queue_size),
+            IO: Stage(IO, io_workers, queue_size),
+        }
+
+    @classmethod
+    def from_settings(cls) -> "PipelineStages":
+        in_flight = max(1, settings.WORKER_CONCURRENCY)
+        cores = os.cpu_count() or 1
+        return cls(
+            cpu_workers=_stage_size(CPU, settings.PIPELINE_CPU_WORKERS, min(cores, in_flight), in_flight),
+            io_workers=_stage_size(IO, settings.PIPELINE_IO_WORKERS, in_flight, in_flight),
+            queue_size=settings.PIPELINE_STAGE_QUEUE_SIZE,
+        )
+
+    def run(self, stage: str, fn: Callable, *args, **kwargs) -> Any:
+        return self.stages[stage].run(fn, *args, **kwargs)
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        return {name: stage.snapshot(reset=reset) for name, stage in self.stages.items()}
+
+    def start_reporter(self, interval: int = 60) -> Optional[threading.Thread]:
+        """Log per-stage utilization every *interval* seconds (0 disables)."""
+        if interval <= 0:
+            return None
+
+        def _report():
+            while True:
+                time.sleep(interval)
+                for name, s in self.snapshot(reset=True).items():
+                    LOG.info(
+                        "Stage %s: utilization=%.0f%% tasks=%d active=%d/%d queued=%d avg_wait=%.2fs",
+                        name, s["utilization"] * 100, s["tasks"], s["active"],
+                        s["workers"], s["queued"], s["avg_wait_s"],
+                    )
+
+        thread = threading.Thread(target=_report, daemon=True, name="stage-reporter")
+        thread.start()
+        return thread
+
+
+def stage_for_provider(provider) -> str:
+    """Local model providers run on the CPU stage, remote APIs on the I/O stage."""
+    return CPU if getattr(provider, "runs_locally", False) is True else IO
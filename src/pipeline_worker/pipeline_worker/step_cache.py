@@ -0,0 +1,166 @@
+"""
+Per-tenant content-addressed cache of pipeline step outputs.
+
+Customers re-upload the same product shots and catalog re-runs re-process
+unchanged images.  Each cacheable step (bg_removal, upscale) is keyed by
+sha256 over the step name, its input bytes and the parameters that change
+its output (provider).  Scene generation is not cached: it is not
+deterministic, and every scene of a job (and every re-run) is meant to be
+a new image even though siblings share one cutout and prompt.  Outputs
+are stored in the outputs container under ``{tenant}/cache/{step}/{key}``
+and indexed in ``step_cache_entries`` with a TTL; a hit skips the provider
+call entirely.
+
+Lookups are read-only.  Hits are counted in memory and written in one
+statement by ``flush_step_cache_hits`` (every STEP_CACHE_HIT_FLUSH_SECONDS);
+expired and over-cap entries are evicted by the worker every
+STEP_CACHE_EVICT_INTERVAL_MINUTES.
+
+Usage:
+    cache = StepCache(tenant_id, generate_read_sas, generate_write_sas, download_blob, upload_blob)
+    result = execute_pipeline(..., step_cache=cache)
+    result.step_timings  # {..., 'cache_hits': 1, 'cache_misses': 2}
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from shared.config import settings
+from shared.db_sqlalchemy import get_step_cache_entry, put_step_cache_entry, record_step_cache_hits
+from shared.storage import build_step_cache_blob_path
+
+LOG = logging.getLogger(__name__)
+
+CACHE_CONTAINER = "outputs"
+
+
+def step_cache_key(step: str, input_bytes: bytes, params: Dict[str, Any]) -> str:
+    """sha256 over the step name, its parameters and its input bytes."""
+    h = hashlib.sha256()
+    h.update(step.encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    h.update(input_bytes)
+    return h.hexdigest()
+
+
+class HitBuffer:
+    """Hit count and latest hit time per (tenant, key), written in batches."""
+
+    def __init__(self, writer: Callable[[Dict[tuple, tuple]], Any]):
+        self._writer = writer
+        self._pending: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def record(self, tenant_id: str, key: str, when: Optional[datetime] = None) -> None:
+        when = when or datetime.utcnow()
+        with self._lock:
+            n, last = self._pending.get((tenant_id, key), (0, when))
+            self._pending[(tenant_id, key)] = (n + 1, max(last, when))
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of entries written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            self._writer(pending)
+        except Exception:
+            LOG.warning("Writing %d step cache hit(s) failed, retrying next flush",
+                        len(pending), exc_info=True)
+            with self._lock:
+                for entry, (n, when) in pending.items():
+                    m, last = self._pending.get(entry, (0, when))
+                    self._pending[entry] = (n + m, max(last, when))
+            return 0
+        return len(pending)
+
+
+_hits = HitBuffer(record_step_cache_hits)
+
+
+def flush_step_cache_hits() -> int:
+    """Write this process's buffered cache hits."""
+    return _hits.flush()
+
+
+class StepCache:
+    """Get-or-compute cache of step outputs for a single tenant."""
+
+    def __init__(
+        self,
+        tenant_id: str,
+        read_url: Callable[..., str],
+        write_url: Callable[..., str],
+        download: Callable[[str], bytes],
+        upload: Callable[[str, bytes], None],
+        ttl_days: Optional[int] = None,
+        lookup: Callable[[str, str], Optional[str]] = get_step_cache_entry,
+        record: Callable[..., None] = put_step_cache_entry,
+        hits: Optional[HitBuffer] = None,
+    ):
+        self.tenant_id = tenant_id
+        self._read_url = read_url
+        self._write_url = write_url
+        self._download = download
+        self._upload = upload
+        self.ttl_days = settings.STEP_CACHE_TTL_DAYS if ttl_days is None else ttl_days
+        self._lookup = lookup
+        self._record = record
+        self._hits = _hits if hits is None else hits
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Cached output for *key*, or None on a miss or unreadable entry."""
+        try:
+            blob_path = self._lookup(self.tenant_id, key)
+            if not blob_path:
+                return None
+            data = self._download(self._read_url(container=CACHE_CONTAINER, blob_path=blob_path))
+            self._hits.record(self.tenant_id, key)
+            return data
+        except Exception as e:
+            LOG.warning("Step cache read failed for %s: %s", key[:12], e)
+            return None
+
+    def put(self, step: str, key: str, data: bytes) -> None:
+        """Store *data* for *key*; failures only cost a future miss."""
+        try:
+            blob_path = build_step_cache_blob_path(self.tenant_id, step, key)
+            self._upload(self._write_url(container=CACHE_CONTAINER, blob_path=blob_path), data)
+            self._record(self.tenant_id, key, step, blob_path, len(data), self.ttl_days)
+        except Exception as e:
+            LOG.warning("Step cache write failed for %s: %s", key[:12], e)
+
+    def lookup(self, step: str, input_bytes: bytes, params: Dict[str, Any],
+               timings: Optional[dict] = None) -> Tuple[str, Optional[bytes]]:
+        """(key, cached output or None), counting the hit or miss in *timings*.
+
+        Callers that produce the output later (async scene edits) keep the
+        key and ``put`` the result once it arrives.
+        """
+        key = step_cache_key(step, input_bytes, params)
+        cached = self.get(key)
+        counter = "cache_hits" if cached is not None else "cache_misses"
+        if cached is not None:
+            LOG.info("Step cache hit: %s %s", step, key[:12])
+        if timings is not None:
+            timings[counter] = timings.get(counter, 0) + 1
+        return key, cached
+
+    def run(self, step: str, input_bytes: bytes, params: Dict[str, Any],
+            compute: Callable[[], bytes], timings: Optional[dict] = None) -> bytes:
+        """Return the cached output of *step* or compute and store it.
+
+        Hit/miss counts are accumulated in *timings* as ``cache_hits`` and
+        ``cache_misses``.
+        """
+        key, cached = self.lookup(step, input_bytes, params, timings)
+        if cached is not None:
+            return cached
+
+        output = compute()
+        self.put(step, key, output)
+        return output
@@ -5,11 +5,11 @@ Reads from the 'jobs' queue and processes each item through the full
 pipeline (bg-removal -> scene-gen -> upscale) in a single process.
 Replaces the orchestrator + bg_removal_worker + scene_worker + upscale_worker.
 """
-import json
-import time
+import functools
 import logging
 import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import time
+from datetime import datetime
 
 # Shim: basicsr imports torchvision.transforms.functional_tensor which was
 # removed in torchvision 0.17+.  Re-export from functional to keep it working.
@@ -29,27 +29,45 @@ except (ModuleNotFoundError, ImportError):
     except ImportError:
         pass  # torchvision not installed (e.g. test environment)
 
-from azure.servicebus import ServiceBusReceiveMode, AutoLockRenewer
-
 from shared.config import settings
 from shared.db import SessionLocal
-from shared.models import Job, JobItem, JobStatus, ItemStatus, User
-from shared.storage import build_output_blob_path
-from shared.pipeline import ProcessingOptions, finalize_job_status, mark_item_failed
+from shared.models import JobItem, ItemStatus
+from shared.storage import build_output_blob_path, sweep_tmp_blobs
+from shared.pipeline import ProcessingOptions, complete_item, mark_item_failed, request_missing_exports
 from shared.scene_types import SCENE_PROMPTS
-from shared.db_sqlalchemy import get_brand_profile, get_job_by_id as get_job_record, get_brand_style_context, get_user_subscription
+from shared.db_sqlalchemy import (
+    claim_job_item,
+    claim_provider_request,
+    claim_provider_resume,
+    enqueue_blob_deletions,
+    evict_step_cache_entries,
+    get_job_context,
+    list_pending_provider_requests,
+    park_item_for_provider,
+)
+from shared.blob_deletion import blob_deleter_from_settings
+from shared.output_encoding import resolve_output_encoding
+from shared.previews import ensure_preview, parse_widths
 from shared.util import new_id
+from shared.worker_runtime import QueueWorker, start_health_server
 
 from pipeline_worker.clients import (
     servicebus_client,
+    blob_service_client,
     generate_read_sas,
     generate_write_sas,
     download_blob,
     upload_blob,
-    send_export_message,
+    send_job_message,
 )
-from pipeline_worker.pipeline import execute_pipeline
-from pipeline_worker.retry import TransientError, PermanentError
+from pipeline_worker.cutouts import SharedCutoutStore
+from pipeline_worker.handoff import ProductHandoff
+from pipeline_worker.image_handle import ImageHandle
+from pipeline_worker.job_context import JobContext, JobContextCache
+from pipeline_worker.pipeline import execute_pipeline, resume_pipeline
+from pipeline_worker.retry import TransientError, PermanentError, classify_and_raise
+from pipeline_worker.stages import PipelineStages
+from pipeline_worker.step_cache import StepCache, flush_step_cache_hits
 
 LOG = logging.getLogger(__name__)
 
@@ -58,27 +76,18 @@ bg_provider = None
 img_gen_provider = None
 upscale_provider = None
 
+# CPU / I/O stage pools shared by all in-flight items (initialized in main)
+stages = None
 
-class HealthHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path in ('/healthz', '/readyz', '/livez', '/'):
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'OK')
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def log_message(self, format, *args):
-        pass
+# bg-removed cutouts shared by items fanned out from one source image
+cutout_store = SharedCutoutStore(generate_read_sas, generate_write_sas, download_blob, upload_blob)
 
+# Edit-mode product images handed to the provider (inline or one upload per content)
+product_handoff = ProductHandoff(generate_read_sas, generate_write_sas, upload_blob)
+blob_deleter = blob_deleter_from_settings(client=blob_service_client)
 
-def start_health_server(port=8080):
-    server = HTTPServer(('0.0.0.0', port), HealthHandler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    LOG.info('Health server started on port %d', port)
+# Brand profile / style / watermark eligibility, loaded once per job
+job_contexts = JobContextCache(get_job_context, ttl=settings.JOB_CONTEXT_TTL)
 
 
 CATEGORY_SURFACES = {
@@ -95,37 +104,16 @@ CATEGORY_SURFACES = {
 }
 
 
-def _resolve_scene_prompt(item_scene_prompt, item_scene_type, job_id, tenant_id, item_id):
+def _resolve_scene_prompt(item_scene_prompt, item_scene_type, ctx: JobContext, item_id):
     """Build scene prompt: item.scene_prompt -> scene_type lookup -> brand profile -> default."""
     if item_scene_prompt:
         LOG.info("Using item scene_prompt for item=%s", item_id)
         return item_scene_prompt
 
+    bp = ctx.brand_profile
     if item_scene_type and item_scene_type in SCENE_PROMPTS:
         parts = [SCENE_PROMPTS[item_scene_type]]
-        job_record = get_job_record(job_id, tenant_id)
-        if job_record and job_record.get("brand_profile_id") and job_record["brand_profile_id"] != "default":
-            bp = get_brand_profile(job_record["brand_profile_id"], tenant_id)
-            if bp:
-                if bp.get("product_category"):
-                    surface = CATEGORY_SURFACES.get(bp["product_category"], "plain flat surface")
-                    parts.append(surface)
-                if bp.get("style_keywords"):
-                    parts.append(", ".join(bp["style_keywords"]))
-                if bp.get("mood"):
-                    parts.append(bp["mood"])
-        parts.append("completely bare scene, nothing on the surface, shallow depth of field")
-        prompt = ", ".join(parts)
-        LOG.info("Scene type prompt for item=%s type=%s", item_id, item_scene_type)
-        return prompt
-
-    job_record = get_job_record(job_id, tenant_id)
-    if job_record and job_record.get("brand_profile_id") and job_record["brand_profile_id"] != "default":
-        bp = get_brand_profile(job_record["brand_profile_id"], tenant_id)
         if bp:
-            parts = []
-            if bp.get("default_scene_prompt"):
-                parts.append(bp["default_scene_prompt"])
             if bp.get("product_category"):
                 surface = CATEGORY_SURFACES.get(bp["product_category"], "plain flat surface")
                 parts.append(surface)
@@ -133,59 +121,69 @@ def _resolve_scene_prompt(item_scene_prompt, item_scene_type, job_id, tenant_id,
                 parts.append(", ".join(bp["style_keywords"]))
             if bp.get("mood"):
                 parts.append(bp["mood"])
-            # Add style context from reference images
-            style_ctx = get_brand_style_context(job_record["brand_profile_id"], tenant_id)
-            if style_ctx:
-                parts.append(style_ctx)
-            parts.append("completely bare scene, nothing on the surface, shallow depth of field")
-            prompt = ", ".join(parts)
-            LOG.info("Brand prompt for job=%s", job_id)
-            return prompt
+        parts.append("completely bare scene, nothing on the surface, shallow depth of field")
+        prompt = ", ".join(parts)
+        LOG.info("Scene type prompt for item=%s type=%s", item_id, item_scene_type)
+        return prompt
+
+    if bp:
+        parts = []
+        if bp.get("default_scene_prompt"):
+            parts.append(bp["default_scene_prompt"])
+        if bp.get("product_category"):
+            surface = CATEGORY_SURFACES.get(bp["product_category"], "plain flat surface")
+            parts.append(surface)
+        if bp.get("style_keywords"):
+            parts.append(", ".join(bp["style_keywords"]))
+        if bp.get("mood"):
+            parts.append(bp["mood"])
+        # Add style context from reference images
+        if ctx.style_context:
+            parts.append(ctx.style_context)
+        parts.append("completely bare scene, nothing on the surface, shallow depth of field")
+        prompt = ", ".join(parts)
+        LOG.info("Brand prompt for job=%s", ctx.job_id)
+        return prompt
 
     return None
 
 
-def _upload_tmp_image(image_bytes: bytes) -> str:
-    """Upload image bytes to a temporary blob and return a SAS-signed read URL.
+def _supports_async(provider) -> bool:
+    return getattr(provider, "supports_async", False) is True
+
+
+def _scene_submitter(provider):
+    """submit_scene_edit callback: queue the edit at the provider.
 
-    Used by edit-mode providers (FLUX.2 Pro Edit) that need a publicly
-    accessible URL for the product image.
+    The cutout is always published as a blob (never inlined): it serves
+    both the provider's fetch and the resume, so the SAS stays valid for
+    the whole async timeout.
     """
-    blob_path = f"_tmp/{new_id('tmp')}.png"
-    write_url = generate_write_sas(container="outputs", blob_path=blob_path, expiry_minutes=15)
-    upload_blob(write_url, image_bytes)
-    read_url = generate_read_sas(container="outputs", blob_path=blob_path, expiry_minutes=15)
-    LOG.info("Uploaded tmp image for edit mode: %s", blob_path)
-    return read_url
-
-
-def _should_watermark(data: dict) -> bool:
-    """Check if this job should get a watermark (free-tier user with no subscription)."""
-    tenant_id = data.get('tenant_id', '')
-    # Look up user by tenant_id to check subscription status
-    try:
-        with SessionLocal() as s:
-            user = s.query(User).filter(User.tenant_id == tenant_id).first()
-            if not user:
-                return False  # API key users or unknown — no watermark
-            # Users with active subscription skip watermark
-            sub = get_user_subscription(user.id)
-            if sub and sub.get('status') == 'active':
-                return False
-            # Users with meaningful token balance (purchased tokens) skip watermark
-            if user.token_balance > 0:
-                return False
-            return True
-    except Exception as e:
-        LOG.warning("Watermark check failed (skipping watermark): %s", e)
-        return False
+    def submit(product: ImageHandle, prompt: str, gen_kwargs: dict) -> dict:
+        expiry = settings.SCENE_GEN_ASYNC_TIMEOUT // 60 + 15
+        blob_path, product_url = product_handoff.publish(product.to_bytes(), expiry_minutes=expiry)
+        request_id = provider.submit(
+            prompt, image_urls=[product_url],
+            webhook_url=settings.SCENE_GEN_WEBHOOK_URL or None, **gen_kwargs,
+        )
+        return {"request_id": request_id, "provider": provider.name, "product_blob_path": blob_path}
+    return submit
+
+
+def _step_cache(tenant_id: str):
+    if not settings.STEP_CACHE_ENABLED:
+        return None
+    return StepCache(tenant_id, generate_read_sas, generate_write_sas, download_blob, upload_blob)
 
 
 def process_message(data: dict) -> None:
+    if data.get('resume_request_id'):
+        _resume_item(data)
+        return
+
     tenant_id = data['tenant_id']
     job_id = data['job_id']
     item_id = data['item_id']
-    correlation_id = data.get('correlation_id', '')
 
     opts = ProcessingOptions.from_dict(data.get('processing_options', {}))
 
@@ -194,40 +192,20 @@ def process_message(data: dict) -> None:
         job_id, item_id, opts.remove_background, opts.generate_scene, opts.upscale,
     )
 
-    # Validate item exists and isn't already done or cancelled
-    with SessionLocal() as s:
-        item = s.get(JobItem, item_id)
-        if not item:
-            LOG.warning('Item not found: %s', item_id)
-            return
-        if item.status == ItemStatus.completed:
-            LOG.info('Item already completed, skipping: %s', item_id)
-            return
-        if item.status == ItemStatus.failed:
-            LOG.info('Item already failed/cancelled, skipping: %s', item_id)
-            return
-        # Check if the parent job was cancelled
-        job = s.get(Job, job_id)
-        if job and job.status in (JobStatus.failed, JobStatus.partial):
-            LOG.info('Job %s already terminated (status=%s), skipping item %s', job_id, job.status.value, item_id)
-            return
-        if not item.raw_blob_path:
-            LOG.error('Missing raw_blob_path: %s', item_id)
-            item.status = ItemStatus.failed
-            item.error_message = 'Missing raw_blob_path'
-            s.commit()
-            return
+    # Validate item + job and mark the item processing (one round trip)
+    claimed = claim_job_item(item_id)
+    if claimed is None:
+        return
+    raw_blob_path = claimed['raw_blob_path']
+    item_angle_type = claimed['angle_type']
+    is_fan_out = claimed['is_fan_out']
 
-        raw_blob_path = item.raw_blob_path
-        item_scene_prompt = item.scene_prompt
-        item_scene_type = item.scene_type
-        item_angle_type = item.angle_type
-        item.status = ItemStatus.processing
-        s.commit()
+    # Brand profile, style context and watermark eligibility, shared by siblings
+    ctx = job_contexts.get(job_id, tenant_id)
 
     # Resolve scene prompt
     scene_prompt = _resolve_scene_prompt(
-        item_scene_prompt, item_scene_type, job_id, tenant_id, item_id
+        claimed['scene_prompt'], claimed['scene_type'], ctx, item_id
     )
 
     # Download raw image (single blob read for the entire pipeline)
@@ -247,6 +225,18 @@ def process_message(data: dict) -> None:
     # Resolve scene-gen provider per-job (admin toggle can change at runtime)
     active_img_gen = _resolve_img_gen_provider()
 
+    # Sibling scenes/angles of one source image share its cutout
+    shared_cutout = None
+    if is_fan_out and opts.remove_background:
+        shared_cutout = functools.partial(cutout_store.get_or_create, raw_blob_path)
+
+    step_cache = _step_cache(tenant_id)
+
+    # Async mode: queue the scene edit and free this slot instead of waiting
+    submit_scene_edit = None
+    if settings.SCENE_GEN_ASYNC and _supports_async(active_img_gen):
+        submit_scene_edit = _scene_submitter(active_img_gen)
+
     # Execute full pipeline in-memory
     result = execute_pipeline(
         raw_bytes=raw_bytes,
@@ -259,25 +249,55 @@ def process_message(data: dict) -> None:
         upscale_provider=upscale_provider,
         upscale_enabled=settings.UPSCALE_ENABLED,
         saved_background_bytes=saved_background_bytes,
-        upload_tmp_image=_upload_tmp_image,
+        upload_tmp_image=product_handoff,
         angle_type=item_angle_type,
+        stages=stages,
+        shared_cutout=shared_cutout,
+        step_cache=step_cache,
+        submit_scene_edit=submit_scene_edit,
     )
 
+    if result.pending:
+        park_item_for_provider(item_id, result.pending['request_id'], {
+            **result.pending,
+            'timings': result.step_timings,
+            'message': data,
+        })
+        LOG.info('Item %s parked on %s request %s', item_id,
+                 result.pending['provider'], result.pending['request_id'])
+        return
+
+    _complete_item(data, result.output, result.step_timings, ctx=ctx)
+
+
+def _complete_item(data: dict, output: ImageHandle, step_timings: dict,
+                   ctx: JobContext | None = None) -> None:
+    """Watermark, encode and upload the final image, then mark the item completed."""
+    tenant_id = data['tenant_id']
+    job_id = data['job_id']
+    item_id = data['item_id']
+    opts = ProcessingOptions.from_dict(data.get('processing_options', {}))
+    if ctx is None:
+        ctx = job_contexts.get(job_id, tenant_id)
+
     # Apply watermark for free-tier users (no subscription, low balance)
-    output_bytes = result.output_bytes
-    if _should_watermark(data):
+    if ctx.watermark:
         try:
-            from shared.watermark import apply_watermark
-            output_bytes = apply_watermark(output_bytes)
+            from shared.watermark import watermark_image
+            output = ImageHandle.from_image(watermark_image(output.image))
             LOG.info("Watermark applied for free-tier user")
         except Exception as e:
             LOG.warning("Watermark failed (using original): %s", e)
 
+    # Single encode of the final image, in the job's output format
+    encoding = resolve_output_encoding(opts.output_format, tenant_id)
+    output_bytes = output.encode(encoding)
+
     # Upload final output (single blob write)
     out_id = new_id('out')
-    out_path = build_output_blob_path(tenant_id, job_id, item_id, f'{out_id}.png')
+    out_path = build_output_blob_path(tenant_id, job_id, item_id, f'{out_id}.{encoding.extension}')
     out_sas = generate_write_sas(container='outputs', blob_path=out_path)
-    upload_blob(out_sas, output_bytes)
+    upload_blob(out_sas, output_bytes, content_type=encoding.content_type)
     LOG.info('Uploaded final output: %s (%d bytes)', out_path, len(output_bytes))
 
     # Generate SEO metadata (non-blocking — failures don't break the pipeline)
@@ -285,19 +305,12 @@ def process_message(data: dict) -> None:
     seo_filename = None
     try:
         from shared.seo_metadata import generate_seo_metadata
-        brand_name = None
-        product_category = None
-        job_record = get_job_record(job_id, tenant_id)
-        if job_record and job_record.get("brand_profile_id") and job_record["brand_profile_id"] != "default":
-            bp = get_brand_profile(job_record["brand_profile_id"], tenant_id)
-            if bp:
-                brand_name = bp.get("name")
-                product_category = bp.get("product_category")
+        bp = ctx.brand_profile or {}
         seo = generate_seo_metadata(
             output_bytes,
             data.get("filename", "product.jpg"),
-            brand_name=brand_name,
-            product_category=product_category,
+            brand_name=bp.get("name"),
+            product_category=bp.get("product_category"),
         )
         seo_alt_text = seo.get("alt_text")
         seo_filename = seo.get("seo_filename")
@@ -305,54 +318,213 @@ def process_message(data: dict) -> None:
     except Exception as e:
         LOG.warning("SEO metadata generation failed (non-fatal): %s", e)
 
-    # Mark item completed
+    # Mark item completed and reconcile the job (one transaction); the
+    # item that turns the job terminal also requests its export
+    fields = {'output_blob_path': out_path}
+    if step_timings:
+        fields['step_timings'] = step_timings
+    if seo_alt_text:
+        fields['seo_alt_text'] = seo_alt_text
+    if seo_filename:
+        fields['seo_filename'] = seo_filename
+    complete_item(job_id, item_id, fields)
+    LOG.info('Item completed: %s', item_id)
+
+    _pregenerate_previews(
+        {'id': item_id, 'job_id': job_id, 'tenant_id': tenant_id, 'output_blob_path': out_path},
+        output_bytes,
+    )
+
+
+def _pregenerate_previews(item: dict, output_bytes: bytes) -> None:
+    """Render the configured gallery previews while the output is in memory (non-fatal)."""
+    widths = parse_widths(settings.PREVIEW_PREGENERATE_WIDTHS)
+    for width in widths:
+        try:
+            ensure_preview(item, 'outputs', width, 'webp', image_bytes=output_bytes)
+        except Exception as e:
+            LOG.warning('Preview w%d for %s failed (non-fatal): %s', width, item['id'], e)
+
+
+def _resume_item(data: dict) -> None:
+    """Collect an async scene edit and finish the item.
+
+    Sent by the fal webhook endpoint (web_api) or the poller.  Deliveries
+    are at-least-once: the request is claimed atomically before resuming,
+    and a result that is not ready yet leaves the item parked.
+    """
+    item_id = data['item_id']
+    request_id = data['resume_request_id']
+
     with SessionLocal() as s:
         item = s.get(JobItem, item_id)
-        if item:
-            item.output_blob_path = out_path
-            item.status = ItemStatus.completed
-            if result.step_timings:
-                item.step_timings = result.step_timings
-            if seo_alt_text:
-                item.seo_alt_text = seo_alt_text
-            if seo_filename:
-                item.seo_filename = seo_filename
-            s.commit()
-            LOG.info('Item completed: %s', item_id)
-
-    finalize_job_status(job_id)
-
-    # Trigger export
+        if not item or item.status != ItemStatus.processing or item.provider_request_id != request_id:
+            LOG.info('Item %s no longer waiting on %s — skipping resume', item_id, request_id)
+            return
+        job_id = item.job_id
+        provider_name = (item.pending_state or {}).get('provider')
+
+    provider = _resolve_img_gen_provider()
+    if not _supports_async(provider) or provider.name != provider_name:
+        raise PermanentError(f'Scene provider {provider_name} unavailable to collect {request_id}')
+
     try:
-        send_export_message({
-            'tenant_id': tenant_id,
-            'job_id': job_id,
-            'item_id': item_id,
-            'correlation_id': correlation_id,
-        })
+        scene_bytes = provider.fetch_result(request_id)
     except Exception as e:
-        LOG.error('Export message failed: %s', e)
+        try:
+            classify_and_raise(e)
+        except TransientError as err:
+            LOG.warning('Fetching %s failed (%s) — left for the poller', request_id, err)
+            return
+        except PermanentError as err:
+            if claim_provider_request(item_id, request_id) is not None:
+                mark_item_failed(job_id, item_id, f'Scene generation failed: {err}')
+            return
+    if scene_bytes is None:
+        LOG.info('Request %s not finished yet — item %s stays parked', request_id, item_id)
+        return
 
+    claimed = claim_provider_request(item_id, request_id)
+    if claimed is None:
+        LOG.info('Request %s already claimed — skipping', request_id)
+        return
+    state = claimed['state']
+    message = state['message']
 
-def _resolve_img_gen_provider():
-    """Resolve scene-gen provider per-job, checking admin DB setting first."""
     try:
-        from shared.image_generation import get_image_gen_provider
-        from shared.settings_service import get_setting
-
-        # Admin DB setting overrides env var
-        provider_name = get_setting("IMAGE_GEN_PROVIDER") or settings.IMAGE_GEN_PROVIDER
-        api_key_map = {"fal-flux2": "FAL_API_KEY"}
-        api_key_attr = api_key_map.get(
-            provider_name,
-            f'{provider_name.upper().replace(".", "_")}_API_KEY',
+        timings = dict(state.get('timings') or {})
+        if claimed['submitted_at']:
+            timings['scene_edit'] = round((datetime.utcnow() - claimed['submitted_at']).total_seconds(), 2)
+
+        step_cache = _step_cache(message['tenant_id'])
+        product_bytes = download_blob(
+            generate_read_sas(container='outputs', blob_path=state['product_blob_path'])
+        )
+        opts = ProcessingOptions.from_dict(message.get('processing_options', {}))
+        result = resume_pipeline(
+            product_bytes, scene_bytes,
+            upscale=opts.upscale,
+            upscale_provider=upscale_provider,
+            upscale_enabled=settings.UPSCALE_ENABLED,
+            stages=stages,
+            step_cache=step_cache,
+            timings=timings,
         )
-        api_key = get_setting(api_key_attr)
-        if api_key:
-            provider = get_image_gen_provider(provider_name, api_key=api_key)
+        _complete_item(message, result.output, result.step_timings)
+    except Exception as e:
+        # The claim is gone, so a redelivery could not resume this item again
+        mark_item_failed(job_id, item_id, str(e))
+        raise
+
+
+def poll_pending_scene_edits(provider=None, now: datetime | None = None) -> int:
+    """One poller pass over parked items.
+
+    Enqueues a resume for every finished request (covers missed or disabled
+    webhooks) and fails items queued longer than SCENE_GEN_ASYNC_TIMEOUT.
+    Requests younger than one poll interval are left to the webhook.  A
+    resume is only enqueued after claiming it (claim_provider_resume), so
+    other replicas, the webhook and later passes do not enqueue it again
+    within SCENE_GEN_RESUME_RETRY_SECONDS.  Returns the number of resumes
+    enqueued.
+    """
+    provider = provider or _resolve_img_gen_provider()
+    if not _supports_async(provider):
+        return 0
+    now = now or datetime.utcnow()
+    retry_after = settings.SCENE_GEN_RESUME_RETRY_SECONDS
+    resumed = 0
+    for pending in list_pending_provider_requests(limit=200):
+        submitted = pending['provider_submitted_at']
+        age = (now - submitted).total_seconds() if submitted else 0
+        if age < settings.SCENE_GEN_POLL_INTERVAL:
+            continue
+        enqueued = pending['provider_resume_enqueued_at']
+        if enqueued and (now - enqueued).total_seconds() < retry_after:
+            continue  # resume already on its way
+        request_id = pending['provider_request_id']
+        try:
+            status = provider.request_status(request_id)
+        except Exception as e:
+            LOG.warning('Status check for %s failed: %s', request_id, e)
+            continue
+        if status == 'COMPLETED':
+            if not claim_provider_resume(pending['item_id'], request_id, retry_after, now=now):
+                continue
+            send_job_message({
+                'tenant_id': pending['tenant_id'],
+                'job_id': pending['job_id'],
+                'item_id': pending['item_id'],
+                'resume_request_id': request_id,
+            })
+            resumed += 1
+        elif age > settings.SCENE_GEN_ASYNC_TIMEOUT:
+            if claim_provider_request(pending['item_id'], request_id) is not None:
+                mark_item_failed(pending['job_id'], pending['item_id'],
+                                 f'Scene generation timed out after {int(age)}s ({status})')
+    if resumed:
+        LOG.info('Scene poller enqueued %d resume(s)', resumed)
+    return resumed
+
+
+def sweep_tmp() -> int:
+    """Delete stale outputs/_tmp/ blobs (product handoffs, parked requests)."""
+    deleted = sweep_tmp_blobs(settings.TMP_BLOB_MAX_AGE_MINUTES, client=blob_service_client)
+    if deleted:
+        LOG.info('Swept %d stale _tmp/ blob(s)', deleted)
+    return deleted
+
+
+def drain_blob_deletions() -> int:
+    """Delete blobs queued by retention cleanup, GDPR erasure and cache eviction."""
+    return blob_deleter.drain()
+
+
+def evict_step_cache() -> int:
+    """Write buffered cache hits, then drop expired and over-cap cache entries."""
+    flush_step_cache_hits()
+    blob_paths = evict_step_cache_entries(settings.STEP_CACHE_MAX_ENTRIES_PER_TENANT)
+    if blob_paths:
+        enqueue_blob_deletions(blob_paths, reason='step_cache')
+        LOG.info('Evicted %d step cache entries', len(blob_paths))
+    return len(blob_paths)
+
+
+def report_providers() -> None:
+    """Log per-provider call metrics from the provider registry."""
+    from shared.provider_registry import get_provider_registry
+    for name, s in get_provider_registry().snapshot().items():
+        LOG.info('Provider %s: calls=%d errors=%d in_flight=%d avg=%.2fs',
+                 name, s['calls'], s['errors'], s['in_flight'], s['avg_s'])
+
+
+def _start_periodic(name: str, interval: float, fn) -> threading.Thread:
+    """Run *fn* every *interval* seconds on a daemon thread."""
+    def _loop():
+        while True:
+            time.sleep(interval)
+            try:
+                fn()
+            except Exception:
+                LOG.exception('%s pass failed', name)
+
+    thread = threading.Thread(target=_loop, daemon=True, name=name)
+    thread.start()
+    return thread
+
+
+def _resolve_img_gen_provider():
+    """Resolve scene-gen provider per-job, checking admin DB setting first.
+
+    The registry hands back the same live instance until the admin
+    setting or API key changes.
+    """
+    try:
+        from shared.provider_registry import resolve_image_gen_provider
+        provider = resolve_image_gen_provider()
+        if provider is not None:
             LOG.debug('Scene gen provider (per-job): %s', provider.name)
             return provider
-        LOG.warning('No API key for %s — scene gen disabled', provider_name)
     except Exception as e:
         LOG.error('Failed to resolve scene gen provider: %s', e)
     # Fall back to startup-initialized provider
@@ -365,7 +537,7 @@ def _init_providers():
 
     # Background removal
     try:
-        from shared.background_removal import get_provider
+        from shared.background_removal import get_provider, with_batching
         bg_kwargs = {}
         if settings.BACKGROUND_REMOVAL_PROVIDER == 'remove.bg':
             bg_kwargs['api_key'] = settings.REMOVEBG_API_KEY
@@ -373,27 +545,23 @@ def _init_providers():
             bg_kwargs['endpoint'] = settings.AZURE_VISION_ENDPOINT
             bg_kwargs['key'] = settings.AZURE_VISION_KEY
         bg_provider = get_provider(settings.BACKGROUND_REMOVAL_PROVIDER, **bg_kwargs)
+        bg_provider = with_batching(
+            bg_provider,
+            max_batch_size=settings.BG_REMOVAL_MAX_BATCH_SIZE,
+            max_wait_ms=settings.BG_REMOVAL_MAX_BATCH_WAIT_MS,
+        )
         LOG.info('BG removal provider: %s', bg_provider.name)
     except Exception as e:
         LOG.error('Failed to init bg provider: %s', e)
 
     # Scene generation (initial — can be overridden per-job via admin setting)
     try:
-        from shared.image_generation import get_image_gen_provider
-        from shared.settings_service import get_setting
-        provider_name = get_setting("IMAGE_GEN_PROVIDER") or settings.IMAGE_GEN_PROVIDER
-        # fal-flux2 uses the same FAL_API_KEY as fal
-        api_key_map = {"fal-flux2": "FAL_API_KEY"}
-        api_key_attr = api_key_map.get(
-            provider_name,
-            f'{provider_name.upper().replace(".", "_")}_API_KEY',
-        )
-        api_key = get_setting(api_key_attr)
-        if api_key:
-            img_gen_provider = get_image_gen_provider(provider_name, api_key=api_key)
+        from shared.provider_registry import resolve_image_gen_provider
+        img_gen_provider = resolve_image_gen_provider()
+        if img_gen_provider is not None:
             LOG.info('Scene gen provider: %s', img_gen_provider.name)
         else:
-            LOG.warning('No API key for %s — scene gen will pass through', provider_name)
+            LOG.warning('Scene gen will pass through until an API key is configured')
     except Exception as e:
         LOG.error('Failed to init scene gen provider: %s', e)
 
@@ -409,7 +577,15 @@ def _init_providers():
         LOG.error('Failed to init upscale provider: %s', e)
 
 
+def _on_failure(data: dict, exc: BaseException) -> None:
+    """Mark the item failed so the job never stays stuck in 'processing'."""
+    error = f'Transient: {exc}' if isinstance(exc, TransientError) else str(exc)
+    mark_item_failed(data.get('job_id'), data.get('item_id'), error)
+
+
 def main():
+    global stages
+
     logging.basicConfig(
         level=getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO),
         format='%(asctime)s %(levelname)s - %(message)s'
@@ -423,75 +599,44 @@ def main():
     start_health_server(port=8080)
     _init_providers()
 
-    LOG.info('Starting message processing loop...')
+    stages = PipelineStages.from_settings()
+    stages.start_reporter(interval=settings.PIPELINE_STAGE_REPORT_INTERVAL)
+    LOG.info('Stage pools: cpu=%d io=%d', stages.stages['cpu'].workers, stages.stages['io'].workers)
 
-    while True:
-        try:
-            receiver = servicebus_client.get_queue_receiver(
-                queue_name=settings.SERVICEBUS_JOBS_QUEUE,
-                max_wait_time=20,
-                receive_mode=ServiceBusReceiveMode.PEEK_LOCK,
-            )
-            renewer = AutoLockRenewer()
-
-            with receiver:
-                messages = receiver.receive_messages(max_message_count=5, max_wait_time=20)
-                for m in messages:
-                    item_id = None
-                    job_id = None
-                    try:
-                        data = json.loads(str(m))
-                        item_id = data.get('item_id')
-                        job_id = data.get('job_id')
-                        # Lock for full pipeline duration (bg + scene + upscale)
-                        renewer.register(receiver, m, max_lock_renewal_duration=600)
-
-                        process_message(data)
-
-                        receiver.complete_message(m)
-                        LOG.info('Message completed: job=%s item=%s', job_id, item_id)
-
-                    except json.JSONDecodeError as e:
-                        LOG.error('Invalid JSON: %s', e)
-                        receiver.dead_letter_message(
-                            m, reason='InvalidJSON', error_description=str(e)
-                        )
-
-                    except PermanentError as e:
-                        LOG.error('Permanent error (dead-lettering): %s', e)
-                        try:
-                            mark_item_failed(job_id, item_id, str(e))
-                        except Exception:
-                            pass
-                        receiver.dead_letter_message(
-                            m, reason='PermanentError', error_description=str(e)
-                        )
-
-                    except TransientError as e:
-                        LOG.warning('Transient error (abandoning for retry): %s', e)
-                        try:
-                            mark_item_failed(job_id, item_id, f'Transient: {e}')
-                        except Exception:
-                            pass
-                        receiver.abandon_message(m)
-
-                    except Exception as e:
-                        LOG.exception('Unexpected error: %s', e)
-                        try:
-                            mark_item_failed(job_id, item_id, str(e))
-                        except Exception:
-                            pass
-                        receiver.abandon_message(m)
-
-                # Close renewer after all messages in the batch are done
-                try:
-                    renewer.close()
-                except Exception:
-                    pass
+    if settings.SCENE_GEN_ASYNC:
+        _start_periodic('scene-poller', settings.SCENE_GEN_POLL_INTERVAL, poll_pending_scene_edits)
+        LOG.info('Async scene generation: ON (poll every %ds, webhook=%s)',
+                 settings.SCENE_GEN_POLL_INTERVAL, settings.SCENE_GEN_WEBHOOK_URL or 'none')
 
-        except Exception as e:
-            LOG.exception('Worker loop error: %s', e)
-            time.sleep(5)
+    if settings.TMP_SWEEP_INTERVAL_MINUTES > 0:
+        _start_periodic('tmp-sweeper', settings.TMP_SWEEP_INTERVAL_MINUTES * 60, sweep_tmp)
+
+    if settings.BLOB_DELETION_INTERVAL_SECONDS > 0:
+        _start_periodic('blob-deleter', settings.BLOB_DELETION_INTERVAL_SECONDS, drain_blob_deletions)
+
+    if settings.EXPORT_SWEEP_INTERVAL_SECONDS > 0:
+        _start_periodic('export-sweeper', settings.EXPORT_SWEEP_INTERVAL_SECONDS, request_missing_exports)
+
+    if settings.STEP_CACHE_ENABLED and settings.STEP_CACHE_HIT_FLUSH_SECONDS > 0:
+        _start_periodic('step-cache-hits', settings.STEP_CACHE_HIT_FLUSH_SECONDS, flush_step_cache_hits)
+
+    if settings.STEP_CACHE_ENABLED and settings.STEP_CACHE_EVICT_INTERVAL_MINUTES > 0:
+        _start_periodic('step-cache-evictor', settings.STEP_CACHE_EVICT_INTERVAL_MINUTES * 60, evict_step_cache)
+
+    if settings.PIPELINE_STAGE_REPORT_INTERVAL > 0:
+        _start_periodic('provider-reporter', settings.PIPELINE_STAGE_REPORT_INTERVAL, report_providers)
+
+    LOG.info('Starting message processing loop...')
+
+    QueueWorker(
+        settings.SERVICEBUS_JOBS_QUEUE,
+        process_message,
+        # Lock for full pipeline duration (bg + scene + upscale)
+        max_lock_renewal_duration=600,
+        permanent_errors=(PermanentError,),
+        on_failure=_on_failure,
+        client=servicebus_client,
+    ).run_forever()
 
 
 if __name__ == '__main__':
@@ -23,6 +23,25 @@ class BackgroundRemovalProvider(ABC):
         """Provider name for logging"""
         pass
 
+    @property
+    def runs_locally(self) -> bool:
+        """Whether inference runs in-process (CPU/GPU bound) rather than over HTTP."""
+        return False
+
+    @property
+    def accepts_images(self) -> bool:
+        """Whether remove_background_image works on PIL images without encoding."""
+        return False
+
+    def remove_background_image(self, image):
+        """Remove background from a PIL image, return an RGBA PIL image."""
+        from io import BytesIO
+        from PIL import Image
+
+        buf = BytesIO()
+        image.save(buf, format="PNG")
+        return Image.open(BytesIO(self.remove_background(buf.getvalue())))
+
 
 class BiRefNetProvider(BackgroundRemovalProvider):
     """Local background removal using BiRefNet (MIT license).
@@ -54,36 +73,75 @@ class BiRefNetProvider(BackgroundRemovalProvider):
         LOG.info("BiRefNet provider initialized (%s)", self._device)
 
     def remove_background(self, image_bytes: bytes) -> bytes:
+        LOG.info("Processing with BiRefNet (local)")
+
+        image, input_tensor = self.preprocess(image_bytes)
+        mask = self.predict_masks([input_tensor])[0]
+        return self.postprocess(image, mask, len(image_bytes))
+
+    def remove_background_image(self, image):
+        image, input_tensor = self.preprocess_image(image)
+        mask = self.predict_masks([input_tensor])[0]
+        return self.apply_mask(image, mask)
+
+    # The phases are public so BatchedBackgroundRemoval can run
+    # decode/encode on the calling threads and batch only the forward pass.
+
+    def preprocess(self, image_bytes: bytes):
+        """Decode *image_bytes* and build the model input tensor (C×res×res)."""
         from io import BytesIO
         from PIL import Image
 
-        LOG.info("Processing with BiRefNet (local)")
+        return self.preprocess_image(Image.open(BytesIO(image_bytes)))
 
-        image = Image.open(BytesIO(image_bytes)).convert("RGB")
-        orig_size = image.size
+    def preprocess_image(self, image):
+        """Build the model input tensor for an already-decoded image."""
+        image = image.convert("RGB")
+        return image, self._transform(image)
 
-        input_tensor = self._transform(image).unsqueeze(0).to(self._device)
+    def predict_masks(self, input_tensors: list) -> list:
+        """Run one forward pass over a batch of same-sized input tensors."""
+        batch = self._torch.stack(input_tensors).to(self._device)
 
         with self._torch.no_grad():
-            preds = self._model(input_tensor)[-1].sigmoid().cpu()
+            preds = self._model(batch)[-1].sigmoid().cpu()
+
+        return [preds[i].squeeze() for i in range(len(input_tensors))]
+
+    def apply_mask(self, image, mask):
+        """Resize *mask* to the original image and return the RGBA cutout."""
+        from PIL import Image
 
-        mask = preds[0].squeeze()
         mask_img = Image.fromarray((mask.numpy() * 255).astype("uint8"), mode="L")
-        mask_img = mask_img.resize(orig_size, Image.Resampling.LANCZOS)
+        mask_img = mask_img.resize(image.size, Image.Resampling.LANCZOS)
 
         result = image.convert("RGBA")
         result.putalpha(mask_img)
+        return result
+
+    def postprocess(self, image, mask, input_size: int = 0) -> bytes:
+        """Apply *mask* and encode the RGBA cutout as PNG."""
+        from io import BytesIO
 
+        result = self.apply_mask(image, mask)
         buf = BytesIO()
         result.save(buf, format="PNG")
         LOG.info("BiRefNet background removal successful (%d bytes -> %d bytes)",
-                 len(image_bytes), buf.tell())
+                 input_size, buf.tell())
         return buf.getvalue()
 
     @property
     def name(self) -> str:
         return "birefnet"
 
+    @property
+    def runs_locally(self) -> bool:
+        return True
+
+    @property
+    def accepts_images(self) -> bool:
+        return True
+
 
 class RembgProvider(BackgroundRemovalProvider):
     """Local background removal using rembg library"""
@@ -104,24 +162,30 @@ class RembgProvider(BackgroundRemovalProvider):
     def name(self) -> str:
         return "rembg"
 
+    @property
+    def runs_locally(self) -> bool:
+        return True
+
 
 class RemoveBgProvider(BackgroundRemovalProvider):
     """Cloud background removal using remove.bg API"""
-    
+
+    TIMEOUT = 60
+
     def __init__(self, api_key: str):
         self.api_key = api_key
         LOG.info("remove.bg provider initialized")
     
     def remove_background(self, image_bytes: bytes) -> bytes:
-        import httpx
+        from .provider_http import get_provider_transport
         LOG.info("Processing with remove.bg API")
         
-        response = httpx.post(
+        response = get_provider_transport().post(
             'https://api.remove.bg/v1.0/removebg',
             headers={'X-Api-Key': self.api_key},
             files={'image_file': image_bytes},
             data={'size': 'auto'},
-            timeout=60
+            timeout=self.TIMEOUT
         )
         response.raise_for_status()
         return response.content
@@ -134,13 +198,15 @@ class RemoveBgProvider(BackgroundRemovalProvider):
 class AzureVisionProvider(BackgroundRemovalProvider):
     """Azure AI Vision background removal using Image Analysis 4.0"""
 
+    TIMEOUT = 60
+
     def __init__(self, endpoint: str, key: str):
         self.endpoint = endpoint.rstrip('/')
         self.key = key
         LOG.info("Azure AI Vision provider initialized (endpoint: %s)", self.endpoint)
 
     def remove_background(self, image_bytes: bytes) -> bytes:
-        import httpx
+        from .provider_http import get_provider_transport
 
         LOG.info("Processing with Azure Computer Vision Image Analysis 4.0")
 
@@ -161,12 +227,12 @@ class AzureVisionProvider(BackgroundRemovalProvider):
                  url, params['api-version'], params['mode'])
 
         # Call Azure Computer Vision API
-        response = httpx.post(
+        response = get_provider_transport().post(
             url,
             params=params,
             headers=headers,
             content=image_bytes,
-            timeout=60
+            timeout=self.TIMEOUT
         )
 
         # Log response details for debugging
@@ -190,6 +256,61 @@ class AzureVisionProvider(BackgroundRemovalProvider):
         return "azure-vision"
 
 
+class BatchedBackgroundRemoval(BackgroundRemovalProvider):
+    """Micro-batching front-end for providers with a batched forward pass.
+
+    Every input is resized to the same resolution×resolution tensor, so
+    concurrent requests can be stacked into one forward pass.  Decoding and
+    PNG encoding stay on the calling threads; only inference is batched.
+    """
+
+    def __init__(self, provider: BackgroundRemovalProvider, max_batch_size: int = 4,
+                 max_wait_ms: float = 10):
+        from .batching import MicroBatcher
+
+        self._provider = provider
+        self._batcher = MicroBatcher(
+            provider.predict_masks, max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms, name=f"{provider.name}-batcher",
+        )
+        LOG.info("Batching %s inference (max_batch=%d, max_wait=%sms)",
+                 provider.name, max_batch_size, max_wait_ms)
+
+    def remove_background(self, image_bytes: bytes) -> bytes:
+        image, input_tensor = self._provider.preprocess(image_bytes)
+        mask = self._batcher.submit(input_tensor)
+        return self._provider.postprocess(image, mask, len(image_bytes))
+
+    def remove_background_image(self, image):
+        image, input_tensor = self._provider.preprocess_image(image)
+        mask = self._batcher.submit(input_tensor)
+        return self._provider.apply_mask(image, mask)
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self._batcher.mean_batch_size
+
+    @property
+    def name(self) -> str:
+        return self._provider.name
+
+    @property
+    def runs_locally(self) -> bool:
+        return self._provider.runs_locally
+
+    @property
+    def accepts_images(self) -> bool:
+        return getattr(self._provider, "accepts_images", False) is True
+
+
+def with_batching(provider: BackgroundRemovalProvider, max_batch_size: int,
+                  max_wait_ms: float) -> BackgroundRemovalProvider:
+    """Wrap *provider* in a micro-batching front-end when it supports batching."""
+    if max_batch_size <= 1 or not hasattr(provider, "predict_masks"):
+        return provider
+    return BatchedBackgroundRemoval(provider, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+
 def get_provider(provider_name: str = "birefnet", **kwargs) -> BackgroundRemovalProvider:
     """Factory function to get background removal provider"""
     providers = {
@@ -0,0 +1,90 @@
+"""
+Micro-batching front-end for batch-capable model calls.
+
+Concurrent callers each submit one input; a single dispatcher thread
+collects inputs for up to ``max_wait_ms`` or until ``max_batch_size`` are
+queued, runs them through ``batch_fn`` in one call and hands each caller
+back its own result.  Per-call overhead (kernel launch, framework dispatch)
+is then paid once per batch instead of once per image.
+
+Usage:
+    batcher = MicroBatcher(model.predict_batch, max_batch_size=8, max_wait_ms=10)
+    result = batcher.submit(tensor)   # blocks until the batch containing it ran
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Sequence
+
+LOG = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects single submissions into batches for ``batch_fn``.
+
+    ``batch_fn`` receives a list of inputs and must return a sequence of
+    results in the same order.  If it raises, every caller in that batch
+    receives the exception.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 10, name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[tuple[Any, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._loop, daemon=True, name=name)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Any:
+        """Queue *item* and block until its batch has been processed."""
+        fut: Future = Future()
+        self._queue.put((item, fut))
+        return fut.result()
+
+    @property
+    def mean_batch_size(self) -> float:
+        with self._lock:
+            return self.items / self.batches if self.batches else 0.0
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            inputs = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(inputs)
+                if len(results) != len(inputs):
+                    raise RuntimeError(
+                        f"{self.name}: batch_fn returned {len(results)} results for {len(inputs)} inputs"
+                    )
+            except BaseException as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
+            LOG.debug("%s: ran batch of %d", self.name, len(batch))
@@ -19,6 +19,9 @@ class Settings(BaseSettings):
     # Background Removal Provider
     BACKGROUND_REMOVAL_PROVIDER: str = Field(default='birefnet', env='BACKGROUND_REMOVAL_PROVIDER')
     REMOVEBG_API_KEY: str = Field(default='', env='REMOVEBG_API_KEY')
+    # Micro-batching of local model inference (1 disables batching)
+    BG_REMOVAL_MAX_BATCH_SIZE: int = Field(default=4, env='BG_REMOVAL_MAX_BATCH_SIZE')
+    BG_REMOVAL_MAX_BATCH_WAIT_MS: int = Field(default=10, env='BG_REMOVAL_MAX_BATCH_WAIT_MS')
     
     # Image Generation
     IMAGE_GEN_PROVIDER: str = Field(default='fal-flux2', env='IMAGE_GEN_PROVIDER')
@@ -43,6 +46,8 @@ class Settings(BaseSettings):
 
     # Database
     DATABASE_URL: str = Field(default='', env='DATABASE_URL')
+    # Pool of the async engine used by async web API routes (shared.db_async)
+    DB_ASYNC_POOL_SIZE: int = Field(default=20, env='DB_ASYNC_POOL_SIZE')
 
     # Azure Storage
     STORAGE_ACCOUNT_NAME: str = Field(default='', env='STORAGE_ACCOUNT_NAME')
@@ -61,6 +66,108 @@ class Settings(BaseSettings):
     SERVICEBUS_SCENE_GEN_QUEUE: str = "scene-gen"
     SERVICEBUS_UPSCALE_QUEUE: str = "upscale"
 
+    # Queue workers: messages processed concurrently per replica
+    WORKER_CONCURRENCY: int = Field(default=4, env='WORKER_CONCURRENCY')
+
+    # Pipeline worker stage pools (CPU: local models; IO: remote providers).  An
+    # item uses one stage at a time, so 0 derives the size from WORKER_CONCURRENCY
+    # (CPU: capped at the core count) and larger values are capped at it
+    PIPELINE_CPU_WORKERS: int = Field(default=0, env='PIPELINE_CPU_WORKERS')
+    PIPELINE_IO_WORKERS: int = Field(default=0, env='PIPELINE_IO_WORKERS')
+    PIPELINE_STAGE_QUEUE_SIZE: int = Field(default=8, env='PIPELINE_STAGE_QUEUE_SIZE')
+    PIPELINE_STAGE_REPORT_INTERVAL: int = Field(default=60, env='PIPELINE_STAGE_REPORT_INTERVAL')
+    # Per-job context (brand profile, style, watermark) reused by sibling items, seconds
+    JOB_CONTEXT_TTL: int = Field(default=300, env='JOB_CONTEXT_TTL')
+
+    # Shared HTTP transport for external image providers (fal.ai, remove.bg, ...)
+    PROVIDER_HTTP_MAX_CONNECTIONS: int = Field(default=50, env='PROVIDER_HTTP_MAX_CONNECTIONS')
+    PROVIDER_HTTP_MAX_KEEPALIVE: int = Field(default=20, env='PROVIDER_HTTP_MAX_KEEPALIVE')
+    PROVIDER_HTTP_CONNECT_TIMEOUT: float = Field(default=10.0, env='PROVIDER_HTTP_CONNECT_TIMEOUT')
+    PROVIDER_HTTP_MAX_RETRIES: int = Field(default=3, env='PROVIDER_HTTP_MAX_RETRIES')
+    PROVIDER_HTTP2: bool = Field(default=True, env='PROVIDER_HTTP2')
+    # Cap on concurrent calls into each provider instance (0 = unlimited), and
+    # per-provider-name caps overriding it (``fal-flux2=8,replicate=2``)
+    PROVIDER_MAX_CONCURRENCY: int = Field(default=0, env='PROVIDER_MAX_CONCURRENCY')
+    PROVIDER_CONCURRENCY_LIMITS: str = Field(default='', env='PROVIDER_CONCURRENCY_LIMITS')
+
+    # Edit-mode product handoff: cutouts up to this size are sent inline (data URI)
+    PRODUCT_INLINE_MAX_KB: int = Field(default=1024, env='PRODUCT_INLINE_MAX_KB')
+    # outputs/_tmp/ lifecycle sweeper (max age must exceed SCENE_GEN_ASYNC_TIMEOUT)
+    TMP_BLOB_MAX_AGE_MINUTES: int = Field(default=180, env='TMP_BLOB_MAX_AGE_MINUTES')
+    TMP_SWEEP_INTERVAL_MINUTES: int = Field(default=60, env='TMP_SWEEP_INTERVAL_MINUTES')
+    # Background blob deletion queue (shared.blob_deletion), drained by pipeline workers
+    BLOB_DELETION_INTERVAL_SECONDS: int = Field(default=30, env='BLOB_DELETION_INTERVAL_SECONDS')
+    BLOB_DELETION_BATCH_SIZE: int = Field(default=256, env='BLOB_DELETION_BATCH_SIZE')
+    BLOB_DELETION_CONCURRENCY: int = Field(default=4, env='BLOB_DELETION_CONCURRENCY')
+    BLOB_DELETION_MAX_ATTEMPTS: int = Field(default=10, env='BLOB_DELETION_MAX_ATTEMPTS')
+    # Re-request exports for finished jobs whose export message failed (0 = off)
+    EXPORT_SWEEP_INTERVAL_SECONDS: int = Field(default=300, env='EXPORT_SWEEP_INTERVAL_SECONDS')
+
+    # Async scene generation: queue fal requests and resume via webhook/poller
+    SCENE_GEN_ASYNC: bool = Field(default=False, env='SCENE_GEN_ASYNC')
+    SCENE_GEN_WEBHOOK_URL: str = Field(default='', env='SCENE_GEN_WEBHOOK_URL')
+    SCENE_GEN_POLL_INTERVAL: int = Field(default=30, env='SCENE_GEN_POLL_INTERVAL')
+    SCENE_GEN_ASYNC_TIMEOUT: int = Field(default=1800, env='SCENE_GEN_ASYNC_TIMEOUT')
+    # A finished request whose resume has not completed is enqueued again after this
+    SCENE_GEN_RESUME_RETRY_SECONDS: int = Field(default=300, env='SCENE_GEN_RESUME_RETRY_SECONDS')
+
+    # In-process admin_settings cache (seconds; 0 = read the DB on every lookup)
+    SETTINGS_CACHE_TTL: float = Field(default=30.0, env='SETTINGS_CACHE_TTL')
+    # Drop cached settings on Postgres NOTIFY from admin writes in other processes
+    SETTINGS_CACHE_LISTEN: bool = Field(default=True, env='SETTINGS_CACHE_LISTEN')
+
+    # Web API: resolved API-key / JWT principals per process (seconds; 0 = look up every request)
+    PRINCIPAL_CACHE_TTL: float = Field(default=30.0, env='PRINCIPAL_CACHE_TTL')
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = Field(default=10000, env='PRINCIPAL_CACHE_MAX_ENTRIES')
+    # Drop cached principals on Postgres NOTIFY from key revocations / balance changes elsewhere
+    PRINCIPAL_CACHE_LISTEN: bool = Field(default=True, env='PRINCIPAL_CACHE_LISTEN')
+    # API key last_used_at is buffered and written every N seconds (0 = on every request)
+    API_KEY_LAST_USED_FLUSH_SECONDS: float = Field(default=30.0, env='API_KEY_LAST_USED_FLUSH_SECONDS')
+
+    # Web API rate limits (GCRA): default per user per minute; "class=limit[/seconds]" for
+    # route classes (path segment after /v1/) and "tenant=limit" / "tenant:class=limit" overrides
+    RATE_LIMIT_PER_MINUTE: int = Field(default=60, env='RATE_LIMIT_PER_MINUTE')
+    RATE_LIMIT_ROUTE_CLASSES: str = Field(default='', env='RATE_LIMIT_ROUTE_CLASSES')
+    RATE_LIMIT_TENANT_OVERRIDES: str = Field(default='', env='RATE_LIMIT_TENANT_OVERRIDES')
+    # In-memory fallback (no Redis): keys tracked per process, least recently seen evicted
+    RATE_LIMIT_MEMORY_MAX_KEYS: int = Field(default=100000, env='RATE_LIMIT_MEMORY_MAX_KEYS')
+
+    # Export worker: parallel output downloads; ZIPs stream to storage in blocks of this size
+    EXPORT_DOWNLOAD_CONCURRENCY: int = Field(default=8, env='EXPORT_DOWNLOAD_CONCURRENCY')
+    EXPORT_BLOCK_SIZE_MB: int = Field(default=8, env='EXPORT_BLOCK_SIZE_MB')
+    # Format-export rendition processes (0 = one per core, 1 = resize in-process)
+    EXPORT_RENDER_WORKERS: int = Field(default=0, env='EXPORT_RENDER_WORKERS')
+    # Keep format-export renditions in storage and reuse them on later exports of the job
+    EXPORT_RENDITION_CACHE: bool = Field(default=True, env='EXPORT_RENDITION_CACHE')
+
+    # Blobs larger than one chunk move as parallel ranged GETs / staged blocks
+    BLOB_TRANSFER_CHUNK_MB: int = Field(default=4, env='BLOB_TRANSFER_CHUNK_MB')
+    BLOB_TRANSFER_CONCURRENCY: int = Field(default=4, env='BLOB_TRANSFER_CONCURRENCY')
+    # Lifetime of cached user delegation keys used to sign SAS URLs (max 168)
+    STORAGE_DELEGATION_KEY_HOURS: int = Field(default=12, env='STORAGE_DELEGATION_KEY_HOURS')
+
+    # Gallery previews (shared.previews): SAS lifetime of preview URLs, and the
+    # widths the pipeline worker renders up front (comma list, empty = on demand only)
+    PREVIEW_URL_TTL_MINUTES: int = Field(default=1440, env='PREVIEW_URL_TTL_MINUTES')
+    PREVIEW_PREGENERATE_WIDTHS: str = Field(default='', env='PREVIEW_PREGENERATE_WIDTHS')
+
+    # Final output encoding policy (see shared.output_encoding); tenants
+    # (``tenant=webp,...``) and then jobs may override
+    OUTPUT_FORMAT: str = Field(default='png', env='OUTPUT_FORMAT')
+    OUTPUT_FORMAT_TENANT_OVERRIDES: str = Field(default='', env='OUTPUT_FORMAT_TENANT_OVERRIDES')
+
+    # Per-tenant content-addressed cache of pipeline step outputs
+    STEP_CACHE_ENABLED: bool = Field(default=True, env='STEP_CACHE_ENABLED')
+    STEP_CACHE_TTL_DAYS: int = Field(default=30, env='STEP_CACHE_TTL_DAYS')
+    STEP_CACHE_MAX_ENTRIES_PER_TENANT: int = Field(default=5000, env='STEP_CACHE_MAX_ENTRIES_PER_TENANT')
+    STEP_CACHE_HIT_FLUSH_SECONDS: int = Field(default=60, env='STEP_CACHE_HIT_FLUSH_SECONDS')
+    STEP_CACHE_EVICT_INTERVAL_MINUTES: int = Field(default=60, env='STEP_CACHE_EVICT_INTERVAL_MINUTES')
+
+    # Shared bg-removal cutouts: lease on computing one (a dead worker's lease
+    # is taken over when it expires) and how often siblings check for it
+    CUTOUT_CLAIM_LEASE_SECONDS: int = Field(default=300, env='CUTOUT_CLAIM_LEASE_SECONDS')
+    CUTOUT_POLL_SECONDS: float = Field(default=1.0, env='CUTOUT_POLL_SECONDS')
+
     # Azure ML endpoint (OPTIONAL for now)
     AML_ENDPOINT_URL: str | None = None
     AML_ENDPOINT_KEY: str | None = None
@@ -0,0 +1,50 @@
+"""
+Async SQLAlchemy engine for the web API's ``async def`` routes.
+
+The web API's async routes (pixel ingestion, auth, A/B tests, catalog
+status) used to call the synchronous helpers in shared.db_sqlalchemy, so
+every query blocked the event loop and serialized all concurrent requests
+of a uvicorn worker.  ``AsyncSessionLocal`` is a second pool on the same
+database, driven by psycopg's async mode (psycopg is already the sync
+driver, so DATABASE_URL and its libpq options work unchanged); the async
+helpers live in shared.db_sqlalchemy_async.
+
+Sessions do not expire objects on commit: async ORM objects cannot lazy-load,
+so helpers convert rows to dicts before the session closes.
+"""
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from .config import settings
+
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+psycopg_async",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with its driver swapped for the async one."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for database backend: {backend}")
+    return parsed.set(drivername=_ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+if settings.DATABASE_URL:
+    async_engine = create_async_engine(
+        async_database_url(settings.DATABASE_URL),
+        pool_pre_ping=True,
+        pool_size=settings.DB_ASYNC_POOL_SIZE,
+        max_overflow=10,
+        pool_recycle=3600,
+        connect_args={
+            "connect_timeout": 10,
+            "application_name": "opal-async",
+        },
+    )
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_engine = None
+    AsyncSessionLocal = None
@@ -2,7 +2,8 @@
 Direct PostgreSQL database functions using SQLAlchemy.
 """
 from typing import Optional, List, Dict, Any
-from sqlalchemy import func, text
+from sqlalchemy import and_, delete, func, insert, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from .db import SessionLocal
 from .models import (
@@ -13,8 +14,11 @@ from .models import (
     AdminSetting, SubscriptionPlan, UserSubscription,
     CatalogJob, CatalogJobStatus, CatalogJobProduct, CatalogProductStatus,
     ABTest, ABTestStatus, ABTestMetric, ABTestVariantLog,
-    ImportedImage, Invoice,
+    ImportedImage, Invoice, StepCacheEntry, ExportRendition, BlobDeletion, CutoutClaim,
 )
+from .principal_cache import invalidate_principal, notify_principal_changed
+from .settings_service import invalidate_settings, notify_settings_changed
+from .storage import build_cutout_blob_path
 from datetime import datetime, timedelta
 import logging
 import secrets
@@ -237,6 +241,42 @@ def update_job(job_id: str, updates: Dict[str, Any]) -> None:
             session.commit()
 
 
+def claim_cutout(blob_path: str, owner: str, lease_seconds: int) -> bool:
+    """Lease computing the shared cutout at *blob_path* to *owner*.
+
+    True if no one holds the lease or the holder's lease expired (e.g. the
+    worker died).  Each call is one short transaction, so no connection is
+    held while the cutout is computed.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=lease_seconds)
+    with SessionLocal() as session:
+        taken_over = session.execute(
+            update(CutoutClaim)
+            .where(CutoutClaim.blob_path == blob_path, CutoutClaim.expires_at < now)
+            .values(owner=owner, expires_at=expires_at)
+        )
+        if taken_over.rowcount == 1:
+            session.commit()
+            return True
+        session.add(CutoutClaim(blob_path=blob_path, owner=owner, expires_at=expires_at))
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            return False
+        return True
+
+
+def release_cutout_claim(blob_path: str, owner: str) -> None:
+    """Drop *owner*'s lease on *blob_path* (a no-op if it was taken over)."""
+    with SessionLocal() as session:
+        session.execute(
+            delete(CutoutClaim).where(CutoutClaim.blob_path == blob_path, CutoutClaim.owner == owner)
+        )
+        session.commit()
+
+
 def get_job_items_by_filename(job_id: str, filename: str) -> List[Dict[str, Any]]:
     """Get all items for a job with a given filename (for multi-scene siblings)."""
     with SessionLocal() as session:
@@ -385,10 +425,29 @@ def update_user_token_balance(user_id: str, delta: int) -> Optional[int]:
             {"user_id": user_id, "delta": delta},
         )
         row = result.fetchone()
+        if row:
+            notify_principal_changed(session, user_id)
         session.commit()
+        if row:
+            invalidate_principal(user_id)
         return row[0] if row else None
 
 
+def touch_api_keys(last_used: Dict[str, datetime]) -> None:
+    """Write buffered last_used_at values ({key_id: time}) in one statement."""
+    if not last_used:
+        return
+    with SessionLocal() as session:
+        session.execute(
+            text(
+                "UPDATE user_api_keys SET last_used_at = :ts "
+                "WHERE id = :kid AND (last_used_at IS NULL OR last_used_at < :ts)"
+            ),
+            [{"kid": kid, "ts": ts} for kid, ts in last_used.items()],
+        )
+        session.commit()
+
+
 # ── Subscription CRUD ──────────────────────────────────────────────
 
 def list_subscription_plans(active_only: bool = True) -> List[Dict[str, Any]]:
@@ -667,12 +726,12 @@ def get_brand_style_context(brand_profile_id: str, tenant_id: str) -> Optional[s
     """Build a style context string from all reference images for a brand profile.
     Returns a comma-separated string of extracted style cues, or None."""
     images = list_brand_reference_images(brand_profile_id, tenant_id)
-    if not images:
-        return None
+    return _style_context([img.get("extracted_style") for img in images])
+
 
+def _style_context(styles: List[Optional[Dict[str, Any]]]) -> Optional[str]:
     style_parts = []
-    for img in images:
-        style = img.get("extracted_style")
+    for style in styles:
         if style:
             if style.get("colors"):
                 style_parts.append(f"colors: {', '.join(style['colors'][:5])}")
@@ -958,7 +1017,9 @@ def credit_tokens(user_id: str, amount: int, tx_type: str, description: str, ref
             created_at=datetime.utcnow(),
         )
         session.add(tx)
+        notify_principal_changed(session, user_id)
         session.commit()
+        invalidate_principal(user_id)
         return new_balance
 
 
@@ -986,7 +1047,9 @@ def debit_tokens(user_id: str, amount: int, description: str, reference_id: Opti
             created_at=datetime.utcnow(),
         )
         session.add(tx)
+        notify_principal_changed(session, user_id)
         session.commit()
+        invalidate_principal(user_id)
         return new_balance
 
 
@@ -1337,6 +1400,13 @@ def get_admin_setting_value(key: str) -> Optional[str]:
         return s.value if s and s.value else None
 
 
+def get_admin_setting_values() -> Dict[str, str]:
+    """All non-empty admin setting values (unmasked), for the settings cache."""
+    with SessionLocal() as session:
+        rows = session.query(AdminSetting.key, AdminSetting.value).all()
+        return {key: value for key, value in rows if value}
+
+
 def upsert_admin_setting(key: str, value: str, user_id: str, category: Optional[str] = None,
                           is_secret: Optional[bool] = None, description: Optional[str] = None) -> Dict[str, Any]:
     """Create or update an admin setting."""
@@ -1364,7 +1434,9 @@ def upsert_admin_setting(key: str, value: str, user_id: str, category: Optional[
                 updated_at=datetime.utcnow(),
             )
             session.add(s)
+        notify_settings_changed(session)
         session.commit()
+        invalidate_settings()
         session.refresh(s)
         return _admin_setting_to_dict(s)
 
@@ -1376,7 +1448,9 @@ def delete_admin_setting(key: str) -> bool:
         if not s:
             return False
         session.delete(s)
+        notify_settings_changed(session)
         session.commit()
+        invalidate_settings()
         return True
 
 
@@ -1403,7 +1477,9 @@ def set_user_admin(user_id: str, is_admin: bool) -> Optional[Dict[str, Any]]:
             return None
         u.is_admin = is_admin
         u.updated_at = datetime.utcnow()
+        notify_principal_changed(session, user_id)
         session.commit()
+        invalidate_principal(user_id)
         session.refresh(u)
         return _user_to_dict(u)
 
@@ -1416,7 +1492,9 @@ def set_user_token_balance(user_id: str, balance: int) -> Optional[Dict[str, Any
             return None
         u.token_balance = balance
         u.updated_at = datetime.utcnow()
+        notify_principal_changed(session, user_id)
         session.commit()
+        invalidate_principal(user_id)
         session.refresh(u)
         return _user_to_dict(u)
 
@@ -1813,7 +1891,9 @@ def export_user_data(user_id: str) -> Optional[Dict[str, Any]]:
 
 def delete_user_data(user_id: str) -> Dict[str, Any]:
     """Delete all personal data for a user (GDPR Art. 17 / AVG).
-    Returns summary of what was deleted. Blob storage cleanup is separate."""
+    Returns summary of what was deleted.  The user's blobs are queued for
+    the background deleter in the same transaction, so they cannot be
+    lost once the rows are gone."""
     with SessionLocal() as session:
         user = session.get(User, user_id)
         if not user:
@@ -1834,6 +1914,10 @@ def delete_user_data(user_id: str) -> Dict[str, Any]:
                     blob_paths.append(("outputs", item.output_blob_path))
             if job.export_blob_path:
                 blob_paths.append(("exports", job.export_blob_path))
+        cache_q = session.query(StepCacheEntry).filter(StepCacheEntry.tenant_id == tenant_id)
+        blob_paths.extend(("outputs", e.blob_path) for e in cache_q.all())
+        renditions_q = session.query(ExportRendition).filter(ExportRendition.tenant_id == tenant_id)
+        blob_paths.extend(("outputs", r.blob_path) for r in renditions_q.all())
 
         # Delete in dependency order
         # 1. Job items
@@ -1844,6 +1928,9 @@ def delete_user_data(user_id: str) -> Dict[str, Any]:
         job_count = session.query(Job).filter(Job.tenant_id == tenant_id).delete()
         summary["jobs_deleted"] = job_count
 
+        summary["step_cache_entries_deleted"] = cache_q.delete()
+        summary["export_renditions_deleted"] = renditions_q.delete()
+
         # 3. Token transactions
         tx_count = session.query(TokenTransaction).filter(
             TokenTransaction.user_id == user_id
@@ -1878,7 +1965,10 @@ def delete_user_data(user_id: str) -> Dict[str, Any]:
 
         # 8. Delete user
         session.delete(user)
+        notify_principal_changed(session, user_id)
+        summary["blobs_queued"] = _queue_blob_deletions(session, blob_paths, reason="gdpr")
         session.commit()
+        invalidate_principal(user_id)
 
         summary["blob_paths"] = blob_paths
         return summary
@@ -1913,23 +2003,43 @@ def get_jobs_older_than(days: int, limit: int = 100) -> List[Dict[str, Any]]:
         ]
 
 
-def delete_job_cascade(job_id: str) -> Dict[str, Any]:
-    """Delete a job and all its items. Returns blob paths for storage cleanup."""
+def delete_job_cascade(job_id: str, reason: str = "retention") -> Dict[str, Any]:
+    """Delete a job and all its items.
+
+    Its blobs are queued for the background deleter in the same
+    transaction; the paths are returned too.
+    """
     with SessionLocal() as session:
         blob_paths = []
+        cutout_sources = set()
         items = session.query(JobItem).filter(JobItem.job_id == job_id).all()
         for item in items:
             if item.raw_blob_path:
                 blob_paths.append(("raw", item.raw_blob_path))
+                if item.scene_index is not None:
+                    cutout_sources.add(item.raw_blob_path)
             if item.output_blob_path:
                 blob_paths.append(("outputs", item.output_blob_path))
+        # Shared bg-removed cutouts of fanned-out (multi-scene/angle) items
+        for raw_path in sorted(cutout_sources):
+            try:
+                blob_paths.append(("outputs", build_cutout_blob_path(raw_path)))
+            except ValueError:
+                pass
 
         job = session.query(Job).filter(Job.id == job_id).first()
         if job and job.export_blob_path:
             blob_paths.append(("exports", job.export_blob_path))
 
+        renditions = session.query(ExportRendition).filter(ExportRendition.job_id == job_id)
+        blob_paths.extend(("outputs", r.blob_path) for r in renditions.all())
+        renditions.delete()
+        # Fanned-out siblings share one raw upload (and its cutout)
+        blob_paths = list(dict.fromkeys(blob_paths))
+
         item_count = session.query(JobItem).filter(JobItem.job_id == job_id).delete()
         job_deleted = session.query(Job).filter(Job.id == job_id).delete()
+        blobs_queued = _queue_blob_deletions(session, blob_paths, reason=reason)
         session.commit()
 
         return {
@@ -1937,9 +2047,547 @@ def delete_job_cascade(job_id: str) -> Dict[str, Any]:
             "items_deleted": item_count,
             "job_deleted": bool(job_deleted),
             "blob_paths": blob_paths,
+            "blobs_queued": blobs_queued,
+        }
+
+
+# ── Pipeline Item Context ─────────────────────────────────────────────
+
+def claim_job_item(item_id: str) -> Optional[Dict[str, Any]]:
+    """Validate an item for processing and mark it processing.
+
+    Item and parent job are read in one query.  Returns the fields the
+    pipeline needs, or None when the item must be skipped (missing, already
+    completed/failed, job terminated, or no raw image — which fails it).
+    """
+    with SessionLocal() as session:
+        row = (
+            session.query(JobItem, Job.status)
+            .outerjoin(Job, Job.id == JobItem.job_id)
+            .filter(JobItem.id == item_id)
+            .first()
+        )
+        if row is None:
+            log.warning("Item not found: %s", item_id)
+            return None
+        item, job_status = row
+        if item.status == ItemStatus.completed:
+            log.info("Item already completed, skipping: %s", item_id)
+            return None
+        if item.status == ItemStatus.failed:
+            log.info("Item already failed/cancelled, skipping: %s", item_id)
+            return None
+        if job_status in (JobStatus.failed, JobStatus.partial):
+            log.info("Job %s already terminated (status=%s), skipping item %s",
+                     item.job_id, job_status.value, item_id)
+            return None
+        if not item.raw_blob_path:
+            log.error("Missing raw_blob_path: %s", item_id)
+            item.status = ItemStatus.failed
+            item.error_message = "Missing raw_blob_path"
+            session.commit()
+            return None
+
+        claimed = {
+            "raw_blob_path": item.raw_blob_path,
+            "filename": item.filename,
+            "scene_prompt": item.scene_prompt,
+            "scene_type": item.scene_type,
+            "angle_type": item.angle_type,
+            "is_fan_out": item.scene_index is not None,
+        }
+        item.status = ItemStatus.processing
+        session.commit()
+        return claimed
+
+
+def get_job_context(job_id: str, tenant_id: str) -> Optional[Dict[str, Any]]:
+    """Job-level data shared by every item of a job.
+
+    Brand profile and watermark eligibility (the tenant's user: no active
+    subscription and no token balance) come from one query; the brand's
+    style context adds a second only when the job has a brand profile.
+    """
+    with SessionLocal() as session:
+        has_active_sub = (
+            select(UserSubscription.id)
+            .where(UserSubscription.user_id == User.id, UserSubscription.status == "active")
+            .exists()
+        )
+        row = (
+            session.query(Job.brand_profile_id, BrandProfile, User.id, User.token_balance, has_active_sub)
+            .select_from(Job)
+            .outerjoin(BrandProfile, and_(
+                BrandProfile.id == Job.brand_profile_id,
+                BrandProfile.tenant_id == Job.tenant_id,
+                Job.brand_profile_id != "default",
+            ))
+            .outerjoin(User, User.tenant_id == Job.tenant_id)
+            .filter(Job.id == job_id, Job.tenant_id == tenant_id)
+            .first()
+        )
+        if row is None:
+            return None
+        brand_profile_id, bp, user_id, token_balance, active_sub = row
+
+        style_context = None
+        if bp is not None:
+            styles = session.query(BrandReferenceImage.extracted_style).filter(
+                BrandReferenceImage.brand_profile_id == bp.id,
+                BrandReferenceImage.tenant_id == tenant_id,
+            ).order_by(BrandReferenceImage.created_at).all()
+            style_context = _style_context([style for (style,) in styles])
+
+        return {
+            "job_id": job_id,
+            "tenant_id": tenant_id,
+            "brand_profile_id": brand_profile_id,
+            "brand_profile": _brand_profile_to_dict(bp) if bp is not None else None,
+            "style_context": style_context,
+            # API key users / unknown tenants, subscribers and token holders
+            # get clean output; free-tier users get a watermark
+            "watermark": user_id is not None and not active_sub and (token_balance or 0) <= 0,
         }
 
 
+# ── Job Item Counters ─────────────────────────────────────────────────
+
+def repair_job_counters(job_ids: Optional[List[str]] = None, batch_size: int = 500) -> List[str]:
+    """Recount jobs' item counters from job_items where they drifted.
+
+    Backfill/repair for shared.job_counters (bulk updates bypass it).
+    Checks *job_ids*, or every job in id-ordered batches, and re-derives
+    the status of repaired jobs (no webhooks).  Returns the repaired ids.
+    """
+    from .job_counters import derive_job_status
+
+    jobs, items = Job.__table__, JobItem.__table__
+
+    def count(*conditions):
+        return (
+            select(func.count()).select_from(items)
+            .where(items.c.job_id == jobs.c.id, *conditions)
+            .scalar_subquery()
+        )
+
+    actual = {
+        "items_total": count(),
+        "items_completed": count(items.c.status == ItemStatus.completed),
+        "items_failed": count(items.c.status == ItemStatus.failed),
+        "items_processing": count(items.c.status == ItemStatus.processing),
+    }
+    drifted = or_(*(jobs.c[col] != expr for col, expr in actual.items()))
+
+    def repair(batch: List[str]) -> List[str]:
+        with SessionLocal() as session:
+            fixed = session.execute(
+                update(jobs).where(jobs.c.id.in_(batch), drifted).values(**actual)
+                .returning(jobs.c.id, jobs.c.status, *(jobs.c[col] for col in actual))
+            ).all()
+            for job_id, current, total, completed, failed, processing in fixed:
+                status = derive_job_status(total, completed, failed, processing)
+                if status and JobStatus(status) != current:
+                    session.execute(update(jobs).where(jobs.c.id == job_id).values(status=JobStatus(status)))
+            session.commit()
+            return [row[0] for row in fixed]
+
+    repaired: List[str] = []
+    if job_ids is not None:
+        for i in range(0, len(job_ids), batch_size):
+            repaired += repair(job_ids[i:i + batch_size])
+        return repaired
+
+    last_id = ""
+    while True:
+        with SessionLocal() as session:
+            batch = [row[0] for row in session.execute(
+                select(jobs.c.id).where(jobs.c.id > last_id).order_by(jobs.c.id).limit(batch_size)
+            )]
+        if not batch:
+            break
+        repaired += repair(batch)
+        last_id = batch[-1]
+    if repaired:
+        log.info("Repaired item counters on %d job(s)", len(repaired))
+    return repaired
+
+
+# ── Step Result Cache ─────────────────────────────────────────────────
+
+def get_step_cache_entry(tenant_id: str, cache_key: str) -> Optional[str]:
+    """Return the blob path of a live cache entry.
+
+    Read-only: hits are buffered by the caller and written in batches by
+    record_step_cache_hits.
+    """
+    now = datetime.utcnow()
+    with SessionLocal() as session:
+        entry = session.get(StepCacheEntry, (tenant_id, cache_key))
+        if not entry or entry.expires_at <= now:
+            return None
+        return entry.blob_path
+
+
+def record_step_cache_hits(hits: Dict[tuple, tuple]) -> None:
+    """Write buffered hits ({(tenant_id, cache_key): (count, last_used_at)}) in one statement."""
+    if not hits:
+        return
+    with SessionLocal() as session:
+        session.execute(
+            text(
+                "UPDATE step_cache_entries SET hit_count = hit_count + :n, "
+                "last_used_at = CASE WHEN last_used_at < :ts THEN :ts ELSE last_used_at END "
+                "WHERE tenant_id = :tenant AND cache_key = :key"
+            ),
+            [{"tenant": tenant, "key": key, "n": n, "ts": ts} for (tenant, key), (n, ts) in hits.items()],
+        )
+        session.commit()
+
+
+def put_step_cache_entry(
+    tenant_id: str, cache_key: str, step: str, blob_path: str,
+    size_bytes: int, ttl_days: int,
+) -> None:
+    """Insert or refresh a cache entry."""
+    now = datetime.utcnow()
+    with SessionLocal() as session:
+        entry = session.get(StepCacheEntry, (tenant_id, cache_key))
+        if entry is None:
+            entry = StepCacheEntry(tenant_id=tenant_id, cache_key=cache_key, created_at=now, hit_count=0)
+            session.add(entry)
+        entry.step = step
+        entry.blob_path = blob_path
+        entry.size_bytes = size_bytes
+        entry.last_used_at = now
+        entry.expires_at = now + timedelta(days=ttl_days)
+        session.commit()
+
+
+def evict_step_cache_entries(max_entries_per_tenant: int, limit: int = 1000) -> List[tuple]:
+    """Delete expired entries and each tenant's least recently used entries
+    beyond *max_entries_per_tenant*.  Returns blob paths for storage cleanup.
+
+    Every pipeline worker runs this periodically; SKIP LOCKED keeps
+    concurrent passes from picking the same rows.
+    """
+    now = datetime.utcnow()
+    with SessionLocal() as session:
+        victims = (
+            session.query(StepCacheEntry)
+            .filter(StepCacheEntry.expires_at <= now)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        over_cap = (
+            session.query(StepCacheEntry.tenant_id, func.count().label("n"))
+            .group_by(StepCacheEntry.tenant_id)
+            .having(func.count() > max_entries_per_tenant)
+            .all()
+        )
+        for tenant_id, n in over_cap:
+            if len(victims) >= limit:
+                break
+            victims.extend(
+                session.query(StepCacheEntry)
+                .filter(StepCacheEntry.tenant_id == tenant_id, StepCacheEntry.expires_at > now)
+                .order_by(StepCacheEntry.last_used_at.asc())
+                .limit(min(n - max_entries_per_tenant, limit - len(victims)))
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+
+        blob_paths = [("outputs", v.blob_path) for v in victims]
+        for v in victims:
+            session.delete(v)
+        session.commit()
+        return blob_paths
+
+
+# ── Export Renditions ─────────────────────────────────────────────────
+
+def get_export_renditions(job_id: str, versions: Dict[str, str]) -> Dict[tuple, Dict[str, str]]:
+    """Cached renditions of *job_id*'s items at the current preset *versions*
+    ({preset_key: version}), keyed by (item_id, preset_key)."""
+    if not versions:
+        return {}
+    with SessionLocal() as session:
+        rows = (
+            session.query(ExportRendition)
+            .filter(ExportRendition.job_id == job_id,
+                    ExportRendition.preset_key.in_(list(versions)))
+            .all()
+        )
+        return {
+            (r.item_id, r.preset_key): {"blob_path": r.blob_path, "source_blob_path": r.source_blob_path}
+            for r in rows if versions.get(r.preset_key) == r.version
+        }
+
+
+def get_rendition(item_id: str, preset_key: str, version: str) -> Optional[Dict[str, str]]:
+    """One cached rendition (e.g. a gallery preview), or None."""
+    with SessionLocal() as session:
+        row = session.get(ExportRendition, (item_id, preset_key, version))
+        if row is None:
+            return None
+        return {"blob_path": row.blob_path, "source_blob_path": row.source_blob_path}
+
+
+def put_export_renditions(records: List[Dict[str, Any]]) -> None:
+    """Insert or replace rendition index rows (one transaction)."""
+    if not records:
+        return
+    with SessionLocal() as session:
+        for record in records:
+            session.merge(ExportRendition(**record))
+        session.commit()
+
+
+# ── Blob Deletion Queue ───────────────────────────────────────────────
+
+def _queue_blob_deletions(session: Session, blob_paths: List[tuple], reason: Optional[str] = None,
+                          chunk_size: int = 1000) -> int:
+    """Insert queue rows in *session*'s transaction (the caller commits)."""
+    rows = [{"container": c, "blob_path": p, "reason": reason} for c, p in blob_paths if p]
+    now = datetime.utcnow()
+    for start in range(0, len(rows), chunk_size):
+        chunk = [{**r, "attempts": 0, "enqueued_at": now, "available_at": now}
+                 for r in rows[start:start + chunk_size]]
+        session.execute(insert(BlobDeletion), chunk)
+    return len(rows)
+
+
+def enqueue_blob_deletions(blob_paths: List[tuple], reason: Optional[str] = None,
+                           chunk_size: int = 1000) -> int:
+    """Queue (container, blob_path) pairs for the background blob deleter."""
+    if not any(p for _, p in blob_paths):
+        return 0
+    with SessionLocal() as session:
+        queued = _queue_blob_deletions(session, blob_paths, reason, chunk_size)
+        session.commit()
+    return queued
+
+
+def claim_blob_deletions(limit: int, lease_seconds: int = 300) -> List[Dict[str, Any]]:
+    """Claim up to *limit* due deletions for *lease_seconds*.
+
+    Claimed rows are hidden from other deleters (SKIP LOCKED, then the
+    lease); rows of a deleter that dies become due again when it expires.
+    """
+    now = datetime.utcnow()
+    with SessionLocal() as session:
+        rows = (
+            session.query(BlobDeletion)
+            .filter(BlobDeletion.available_at <= now, BlobDeletion.dead_lettered_at.is_(None))
+            .order_by(BlobDeletion.available_at, BlobDeletion.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        claimed = [{"id": r.id, "container": r.container, "blob_path": r.blob_path,
+                    "attempts": r.attempts} for r in rows]
+        if rows:
+            session.execute(
+                update(BlobDeletion)
+                .where(BlobDeletion.id.in_([r.id for r in rows]))
+                .values(available_at=now + timedelta(seconds=lease_seconds))
+            )
+        session.commit()
+        return claimed
+
+
+def complete_blob_deletions(ids: List[int]) -> None:
+    """Drop deleted (or already missing) blobs from the queue."""
+    if not ids:
+        return
+    with SessionLocal() as session:
+        session.execute(delete(BlobDeletion).where(BlobDeletion.id.in_(ids)))
+        session.commit()
+
+
+def fail_blob_deletions(errors: Dict[int, str], max_attempts: int,
+                        base_delay: int = 60, max_delay: int = 3600) -> int:
+    """Reschedule failed deletions with exponential backoff.
+
+    Rows failing *max_attempts* times are dead-lettered: kept with
+    ``dead_lettered_at`` set, never claimed again and reported by
+    get_blob_deletion_stats until requeue_dead_blob_deletions retries them.
+    Returns how many were dead-lettered.
+    """
+    if not errors:
+        return 0
+    now = datetime.utcnow()
+    given_up = 0
+    with SessionLocal() as session:
+        for row in session.query(BlobDeletion).filter(BlobDeletion.id.in_(list(errors))).all():
+            row.attempts = (row.attempts or 0) + 1
+            row.last_error = (errors[row.id] or "")[:1000]
+            if row.attempts >= max_attempts:
+                log.error("Dead-lettering blob deletion %s/%s after %d attempts: %s",
+                          row.container, row.blob_path, row.attempts, row.last_error)
+                row.dead_lettered_at = now
+                given_up += 1
+                continue
+            delay = min(max_delay, base_delay * 2 ** (row.attempts - 1))
+            row.available_at = now + timedelta(seconds=delay)
+        session.commit()
+    return given_up
+
+
+def requeue_dead_blob_deletions() -> int:
+    """Make dead-lettered deletions due again with a fresh attempt budget."""
+    with SessionLocal() as session:
+        count = session.execute(
+            update(BlobDeletion)
+            .where(BlobDeletion.dead_lettered_at.isnot(None))
+            .values(dead_lettered_at=None, attempts=0, available_at=datetime.utcnow())
+        ).rowcount
+        session.commit()
+    return count
+
+
+def get_blob_deletion_stats() -> Dict[str, Any]:
+    """Backlog of the blob deletion queue, for monitoring."""
+    now = datetime.utcnow()
+    live = BlobDeletion.dead_lettered_at.is_(None)
+    with SessionLocal() as session:
+        pending, oldest = (
+            session.query(func.count(BlobDeletion.id), func.min(BlobDeletion.enqueued_at))
+            .filter(live).one()
+        )
+        retrying = session.query(func.count(BlobDeletion.id)).filter(live, BlobDeletion.attempts > 0).scalar()
+        by_reason = dict(
+            session.query(BlobDeletion.reason, func.count(BlobDeletion.id))
+            .filter(live).group_by(BlobDeletion.reason).all()
+        )
+        dead = dict(
+            session.query(BlobDeletion.reason, func.count(BlobDeletion.id))
+            .filter(BlobDeletion.dead_lettered_at.isnot(None)).group_by(BlobDeletion.reason).all()
+        )
+    return {
+        "pending": pending,
+        "retrying": retrying or 0,
+        "oldest_age_seconds": int((now - oldest).total_seconds()) if oldest else 0,
+        "by_reason": {k or "unspecified": v for k, v in by_reason.items()},
+        "dead_lettered": sum(dead.values()),
+        "dead_lettered_by_reason": {k or "unspecified": v for k, v in dead.items()},
+    }
+
+
+# ── Async Provider Requests ───────────────────────────────────────────
+
+def park_item_for_provider(item_id: str, request_id: str, state: Dict[str, Any]) -> None:
+    """Record a queued provider request and the state needed to resume the item."""
+    with SessionLocal() as session:
+        item = session.get(JobItem, item_id)
+        if item:
+            item.provider_request_id = request_id
+            item.provider_submitted_at = datetime.utcnow()
+            item.provider_resume_enqueued_at = None
+            item.pending_state = state
+            item.updated_at = datetime.utcnow()
+            session.commit()
+
+
+def get_item_by_provider_request(request_id: str) -> Optional[Dict[str, Any]]:
+    """Find the processing item waiting on *request_id*."""
+    with SessionLocal() as session:
+        item = session.query(JobItem).filter(
+            JobItem.provider_request_id == request_id,
+            JobItem.status == ItemStatus.processing,
+        ).first()
+        if not item:
+            return None
+        return {
+            "item_id": item.id,
+            "job_id": item.job_id,
+            "tenant_id": item.tenant_id,
+            "provider_request_id": item.provider_request_id,
+        }
+
+
+def claim_provider_request(item_id: str, request_id: str) -> Optional[Dict[str, Any]]:
+    """Atomically take ownership of a completed provider request.
+
+    Clears the request id so concurrent webhook/poller deliveries resume the
+    item only once.  Returns the pending state and submit time, or None if
+    another worker already claimed it.
+    """
+    with SessionLocal() as session:
+        item = session.get(JobItem, item_id)
+        if not item or item.provider_request_id != request_id:
+            return None
+        state = dict(item.pending_state or {})
+        submitted_at = item.provider_submitted_at
+        claimed = session.execute(
+            text("""
+                UPDATE job_items
+                SET provider_request_id = NULL, pending_state = NULL,
+                    provider_resume_enqueued_at = NULL, updated_at = :now
+                WHERE id = :item_id AND provider_request_id = :request_id
+            """),
+            {"item_id": item_id, "request_id": request_id, "now": datetime.utcnow()},
+        ).rowcount
+        session.commit()
+        if not claimed:
+            return None
+        return {"state": state, "submitted_at": submitted_at}
+
+
+def claim_provider_resume(item_id: str, request_id: str, retry_after_seconds: int,
+                          now: Optional[datetime] = None) -> bool:
+    """Take the right to enqueue the resume of a finished provider request.
+
+    The webhook and every replica's poller may see the request finish; only
+    the caller whose conditional UPDATE sets provider_resume_enqueued_at
+    enqueues.  A resume that has not claimed the request after
+    *retry_after_seconds* (e.g. a transient fetch failure) can be claimed
+    again.
+    """
+    now = now or datetime.utcnow()
+    with SessionLocal() as session:
+        claimed = session.execute(
+            update(JobItem)
+            .where(
+                JobItem.id == item_id,
+                JobItem.provider_request_id == request_id,
+                or_(
+                    JobItem.provider_resume_enqueued_at.is_(None),
+                    JobItem.provider_resume_enqueued_at < now - timedelta(seconds=retry_after_seconds),
+                ),
+            )
+            .values(provider_resume_enqueued_at=now)
+        ).rowcount
+        session.commit()
+        return claimed == 1
+
+
+def list_pending_provider_requests(limit: int = 100) -> List[Dict[str, Any]]:
+    """Processing items waiting on a provider request, oldest first."""
+    with SessionLocal() as session:
+        items = (
+            session.query(JobItem)
+            .filter(
+                JobItem.provider_request_id.isnot(None),
+                JobItem.status == ItemStatus.processing,
+            )
+            .order_by(JobItem.provider_submitted_at.asc())
+            .limit(limit)
+            .all()
+        )
+        return [
+            {
+                "item_id": item.id,
+                "job_id": item.job_id,
+                "tenant_id": item.tenant_id,
+                "provider_request_id": item.provider_request_id,
+                "provider_submitted_at": item.provider_submitted_at,
+                "provider_resume_enqueued_at": item.provider_resume_enqueued_at,
+            }
+            for item in items
+        ]
+
+
 # ── Catalog Jobs ──────────────────────────────────────────────────────
 
 def _catalog_job_to_dict(cj: CatalogJob) -> Dict[str, Any]:
@@ -2513,6 +3161,21 @@ def find_running_test(integration_id: str, product_id: str) -> Optional[Dict[str
         return dict(row) if row else None
 
 
+# One statement, so concurrent first events of a day cannot both miss the
+# UPDATE and race on the (ab_test_id, variant, date) unique key.
+_INCREMENT_METRIC_SQL = text("""
+    INSERT INTO ab_test_metrics (id, ab_test_id, variant, date, views, clicks, add_to_carts, conversions, revenue_cents,
+                                 created_at, updated_at)
+    VALUES (:id, :tid, :var, :d, :v, 0, :atc, :c, :rc, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT (ab_test_id, variant, date) DO UPDATE
+    SET views = ab_test_metrics.views + EXCLUDED.views,
+        add_to_carts = ab_test_metrics.add_to_carts + EXCLUDED.add_to_carts,
+        conversions = ab_test_metrics.conversions + EXCLUDED.conversions,
+        revenue_cents = ab_test_metrics.revenue_cents + EXCLUDED.revenue_cents,
+        updated_at = CURRENT_TIMESTAMP
+""")
+
+
 def increment_ab_test_metric(
     test_id: str,
     variant: str,
@@ -2525,28 +3188,11 @@ def increment_ab_test_metric(
     """Atomically increment metric counters for a variant on a date."""
     from .util import new_id
     with SessionLocal() as session:
-        result = session.execute(
-            text("""
-                UPDATE ab_test_metrics
-                SET views = views + :v,
-                    add_to_carts = add_to_carts + :atc,
-                    conversions = conversions + :c,
-                    revenue_cents = revenue_cents + :rc,
-                    updated_at = NOW()
-                WHERE ab_test_id = :tid AND variant = :var AND date = :d
-            """),
-            {"tid": test_id, "var": variant, "d": date_str,
+        session.execute(
+            _INCREMENT_METRIC_SQL,
+            {"id": new_id("abm"), "tid": test_id, "var": variant, "d": date_str,
              "v": views, "atc": add_to_carts, "c": conversions, "rc": revenue_cents},
         )
-        if result.rowcount == 0:
-            session.execute(
-                text("""
-                    INSERT INTO ab_test_metrics (id, ab_test_id, variant, date, views, clicks, add_to_carts, conversions, revenue_cents)
-                    VALUES (:id, :tid, :var, :d, :v, 0, :atc, :c, :rc)
-                """),
-                {"id": new_id("abm"), "tid": test_id, "var": variant, "d": date_str,
-                 "v": views, "atc": add_to_carts, "c": conversions, "rc": revenue_cents},
-            )
         session.commit()
 
 
@@ -0,0 +1,327 @@
+"""
+Async counterparts of the shared.db_sqlalchemy helpers used by hot async routes.
+
+Same names, arguments and return values as the sync helpers, so a route
+switches by changing its import and awaiting the call.  Each helper runs on
+shared.db_async.AsyncSessionLocal and converts ORM rows with the sync
+module's ``_*_to_dict`` functions before its session closes.
+
+Covered: pixel ingestion, API key / JWT user resolution, A/B test routes
+and catalog job status.  Rarely used write paths (user provisioning,
+catalog processing) stay on the sync helpers.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, select, text
+
+from .db_async import AsyncSessionLocal
+from .db_sqlalchemy import (
+    _INCREMENT_METRIC_SQL, _ab_metric_to_dict, _ab_test_to_dict, _catalog_job_to_dict, _catalog_product_to_dict,
+    _integration_to_dict, _user_to_dict,
+)
+from .models import (
+    ABTest, ABTestMetric, ABTestVariantLog, CatalogJob, CatalogJobProduct, Integration, User,
+)
+
+
+# ── Users & API keys ──────────────────────────────────────────────────
+
+async def get_user_by_entra_subject(subject_id: str) -> Optional[Dict[str, Any]]:
+    """Find user by Entra subject ID (from JWT 'sub' claim)."""
+    async with AsyncSessionLocal() as session:
+        u = (await session.execute(
+            select(User).where(User.entra_subject_id == subject_id).limit(1)
+        )).scalars().first()
+        return _user_to_dict(u) if u else None
+
+
+async def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
+    """Find user by email address."""
+    async with AsyncSessionLocal() as session:
+        u = (await session.execute(select(User).where(User.email == email).limit(1))).scalars().first()
+        return _user_to_dict(u) if u else None
+
+
+async def get_api_key_user(key_hash: str) -> Optional[Dict[str, Any]]:
+    """User behind an active user-generated API key (last_used_at is written by shared.principal_cache)."""
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(
+            text("""
+                SELECT ak.id AS key_id, ak.user_id,
+                       u.tenant_id, u.email, u.token_balance, u.is_admin
+                FROM user_api_keys ak
+                JOIN users u ON u.id = ak.user_id
+                WHERE ak.key_hash = :kh AND ak.is_active = TRUE
+            """),
+            {"kh": key_hash},
+        )).mappings().first()
+        return dict(row) if row else None
+
+
+# ── Integrations & pixel ingestion ────────────────────────────────────
+
+async def get_integration(integration_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """Get an integration by ID, scoped to user."""
+    async with AsyncSessionLocal() as session:
+        i = (await session.execute(
+            select(Integration).where(Integration.id == integration_id, Integration.user_id == user_id)
+        )).scalars().first()
+        return _integration_to_dict(i) if i else None
+
+
+async def get_integration_by_pixel_key(pixel_key: str) -> Optional[Dict[str, Any]]:
+    """Look up an integration by its pixel key."""
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(
+            text("""
+                SELECT id, user_id, provider, store_url, status, pixel_key, provider_metadata
+                FROM integrations
+                WHERE pixel_key = :pk AND status = 'active'
+            """),
+            {"pk": pixel_key},
+        )).mappings().first()
+        return dict(row) if row else None
+
+
+async def get_integration_event_limit(integration_id: str) -> Optional[int]:
+    """Get the monthly event limit for an integration. NULL = unlimited."""
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(
+            text("SELECT monthly_event_limit FROM integrations WHERE id = :iid"),
+            {"iid": integration_id},
+        )).mappings().first()
+        return row["monthly_event_limit"] if row else 1000
+
+
+async def get_monthly_view_count(integration_id: str) -> int:
+    """Count total views across all tests for an integration in the current calendar month."""
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(
+            text("""
+                SELECT COALESCE(SUM(m.views), 0) AS total_views
+                FROM ab_test_metrics m
+                JOIN ab_tests t ON t.id = m.ab_test_id
+                WHERE t.integration_id = :iid
+                  AND m.date >= date_trunc('month', CURRENT_DATE)::date
+            """),
+            {"iid": integration_id},
+        )).mappings().first()
+        return int(row["total_views"]) if row else 0
+
+
+async def find_running_test(integration_id: str, product_id: str) -> Optional[Dict[str, Any]]:
+    """Find a running A/B test for a specific product+integration."""
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(
+            text("""
+                SELECT id, user_id, integration_id, product_id, active_variant,
+                       status, tracking_mode, auto_conclude, started_at
+                FROM ab_tests
+                WHERE integration_id = :iid
+                  AND product_id = :pid
+                  AND status = 'running'
+                LIMIT 1
+            """),
+            {"iid": integration_id, "pid": product_id},
+        )).mappings().first()
+        return dict(row) if row else None
+
+
+async def get_active_variant_at(test_id: str, event_time: datetime) -> Optional[str]:
+    """Determine which variant was active for a test at a given timestamp."""
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(
+            text("""
+                SELECT variant FROM ab_test_variant_log
+                WHERE test_id = :tid AND activated_at <= :ts
+                ORDER BY activated_at DESC
+                LIMIT 1
+            """),
+            {"tid": test_id, "ts": event_time},
+        )).mappings().first()
+        return row["variant"] if row else None
+
+
+async def increment_ab_test_metric(
+    test_id: str,
+    variant: str,
+    date_str: str,
+    views: int = 0,
+    add_to_carts: int = 0,
+    conversions: int = 0,
+    revenue_cents: int = 0,
+) -> None:
+    """Atomically increment metric counters for a variant on a date."""
+    from .util import new_id
+    params = {"tid": test_id, "var": variant, "d": date_str,
+              "v": views, "atc": add_to_carts, "c": conversions, "rc": revenue_cents}
+    async with AsyncSessionLocal() as session:
+        await session.execute(_INCREMENT_METRIC_SQL, {"id": new_id("abm"), **params})
+        await session.commit()
+
+
+# ── A/B tests ─────────────────────────────────────────────────────────
+
+async def create_ab_test(data: Dict[str, Any]) -> Dict[str, Any]:
+    async with AsyncSessionLocal() as session:
+        t = ABTest(**data)
+        session.add(t)
+        await session.commit()
+        await session.refresh(t)
+        return _ab_test_to_dict(t)
+
+
+async def get_ab_test(test_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        t = (await session.execute(
+            select(ABTest).where(ABTest.id == test_id, ABTest.user_id == user_id)
+        )).scalars().first()
+        return _ab_test_to_dict(t) if t else None
+
+
+async def list_ab_tests(user_id: str, integration_id: Optional[str] = None, status: Optional[str] = None,
+                        limit: int = 50) -> List[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        q = select(ABTest).where(ABTest.user_id == user_id)
+        if integration_id:
+            q = q.where(ABTest.integration_id == integration_id)
+        if status:
+            q = q.where(ABTest.status == status)
+        tests = (await session.execute(q.order_by(ABTest.created_at.desc()).limit(limit))).scalars().all()
+        return [_ab_test_to_dict(t) for t in tests]
+
+
+async def update_ab_test(test_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        t = await session.get(ABTest, test_id)
+        if not t:
+            return None
+        for k, v in updates.items():
+            setattr(t, k, v)
+        t.updated_at = datetime.utcnow()
+        await session.commit()
+        await session.refresh(t)
+        return _ab_test_to_dict(t)
+
+
+async def get_ab_test_metrics(test_id: str) -> List[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        metrics = (await session.execute(
+            select(ABTestMetric)
+            .where(ABTestMetric.ab_test_id == test_id)
+            .order_by(ABTestMetric.date.asc(), ABTestMetric.variant.asc())
+        )).scalars().all()
+        return [_ab_metric_to_dict(m) for m in metrics]
+
+
+async def upsert_ab_test_metric(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Insert or update a metric row (unique on test_id + variant + date)."""
+    async with AsyncSessionLocal() as session:
+        existing = (await session.execute(
+            select(ABTestMetric).where(
+                ABTestMetric.ab_test_id == data["ab_test_id"],
+                ABTestMetric.variant == data["variant"],
+                ABTestMetric.date == data["date"],
+            )
+        )).scalars().first()
+        if existing:
+            for k, v in data.items():
+                if k not in ("id", "ab_test_id", "variant", "date"):
+                    setattr(existing, k, v)
+            existing.updated_at = datetime.utcnow()
+            m = existing
+        else:
+            m = ABTestMetric(**data)
+            session.add(m)
+        await session.commit()
+        await session.refresh(m)
+        return _ab_metric_to_dict(m)
+
+
+async def get_ab_test_aggregated_metrics(test_id: str) -> Dict[str, Dict[str, int]]:
+    """Get totals per variant across all dates (summed in the database)."""
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(
+                ABTestMetric.variant,
+                func.coalesce(func.sum(ABTestMetric.views), 0),
+                func.coalesce(func.sum(ABTestMetric.clicks), 0),
+                func.coalesce(func.sum(ABTestMetric.add_to_carts), 0),
+                func.coalesce(func.sum(ABTestMetric.conversions), 0),
+                func.coalesce(func.sum(ABTestMetric.revenue_cents), 0),
+            )
+            .where(ABTestMetric.ab_test_id == test_id)
+            .group_by(ABTestMetric.variant)
+        )).all()
+        return {
+            variant: {"views": int(v), "clicks": int(c), "add_to_carts": int(atc),
+                      "conversions": int(conv), "revenue_cents": int(rc)}
+            for variant, v, c, atc, conv, rc in rows
+        }
+
+
+async def create_variant_log_entry(test_id: str, variant: str,
+                                   activated_at: Optional[datetime] = None) -> Dict[str, Any]:
+    """Record a variant activation (test start or swap)."""
+    from .util import new_id
+    async with AsyncSessionLocal() as session:
+        entry = ABTestVariantLog(
+            id=new_id("vtlog"),
+            test_id=test_id,
+            variant=variant,
+            activated_at=activated_at or datetime.utcnow(),
+        )
+        session.add(entry)
+        await session.commit()
+        await session.refresh(entry)
+        return {
+            "id": entry.id,
+            "test_id": entry.test_id,
+            "variant": entry.variant,
+            "activated_at": entry.activated_at.isoformat() if entry.activated_at else None,
+        }
+
+
+# ── Catalog jobs ──────────────────────────────────────────────────────
+
+async def get_catalog_job(catalog_job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        cj = (await session.execute(
+            select(CatalogJob).where(CatalogJob.id == catalog_job_id, CatalogJob.user_id == user_id)
+        )).scalars().first()
+        return _catalog_job_to_dict(cj) if cj else None
+
+
+async def list_catalog_jobs(user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        cjs = (await session.execute(
+            select(CatalogJob)
+            .where(CatalogJob.user_id == user_id)
+            .order_by(CatalogJob.created_at.desc())
+            .limit(limit)
+        )).scalars().all()
+        return [_catalog_job_to_dict(cj) for cj in cjs]
+
+
+async def update_catalog_job(catalog_job_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        cj = await session.get(CatalogJob, catalog_job_id)
+        if not cj:
+            return None
+        for k, v in updates.items():
+            setattr(cj, k, v)
+        cj.updated_at = datetime.utcnow()
+        await session.commit()
+        await session.refresh(cj)
+        return _catalog_job_to_dict(cj)
+
+
+async def get_catalog_job_products(catalog_job_id: str) -> List[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        products = (await session.execute(
+            select(CatalogJobProduct)
+            .where(CatalogJobProduct.catalog_job_id == catalog_job_id)
+            .order_by(CatalogJobProduct.created_at.asc())
+        )).scalars().all()
+        return [_catalog_product_to_dict(p) for p in products]
@@ -8,6 +8,7 @@ from urllib.parse import urlencode
 
 import httpx
 
+from .output_encoding import content_type_for
 from .settings_service import get_setting
 
 LOG = logging.getLogger(__name__)
@@ -148,7 +149,7 @@ class EtsyClient:
             resp = await client.post(
                 f"{ETSY_API_BASE}/application/shops/{self.shop_id}/listings/{listing_id}/images",
                 headers=self._headers(),
-                files={"image": (filename, image_data, "image/png")},
+                files={"image": (filename, image_data, content_type_for(filename))},
                 data={"rank": str(rank)},
             )
             resp.raise_for_status()
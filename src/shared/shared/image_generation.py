@@ -5,7 +5,8 @@ Supports: FAL.AI (FLUX-dev, FLUX.2 Pro Edit), Replicate, Hugging Face
 import logging
 from abc import ABC, abstractmethod
 from typing import Optional, List
-import httpx
+
+from .provider_http import get_provider_transport
 
 LOG = logging.getLogger(__name__)
 
@@ -29,10 +30,46 @@ class ImageGenerationProvider(ABC):
         """Whether this provider supports native image editing (no PIL compositing needed)."""
         return False
 
+    @property
+    def supports_async(self) -> bool:
+        """Whether this is an AsyncImageGenerationProvider (queue now, collect later).
+
+        A flag rather than isinstance() so the check also works through
+        provider_registry's InstrumentedProvider proxy.
+        """
+        return False
+
+
+class AsyncImageGenerationProvider(ImageGenerationProvider):
+    """Provider that can also queue a generation and collect it later."""
+
+    @property
+    def supports_async(self) -> bool:
+        return True
+
+    @abstractmethod
+    def submit(self, prompt: str, image_url: Optional[str] = None,
+               webhook_url: Optional[str] = None, **kwargs) -> str:
+        """Queue a generation and return the provider's request id."""
+        pass
+
+    @abstractmethod
+    def request_status(self, request_id: str) -> str:
+        """Status of a queued request (COMPLETED once a result can be fetched)."""
+        pass
+
+    @abstractmethod
+    def fetch_result(self, request_id: str) -> Optional[bytes]:
+        """Image bytes of a queued request, or None while it is still running."""
+        pass
+
 
 class FalProvider(ImageGenerationProvider):
     """FAL.AI image generation (FLUX-dev via flux-lora endpoint)"""
 
+    TIMEOUT = 120
+    DOWNLOAD_TIMEOUT = 60
+
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = "https://fal.run/fal-ai"
@@ -74,51 +111,64 @@ class FalProvider(ImageGenerationProvider):
             "Content-Type": "application/json"
         }
 
-        with httpx.Client(timeout=120) as client:
-            # Submit generation request
-            response = client.post(endpoint, json=payload, headers=headers)
-            response.raise_for_status()
-            result = response.json()
+        http = get_provider_transport()
+
+        # Submit generation request
+        response = http.post(endpoint, json=payload, headers=headers, timeout=self.TIMEOUT)
+        response.raise_for_status()
+        result = response.json()
 
-            # Get image URL from result
-            image_url = result["images"][0]["url"]
+        # Get image URL from result
+        image_url = result["images"][0]["url"]
 
-            # Download generated image
-            img_response = client.get(image_url)
-            img_response.raise_for_status()
+        # Download generated image
+        img_response = http.get(image_url, timeout=self.DOWNLOAD_TIMEOUT)
+        img_response.raise_for_status()
 
-            LOG.info("FAL.AI FLUX-dev generation successful")
-            return img_response.content
+        LOG.info("FAL.AI FLUX-dev generation successful")
+        return img_response.content
 
     @property
     def name(self) -> str:
         return "fal.ai"
 
 
-class FalFlux2ProEditProvider(ImageGenerationProvider):
+class FalFlux2ProEditProvider(AsyncImageGenerationProvider):
     """FAL.AI FLUX.2 Pro Edit — native scene compositing.
 
     Sends the product image + scene prompt to FLUX.2 Pro Edit which
     generates the scene *around* the product with natural lighting,
     shadows and reflections.  No PIL compositing needed.
+
+    Besides the blocking ``generate`` (fal.run) the provider supports fal's
+    queue API: ``submit`` returns a request id straight away, and the
+    result is collected later with ``fetch_result`` — after fal calls the
+    webhook, or by polling ``request_status``.
     """
 
-    def __init__(self, api_key: str):
+    TIMEOUT = 180
+    DOWNLOAD_TIMEOUT = 60
+    QUEUE_TIMEOUT = 30
+    MODEL = "flux-2-pro"
+
+    def __init__(self, api_key: str, base_url: str = "https://fal.run/fal-ai",
+                 queue_url: str = "https://queue.fal.run/fal-ai"):
         self.api_key = api_key
-        self.base_url = "https://fal.run/fal-ai"
+        self.base_url = base_url
+        self.queue_url = queue_url
         LOG.info("FAL.AI FLUX.2 Pro Edit provider initialized")
 
     @property
     def supports_edit(self) -> bool:
         return True
 
-    def generate(self, prompt: str, image_url: Optional[str] = None, **kwargs) -> bytes:
-        """Generate with FLUX.2 Pro Edit.
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Key {self.api_key}",
+            "Content-Type": "application/json",
+        }
 
-        When *image_url* is provided the model edits / composites the
-        product into the described scene.  Without an image URL it falls
-        back to pure text-to-image generation.
-        """
+    def _payload(self, prompt: str, image_url: Optional[str], **kwargs) -> dict:
         image_urls: List[str] = kwargs.get("image_urls") or (
             [image_url] if image_url else []
         )
@@ -128,8 +178,6 @@ class FalFlux2ProEditProvider(ImageGenerationProvider):
             len(image_urls), prompt[:80],
         )
 
-        endpoint = f"{self.base_url}/flux-2-pro/edit"
-
         payload: dict = {
             "prompt": prompt,
             "image_size": kwargs.get("image_size", "landscape_16_9"),
@@ -144,23 +192,68 @@ class FalFlux2ProEditProvider(ImageGenerationProvider):
         seed = kwargs.get("seed")
         if seed is not None:
             payload["seed"] = int(seed)
+        return payload
 
-        headers = {
-            "Authorization": f"Key {self.api_key}",
-            "Content-Type": "application/json",
-        }
+    def _download(self, result: dict) -> bytes:
+        img_response = get_provider_transport().get(
+            result["images"][0]["url"], timeout=self.DOWNLOAD_TIMEOUT,
+        )
+        img_response.raise_for_status()
+        return img_response.content
+
+    def generate(self, prompt: str, image_url: Optional[str] = None, **kwargs) -> bytes:
+        """Generate with FLUX.2 Pro Edit.
+
+        When *image_url* is provided the model edits / composites the
+        product into the described scene.  Without an image URL it falls
+        back to pure text-to-image generation.
+        """
+        payload = self._payload(prompt, image_url, **kwargs)
+        endpoint = f"{self.base_url}/{self.MODEL}/edit"
+
+        response = get_provider_transport().post(
+            endpoint, json=payload, headers=self._headers(), timeout=self.TIMEOUT,
+        )
+        response.raise_for_status()
+        image = self._download(response.json())
 
-        with httpx.Client(timeout=180) as client:
-            response = client.post(endpoint, json=payload, headers=headers)
-            response.raise_for_status()
-            result = response.json()
+        LOG.info("FLUX.2 Pro Edit generation successful")
+        return image
 
-            result_url = result["images"][0]["url"]
-            img_response = client.get(result_url)
-            img_response.raise_for_status()
+    def submit(self, prompt: str, image_url: Optional[str] = None,
+               webhook_url: Optional[str] = None, **kwargs) -> str:
+        """Queue a FLUX.2 Pro Edit request; fal POSTs *webhook_url* when done."""
+        payload = self._payload(prompt, image_url, **kwargs)
+        params = {"fal_webhook": webhook_url} if webhook_url else None
 
-            LOG.info("FLUX.2 Pro Edit generation successful")
-            return img_response.content
+        response = get_provider_transport().post(
+            f"{self.queue_url}/{self.MODEL}/edit", json=payload, params=params,
+            headers=self._headers(), timeout=self.QUEUE_TIMEOUT,
+        )
+        response.raise_for_status()
+        request_id = response.json()["request_id"]
+        LOG.info("FLUX.2 Pro Edit request queued: %s", request_id)
+        return request_id
+
+    def request_status(self, request_id: str) -> str:
+        response = get_provider_transport().get(
+            f"{self.queue_url}/{self.MODEL}/requests/{request_id}/status",
+            headers=self._headers(), timeout=self.QUEUE_TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json().get("status", "")
+
+    def fetch_result(self, request_id: str) -> Optional[bytes]:
+        if self.request_status(request_id) != "COMPLETED":
+            return None
+        response = get_provider_transport().get(
+            f"{self.queue_url}/{self.MODEL}/requests/{request_id}",
+            headers=self._headers(), timeout=self.QUEUE_TIMEOUT,
+        )
+        response.raise_for_status()
+        image = self._download(response.json())
+        LOG.info("FLUX.2 Pro Edit result collected: %s", request_id)
+        return image
 
     @property
     def name(self) -> str:
@@ -169,7 +262,9 @@ class FalFlux2ProEditProvider(ImageGenerationProvider):
 
 class ReplicateProvider(ImageGenerationProvider):
     """Replicate API (SDXL models)"""
-    
+
+    DOWNLOAD_TIMEOUT = 60
+
     def __init__(self, api_key: str):
         self.api_key = api_key
         LOG.info("Replicate provider initialized")
@@ -190,10 +285,9 @@ class ReplicateProvider(ImageGenerationProvider):
         )
         
         # Download image
-        with httpx.Client(timeout=60) as client:
-            response = client.get(output[0])
-            response.raise_for_status()
-            return response.content
+        response = get_provider_transport().get(output[0], timeout=self.DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        return response.content
     
     @property
     def name(self) -> str:
@@ -202,7 +296,9 @@ class ReplicateProvider(ImageGenerationProvider):
 
 class HuggingFaceProvider(ImageGenerationProvider):
     """Hugging Face Inference API"""
-    
+
+    TIMEOUT = 120
+
     def __init__(self, api_key: str):
         self.api_key = api_key
         LOG.info("Hugging Face provider initialized")
@@ -214,10 +310,11 @@ class HuggingFaceProvider(ImageGenerationProvider):
         
         headers = {"Authorization": f"Bearer {self.api_key}"}
         
-        with httpx.Client(timeout=120) as client:
-            response = client.post(endpoint, headers=headers, json={"inputs": prompt})
-            response.raise_for_status()
-            return response.content
+        response = get_provider_transport().post(
+            endpoint, headers=headers, json={"inputs": prompt}, timeout=self.TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.content
     
     @property
     def name(self) -> str:
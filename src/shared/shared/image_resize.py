@@ -1,33 +1,47 @@
 """Image resizing and padding for marketplace export presets."""
 
 import io
+from typing import Callable
+
 from PIL import Image
 
 from .export_presets import ExportPreset
 
+# resize(img, (w, h)) -> resized image; swapped for a pyramid by shared.renditions
+Resizer = Callable[[Image.Image, tuple[int, int]], Image.Image]
+
+
+def _lanczos(img: Image.Image, size: tuple[int, int]) -> Image.Image:
+    return img.resize(size, Image.Resampling.LANCZOS)
+
+
+def preset_mode(preset: ExportPreset) -> str:
+    """Pillow mode a preset renders in: RGBA if transparent, otherwise RGB."""
+    return "RGBA" if preset.bg_color == "transparent" else "RGB"
+
 
 def resize_image(image_bytes: bytes, preset: ExportPreset) -> bytes:
     """Resize an image to fit the preset dimensions.
 
     - fit="contain": scales down to fit within target, pads remaining space
     - fit="cover": scales up to fill target, crops excess
+
+    For several presets of one image use shared.renditions.render_presets,
+    which decodes once.
     """
     img = Image.open(io.BytesIO(image_bytes))
+    img = img.convert(preset_mode(preset))
+    return encode_preset(fit_preset(img, preset), preset)
 
-    # Convert to RGBA if we need transparency, otherwise RGB
-    if preset.bg_color == "transparent":
-        img = img.convert("RGBA")
-    else:
-        img = img.convert("RGB")
-
-    target_w, target_h = preset.width, preset.height
 
+def fit_preset(img: Image.Image, preset: ExportPreset, resize: Resizer = _lanczos) -> Image.Image:
+    """Scale and pad/crop *img* (already in preset_mode) to the preset's size."""
     if preset.fit == "cover":
-        img = _fit_cover(img, target_w, target_h)
-    else:
-        img = _fit_contain(img, target_w, target_h, preset.bg_color)
+        return _fit_cover(img, preset.width, preset.height, resize)
+    return _fit_contain(img, preset.width, preset.height, preset.bg_color, resize)
+
 
-    # Save to bytes
+def encode_preset(img: Image.Image, preset: ExportPreset) -> bytes:
     buf = io.BytesIO()
     if preset.bg_color == "transparent":
         img.save(buf, format="PNG", optimize=True)
@@ -36,7 +50,8 @@ def resize_image(image_bytes: bytes, preset: ExportPreset) -> bytes:
     return buf.getvalue()
 
 
-def _fit_contain(img: Image.Image, target_w: int, target_h: int, bg_color: str) -> Image.Image:
+def _fit_contain(img: Image.Image, target_w: int, target_h: int, bg_color: str,
+                 resize: Resizer = _lanczos) -> Image.Image:
     """Scale image to fit within target, pad remaining space with bg_color."""
     orig_w, orig_h = img.size
 
@@ -47,7 +62,7 @@ def _fit_contain(img: Image.Image, target_w: int, target_h: int, bg_color: str)
 
     # Only resize if we need to scale down (or up to fill more space)
     if (new_w, new_h) != (orig_w, orig_h):
-        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        img = resize(img, (new_w, new_h))
 
     # Create canvas with background color
     if bg_color == "transparent":
@@ -72,7 +87,8 @@ def _fit_contain(img: Image.Image, target_w: int, target_h: int, bg_color: str)
     return canvas
 
 
-def _fit_cover(img: Image.Image, target_w: int, target_h: int) -> Image.Image:
+def _fit_cover(img: Image.Image, target_w: int, target_h: int,
+               resize: Resizer = _lanczos) -> Image.Image:
     """Scale image to cover target dimensions, crop excess."""
     orig_w, orig_h = img.size
 
@@ -82,7 +98,7 @@ def _fit_cover(img: Image.Image, target_w: int, target_h: int) -> Image.Image:
     new_h = int(orig_h * scale)
 
     if (new_w, new_h) != (orig_w, orig_h):
-        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        img = resize(img, (new_w, new_h))
 
     # Center crop
     left = (new_w - target_w) // 2
@@ -0,0 +1,114 @@
+"""
+Per-job item counters (jobs.items_total / items_completed / items_failed /
+items_processing), maintained incrementally.
+
+Finalizing a job used to load every item and count statuses in Python after
+each item transition — O(n) rows per item, O(n²) per job.  Instead, every
+ORM flush that inserts, deletes or changes the status of a JobItem applies
+the matching deltas to its job row with one atomic
+``UPDATE jobs SET items_x = items_x + :d`` in the same transaction.  The row
+lock taken by that UPDATE serialises concurrent transitions of one job, so
+the transaction that moves the last item sees the final counts.
+
+Bulk ``query.update()/delete()`` bypasses ORM events; fix drift with
+``shared.db_sqlalchemy.repair_job_counters`` (scripts/repair_job_counters.py
+or POST /v1/admin/jobs/repair-counters).
+"""
+from collections import Counter, defaultdict
+from typing import Dict, Optional
+
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
+
+COUNTER_COLUMNS = ("items_total", "items_completed", "items_failed", "items_processing")
+
+_STATUS_COLUMNS = {
+    "completed": "items_completed",
+    "failed": "items_failed",
+    "processing": "items_processing",
+}
+
+_EXPIRE_KEY = "job_counters_touched"
+
+
+def counter_column(status) -> Optional[str]:
+    """Counter column tracking *status* (None for created/uploaded)."""
+    if status is None:
+        return None
+    return _STATUS_COLUMNS.get(getattr(status, "value", status))
+
+
+def derive_job_status(total: int, completed: int, failed: int, processing: int) -> Optional[str]:
+    """Job status implied by its item counters (None when there are no items)."""
+    if total <= 0:
+        return None
+    pending = total - completed - failed - processing  # created/uploaded
+    if completed == total:
+        return "completed"
+    if pending > 0 or processing > 0:
+        return "processing"
+    if failed == total:
+        return "failed"
+    return "partial"
+
+
+def _item_deltas(session: Session) -> Dict[str, Counter]:
+    from .models import JobItem
+
+    deltas: Dict[str, Counter] = defaultdict(Counter)
+    for obj in session.new:
+        if isinstance(obj, JobItem) and obj.job_id:
+            deltas[obj.job_id]["items_total"] += 1
+            column = counter_column(obj.status)
+            if column:
+                deltas[obj.job_id][column] += 1
+    for obj in session.dirty:
+        if not isinstance(obj, JobItem) or not obj.job_id:
+            continue
+        history = inspect(obj).attrs.status.history
+        if not history.added:
+            continue
+        old = counter_column(history.deleted[0] if history.deleted else None)
+        new = counter_column(history.added[0])
+        if old != new:
+            if old:
+                deltas[obj.job_id][old] -= 1
+            if new:
+                deltas[obj.job_id][new] += 1
+    for obj in session.deleted:
+        if isinstance(obj, JobItem) and obj.job_id:
+            deltas[obj.job_id]["items_total"] -= 1
+            history = inspect(obj).attrs.status.history
+            committed = (history.deleted or history.unchanged or [None])[0]
+            column = counter_column(committed)
+            if column:
+                deltas[obj.job_id][column] -= 1
+    return deltas
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_item_deltas(session: Session, flush_context) -> None:
+    from .models import Job
+
+    jobs = Job.__table__
+    touched = session.info.setdefault(_EXPIRE_KEY, set())
+    for job_id, delta in _item_deltas(session).items():
+        values = {col: jobs.c[col] + n for col, n in delta.items() if n}
+        if not values:
+            continue
+        session.connection().execute(update(jobs).where(jobs.c.id == job_id).values(**values))
+        touched.add(job_id)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _expire_counters(session: Session, flush_context) -> None:
+    from .models import Job
+
+    touched = session.info.pop(_EXPIRE_KEY, None)
+    if not touched:
+        return
+    # The UPDATE bypassed the identity map: reload counters on next access
+    for job_id in touched:
+        job = session.identity_map.get(inspect(Job).identity_key_from_primary_key((job_id,)))
+        if job is not None:
+            session.expire(job, list(COUNTER_COLUMNS))
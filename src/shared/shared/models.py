@@ -1,4 +1,6 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Enum as SQLEnum, JSON, ARRAY, Numeric
+from sqlalchemy import (
+    Column, String, Integer, Boolean, DateTime, ForeignKey, Enum as SQLEnum, JSON, ARRAY, Numeric, UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -238,6 +240,13 @@ class Job(Base):
     processing_options = Column(JSON, nullable=True)
     callback_url = Column(String, nullable=True)
     export_blob_path = Column(String, nullable=True)
+    # Set once by the transaction that turns the job terminal (shared.pipeline)
+    export_requested_at = Column(DateTime, nullable=True)
+    # Item status counters, kept in step with job_items (see shared.job_counters)
+    items_total = Column(Integer, nullable=False, default=0, server_default='0')
+    items_completed = Column(Integer, nullable=False, default=0, server_default='0')
+    items_failed = Column(Integer, nullable=False, default=0, server_default='0')
+    items_processing = Column(Integer, nullable=False, default=0, server_default='0')
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -397,6 +406,7 @@ class ABTest(Base):
 
 class ABTestMetric(Base):
     __tablename__ = 'ab_test_metrics'
+    __table_args__ = (UniqueConstraint('ab_test_id', 'variant', 'date'),)
 
     id = Column(String, primary_key=True)
     ab_test_id = Column(String, ForeignKey('ab_tests.id', ondelete='CASCADE'), nullable=False, index=True)
@@ -499,6 +509,73 @@ class ImportedImage(Base):
         return f'<ImportedImage {self.id} product={self.provider_product_id}>'
 
 
+class StepCacheEntry(Base):
+    """Index of cached pipeline step outputs, keyed per tenant by content hash."""
+    __tablename__ = 'step_cache_entries'
+
+    tenant_id = Column(String, primary_key=True)
+    cache_key = Column(String, primary_key=True)
+    step = Column(String, nullable=False)
+    blob_path = Column(String, nullable=False)
+    size_bytes = Column(Integer, nullable=True)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<StepCacheEntry {self.tenant_id}/{self.step}/{self.cache_key[:12]}>'
+
+
+class ExportRendition(Base):
+    """Cached format-export rendition of one item output for one preset version."""
+    __tablename__ = 'export_renditions'
+
+    item_id = Column(String, primary_key=True)
+    preset_key = Column(String, primary_key=True)
+    version = Column(String, primary_key=True)
+    tenant_id = Column(String, nullable=False, index=True)
+    job_id = Column(String, nullable=False, index=True)
+    source_blob_path = Column(String, nullable=False)
+    blob_path = Column(String, nullable=False)
+    size_bytes = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ExportRendition {self.item_id}/{self.preset_key}@{self.version}>'
+
+
+class BlobDeletion(Base):
+    """Blob waiting for the background deleter (shared.blob_deletion)."""
+    __tablename__ = 'blob_deletions'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    container = Column(String(63), nullable=False)
+    blob_path = Column(String(1024), nullable=False)
+    reason = Column(String(50), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    enqueued_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    # Set after BLOB_DELETION_MAX_ATTEMPTS failures; the row is kept but never claimed
+    dead_lettered_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<BlobDeletion {self.container}/{self.blob_path}>'
+
+
+class CutoutClaim(Base):
+    """Lease on computing one shared bg-removal cutout (pipeline_worker.cutouts)."""
+    __tablename__ = 'cutout_claims'
+
+    blob_path = Column(String(1024), primary_key=True)
+    owner = Column(String(64), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<CutoutClaim {self.blob_path} by {self.owner}>'
+
+
 class JobItem(Base):
     __tablename__ = 'job_items'
 
@@ -518,6 +595,12 @@ class JobItem(Base):
     seo_filename = Column(String(255), nullable=True)
     angle_type = Column(String(50), nullable=True)
     step_timings = Column(JSON, nullable=True)
+    # Async scene generation: provider request in flight + state to resume from
+    provider_request_id = Column(String(100), nullable=True, index=True)
+    provider_submitted_at = Column(DateTime, nullable=True)
+    pending_state = Column(JSON, nullable=True)
+    # Last time a webhook/poller enqueued a resume for the request (claimed atomically)
+    provider_resume_enqueued_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -529,3 +612,7 @@ class JobItem(Base):
 
     def __repr__(self):
         return f'<JobItem {self.id} status={self.status}>'
+
+
+# Registers the ORM flush hooks that maintain Job item counters
+from . import job_counters  # noqa: E402,F401
@@ -0,0 +1,166 @@
+"""
+Output encoding policies for final pipeline images.
+
+Final outputs used to be PNGs saved with ``optimize=True``: slow to encode
+and multi-megabyte, which every later upload, download, export and store
+push-back then has to move.  A policy picks the format and encoder
+settings once per job:
+
+    png            PNG, zlib level 3 (fast, near-optimal size)  [default]
+    png-max        PNG with optimize=True (legacy; smallest PNG, slowest)
+    webp-lossless  lossless WebP, keeps transparency
+    webp           WebP quality 90, keeps transparency
+    jpeg           JPEG quality 92, alpha flattened onto white
+    avif           AVIF quality 80 (falls back to webp when Pillow lacks AVIF)
+
+Resolution order: job ``processing_options.output_format`` > the job's
+tenant in ``OUTPUT_FORMAT_TENANT_OVERRIDES`` (``tenant=webp, ...``) > the
+``OUTPUT_FORMAT`` setting > ``png``.  Both settings are admin-overridable.
+
+Usage:
+    enc = resolve_output_encoding(opts.output_format, tenant_id)
+    data = encode_image(img, enc)
+    path = build_output_blob_path(tenant, job, item, f"{out_id}.{enc.extension}")
+"""
+import logging
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import PurePosixPath
+from typing import Any, Dict, Optional
+
+from PIL import Image, features
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class OutputEncoding:
+    name: str
+    pil_format: str
+    extension: str
+    content_type: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    supports_alpha: bool = True
+    lossless: bool = True
+
+
+POLICIES: Dict[str, OutputEncoding] = {
+    "png": OutputEncoding("png", "PNG", "png", "image/png", {"compress_level": 3}),
+    "png-max": OutputEncoding("png-max", "PNG", "png", "image/png", {"optimize": True}),
+    "webp-lossless": OutputEncoding(
+        "webp-lossless", "WEBP", "webp", "image/webp", {"lossless": True, "quality": 25, "method": 1},
+    ),
+    "webp": OutputEncoding(
+        "webp", "WEBP", "webp", "image/webp", {"quality": 90, "method": 4}, lossless=False,
+    ),
+    "jpeg": OutputEncoding(
+        "jpeg", "JPEG", "jpg", "image/jpeg", {"quality": 92, "optimize": False, "subsampling": 0},
+        supports_alpha=False, lossless=False,
+    ),
+    "avif": OutputEncoding(
+        "avif", "AVIF", "avif", "image/avif", {"quality": 80, "speed": 8}, lossless=False,
+    ),
+}
+
+DEFAULT_POLICY = "png"
+
+CONTENT_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+
+
+def _avif_available() -> bool:
+    try:
+        if features.check("avif"):
+            return True
+    except Exception:
+        pass
+    try:
+        import pillow_avif  # noqa: F401 — registers the AVIF plugin
+        return True
+    except ImportError:
+        return False
+
+
+def get_output_encoding(name: Optional[str]) -> OutputEncoding:
+    """Policy by name; unknown names fall back to the default PNG policy."""
+    enc = POLICIES.get((name or "").strip().lower())
+    if enc is None:
+        if name:
+            LOG.warning("Unknown output format %r — using %s", name, DEFAULT_POLICY)
+        return POLICIES[DEFAULT_POLICY]
+    if enc.name == "avif" and not _avif_available():
+        LOG.warning("AVIF encoder not available — using webp")
+        return POLICIES["webp"]
+    return enc
+
+
+def parse_tenant_formats(spec: str) -> Dict[str, str]:
+    """``"t_a=webp, t_b=jpeg"`` -> {tenant: policy name}; bad entries are skipped."""
+    formats = {}
+    for part in (spec or "").split(","):
+        tenant, _, name = part.partition("=")
+        tenant, name = tenant.strip(), name.strip().lower()
+        if not tenant or not name:
+            continue
+        if name not in POLICIES:
+            LOG.warning("Ignoring invalid tenant output format %r", part.strip())
+            continue
+        formats[tenant] = name
+    return formats
+
+
+def resolve_output_encoding(job_format: Optional[str] = None,
+                            tenant_id: Optional[str] = None) -> OutputEncoding:
+    """Job option first, then the tenant's override, then the OUTPUT_FORMAT setting."""
+    if job_format:
+        return get_output_encoding(job_format)
+    try:
+        from .settings_service import get_setting
+        if tenant_id:
+            tenant_format = parse_tenant_formats(get_setting("OUTPUT_FORMAT_TENANT_OVERRIDES")).get(tenant_id)
+            if tenant_format:
+                return get_output_encoding(tenant_format)
+        return get_output_encoding(get_setting("OUTPUT_FORMAT"))
+    except Exception:
+        return POLICIES[DEFAULT_POLICY]
+
+
+def encode_image(image: Image.Image, encoding: OutputEncoding) -> bytes:
+    """Encode *image* with *encoding*, flattening alpha for formats without it."""
+    img = image
+    if not encoding.supports_alpha:
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            flat = Image.new("RGB", rgba.size, (255, 255, 255))
+            flat.paste(rgba, mask=rgba.split()[3])
+            img = flat
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+        img = img.convert("RGBA")
+
+    buf = BytesIO()
+    img.save(buf, format=encoding.pil_format, **encoding.params)
+    return buf.getvalue()
+
+
+def content_type_for(filename: str, default: str = "image/png") -> str:
+    """MIME type from a filename's extension."""
+    return CONTENT_TYPES.get(PurePosixPath(filename).suffix.lower(), default)
+
+
+def with_extension(filename: str, extension_source: str) -> str:
+    """*filename* with its suffix replaced by *extension_source*'s suffix.
+
+    Used to name outputs after their actual encoding, e.g.
+    ``with_extension("shoe.jpg", "t/jobs/j/items/i/outputs/out_1.webp")`` → ``shoe.webp``.
+    """
+    suffix = PurePosixPath(extension_source).suffix
+    if not suffix:
+        return filename
+    return f"{PurePosixPath(filename).stem}{suffix}"
@@ -6,17 +6,24 @@ from __future__ import annotations
 
 import json
 import logging
+import time
 from dataclasses import dataclass, field
 from typing import Optional, Dict, Any
 
 LOG = logging.getLogger(__name__)
 
+# Export message sends are retried inline; what still fails is re-requested
+# by request_missing_exports (run periodically by the pipeline worker).
+EXPORT_SEND_ATTEMPTS = 3
+EXPORT_SEND_BACKOFF = 1.0  # seconds, doubled per attempt
+
 
 @dataclass
 class ProcessingOptions:
     remove_background: bool = True
     generate_scene: bool = True
     upscale: bool = False
+    output_format: Optional[str] = None   # shared.output_encoding policy name
 
     @classmethod
     def from_dict(cls, d: Dict[str, Any]) -> "ProcessingOptions":
@@ -24,6 +31,7 @@ class ProcessingOptions:
             remove_background=d.get("remove_background", True),
             generate_scene=d.get("generate_scene", True),
             upscale=d.get("upscale", False),
+            output_format=d.get("output_format"),
         )
 
     def to_dict(self) -> Dict[str, Any]:
@@ -31,6 +39,7 @@ class ProcessingOptions:
             "remove_background": self.remove_background,
             "generate_scene": self.generate_scene,
             "upscale": self.upscale,
+            "output_format": self.output_format,
         }
 
 
@@ -103,19 +112,41 @@ def mark_item_failed(job_id: str, item_id: str, error: str) -> None:
     Mark an item as failed and immediately reconcile the parent job status.
     Call this from worker exception handlers so the job never stays stuck in 'processing'.
     """
-    from shared.db import SessionLocal
-    from shared.models import JobItem, ItemStatus
+    from shared.models import ItemStatus
 
     if not item_id:
         return
+    _finish_item(job_id, item_id, {"status": ItemStatus.failed, "error_message": str(error)[:4000]})
+
+
+def complete_item(job_id: str, item_id: str, fields: Dict[str, Any]) -> None:
+    """
+    Mark an item completed (setting *fields*, e.g. output_blob_path) and
+    reconcile the parent job status in the same transaction.
+    """
+    from shared.models import ItemStatus
+
+    _finish_item(job_id, item_id, {**fields, "status": ItemStatus.completed})
+
+
+def _finish_item(job_id: Optional[str], item_id: str, fields: Dict[str, Any]) -> None:
+    from shared.db import SessionLocal
+    from shared.models import Job, JobItem
+
+    finalized = None
     with SessionLocal() as s:
         item = s.get(JobItem, item_id)
         if item:
-            item.status = ItemStatus.failed
-            item.error_message = str(error)[:4000]
-            s.commit()
-    if job_id:
-        finalize_job_status(job_id)
+            for key, value in fields.items():
+                setattr(item, key, value)
+            s.flush()
+        job = s.get(Job, job_id) if job_id else None
+        if job is not None:
+            finalized = _finalize(s, job)
+        s.commit()
+
+    if finalized:
+        finalized.dispatch()
 
 
 def finalize_job_status(job_id: str) -> None:
@@ -123,49 +154,170 @@ def finalize_job_status(job_id: str) -> None:
     Update overall job status based on all item statuses.
     Call after an item reaches completed or failed.
     Moved from orchestrator so all workers can import it.
-    Fires webhook callback on terminal states (completed/failed/partial).
+    On terminal states (completed/failed/partial) fires the webhook callback
+    and requests the job's export — once per job, whichever worker gets there.
     """
     from shared.db import SessionLocal
-    from shared.models import Job, JobItem, JobStatus, ItemStatus
-
-    callback_url = None
-    new_status = None
+    from shared.models import Job
 
+    finalized = None
     with SessionLocal() as s:
         job = s.get(Job, job_id)
         if not job:
             return
+        finalized = _finalize(s, job)
+        s.commit()
+
+    if finalized:
+        finalized.dispatch()
+
+
+@dataclass
+class _Finalized:
+    """Side effects of a job reaching a terminal status, run after commit."""
+    job_id: str
+    tenant_id: str
+    correlation_id: str
+    status: str
+    callback_url: Optional[str] = None
+    export: bool = False
+
+    def dispatch(self) -> None:
+        if self.export:
+            _request_export(self.job_id, self.tenant_id, self.correlation_id)
+        if self.callback_url:
+            _fire_webhook(self.callback_url, self.job_id, self.status)
+
+
+def _finalize(s, job) -> Optional[_Finalized]:
+    status = _reconcile_job_status(s, job)
+    if not status:
+        return None
+    return _Finalized(
+        job_id=job.id,
+        tenant_id=job.tenant_id,
+        correlation_id=job.correlation_id,
+        status=status,
+        callback_url=job.callback_url,
+        export=_claim_export(s, job),
+    )
 
-        items = list(job.items)
-        if not items:
-            return
 
-        statuses = [item.status for item in items]
-        completed = statuses.count(ItemStatus.completed)
-        failed = statuses.count(ItemStatus.failed)
-        processing = statuses.count(ItemStatus.processing)
-        pending = len(items) - completed - failed - processing  # created/uploaded
-
-        if completed == len(items):
-            job.status = JobStatus.completed
-            new_status = "completed"
-            LOG.info("Job COMPLETED: %s", job_id)
-        elif pending > 0 or processing > 0:
-            job.status = JobStatus.processing
-        elif failed == len(items):
-            job.status = JobStatus.failed
-            new_status = "failed"
-        elif failed > 0:
-            job.status = JobStatus.partial
-            new_status = "partial"
+def _reconcile_job_status(s, job) -> Optional[str]:
+    """Set job.status from its item counters (caller commits).
 
+    The counters are maintained in the item transition's own transaction
+    (shared.job_counters), so this reads one row instead of every item.
+    Returns the terminal status reached, if any.
+    """
+    from shared.job_counters import derive_job_status
+    from shared.models import JobStatus
+
+    s.flush()
+    status = derive_job_status(job.items_total, job.items_completed,
+                               job.items_failed, job.items_processing)
+    if status is None:
+        return None
+    job.status = JobStatus(status)
+    if status == "processing":
+        return None
+    if status == "completed":
+        LOG.info("Job COMPLETED: %s", job.id)
+    return status
+
+
+def _claim_export(s, job) -> bool:
+    """Flag *job*'s export as requested; True for the one transaction that wins.
+
+    Every item's worker may see the job turn terminal (redeliveries, the
+    orchestrator passthrough and late failures included), but only the
+    conditional UPDATE that flips export_requested_at from NULL sends the
+    export message.  Jobs without a completed item have nothing to export.
+    """
+    from datetime import datetime
+    from sqlalchemy import update
+    from shared.models import Job
+
+    if job.items_completed <= 0:
+        return False
+    result = s.execute(
+        update(Job.__table__)
+        .where(Job.__table__.c.id == job.id, Job.__table__.c.export_requested_at.is_(None))
+        .values(export_requested_at=datetime.utcnow())
+    )
+    return result.rowcount == 1
+
+
+def _request_export(job_id: str, tenant_id: str, correlation_id: str) -> bool:
+    """Queue the job's ZIP export, retrying the send with backoff.
+
+    If every attempt fails the claim is released; request_missing_exports
+    then picks the job up on its next pass (no later finalize may come).
+    """
+    payload = {'tenant_id': tenant_id, 'job_id': job_id, 'correlation_id': correlation_id}
+    for attempt in range(EXPORT_SEND_ATTEMPTS):
+        try:
+            _send_export_message(payload, message_id=f'export-{job_id}')
+            return True
+        except Exception as e:
+            if attempt + 1 < EXPORT_SEND_ATTEMPTS:
+                LOG.warning("Export message failed: job=%s attempt=%d error=%s", job_id, attempt + 1, e)
+                time.sleep(EXPORT_SEND_BACKOFF * 2 ** attempt)
+            else:
+                LOG.error("Export message failed: job=%s error=%s (sweeper will retry)", job_id, e)
+    _release_export_claim(job_id)
+    return False
+
+
+def _send_export_message(payload: Dict[str, Any], message_id: Optional[str] = None) -> None:
+    from shared.queue_database import send_export_message
+    send_export_message(payload, message_id=message_id)
+
+
+def request_missing_exports(limit: int = 100) -> int:
+    """Request exports for finished jobs that never got one.
+
+    Catches jobs whose export send failed after the last item finished.
+    Each job is claimed with the same conditional UPDATE as finalization,
+    so a concurrent finalize or another replica's sweep cannot double-send.
+    Returns how many exports were requested.
+    """
+    from shared.db import SessionLocal
+    from shared.models import Job, JobStatus
+
+    with SessionLocal() as s:
+        jobs = (
+            s.query(Job)
+            .filter(
+                Job.status.in_([JobStatus.completed, JobStatus.partial, JobStatus.failed]),
+                Job.items_completed > 0,
+                Job.export_requested_at.is_(None),
+                Job.export_blob_path.is_(None),
+            )
+            .limit(limit)
+            .all()
+        )
+        claimed = [(j.id, j.tenant_id, j.correlation_id) for j in jobs if _claim_export(s, j)]
         s.commit()
 
-        if new_status and job.callback_url:
-            callback_url = job.callback_url
+    requested = sum(_request_export(*job) for job in claimed)
+    if claimed:
+        LOG.info("Export sweep: requested %d/%d missing export(s)", requested, len(claimed))
+    return requested
+
+
+def _release_export_claim(job_id: str) -> None:
+    from shared.db import SessionLocal
+    from shared.models import Job
 
-    if callback_url:
-        _fire_webhook(callback_url, job_id, new_status)
+    try:
+        with SessionLocal() as s:
+            job = s.get(Job, job_id)
+            if job is not None and not job.export_blob_path:
+                job.export_requested_at = None
+                s.commit()
+    except Exception as e:
+        LOG.warning("Could not release export claim: job=%s error=%s", job_id, e)
 
 
 def _fire_webhook(url: str, job_id: str, status: str) -> None:
@@ -0,0 +1,138 @@
+"""
+Small gallery previews of item images, generated once and served from storage.
+
+The job gallery used to download multi-megabyte originals just to draw
+thumbnails.  A preview is a WebP or JPEG of the raw upload or final output
+at one of PREVIEW_WIDTHS.  It is rendered on first request (or by the
+pipeline worker when the item completes, see PREVIEW_PREGENERATE_WIDTHS),
+stored next to the item like export renditions and indexed in the same
+``export_renditions`` table (preset key ``preview-<source>-w<width>``), so
+it is cleaned up with the job.  The blob path includes a hash of the
+source blob path, so a reprocessed item (new output) gets a new preview
+blob and the old one is queued for deletion; blobs never change in place
+and are uploaded with an immutable Cache-Control header.
+
+Usage:
+    blob_path = ensure_preview(item, "outputs", 320, "webp")
+"""
+import hashlib
+import io
+import logging
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+LOG = logging.getLogger(__name__)
+
+PREVIEW_WIDTHS = (160, 320, 640, 1024)
+PREVIEW_SOURCES = ("outputs", "raw")
+# format -> (Pillow format, extension, content type, save options)
+PREVIEW_FORMATS = {
+    "webp": ("WEBP", "webp", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+PREVIEW_VERSION = 1
+PREVIEW_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def snap_width(width: int) -> int:
+    """Smallest preview width >= *width* (the largest one for bigger requests)."""
+    for allowed in PREVIEW_WIDTHS:
+        if width <= allowed:
+            return allowed
+    return PREVIEW_WIDTHS[-1]
+
+
+def parse_widths(value: str) -> List[int]:
+    """Snapped, de-duplicated widths from a comma list such as "320,640"."""
+    widths = []
+    for part in (value or "").split(","):
+        part = part.strip()
+        if part.isdigit() and int(part) > 0:
+            width = snap_width(int(part))
+            if width not in widths:
+                widths.append(width)
+    return widths
+
+
+def preview_key(source: str, width: int) -> str:
+    return f"preview-{source}-w{width}"
+
+
+def preview_version(width: int, fmt: str) -> str:
+    spec = (PREVIEW_VERSION, width, fmt, sorted(PREVIEW_FORMATS[fmt][3].items()))
+    return hashlib.sha256(repr(spec).encode("utf-8")).hexdigest()[:12]
+
+
+def render_preview(image_bytes: bytes, width: int, fmt: str = "webp") -> bytes:
+    """Downscale to *width* px wide (never up) and encode as *fmt*."""
+    pil_format, _, _, options = PREVIEW_FORMATS[fmt]
+    img = Image.open(io.BytesIO(image_bytes))
+    # JPEG sources decode at reduced scale straight away
+    img.draft("RGB", (width, max(1, width * img.height // img.width)))
+    if img.width > width:
+        height = max(1, round(img.height * width / img.width))
+        img = img.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if fmt == "jpeg" and has_alpha:
+        rgba = img.convert("RGBA")
+        canvas = Image.new("RGB", rgba.size, (255, 255, 255))
+        canvas.paste(rgba, mask=rgba.getchannel("A"))
+        img = canvas
+    else:
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+    buf = io.BytesIO()
+    img.save(buf, format=pil_format, **options)
+    return buf.getvalue()
+
+
+def ensure_preview(item: Dict[str, Any], source: str, width: int, fmt: str = "webp",
+                   image_bytes: Optional[bytes] = None) -> Optional[str]:
+    """Blob path (outputs container) of *item*'s preview, rendering it first if needed.
+
+    *item* needs id, job_id, tenant_id and the source's blob path
+    (``output_blob_path`` / ``raw_blob_path``).  Pass *image_bytes* when the
+    source is already in memory.  Returns None when the item has no such
+    source image yet.
+    """
+    from .db_sqlalchemy import enqueue_blob_deletions, get_rendition, put_export_renditions
+    from .storage import build_rendition_blob_path, download_blob, upload_blob
+
+    source_path = item.get("output_blob_path" if source == "outputs" else "raw_blob_path")
+    if not source_path:
+        return None
+
+    key = preview_key(source, width)
+    version = preview_version(width, fmt)
+    cached = get_rendition(item["id"], key, version)
+    if cached and cached["source_blob_path"] == source_path:
+        return cached["blob_path"]
+
+    if image_bytes is None:
+        image_bytes = download_blob(source, source_path)
+    data = render_preview(image_bytes, width, fmt)
+    _, ext, content_type, _ = PREVIEW_FORMATS[fmt]
+    source_hash = hashlib.sha256(source_path.encode("utf-8")).hexdigest()[:8]
+    blob_path = build_rendition_blob_path(
+        item["tenant_id"], item["job_id"], item["id"], key, f"{version}-{source_hash}", ext,
+    )
+    upload_blob("outputs", blob_path, data, content_type=content_type, cache_control=PREVIEW_CACHE_CONTROL)
+    put_export_renditions([{
+        "item_id": item["id"],
+        "preset_key": key,
+        "version": version,
+        "tenant_id": item["tenant_id"],
+        "job_id": item["job_id"],
+        "source_blob_path": source_path,
+        "blob_path": blob_path,
+        "size_bytes": len(data),
+    }])
+    if cached and cached["blob_path"] != blob_path:
+        try:
+            enqueue_blob_deletions([("outputs", cached["blob_path"])], reason="preview")
+        except Exception as e:
+            LOG.warning("Failed to queue stale preview %s for deletion: %s", cached["blob_path"], e)
+    LOG.info("Preview generated item=%s %s (%d bytes)", item["id"], key, len(data))
+    return blob_path
@@ -0,0 +1,251 @@
+"""Principal cache: resolved API-key and JWT users, and buffered last_used_at writes.
+
+Every authenticated request used to look its principal up in the database
+(a user_api_keys/users join, or the user behind a JWT subject) and, for API
+keys, write ``last_used_at`` with its own commit.  Each web API process now
+keeps:
+
+  - the resolved principal per key hash or JWT subject for up to
+    PRINCIPAL_CACHE_TTL seconds (at most PRINCIPAL_CACHE_MAX_ENTRIES,
+    least recently used dropped first)
+  - ``last_used_at`` per API key in memory, written in one statement every
+    API_KEY_LAST_USED_FLUSH_SECONDS and on shutdown
+
+Key revocation and changes to a user's balance or admin flag drop that
+user's principals at once in the writing process and ``pg_notify`` every
+other process, whose LISTEN thread drops theirs.  A lost notification is
+bounded by the TTL.
+
+Usage:
+    cached = get_principal(f"key:{key_hash}")
+    if cached is None:
+        cached = lookup(...)
+        cache_principal(f"key:{key_hash}", cached["user_id"], cached)
+    record_api_key_use(cached["key_id"])
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from .config import settings as env_settings
+
+LOG = logging.getLogger(__name__)
+
+PRINCIPALS_CHANNEL = "principals_changed"
+
+
+class PrincipalCache:
+    """TTL + LRU map of auth key -> resolved principal, indexed by user."""
+
+    def __init__(self, ttl: float, max_entries: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self._by_user: Dict[str, Set[str]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> int:
+        """Bumped by every invalidation; pass it to ``put`` to drop racing loads."""
+        return self._generation
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._clock() >= entry[0]:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: str, user_id: str, value: Any, generation: Optional[int] = None) -> None:
+        with self._lock:
+            # An invalidation during the lookup may have raced the read
+            if generation is not None and generation != self._generation:
+                return
+            self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, user_id, value)
+            self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: str) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in self._by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_user.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry[1]]
+
+
+class LastUsedBuffer:
+    """Latest use time per API key, written in batches by a background thread."""
+
+    def __init__(self, writer: Callable[[Dict[str, datetime]], Any], interval: float):
+        self._writer = writer
+        self.interval = interval
+        self._pending: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self.flushes = 0
+
+    def record(self, key_id: str, when: Optional[datetime] = None) -> None:
+        when = when or datetime.now(timezone.utc)
+        with self._lock:
+            current = self._pending.get(key_id)
+            if current is None or when > current:
+                self._pending[key_id] = when
+            start = not self._started and self.interval > 0
+            self._started = self._started or start
+        if start:
+            threading.Thread(target=self._run, daemon=True, name="api-key-last-used").start()
+        elif self.interval <= 0:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of keys written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            self._writer(pending)
+            self.flushes += 1
+        except Exception:
+            LOG.warning("Writing last_used_at for %d API keys failed, retrying next flush",
+                        len(pending), exc_info=True)
+            with self._lock:
+                for key_id, when in pending.items():
+                    if key_id not in self._pending or when > self._pending[key_id]:
+                        self._pending[key_id] = when
+            return 0
+        return len(pending)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+def _write_last_used(last_used: Dict[str, datetime]) -> None:
+    from .db_sqlalchemy import touch_api_keys
+    touch_api_keys(last_used)
+
+
+_cache = PrincipalCache(ttl=env_settings.PRINCIPAL_CACHE_TTL,
+                        max_entries=env_settings.PRINCIPAL_CACHE_MAX_ENTRIES)
+_last_used = LastUsedBuffer(_write_last_used, interval=env_settings.API_KEY_LAST_USED_FLUSH_SECONDS)
+_listener_started = False
+_listener_lock = threading.Lock()
+
+
+def get_principal(key: str) -> Optional[Any]:
+    """Cached principal for *key* ("key:<hash>" or "sub:<subject>"), or None."""
+    if _cache.ttl <= 0:
+        return None
+    _ensure_listener()
+    return _cache.get(key)
+
+
+def principal_generation() -> int:
+    """Read before a principal lookup and pass to ``cache_principal``."""
+    return _cache.generation
+
+
+def cache_principal(key: str, user_id: str, value: Any, generation: Optional[int] = None) -> None:
+    if _cache.ttl > 0:
+        _cache.put(key, user_id, value, generation=generation)
+
+
+def invalidate_principal(user_id: str) -> None:
+    """Drop this process's cached principals of *user_id*."""
+    _cache.invalidate_user(user_id)
+
+
+def notify_principal_changed(session, user_id: str) -> None:
+    """Queue a principal invalidation on *session*'s transaction (Postgres only).
+
+    Delivered to listening processes when the transaction commits.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy import text
+        session.execute(text("SELECT pg_notify(:channel, :uid)"),
+                        {"channel": PRINCIPALS_CHANNEL, "uid": user_id})
+
+
+def record_api_key_use(key_id: str) -> None:
+    """Buffer a last_used_at update for *key_id*."""
+    _last_used.record(key_id)
+
+
+def flush_api_key_use() -> int:
+    """Write buffered last_used_at values now (called on shutdown)."""
+    return _last_used.flush()
+
+
+# ── Cross-process invalidation (Postgres LISTEN) ─────────────────────
+
+def _listen_forever(conninfo: str) -> None:
+    import psycopg
+
+    backoff = 1.0
+    while True:
+        try:
+            with psycopg.connect(conninfo, autocommit=True) as conn:
+                conn.execute(f"LISTEN {PRINCIPALS_CHANNEL}")
+                # Anything committed while we were disconnected was missed
+                _cache.clear()
+                backoff = 1.0
+                LOG.info("Listening for principal changes")
+                while True:
+                    for notify in conn.notifies(timeout=60):
+                        _cache.invalidate_user(notify.payload)
+                    # Round trip so a dead connection is noticed
+                    conn.execute("SELECT 1")
+        except Exception as e:
+            LOG.warning("Principal listener disconnected (%s), retrying in %.0fs", e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+
+def _ensure_listener() -> None:
+    global _listener_started
+    if _listener_started or not env_settings.PRINCIPAL_CACHE_LISTEN:
+        return
+    with _listener_lock:
+        if _listener_started:
+            return
+        _listener_started = True
+        from .db import engine
+        if engine is None or engine.dialect.name != "postgresql":
+            return  # nothing to listen to; the TTL alone bounds staleness
+        conninfo = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        threading.Thread(target=_listen_forever, args=(conninfo,),
+                         daemon=True, name="principal-listener").start()
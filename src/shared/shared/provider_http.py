@@ -0,0 +1,179 @@
+"""
+Shared HTTP transport for external image providers.
+
+Providers used to open a fresh ``httpx.Client`` (or call ``httpx.post``) per
+call, paying DNS + TCP + TLS setup every time — twice per item for fal.ai
+(generate, then download the result from its CDN).  All providers now go
+through one process-wide transport:
+
+  - keep-alive connection pools per host, HTTP/2 when ``h2`` is installed
+  - per-call read timeouts (each provider keeps its own), shared connect timeout
+  - retries with exponential backoff + jitter on 429/5xx and connection
+    failures, honouring ``Retry-After``; a connection dropped mid-request
+    is only retried for idempotent methods (GET, status polls)
+
+Usage:
+    response = get_provider_transport().post(url, json=payload, timeout=180)
+    response.raise_for_status()
+"""
+import email.utils
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import httpx
+
+LOG = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Failures before the request was sent, so resending is safe even for
+# POSTs.  Read timeouts are not retried: the provider may still be
+# generating.
+RETRY_EXCEPTIONS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+)
+
+# The connection dropped after (part of) the request went out.  The
+# provider may already have accepted it, so resending a submit/generate
+# POST could start a second billed generation; only idempotent methods
+# are retried.
+IDEMPOTENT_RETRY_EXCEPTIONS = (httpx.RemoteProtocolError,)
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def parse_retry_after(value: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+class ProviderTransport:
+    """Pooled, retrying HTTP client shared by all provider instances."""
+
+    def __init__(self, max_connections: int = 50, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 60.0, connect_timeout: float = 10.0,
+                 default_timeout: float = 120.0, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 http2: Optional[bool] = None, transport: Optional[httpx.BaseTransport] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.connect_timeout = connect_timeout
+        self.default_timeout = default_timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+        self.http2 = _http2_available() if http2 is None else (http2 and _http2_available())
+        self.client = httpx.Client(
+            http2=self.http2,
+            transport=transport,
+            timeout=self._timeout(default_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            follow_redirects=True,
+        )
+        self.retries = 0
+
+    def _timeout(self, seconds: Optional[float]) -> httpx.Timeout:
+        return httpx.Timeout(seconds or self.default_timeout, connect=self.connect_timeout)
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.backoff_max)
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def request(self, method: str, url: str, *, timeout: Optional[float] = None,
+                max_retries: Optional[int] = None, **kwargs) -> httpx.Response:
+        """Send a request, retrying transient failures.
+
+        Returns the final response — callers still ``raise_for_status()``;
+        a 429/5xx that persists past the retry budget is returned as-is.
+        """
+        retries = self.max_retries if max_retries is None else max_retries
+        timeout_cfg = self._timeout(timeout)
+        retry_on = RETRY_EXCEPTIONS
+        if method.upper() in IDEMPOTENT_METHODS:
+            retry_on += IDEMPOTENT_RETRY_EXCEPTIONS
+        attempt = 0
+        while True:
+            try:
+                response = self.client.request(method, url, timeout=timeout_cfg, **kwargs)
+            except retry_on as exc:
+                if attempt >= retries:
+                    raise
+                delay = self._backoff(attempt, None)
+                LOG.warning("%s %s failed (%s) — retry %d/%d in %.1fs",
+                            method, httpx.URL(url).host, type(exc).__name__, attempt + 1, retries, delay)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                delay = self._backoff(attempt, response)
+                LOG.warning("%s %s returned %d — retry %d/%d in %.1fs",
+                            method, httpx.URL(url).host, response.status_code, attempt + 1, retries, delay)
+                response.close()
+            attempt += 1
+            self.retries += 1
+            self._sleep(delay)
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+_transport: Optional[ProviderTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_provider_transport() -> ProviderTransport:
+    """Process-wide transport, created from settings on first use."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                from .config import settings
+                _transport = ProviderTransport(
+                    max_connections=settings.PROVIDER_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.PROVIDER_HTTP_MAX_KEEPALIVE,
+                    connect_timeout=settings.PROVIDER_HTTP_CONNECT_TIMEOUT,
+                    max_retries=settings.PROVIDER_HTTP_MAX_RETRIES,
+                    http2=settings.PROVIDER_HTTP2,
+                )
+                LOG.info("Provider HTTP transport ready (http2=%s, max_connections=%d)",
+                         _transport.http2, settings.PROVIDER_HTTP_MAX_CONNECTIONS)
+    return _transport
@@ -0,0 +1,193 @@
+"""
+Long-lived provider instances shared by every job a process handles.
+
+Workers and the preview route used to construct a new provider object per
+message/request.  The registry keeps one instance per provider slot and only
+rebuilds it when its configuration (API key, endpoint, ...) changes — e.g.
+an admin switches IMAGE_GEN_PROVIDER or rotates FAL_API_KEY.  Configuration
+is compared by fingerprint, so credentials are never kept as dict keys.
+
+Instances are wrapped in ``InstrumentedProvider``: per-provider call
+metrics, plus an optional cap on concurrent calls
+(``PROVIDER_MAX_CONCURRENCY``, or a per-name limit from
+``PROVIDER_CONCURRENCY_LIMITS="fal-flux2=8,replicate=2"``).
+
+Usage:
+    provider = resolve_image_gen_provider()   # None when no API key is set
+    provider.generate(prompt, image_url=url)
+"""
+import functools
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+# Admin/env setting holding each image-gen provider's API key
+# (default: <NAME>_API_KEY; fal-flux2 shares fal's key)
+IMAGE_GEN_API_KEY_SETTINGS = {"fal-flux2": "FAL_API_KEY"}
+
+
+def image_gen_api_key_setting(provider_name: str) -> str:
+    return IMAGE_GEN_API_KEY_SETTINGS.get(
+        provider_name, f'{provider_name.upper().replace(".", "_")}_API_KEY',
+    )
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """``"fal-flux2=8, replicate=2"`` -> {name: limit}; bad entries are skipped."""
+    limits = {}
+    for part in (spec or "").split(","):
+        name, _, value = part.partition("=")
+        name, value = name.strip(), value.strip()
+        if not name or not value:
+            continue
+        try:
+            limits[name] = int(value)
+        except ValueError:
+            LOG.warning("Ignoring invalid provider concurrency limit %r", part.strip())
+    return limits
+
+
+def config_fingerprint(config: Dict[str, Any]) -> str:
+    """Stable digest of a provider's constructor arguments."""
+    canonical = repr(sorted((k, repr(v)) for k, v in config.items()))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+class InstrumentedProvider:
+    """Transparent proxy that meters (and optionally caps) provider calls."""
+
+    METERED = frozenset({
+        "generate", "submit", "request_status", "fetch_result",
+        "remove_background", "upscale",
+    })
+
+    def __init__(self, provider: Any, max_concurrency: int = 0):
+        self._provider = provider
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def wrapped(self) -> Any:
+        return self._provider
+
+    def __getattr__(self, attr: str) -> Any:
+        value = getattr(self._provider, attr)
+        if attr in self.METERED and callable(value):
+            return functools.partial(self._call, value)
+        return value
+
+    def _call(self, fn: Callable, *args, **kwargs) -> Any:
+        if self._slots is not None:
+            self._slots.acquire()
+        started = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.calls += 1
+                self.errors += 0 if ok else 1
+                self.busy_seconds += time.monotonic() - started
+            if self._slots is not None:
+                self._slots.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "avg_s": round(self.busy_seconds / self.calls, 3) if self.calls else 0.0,
+            }
+
+
+class ProviderRegistry:
+    """One live provider per (kind, name) slot, rebuilt when its config changes."""
+
+    def __init__(self, default_limit: int = 0, limits: Optional[Dict[str, int]] = None):
+        self.default_limit = default_limit
+        self.limits = dict(limits or {})
+        self._slots: Dict[Tuple[str, str], Tuple[str, InstrumentedProvider]] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    def get(self, kind: str, name: str, factory: Callable[..., Any], **config) -> InstrumentedProvider:
+        """Live instance of provider *name*, built by ``factory(name, **config)`` if needed."""
+        fingerprint = config_fingerprint(config)
+        slot = (kind, name)
+        with self._lock:
+            current = self._slots.get(slot)
+            if current is not None and current[0] == fingerprint:
+                self.hits += 1
+                return current[1]
+            # Built under the lock: construction is cheap (no I/O) and this
+            # keeps concurrent first callers from racing to build duplicates
+            provider = InstrumentedProvider(
+                factory(name, **config), self.limits.get(name, self.default_limit),
+            )
+            self._slots[slot] = (fingerprint, provider)
+            self.builds += 1
+        LOG.info("%s provider %s %s (config %s)", kind, name,
+                 "rebuilt" if current is not None else "created", fingerprint)
+        return provider
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slots.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            live = list(self._slots.items())
+        return {f"{kind}/{name}": provider.snapshot() for (kind, name), (_, provider) in live}
+
+
+_registry: Optional[ProviderRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_provider_registry() -> ProviderRegistry:
+    """Process-wide registry, created from settings on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from .config import settings
+                _registry = ProviderRegistry(
+                    default_limit=settings.PROVIDER_MAX_CONCURRENCY,
+                    limits=parse_limits(settings.PROVIDER_CONCURRENCY_LIMITS),
+                )
+    return _registry
+
+
+def resolve_image_gen_provider(provider_name: Optional[str] = None):
+    """Live scene-generation provider, or None when it has no API key.
+
+    *provider_name* defaults to the IMAGE_GEN_PROVIDER admin setting (then
+    env).  Settings reads are cached, so calling this per job is cheap.
+    """
+    from .config import settings
+    from .image_generation import get_image_gen_provider
+    from .settings_service import get_setting
+
+    provider_name = provider_name or get_setting("IMAGE_GEN_PROVIDER") or settings.IMAGE_GEN_PROVIDER
+    api_key = get_setting(image_gen_api_key_setting(provider_name))
+    if not api_key:
+        LOG.warning("No API key for %s — scene gen disabled", provider_name)
+        return None
+    return get_provider_registry().get("image_gen", provider_name, get_image_gen_provider, api_key=api_key)
@@ -293,9 +293,13 @@ def send_job_messages_batch(payloads: List[Dict[str, Any]]):
         send_message('jobs', payload)
 
 
-def send_export_message(payload: Dict[str, Any]):
-    """Send a message to the exports queue (routes via QUEUE_BACKEND setting)."""
+def send_export_message(payload: Dict[str, Any], message_id: Optional[str] = None):
+    """Send a message to the exports queue (routes via QUEUE_BACKEND setting).
+
+    *message_id* enables Service Bus duplicate detection; the database
+    backend ignores it.
+    """
     if settings.QUEUE_BACKEND == 'azure':
         from shared.servicebus import send_export_message as _sb_send
-        return _sb_send(payload)
+        return _sb_send(payload, message_id=message_id)
     return send_message('exports', payload)
@@ -0,0 +1,236 @@
+"""
+Rendition engine: every export preset of one image from a single decode.
+
+``resize_image`` decodes the source and runs a full-resolution LANCZOS
+resize for each preset — an all-presets export decodes and resamples each
+image 11 times.  ``render_presets`` decodes once and keeps a pyramid of
+``Image.reduce(2)`` levels per colour mode, built on demand; each preset is
+resampled from the smallest level still REDUCING_GAP times larger than its
+target.  Box-reducing by 2 and then LANCZOS from >= 2x the target size is
+the trade-off Pillow's ``reducing_gap`` makes: on product shots the mean
+per-channel difference from LANCZOS on the original stays below 0.3/255
+for every preset (scripts/benchmark_renditions.py checks it), at a
+fraction of the cost.
+
+``RenditionPool`` fans the work out across processes: one task per item, or
+per (item, preset group) when a job has fewer items than workers.
+
+Usage:
+    renditions = render_presets(image_bytes, [get_preset("shopify"), ...])
+    renditions["shopify"]  # encoded bytes, as resize_image would return
+"""
+import hashlib
+import io
+import logging
+import math
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from .export_presets import ExportPreset
+from .image_resize import encode_preset, fit_preset, preset_mode
+
+LOG = logging.getLogger(__name__)
+
+REDUCING_GAP = 2.0
+# Bump when the resampling or encoding changes, to retire cached renditions
+ENGINE_VERSION = 1
+
+
+def rendition_version(preset: ExportPreset) -> str:
+    """Fingerprint of everything that shapes a preset's output bytes.
+
+    Cached renditions (export_worker.rendition_cache) are keyed by it, so
+    editing a preset's size, fit, background or quality — or bumping
+    ENGINE_VERSION — invalidates them without a migration.
+    """
+    spec = (ENGINE_VERSION, preset.width, preset.height, preset.bg_color, preset.fit, preset.quality)
+    return hashlib.sha256(repr(spec).encode("utf-8")).hexdigest()[:12]
+
+
+class Pyramid:
+    """A decoded image plus its 2x box-reduced levels, built on demand."""
+
+    def __init__(self, image: Image.Image):
+        self.source = image
+        self.levels: List[Image.Image] = [image]
+
+    def level_for(self, width: int, height: int) -> Tuple[Image.Image, int]:
+        """Smallest level at least REDUCING_GAP x (width, height), with its reduction factor."""
+        min_w, min_h = width * REDUCING_GAP, height * REDUCING_GAP
+        # Extend the pyramid while the next level would still be large enough
+        while True:
+            last = self.levels[-1]
+            if math.ceil(last.width / 2) < min_w or math.ceil(last.height / 2) < min_h:
+                break
+            self.levels.append(last.reduce(2))
+        for index in range(len(self.levels) - 1, -1, -1):
+            level = self.levels[index]
+            if level.width >= min_w and level.height >= min_h:
+                return level, 2 ** index
+        return self.source, 1
+
+    def resize(self, img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+        """LANCZOS resize of the source to *size*, starting from the nearest larger level."""
+        level, factor = self.level_for(*size)
+        if factor == 1:
+            return level.resize(size, Image.Resampling.LANCZOS)
+        # reduce() rounds odd edges up: map the source's exact extent onto the level
+        box = (0, 0, self.source.width / factor, self.source.height / factor)
+        return level.resize(size, Image.Resampling.LANCZOS, box=box)
+
+
+def render_presets(image_bytes: bytes, presets: Sequence[ExportPreset]) -> Dict[str, bytes]:
+    """Encode *image_bytes* for every preset, decoding it once.
+
+    A preset that fails is logged and left out of the result; an image that
+    cannot be decoded raises.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+    pyramids: Dict[str, Pyramid] = {}
+    out: Dict[str, bytes] = {}
+    for preset in presets:
+        mode = preset_mode(preset)
+        pyramid = pyramids.get(mode)
+        if pyramid is None:
+            pyramid = pyramids[mode] = Pyramid(image.convert(mode))
+        try:
+            out[preset.key] = encode_preset(fit_preset(pyramid.source, preset, pyramid.resize), preset)
+        except Exception as e:
+            LOG.error("Rendition failed preset=%s: %s", preset.key, e)
+    return out
+
+
+def _split(presets: Sequence[ExportPreset], groups: int) -> List[Tuple[ExportPreset, ...]]:
+    groups = max(1, min(groups, len(presets)))
+    return [tuple(presets[i::groups]) for i in range(groups)]
+
+
+class RenditionPool:
+    """Renders preset sets for a stream of images on a process pool.
+
+    ``workers=1`` renders in the calling process (no pool); ``0`` means one
+    worker per CPU.  The pool starts on first use and is reused.  A worker
+    process dying (e.g. OOM-killed) breaks the pool: the items it was
+    rendering get the BrokenProcessPool error and the next submit starts a
+    fresh pool.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: the export worker runs threads (queue receiver, downloads)
+        # and forking a threaded process can deadlock the child
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        """Drop a broken *executor* (unless it was already replaced)."""
+        if self._executor is executor:
+            LOG.warning("Rendition pool broken (worker process died), restarting it")
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, image_bytes: bytes, presets: Tuple[ExportPreset, ...]) -> Tuple[ProcessPoolExecutor, Future]:
+        for attempt in range(2):
+            if self._executor is None:
+                self._executor = self._new_executor()
+            executor = self._executor
+            try:
+                return executor, executor.submit(render_presets, image_bytes, presets)
+            except BrokenProcessPool:
+                self._discard(executor)
+                if attempt:
+                    raise
+
+    def render_many(self, sources: Iterable[Tuple[Hashable, Optional[bytes]]],
+                    presets: Sequence[ExportPreset], total: Optional[int] = None,
+                    presets_for: Optional[Callable[[Hashable], Sequence[ExportPreset]]] = None,
+                    ) -> Iterator[Tuple[Hashable, Any]]:
+        """Yield ``(key, renditions | exception)`` for each ``(key, image_bytes)`` in order.
+
+        *sources* is consumed lazily, at most ``2 * workers`` images ahead, so
+        a streamed download keeps bounded memory.  Pass *total* (number of
+        sources) to let small batches split their presets across idle workers.
+        *presets_for(key)* narrows the presets rendered for one source (e.g.
+        only those missing from a cache); an empty selection yields ``{}``
+        without needing image bytes.  Otherwise sources whose bytes are None
+        (failed downloads) are passed through as None.
+        """
+        def selected(key) -> Sequence[ExportPreset]:
+            return presets if presets_for is None else presets_for(key)
+
+        if self.workers <= 1:
+            for key, data in sources:
+                wanted = selected(key)
+                if not wanted:
+                    yield key, {}
+                    continue
+                if data is None:
+                    yield key, None
+                    continue
+                try:
+                    yield key, render_presets(data, wanted)
+                except Exception as e:
+                    yield key, e
+            return
+
+        split = math.ceil(self.workers / total) if total else 1
+        window = 2 * self.workers
+        pending: deque = deque()
+        source_iter = iter(sources)
+        exhausted = False
+
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    key, data = next(source_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                wanted = selected(key)
+                futures: Any = []
+                if wanted and data is not None:
+                    try:
+                        futures = [self._submit(data, group) for group in _split(wanted, split)]
+                    except Exception as e:
+                        futures = e  # reported for this item only
+                pending.append((key, data is None, wanted, futures))
+            if not pending:
+                return
+            key, missing, wanted, futures = pending.popleft()
+            if not wanted:
+                yield key, {}
+                continue
+            if missing:
+                yield key, None
+                continue
+            if isinstance(futures, Exception):
+                yield key, futures
+                continue
+            try:
+                merged: Dict[str, bytes] = {}
+                for executor, future in futures:
+                    try:
+                        merged.update(future.result())
+                    except BrokenProcessPool:
+                        self._discard(executor)
+                        raise
+                # Keep the caller's preset order
+                yield key, {p.key: merged[p.key] for p in wanted if p.key in merged}
+            except Exception as e:
+                yield key, e
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
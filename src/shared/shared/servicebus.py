@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import json
 import logging
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from azure.identity import DefaultAzureCredential
 from azure.servicebus import ServiceBusClient, ServiceBusMessage
@@ -35,12 +35,15 @@ def get_client() -> ServiceBusClient:
     return _client
 
 
-def _send_to_queue(queue_name: str, payload: Dict[str, Any]) -> None:
-    """Send a single message to a named queue."""
+def _send_to_queue(queue_name: str, payload: Dict[str, Any], message_id: Optional[str] = None) -> None:
+    """Send a single message to a named queue.
+
+    *message_id* lets queues with duplicate detection drop resends.
+    """
     client = get_client()
     sender = client.get_queue_sender(queue_name=queue_name)
     with sender:
-        sender.send_messages(ServiceBusMessage(json.dumps(payload)))
+        sender.send_messages(ServiceBusMessage(json.dumps(payload), message_id=message_id))
 
 
 def send_job_message(payload: Dict[str, Any]) -> None:
@@ -125,10 +128,10 @@ def send_upscale_message(payload: Dict[str, Any]) -> None:
         raise
 
 
-def send_export_message(payload: Dict[str, Any]) -> None:
+def send_export_message(payload: Dict[str, Any], message_id: Optional[str] = None) -> None:
     """Send a message to the exports queue."""
     try:
-        _send_to_queue(settings.SERVICEBUS_EXPORTS_QUEUE, payload)
+        _send_to_queue(settings.SERVICEBUS_EXPORTS_QUEUE, payload, message_id=message_id)
         LOG.info(
             "Sent export message to queue=%s job_id=%s",
             settings.SERVICEBUS_EXPORTS_QUEUE,
@@ -3,25 +3,162 @@
 Usage:
     from shared.settings_service import get_setting
     api_key = get_setting("SHOPIFY_API_KEY")  # checks DB, then env/config
+
+The admin_settings table is small and read on every item (provider
+selection, fal steps/guidance/endpoint, API keys), so each process keeps an
+in-memory snapshot of the whole table instead of querying per key:
+
+  - the snapshot is reloaded at most every SETTINGS_CACHE_TTL seconds
+  - writes (upsert/delete_admin_setting) drop it at once in the writing
+    process and ``pg_notify`` every other process, whose LISTEN thread
+    drops theirs — admin toggles apply within a second everywhere, and
+    within the TTL even if a notification is lost
 """
 import logging
-from typing import Optional
+import threading
+import time
+from typing import Callable, Dict, Optional
 
 from .config import settings as env_settings
 
 LOG = logging.getLogger(__name__)
 
+SETTINGS_CHANNEL = "admin_settings_changed"
+
+
+class SettingsCache:
+    """TTL snapshot of all admin settings, shared by every thread of a process."""
+
+    def __init__(self, loader: Callable[[], Dict[str, str]], ttl: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self._loader = loader
+        self.ttl = ttl
+        self._clock = clock
+        self._values: Optional[Dict[str, str]] = None
+        self._expires = 0.0
+        self._generation = 0
+        self._load_lock = threading.Lock()   # one reload at a time
+        self._state_lock = threading.Lock()  # never held across the DB query
+        self.loads = 0
+
+    def get(self, key: str) -> Optional[str]:
+        values = self._values
+        if values is None or self._clock() >= self._expires:
+            values = self._refresh()
+        return values.get(key)
+
+    def _refresh(self) -> Dict[str, str]:
+        with self._load_lock:
+            # Another thread may have reloaded while we waited
+            values = self._values
+            if values is not None and self._clock() < self._expires:
+                return values
+            generation = self._generation
+            try:
+                values = self._loader()
+                self.loads += 1
+            except Exception:
+                LOG.debug("admin_settings unavailable, using env values", exc_info=True)
+                if values is None:
+                    # Nothing to fall back on: env values for this call only,
+                    # retry the load on the next one
+                    return {}
+                # Keep serving the last snapshot until the next TTL
+            # An invalidation during the load may have raced the read: serve
+            # these values to this caller but don't cache them
+            with self._state_lock:
+                if generation == self._generation:
+                    self._values = values
+                    self._expires = self._clock() + self.ttl
+            return values
+
+    def invalidate(self) -> None:
+        with self._state_lock:
+            self._generation += 1
+            self._values = None
+            self._expires = 0.0
+
+
+def _load_admin_settings() -> Dict[str, str]:
+    from .db_sqlalchemy import get_admin_setting_values
+    return get_admin_setting_values()
+
+
+_cache = SettingsCache(_load_admin_settings, ttl=env_settings.SETTINGS_CACHE_TTL)
+_listener_started = False
+_listener_lock = threading.Lock()
+
 
 def get_setting(key: str) -> str:
     """Get a setting value. Priority: DB admin_settings > env var > empty string."""
-    # Try DB first
-    try:
-        from .db_sqlalchemy import get_admin_setting_value
-        db_value = get_admin_setting_value(key)
-        if db_value:
-            return db_value
-    except Exception:
-        pass  # DB not available, fall through to env
+    if _cache.ttl <= 0:
+        # Cache disabled: one DB lookup per call
+        try:
+            from .db_sqlalchemy import get_admin_setting_value
+            db_value = get_admin_setting_value(key)
+        except Exception:
+            db_value = None  # DB not available, fall through to env
+    else:
+        _ensure_listener()
+        db_value = _cache.get(key)
+    if db_value:
+        return db_value
 
     # Fall back to env var / pydantic settings
     return getattr(env_settings, key, '') or ''
+
+
+def invalidate_settings() -> None:
+    """Drop this process's cached admin settings (next read reloads)."""
+    _cache.invalidate()
+
+
+def notify_settings_changed(session) -> None:
+    """Queue a change notification on *session*'s transaction (Postgres only).
+
+    Delivered to listening processes when the transaction commits.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy import text
+        session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": SETTINGS_CHANNEL})
+
+
+# ── Cross-process invalidation (Postgres LISTEN) ─────────────────────
+
+def _listen_forever(conninfo: str) -> None:
+    import psycopg
+
+    backoff = 1.0
+    while True:
+        try:
+            with psycopg.connect(conninfo, autocommit=True) as conn:
+                conn.execute(f"LISTEN {SETTINGS_CHANNEL}")
+                # Anything committed while we were disconnected was missed
+                _cache.invalidate()
+                backoff = 1.0
+                LOG.info("Listening for admin settings changes")
+                while True:
+                    for _ in conn.notifies(timeout=60):
+                        _cache.invalidate()
+                    # Round trip so a dead connection is noticed
+                    conn.execute("SELECT 1")
+        except Exception as e:
+            LOG.warning("Admin settings listener disconnected (%s), retrying in %.0fs", e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+
+def _ensure_listener() -> None:
+    global _listener_started
+    if _listener_started or not env_settings.SETTINGS_CACHE_LISTEN:
+        return
+    with _listener_lock:
+        if _listener_started:
+            return
+        _listener_started = True
+        from .db import engine
+        if engine is None or engine.dialect.name != "postgresql":
+            return  # nothing to listen to; the TTL alone bounds staleness
+        conninfo = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        threading.Thread(target=_listen_forever, args=(conninfo,),
+                         daemon=True, name="settings-listener").start()
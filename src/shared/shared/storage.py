@@ -1,18 +1,92 @@
+import base64
+import logging
 import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
 from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions, ContentSettings
+from azure.storage.blob import BlobBlock, BlobServiceClient, generate_blob_sas, BlobSasPermissions, ContentSettings
 from .config import settings
 
+LOG = logging.getLogger(__name__)
+
+# User delegation keys are valid for at most 7 days
+MAX_DELEGATION_KEY_LIFETIME = timedelta(days=7)
+# Refresh a cached key this long before it expires
+DELEGATION_KEY_MARGIN = timedelta(minutes=5)
+
+_client: BlobServiceClient | None = None
+_client_lock = threading.Lock()
+_delegation_key = None
+_delegation_key_expiry: datetime | None = None
+_delegation_key_lock = threading.Lock()
+
 
 def _account_url() -> str:
     return f"https://{settings.STORAGE_ACCOUNT_NAME}.blob.core.windows.net"
 
 
 def get_blob_service_client() -> BlobServiceClient:
-    cred = DefaultAzureCredential(exclude_interactive_browser_credential=True)
-    return BlobServiceClient(account_url=_account_url(), credential=cred)
+    """Process-wide BlobServiceClient (one credential and connection pool)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                cred = DefaultAzureCredential(exclude_interactive_browser_credential=True)
+                chunk = settings.BLOB_TRANSFER_CHUNK_MB * 1024 * 1024
+                # Blobs over one chunk go up as staged blocks and come down as ranges
+                _client = BlobServiceClient(
+                    account_url=_account_url(), credential=cred,
+                    max_single_put_size=chunk, max_block_size=chunk,
+                    max_single_get_size=chunk, max_chunk_get_size=chunk,
+                )
+    return _client
+
+
+def get_user_delegation_key(valid_until: datetime):
+    """Cached user delegation key valid at least until *valid_until*.
+
+    Every SAS used to fetch its own key (one AAD round trip per URL).  The
+    key is now shared until it is DELEGATION_KEY_MARGIN from expiry or a SAS
+    needs to outlive it; new keys last STORAGE_DELEGATION_KEY_HOURS (longer
+    if a SAS asks for it, up to the 7-day service limit).
+    """
+    global _delegation_key, _delegation_key_expiry
+    now = datetime.now(timezone.utc)
+    valid_until = min(valid_until, now + MAX_DELEGATION_KEY_LIFETIME - DELEGATION_KEY_MARGIN)
+    with _delegation_key_lock:
+        if (_delegation_key is None or _delegation_key_expiry - DELEGATION_KEY_MARGIN < now
+                or _delegation_key_expiry < valid_until):
+            start = now - timedelta(minutes=5)
+            expiry = max(now + timedelta(hours=settings.STORAGE_DELEGATION_KEY_HOURS),
+                         valid_until + DELEGATION_KEY_MARGIN)
+            expiry = min(expiry, now + MAX_DELEGATION_KEY_LIFETIME)
+            _delegation_key = get_blob_service_client().get_user_delegation_key(
+                key_start_time=start, key_expiry_time=expiry,
+            )
+            _delegation_key_expiry = expiry
+            LOG.debug("Refreshed user delegation key (expires %s)", expiry.isoformat())
+        return _delegation_key, _delegation_key_expiry
+
+
+def _generate_sas(container: str, blob_path: str, permission: BlobSasPermissions,
+                  expiry_minutes: int) -> str:
+    start = datetime.now(timezone.utc) - timedelta(minutes=5)
+    expiry = datetime.now(timezone.utc) + timedelta(minutes=expiry_minutes)
+    delegation_key, key_expiry = get_user_delegation_key(expiry)
+    sas = generate_blob_sas(
+        account_name=settings.STORAGE_ACCOUNT_NAME,
+        container_name=container,
+        blob_name=blob_path,
+        user_delegation_key=delegation_key,
+        permission=permission,
+        # A SAS cannot outlive the key that signed it
+        expiry=min(expiry, key_expiry),
+        start=start,
+    )
+    return f"{_account_url()}/{container}/{blob_path}?{sas}"
 
 
 def _sanitize_path_component(component: str, allow_dots: bool = False) -> str:
@@ -63,22 +137,41 @@ def build_output_blob_path(tenant_id: str, job_id: str, item_id: str, filename:
     return f"{tenant}/jobs/{job}/items/{item}/outputs/{safe_filename}"
 
 
+def build_cutout_blob_path(raw_blob_path: str) -> str:
+    """Outputs-container path of the bg-removed cutout shared by every item
+    fanned out (scenes × angles) from the same raw blob.
+
+    ``{tenant}/jobs/{job}/items/{item}/raw/{name}.{ext}``
+    → ``{tenant}/jobs/{job}/items/{item}/bg/{name}_cutout.png``
+    """
+    prefix, sep, filename = raw_blob_path.rpartition("/raw/")
+    if not sep or not prefix or "/" in filename:
+        raise ValueError(f"Not a raw blob path: {raw_blob_path}")
+    return f"{prefix}/bg/{Path(_sanitize_filename(filename)).stem}_cutout.png"
+
+
+def build_rendition_blob_path(tenant_id: str, job_id: str, item_id: str,
+                              preset_key: str, version: str, extension: str) -> str:
+    """Outputs-container path of an item's cached export rendition."""
+    tenant = _sanitize_path_component(tenant_id)
+    job = _sanitize_path_component(job_id)
+    item = _sanitize_path_component(item_id)
+    name = _sanitize_filename(f"{preset_key}-{version}.{extension}")
+
+    return f"{tenant}/jobs/{job}/items/{item}/renditions/{name}"
+
+
+def build_step_cache_blob_path(tenant_id: str, step: str, cache_key: str) -> str:
+    tenant = _sanitize_path_component(tenant_id)
+    step = _sanitize_path_component(step)
+    key = _sanitize_path_component(cache_key)
+
+    return f"{tenant}/cache/{step}/{key}"
+
+
 def generate_write_sas(container: str, blob_path: str, expiry_minutes: int = 30) -> str:
     # Uses user delegation key with AAD auth
-    client = get_blob_service_client()
-    start = datetime.now(timezone.utc) - timedelta(minutes=5)
-    expiry = datetime.now(timezone.utc) + timedelta(minutes=expiry_minutes)
-    delegation_key = client.get_user_delegation_key(key_start_time=start, key_expiry_time=expiry)
-    sas = generate_blob_sas(
-        account_name=settings.STORAGE_ACCOUNT_NAME,
-        container_name=container,
-        blob_name=blob_path,
-        user_delegation_key=delegation_key,
-        permission=BlobSasPermissions(write=True, create=True),
-        expiry=expiry,
-        start=start,
-    )
-    return f"{_account_url()}/{container}/{blob_path}?{sas}"
+    return _generate_sas(container, blob_path, BlobSasPermissions(write=True, create=True), expiry_minutes)
 
 
 # Convenience aliases matching the unified interface names
@@ -103,7 +196,7 @@ def download_blob(container: str, blob_path: str) -> bytes:
     """Download a blob's content using managed identity."""
     client = get_blob_service_client()
     blob_client = client.get_blob_client(container=container, blob=blob_path)
-    return blob_client.download_blob().readall()
+    return blob_client.download_blob(max_concurrency=settings.BLOB_TRANSFER_CONCURRENCY).readall()
 
 
 def delete_blob(container: str, blob_path: str) -> bool:
@@ -117,25 +210,146 @@ def delete_blob(container: str, blob_path: str) -> bool:
         return False
 
 
-def upload_blob(container: str, blob_path: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+def sweep_tmp_blobs(max_age_minutes: int, container: str = "outputs", prefix: str = "_tmp/",
+                    client: BlobServiceClient | None = None, now: datetime | None = None,
+                    limit: int = 5000) -> int:
+    """Delete blobs under *prefix* last modified more than *max_age_minutes* ago.
+
+    Lifecycle sweeper for transient handoff blobs (edit-mode product images,
+    parked async requests).  Returns the number of blobs deleted.
+    """
+    client = client or get_blob_service_client()
+    container_client = client.get_container_client(container)
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(minutes=max_age_minutes)
+    deleted = 0
+    for blob in container_client.list_blobs(name_starts_with=prefix):
+        if deleted >= limit:
+            break
+        if blob.last_modified and blob.last_modified < cutoff:
+            try:
+                container_client.delete_blob(blob.name)
+                deleted += 1
+            except Exception:
+                pass  # already gone (another replica swept it) or transient — next sweep retries
+    return deleted
+
+
+def upload_blob(container: str, blob_path: str, data: bytes, content_type: str = "application/octet-stream",
+                cache_control: str | None = None) -> None:
     """Upload data to a blob using managed identity."""
     client = get_blob_service_client()
     blob_client = client.get_blob_client(container=container, blob=blob_path)
-    blob_client.upload_blob(data, overwrite=True, content_settings=ContentSettings(content_type=content_type))
+    blob_client.upload_blob(data, overwrite=True, max_concurrency=settings.BLOB_TRANSFER_CONCURRENCY,
+                            content_settings=ContentSettings(content_type=content_type, cache_control=cache_control))
+
+
+class BlockBlobWriter:
+    """Write-only stream that uploads a block blob in staged blocks.
+
+    Holds at most ``block_size`` bytes: each full block is staged as soon as
+    it is written, and ``close()`` commits the block list.  The blob is only
+    visible once committed — if the writer is abandoned (exception inside the
+    ``with`` block) nothing replaces an existing blob and the staged blocks
+    expire on their own.  Not seekable, so ``zipfile`` writes in streaming
+    mode (data descriptors) without rewinding.
+
+    With ``concurrency > 1`` full blocks are staged on background threads,
+    at most ``concurrency`` at a time (peak memory ``concurrency + 1``
+    blocks); a failed block surfaces from the next ``write()`` or ``close()``.
+    """
+
+    def __init__(self, blob_client, block_size: int = 8 * 1024 * 1024,
+                 content_type: str = "application/octet-stream", concurrency: int = 1):
+        self._blob_client = blob_client
+        self.block_size = block_size
+        self.content_type = content_type
+        self.concurrency = max(1, concurrency)
+        self._buffer = bytearray()
+        self._blocks: list[str] = []
+        self._pending: deque[Future] = deque()
+        self._executor: ThreadPoolExecutor | None = None
+        self._written = 0
+        self.closed = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._written += len(data)
+        while len(self._buffer) >= self.block_size:
+            self._stage(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+        return len(data)
+
+    def tell(self) -> int:
+        return self._written
+
+    def flush(self) -> None:
+        pass  # blocks are staged when full; the tail goes up on close()
+
+    def _stage(self, data: bytes) -> None:
+        block_id = base64.b64encode(f"{len(self._blocks):08d}".encode()).decode()
+        if self.concurrency == 1:
+            self._blob_client.stage_block(block_id, data)
+            self._blocks.append(block_id)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="blob-block")
+        while len(self._pending) >= self.concurrency:
+            self._pending.popleft().result()
+        self._pending.append(self._executor.submit(self._blob_client.stage_block, block_id, data))
+        self._blocks.append(block_id)
+
+    def _shutdown(self) -> None:
+        if self._executor is not None:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._pending.clear()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._blocks:
+                self._stage(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self._shutdown()
+        self._blob_client.commit_block_list(
+            [BlobBlock(block_id=b) for b in self._blocks],
+            content_settings=ContentSettings(content_type=self.content_type),
+        )
+        self.closed = True
+
+    def abort(self) -> None:
+        """Give up without committing; staged blocks expire on their own."""
+        self._shutdown()
+        self._buffer.clear()
+        self.closed = True
+
+    def __enter__(self) -> "BlockBlobWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()  # uncommitted blocks are discarded by storage
+
+
+def open_blob_writer(container: str, blob_path: str, content_type: str = "application/octet-stream",
+                     block_size: int = 8 * 1024 * 1024, concurrency: int = 1) -> BlockBlobWriter:
+    """Streaming writer for a blob; peak memory is ``concurrency + 1`` blocks."""
+    client = get_blob_service_client()
+    blob_client = client.get_blob_client(container=container, blob=blob_path)
+    return BlockBlobWriter(blob_client, block_size=block_size, content_type=content_type,
+                           concurrency=concurrency)
 
 
 def generate_read_sas(container: str, blob_path: str, expiry_minutes: int = 30) -> str:
-    client = get_blob_service_client()
-    start = datetime.now(timezone.utc) - timedelta(minutes=5)
-    expiry = datetime.now(timezone.utc) + timedelta(minutes=expiry_minutes)
-    delegation_key = client.get_user_delegation_key(key_start_time=start, key_expiry_time=expiry)
-    sas = generate_blob_sas(
-        account_name=settings.STORAGE_ACCOUNT_NAME,
-        container_name=container,
-        blob_name=blob_path,
-        user_delegation_key=delegation_key,
-        permission=BlobSasPermissions(read=True),
-        expiry=expiry,
-        start=start,
-    )
-    return f"{_account_url()}/{container}/{blob_path}?{sas}"
+    return _generate_sas(container, blob_path, BlobSasPermissions(read=True), expiry_minutes)
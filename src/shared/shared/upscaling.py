@@ -3,9 +3,9 @@ Image upscaling service abstraction.
 Supports: Real-ESRGAN (local), FAL.AI (API), Replicate (API)
 """
 import logging
+import threading
 from abc import ABC, abstractmethod
 from typing import Optional
-import httpx
 
 LOG = logging.getLogger(__name__)
 
@@ -24,12 +24,34 @@ class UpscalingProvider(ABC):
         """Provider name for logging"""
         pass
 
+    @property
+    def runs_locally(self) -> bool:
+        """Whether inference runs in-process (CPU/GPU bound) rather than over HTTP."""
+        return False
+
+    @property
+    def accepts_images(self) -> bool:
+        """Whether upscale_image works on PIL images without encoding."""
+        return False
+
+    def upscale_image(self, image, scale: int = 2):
+        """Upscale a PIL image, return a PIL image."""
+        from io import BytesIO
+        from PIL import Image
+
+        buf = BytesIO()
+        image.save(buf, format="PNG")
+        return Image.open(BytesIO(self.upscale(buf.getvalue(), scale=scale)))
+
 
 class RealESRGANProvider(UpscalingProvider):
     """Local upscaling using Real-ESRGAN with singleton pattern"""
 
     _instance = None
     _upsampler = None
+    # RealESRGANer keeps per-call state on the instance (img, output, …),
+    # so concurrent worker threads must not share it unguarded.
+    _lock = threading.Lock()
     _Image = None
     _np = None
 
@@ -75,24 +97,36 @@ class RealESRGANProvider(UpscalingProvider):
     def upscale(self, image_bytes: bytes, scale: int = 2) -> bytes:
         from io import BytesIO
 
+        from .output_encoding import DEFAULT_POLICY, POLICIES, encode_image
+
+        result_img = self.upscale_image(RealESRGANProvider._Image.open(BytesIO(image_bytes)), scale=scale)
+        return encode_image(result_img, POLICIES[DEFAULT_POLICY])
+
+    def upscale_image(self, image, scale: int = 2):
         LOG.info("Upscaling with Real-ESRGAN (2x)")
 
-        img = RealESRGANProvider._Image.open(BytesIO(image_bytes)).convert('RGB')
+        img = image.convert('RGB')
         img_array = RealESRGANProvider._np.array(img)
 
-        output, _ = RealESRGANProvider._upsampler.enhance(img_array, outscale=2)
+        with RealESRGANProvider._lock:
+            output, _ = RealESRGANProvider._upsampler.enhance(img_array, outscale=2)
 
         result_img = RealESRGANProvider._Image.fromarray(output)
-        output_buffer = BytesIO()
-        result_img.save(output_buffer, format='PNG', optimize=True)
-
         LOG.info(f"Real-ESRGAN upscaling complete: {img.size} → {result_img.size}")
-        return output_buffer.getvalue()
+        return result_img
     
     @property
     def name(self) -> str:
         return "realesrgan"
 
+    @property
+    def runs_locally(self) -> bool:
+        return True
+
+    @property
+    def accepts_images(self) -> bool:
+        return True
+
 
 class FalUpscalingProvider(UpscalingProvider):
     """FAL.AI upscaling (API)"""
@@ -5,7 +5,15 @@ from PIL import Image, ImageDraw, ImageFont
 
 def apply_watermark(image_bytes: bytes, text: str = "OPAL PREVIEW") -> bytes:
     """Apply a semi-transparent diagonal text watermark across the image."""
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
+    from .output_encoding import DEFAULT_POLICY, POLICIES, encode_image
+
+    result = watermark_image(Image.open(io.BytesIO(image_bytes)), text=text)
+    return encode_image(result, POLICIES[DEFAULT_POLICY])
+
+
+def watermark_image(image: Image.Image, text: str = "OPAL PREVIEW") -> Image.Image:
+    """Image-level watermark; returns a new RGB image."""
+    img = image.convert("RGBA")
 
     # Create watermark layer
     watermark = Image.new("RGBA", img.size, (0, 0, 0, 0))
@@ -44,8 +52,4 @@ def apply_watermark(image_bytes: bytes, text: str = "OPAL PREVIEW") -> bytes:
 
     # Composite
     result = Image.alpha_composite(img, watermark)
-    result = result.convert("RGB")
-
-    buf = io.BytesIO()
-    result.save(buf, format="PNG", optimize=True)
-    return buf.getvalue()
+    return result.convert("RGB")
@@ -6,6 +6,7 @@ from urllib.parse import urlencode
 
 import httpx
 
+from .output_encoding import content_type_for
 from .settings_service import get_setting
 
 LOG = logging.getLogger(__name__)
@@ -99,7 +100,7 @@ class WooCommerceClient:
                 auth=self._auth(),
                 headers={
                     "Content-Disposition": f'attachment; filename="{filename}"',
-                    "Content-Type": "image/png",
+                    "Content-Type": content_type_for(filename),
                 },
                 content=image_data,
             )
@@ -132,7 +133,7 @@ class WooCommerceClient:
                 auth=self._auth(),
                 headers={
                     "Content-Disposition": f'attachment; filename="{filename}"',
-                    "Content-Type": "image/png",
+                    "Content-Type": content_type_for(filename),
                 },
                 content=image_data,
             )
@@ -0,0 +1,203 @@
+"""
+Concurrent Service Bus consumer shared by all queue workers.
+
+Every worker (pipeline, export, orchestrator and the legacy step workers)
+used to copy the same receive loop and handle one message at a time, so a
+replica sat idle while a single item waited on a remote provider.  This
+module owns that loop once:
+
+  • up to ``concurrency`` messages are processed in a thread pool
+  • receives only ask for as many messages as there are free slots
+  • every message gets its own lock renewal for the duration of its work
+  • settlement (complete / abandon / dead-letter) happens on the receiving
+    thread — the Service Bus receiver is not thread-safe
+
+Handlers receive the decoded message payload and signal failure by raising.
+Exceptions listed in ``permanent_errors`` are dead-lettered, everything
+else is abandoned for redelivery.
+
+Usage:
+    from shared.worker_runtime import QueueWorker, start_health_server
+
+    start_health_server(port=8080)
+    QueueWorker(settings.SERVICEBUS_JOBS_QUEUE, process_message).run_forever()
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+from azure.servicebus import ServiceBusReceiveMode, AutoLockRenewer
+
+from .config import settings
+
+LOG = logging.getLogger(__name__)
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    """Simple health check endpoint for Container Apps probes"""
+    def do_GET(self):
+        if self.path in ('/healthz', '/readyz', '/livez', '/'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.end_headers()
+            self.wfile.write(b'OK')
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_health_server(port: int = 8080) -> HTTPServer:
+    server = HTTPServer(('0.0.0.0', port), HealthHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    LOG.info('Health server started on port %d', port)
+    return server
+
+
+def decode_json_message(m) -> Dict[str, Any]:
+    """Default message decoder: the body is a JSON object."""
+    return json.loads(str(m))
+
+
+class QueueWorker:
+    """Peek-lock consumer that keeps up to ``concurrency`` messages in flight."""
+
+    # Receive wait while other messages are in flight — short so finished
+    # work is settled promptly instead of waiting out a long poll.
+    BUSY_WAIT_SECONDS = 1
+
+    def __init__(
+        self,
+        queue_name: str,
+        handler: Callable[[Dict[str, Any]], None],
+        *,
+        concurrency: Optional[int] = None,
+        max_lock_renewal_duration: int = 600,
+        permanent_errors: Tuple[Type[BaseException], ...] = (),
+        on_failure: Optional[Callable[[Dict[str, Any], BaseException], None]] = None,
+        decode: Callable[[Any], Dict[str, Any]] = decode_json_message,
+        client=None,
+        max_wait_time: int = 20,
+    ):
+        self.queue_name = queue_name
+        self.handler = handler
+        self.concurrency = max(1, concurrency or settings.WORKER_CONCURRENCY)
+        self.max_lock_renewal_duration = max_lock_renewal_duration
+        self.permanent_errors = permanent_errors
+        self.on_failure = on_failure
+        self.decode = decode
+        self.max_wait_time = max_wait_time
+        self._client = client
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix=f'{queue_name}-worker',
+        )
+
+    def _get_client(self):
+        if self._client is None:
+            from .servicebus import get_client
+            self._client = get_client()
+        return self._client
+
+    def run_forever(self) -> None:
+        """Receive and process messages until the process exits."""
+        LOG.info('Consuming queue=%s concurrency=%d', self.queue_name, self.concurrency)
+        while True:
+            renewer = AutoLockRenewer(max_workers=self.concurrency)
+            try:
+                receiver = self._get_client().get_queue_receiver(
+                    queue_name=self.queue_name,
+                    max_wait_time=self.max_wait_time,
+                    receive_mode=ServiceBusReceiveMode.PEEK_LOCK,
+                )
+                with receiver:
+                    self.pump(receiver, renewer)
+            except Exception as e:
+                LOG.exception('Worker loop error: %s', e)
+                time.sleep(5)
+            finally:
+                try:
+                    renewer.close()
+                except Exception:
+                    pass
+
+    def pump(self, receiver, renewer, max_iterations: Optional[int] = None) -> None:
+        """Receive, dispatch and settle messages on a single receiver.
+
+        Runs forever unless *max_iterations* is given (used by tests).  On a
+        receive error, in-flight messages are drained and settled before the
+        error propagates so no lock is left dangling.
+        """
+        in_flight: Dict[Future, Tuple[Any, Dict[str, Any]]] = {}
+        iterations = 0
+        try:
+            while max_iterations is None or iterations < max_iterations:
+                iterations += 1
+                free = self.concurrency - len(in_flight)
+                if free > 0:
+                    wait_time = self.BUSY_WAIT_SECONDS if in_flight else self.max_wait_time
+                    for m in receiver.receive_messages(max_message_count=free, max_wait_time=wait_time):
+                        self._dispatch(receiver, renewer, m, in_flight)
+
+                if in_flight:
+                    timeout = 0 if free > 0 else self.BUSY_WAIT_SECONDS
+                    done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        m, data = in_flight.pop(fut)
+                        self._settle(receiver, m, data, fut)
+        finally:
+            for fut in list(in_flight):
+                m, data = in_flight.pop(fut)
+                try:
+                    fut.result()
+                except BaseException:
+                    pass
+                self._settle(receiver, m, data, fut)
+
+    def _dispatch(self, receiver, renewer, m, in_flight: Dict[Future, Tuple[Any, Dict[str, Any]]]) -> None:
+        try:
+            data = self.decode(m)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            LOG.error('Invalid JSON: %s', e)
+            receiver.dead_letter_message(m, reason='InvalidJSON', error_description=str(e))
+            return
+
+        renewer.register(receiver, m, max_lock_renewal_duration=self.max_lock_renewal_duration)
+        in_flight[self._pool.submit(self.handler, data)] = (m, data)
+
+    def _settle(self, receiver, m, data: Dict[str, Any], fut: Future) -> None:
+        exc = fut.exception()
+        try:
+            if exc is None:
+                receiver.complete_message(m)
+                LOG.info('Message completed: job=%s item=%s', data.get('job_id'), data.get('item_id'))
+                return
+
+            if isinstance(exc, self.permanent_errors):
+                LOG.error('Permanent error (dead-lettering): %s', exc)
+            else:
+                LOG.error('Processing failed (abandoning for retry): %s', exc, exc_info=exc)
+
+            if self.on_failure:
+                try:
+                    self.on_failure(data, exc)
+                except Exception:
+                    LOG.exception('on_failure hook failed')
+
+            if isinstance(exc, self.permanent_errors):
+                receiver.dead_letter_message(
+                    m, reason=type(exc).__name__, error_description=str(exc)[:1024],
+                )
+            else:
+                receiver.abandon_message(m)
+        except Exception as e:
+            # Lock lost or link dropped — the message will be redelivered
+            LOG.warning('Failed to settle message (will be redelivered): %s', e)
@@ -1,60 +1,35 @@
-import json
-import time
 import logging
 import httpx
-import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
 from tenacity import retry, stop_after_attempt, wait_exponential
-from azure.servicebus import ServiceBusReceiveMode, AutoLockRenewer
 
+from shared import blob_transfer
 from shared.config import settings
 from shared.db import SessionLocal
 from shared.models import JobItem, ItemStatus
 from shared.storage import generate_read_sas, generate_write_sas, build_output_blob_path
-from shared.servicebus import get_client, send_export_message
 from shared.pipeline import PipelineMessage, finalize_job_status, mark_item_failed
 from shared.upscaling import get_upscaling_provider
 from shared.util import new_id
+from shared.worker_runtime import QueueWorker, start_health_server
 
 LOG = logging.getLogger(__name__)
 upscale_provider = None
 
-
-class HealthHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path in ('/healthz', '/readyz', '/livez', '/'):
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'OK')
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def log_message(self, format, *args):
-        pass
-
-
-def start_health_server(port=8080):
-    server = HTTPServer(('0.0.0.0', port), HealthHandler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    LOG.info('Health server started on port %d', port)
+_CHUNK_SIZE = settings.BLOB_TRANSFER_CHUNK_MB * 1024 * 1024
 
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=5))
 def upload_blob_via_sas(sas_url: str, data: bytes) -> None:
     with httpx.Client(timeout=60) as client:
-        r = client.put(sas_url, content=data, headers={'x-ms-blob-type': 'BlockBlob'})
-        r.raise_for_status()
+        blob_transfer.upload(client, sas_url, data, chunk_size=_CHUNK_SIZE,
+                             concurrency=settings.BLOB_TRANSFER_CONCURRENCY)
 
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=5))
 def download_blob_via_sas(sas_url: str) -> bytes:
     with httpx.Client(timeout=60) as client:
-        r = client.get(sas_url)
-        r.raise_for_status()
-        return r.content
+        return blob_transfer.download(client, sas_url, chunk_size=_CHUNK_SIZE,
+                                      concurrency=settings.BLOB_TRANSFER_CONCURRENCY)
 
 
 def _mark_failed(item_id: str, error: str) -> None:
@@ -101,14 +76,12 @@ def process_message(data: dict) -> None:
             s.commit()
             LOG.info('Item completed: %s', msg.item_id)
 
+    # Requests the job's export once the last item lands
     finalize_job_status(msg.job_id)
 
-    send_export_message({
-        'tenant_id': msg.tenant_id,
-        'job_id': msg.job_id,
-        'item_id': msg.item_id,
-        'correlation_id': msg.correlation_id,
-    })
+
+def _on_failure(data: dict, exc: BaseException) -> None:
+    mark_item_failed(data.get('job_id'), data.get('item_id'), str(exc))
 
 
 def main():
@@ -137,47 +110,12 @@ def main():
 
     LOG.info('Starting message processing loop...')
 
-    while True:
-        try:
-            with get_client() as client:
-                receiver = client.get_queue_receiver(
-                    queue_name=settings.SERVICEBUS_UPSCALE_QUEUE,
-                    max_wait_time=20,
-                    receive_mode=ServiceBusReceiveMode.PEEK_LOCK,
-                )
-                renewer = AutoLockRenewer()
-                with receiver:
-                    messages = receiver.receive_messages(max_message_count=5, max_wait_time=20)
-                    for m in messages:
-                        item_id = None
-                        job_id = None
-                        try:
-                            data = json.loads(str(m))
-                            item_id = data.get('item_id')
-                            job_id = data.get('job_id')
-                            renewer.register(receiver, m, max_lock_renewal_duration=600)
-                            process_message(data)
-                            receiver.complete_message(m)
-                            LOG.info('Message completed: %s', item_id)
-                        except json.JSONDecodeError as e:
-                            LOG.error('Invalid JSON: %s', e)
-                            receiver.dead_letter_message(m, reason='InvalidJSON',
-                                                          error_description=str(e))
-                        except Exception as e:
-                            LOG.exception('Processing failed: %s', e)
-                            try:
-                                mark_item_failed(job_id, item_id, str(e))
-                            except Exception:
-                                pass
-                            receiver.abandon_message(m)
-                        finally:
-                            try:
-                                renewer.close()
-                            except Exception:
-                                pass
-        except Exception as e:
-            LOG.exception('Worker loop error: %s', e)
-            time.sleep(5)
+    QueueWorker(
+        settings.SERVICEBUS_UPSCALE_QUEUE,
+        process_message,
+        max_lock_renewal_duration=600,
+        on_failure=_on_failure,
+    ).run_forever()
 
 
 if __name__ == '__main__':
@@ -1,20 +1,18 @@
 import hashlib
 import logging
 import secrets
-from datetime import datetime, timezone
 from typing import Optional
 
-from fastapi import HTTPException, Security, Depends, status
+from fastapi import HTTPException, Request, Security, Depends, status
 from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
 import jwt
-from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
 
 from shared.config import settings
-from shared.db import SessionLocal
-from shared.db_sqlalchemy import (
-    get_user_by_entra_subject, get_user_by_email, link_entra_subject,
-    create_user,
-)
+from shared.db_async import AsyncSessionLocal
+from shared.db_sqlalchemy import link_entra_subject, create_user
+from shared.db_sqlalchemy_async import get_api_key_user, get_user_by_entra_subject, get_user_by_email
+from shared.principal_cache import cache_principal, get_principal, principal_generation, record_api_key_use
 from shared.util import new_id
 
 LOG = logging.getLogger(__name__)
@@ -49,6 +47,7 @@ def get_valid_api_keys() -> set:
 
 
 async def get_current_user(
+    request: Request,
     api_key: Optional[str] = Security(api_key_header),
     credentials: Optional[HTTPAuthorizationCredentials] = Security(bearer_scheme),
 ) -> dict:
@@ -61,13 +60,13 @@ async def get_current_user(
     # Path 1: Bearer JWT (Entra External ID)
     if credentials and credentials.credentials:
         user = await _resolve_jwt_user(credentials.credentials)
-        check_rate_limit(user["user_id"])
+        check_rate_limit(user["user_id"], tenant_id=user["tenant_id"], request=request)
         return user
 
     # Path 2: API key (programmatic access)
     if api_key:
-        user = _resolve_api_key_user(api_key)
-        check_rate_limit(user["user_id"])
+        user = await _resolve_api_key_user(api_key)
+        check_rate_limit(user["user_id"], tenant_id=user["tenant_id"], request=request)
         return user
 
     # Path 3: No auth configured (local dev only)
@@ -119,16 +118,21 @@ async def _resolve_jwt_user(token: str) -> dict:
     subject = payload["sub"]
     email = payload.get("email") or payload.get("preferred_username", "")
 
+    cached = get_principal(f"sub:{subject}")
+    if cached is not None:
+        return dict(cached)
+    generation = principal_generation()
+
     # JIT user provisioning — create on first login
-    user = get_user_by_entra_subject(subject)
+    user = await get_user_by_entra_subject(subject)
     if not user and email:
         # Check if a pre-created user exists with this email (e.g. admin bootstrap)
-        user = get_user_by_email(email)
+        user = await get_user_by_email(email)
         if user:
-            link_entra_subject(user["id"], subject)
+            await run_in_threadpool(link_entra_subject, user["id"], subject)
             LOG.info("Linked Entra subject to existing user: %s", user["id"])
     if not user:
-        user = create_user({
+        user = await run_in_threadpool(create_user, {
             "id": new_id("user"),
             "entra_subject_id": subject,
             "email": email,
@@ -138,16 +142,18 @@ async def _resolve_jwt_user(token: str) -> dict:
         })
         LOG.info("JIT-provisioned user: %s", user["id"])
 
-    return {
+    principal = {
         "user_id": user["id"],
         "tenant_id": user["tenant_id"],
         "email": user["email"],
         "token_balance": user["token_balance"],
         "is_admin": user.get("is_admin", False),
     }
+    cache_principal(f"sub:{subject}", user["id"], principal, generation=generation)
+    return dict(principal)
 
 
-def _resolve_api_key_user(api_key: str) -> dict:
+async def _resolve_api_key_user(api_key: str) -> dict:
     """Validate API key — check static keys first, then user-generated keys."""
     # 1. Check static API_KEYS env var (admin / unlimited)
     valid_keys = get_valid_api_keys()
@@ -156,35 +162,25 @@ def _resolve_api_key_user(api_key: str) -> dict:
         return {"user_id": "apikey", "tenant_id": tenant, "email": "", "token_balance": 999999}
 
     # 2. Check user-generated API keys in DB
-    if not SessionLocal:
+    if not AsyncSessionLocal:
         raise HTTPException(status_code=403, detail="Invalid API key")
     key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-    with SessionLocal() as session:
-        row = session.execute(
-            text("""
-                SELECT ak.id AS key_id, ak.user_id,
-                       u.tenant_id, u.email, u.token_balance, u.is_admin
-                FROM user_api_keys ak
-                JOIN users u ON u.id = ak.user_id
-                WHERE ak.key_hash = :kh AND ak.is_active = TRUE
-            """),
-            {"kh": key_hash},
-        ).mappings().first()
-
+    row = get_principal(f"key:{key_hash}")
+    if row is None:
+        generation = principal_generation()
+        row = await get_api_key_user(key_hash)
         if row:
-            # Update last_used_at
-            session.execute(
-                text("UPDATE user_api_keys SET last_used_at = :now WHERE id = :kid"),
-                {"now": datetime.now(timezone.utc), "kid": row["key_id"]},
-            )
-            session.commit()
-            return {
-                "user_id": row["user_id"],
-                "tenant_id": row["tenant_id"],
-                "email": row["email"] or "",
-                "token_balance": row["token_balance"],
-                "is_admin": row["is_admin"] or False,
-            }
+            cache_principal(f"key:{key_hash}", row["user_id"], row, generation=generation)
+    if row:
+        # last_used_at is written in batches, not per request
+        record_api_key_use(row["key_id"])
+        return {
+            "user_id": row["user_id"],
+            "tenant_id": row["tenant_id"],
+            "email": row["email"] or "",
+            "token_balance": row["token_balance"],
+            "is_admin": row["is_admin"] or False,
+        }
 
     raise HTTPException(status_code=403, detail="Invalid API key")
 
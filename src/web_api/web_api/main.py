@@ -21,6 +21,7 @@ from web_api.routes_gdpr import router as gdpr_privacy_router, public_router as
 from web_api.routes_api_keys import router as api_keys_router
 from web_api.routes_preferences import router as preferences_router
 from web_api.routes_account import router as account_router
+from web_api.routes_webhooks import router as webhooks_router
 from web_api.auth import get_current_user
 
 log = logging.getLogger("opal")
@@ -42,6 +43,11 @@ async def lifespan(app):
     except Exception as e:
         log.warning("Startup migration check failed (non-fatal): %s", e)
     yield
+    from shared.principal_cache import flush_api_key_use
+    try:
+        flush_api_key_use()
+    except Exception as e:
+        log.warning("Flushing API key last_used_at on shutdown failed: %s", e)
 
 app = FastAPI(title="Opal Web API", version="0.8.1", lifespan=lifespan)
 
@@ -58,7 +64,17 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class RateLimitHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response: Response = await call_next(request)
+        result = getattr(request.state, "rate_limit", None)
+        if result is not None:
+            response.headers.update(result.headers())
+        return response
+
+
 app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(RateLimitHeadersMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -66,11 +82,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization", "X-API-Key", "X-Pixel-Key"],
+    expose_headers=["RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After"],
 )
 
 app.include_router(health_router)
 app.include_router(billing_public_router)  # Public endpoints (no auth)
 app.include_router(gdpr_public_router)  # Public privacy info (no auth)
+app.include_router(webhooks_router)  # Provider callbacks (no auth; body untrusted, results fetched from provider)
 app.include_router(jobs_router, dependencies=[Depends(get_current_user)])
 app.include_router(uploads_router, dependencies=[Depends(get_current_user)])
 app.include_router(downloads_router, dependencies=[Depends(get_current_user)])
@@ -1,31 +1,121 @@
 """
-Sliding-window rate limiter with Redis backend and in-memory fallback.
+GCRA rate limiter with Redis backend and in-memory fallback.
 
 Uses Redis when REDIS_URL is set (works across multiple replicas).
-Falls back to in-memory dict when Redis is unavailable.
+Falls back to an in-process store when Redis is unavailable.
+
+GCRA (generic cell rate algorithm) keeps one number per key, the
+theoretical arrival time (TAT) of the next request.  A policy of N
+requests per P seconds spaces requests P/N apart and allows a burst of N;
+a request is allowed if it would not push the TAT more than P ahead of
+now.  On Redis this is one Lua script call per request; in memory it is
+one float per key in an LRU map capped at RATE_LIMIT_MEMORY_MAX_KEYS.
+
+Limits:
+  - RATE_LIMIT_PER_MINUTE is the default per principal (user or IP)
+  - RATE_LIMIT_ROUTE_CLASSES gives route classes (the path segment after
+    /v1/, e.g. ``uploads``) their own limit and bucket
+  - RATE_LIMIT_TENANT_OVERRIDES overrides the default (``tenant=600``) or
+    one route class (``tenant:uploads=120``) for a tenant
+  Values are ``limit`` per minute or ``limit/seconds``.
+
+Allowed requests get RateLimit-Limit/-Remaining/-Reset headers (added by
+RateLimitHeadersMiddleware); rejected ones a 429 with the same headers
+plus Retry-After.
 """
 import logging
+import math
 import os
+import threading
 import time
-from collections import defaultdict
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
 
 from fastapi import HTTPException, Request, status
 
+from shared.config import settings
+
 LOG = logging.getLogger(__name__)
 
-# Config: max requests per window
-RATE_LIMIT = 60  # requests
+# Config: default max requests per window
+RATE_LIMIT = settings.RATE_LIMIT_PER_MINUTE  # requests
 WINDOW_SECONDS = 60  # per minute
 
+# Float slack so N requests spaced P/N apart fit exactly into P
+_EPSILON = 1e-6
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    limit: int
+    period: float = WINDOW_SECONDS
+
+    @property
+    def interval(self) -> float:
+        """Seconds between requests at the sustained rate."""
+        return self.period / self.limit
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # seconds until the full burst is available again
+    retry_after: float = 0.0  # seconds until the next request would be allowed
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def _result(policy: RatePolicy, allowed: bool, tat_offset: float, retry_after: float = 0.0) -> RateLimitResult:
+    """Build a result from the TAT's distance ahead of now (after this request if allowed)."""
+    remaining = int((policy.period - tat_offset + _EPSILON) // policy.interval) if allowed else 0
+    return RateLimitResult(
+        allowed=allowed,
+        limit=policy.limit,
+        remaining=max(0, min(policy.limit, remaining)),
+        reset_after=max(0.0, tat_offset),
+        retry_after=max(0.0, retry_after),
+    )
+
+
 # ── Redis backend ──
 
 _redis_client = None
 _redis_checked = False
+_redis_script = None
+
+# KEYS[1] = bucket, ARGV = interval ms, period ms.
+# Returns {allowed, TAT offset ms, retry-after ms}; uses the server clock so
+# replicas agree.
+GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local new_tat = tat + interval
+if new_tat - now > period then
+  return {0, tat - now, new_tat - now - period}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, new_tat - now, 0}
+"""
 
 
 def _get_redis():
     """Lazy-init Redis connection. Returns None if unavailable."""
-    global _redis_client, _redis_checked
+    global _redis_client, _redis_checked, _redis_script
     if _redis_checked:
         return _redis_client
     _redis_checked = True
@@ -39,6 +129,7 @@ def _get_redis():
         import redis
         _redis_client = redis.from_url(redis_url, decode_responses=True, socket_connect_timeout=2)
         _redis_client.ping()
+        _redis_script = _redis_client.register_script(GCRA_LUA)
         LOG.info("Rate limiter connected to Redis")
     except Exception as exc:
         LOG.warning("Redis unavailable, falling back to in-memory rate limiter: %s", exc)
@@ -47,30 +138,18 @@ def _get_redis():
     return _redis_client
 
 
-def _check_redis(key: str, limit: int) -> bool:
-    """Check rate limit via Redis sorted set. Returns True if allowed."""
+def _check_redis(key: str, policy: RatePolicy) -> Optional[RateLimitResult]:
+    """Check rate limit with one script call. Returns None to use the fallback."""
     r = _get_redis()
     if r is None:
-        return None  # signal to use fallback
-
-    now = time.time()
-    redis_key = f"rl:{key}"
-    cutoff = now - WINDOW_SECONDS
+        return None
 
     try:
-        pipe = r.pipeline()
-        pipe.zremrangebyscore(redis_key, 0, cutoff)
-        pipe.zcard(redis_key)
-        pipe.zadd(redis_key, {str(now): now})
-        pipe.expire(redis_key, WINDOW_SECONDS + 1)
-        results = pipe.execute()
-
-        count = results[1]  # zcard result (before adding current request)
-        if count >= limit:
-            # Remove the entry we just added
-            r.zrem(redis_key, str(now))
-            return False
-        return True
+        allowed, tat_offset, retry_after = _redis_script(
+            keys=[f"gcra:{key}"],
+            args=[int(policy.interval * 1000), int(policy.period * 1000)],
+        )
+        return _result(policy, bool(allowed), int(tat_offset) / 1000, int(retry_after) / 1000)
     except Exception as exc:
         LOG.warning("Redis error in rate limiter, falling back: %s", exc)
         return None  # fallback to in-memory
@@ -78,51 +157,110 @@ def _check_redis(key: str, limit: int) -> bool:
 
 # ── In-memory fallback ──
 
-_requests: dict[str, list[float]] = defaultdict(list)
-
-
-def _cleanup(key: str, now: float) -> None:
-    """Remove timestamps outside the current window."""
-    cutoff = now - WINDOW_SECONDS
-    entries = _requests[key]
-    i = 0
-    while i < len(entries) and entries[i] < cutoff:
-        i += 1
-    if i:
-        _requests[key] = entries[i:]
-
-
-def _check_memory(key: str, limit: int) -> bool:
-    """Check rate limit via in-memory dict. Returns True if allowed."""
-    now = time.monotonic()
-    _cleanup(key, now)
-
-    if len(_requests[key]) >= limit:
-        return False
-
-    _requests[key].append(now)
-    return True
+class MemoryGCRA:
+    """TAT per key in an LRU map; the least recently seen keys go first."""
+
+    def __init__(self, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max(1, max_keys)
+        self._clock = clock
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: str, policy: RatePolicy) -> RateLimitResult:
+        with self._lock:
+            now = self._clock()
+            tat = max(self._tats.get(key, now), now)
+            new_tat = tat + policy.interval
+            if new_tat - now > policy.period + _EPSILON:
+                self._tats.move_to_end(key)
+                return _result(policy, False, tat - now, new_tat - now - policy.period)
+            self._tats[key] = new_tat
+            self._tats.move_to_end(key)
+            while len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+            return _result(policy, True, new_tat - now)
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+
+_memory = MemoryGCRA(max_keys=settings.RATE_LIMIT_MEMORY_MAX_KEYS)
+
+
+# ── Policies ──
+
+def parse_policies(spec: str) -> Dict[str, RatePolicy]:
+    """``"uploads=30, pixel=600/60"`` -> {name: RatePolicy}; bad entries are skipped."""
+    policies = {}
+    for part in (spec or "").split(","):
+        name, _, value = part.partition("=")
+        name, value = name.strip(), value.strip()
+        if not name or not value:
+            continue
+        limit, _, period = value.partition("/")
+        try:
+            policy = RatePolicy(int(limit), float(period) if period else WINDOW_SECONDS)
+        except ValueError:
+            LOG.warning("Ignoring invalid rate limit %r", part.strip())
+            continue
+        if policy.limit > 0 and policy.period > 0:
+            policies[name] = policy
+    return policies
+
+
+_route_policies = parse_policies(settings.RATE_LIMIT_ROUTE_CLASSES)
+_tenant_policies = parse_policies(settings.RATE_LIMIT_TENANT_OVERRIDES)
+
+
+def route_class(request: Optional[Request]) -> str:
+    """Path segment after /v1/ (``/v1/uploads/sas`` -> ``uploads``)."""
+    if request is None:
+        return "default"
+    parts = request.url.path.strip("/").split("/")
+    if len(parts) >= 2 and parts[0] == "v1":
+        return parts[1]
+    return parts[0] or "default"
+
+
+def resolve_policy(tenant_id: Optional[str], klass: str, default_limit: int) -> Tuple[RatePolicy, bool]:
+    """(policy, whether it is specific to the route class and needs its own bucket)."""
+    if tenant_id:
+        policy = _tenant_policies.get(f"{tenant_id}:{klass}")
+        if policy:
+            return policy, True
+    policy = _route_policies.get(klass)
+    if policy:
+        return policy, True
+    if tenant_id and tenant_id in _tenant_policies:
+        return _tenant_policies[tenant_id], False
+    return RatePolicy(default_limit), False
 
 
 # ── Public API ──
 
-def check_rate_limit(user_id: str, limit: int = RATE_LIMIT) -> None:
-    """Raise 429 if user exceeds rate limit."""
-    key = user_id
+def check_rate_limit(user_id: str, limit: int = RATE_LIMIT, tenant_id: Optional[str] = None,
+                     request: Optional[Request] = None) -> RateLimitResult:
+    """Raise 429 if *user_id* exceeds its limit for this request's route class."""
+    klass = route_class(request)
+    policy, per_class = resolve_policy(tenant_id, klass, limit)
+    key = f"{user_id}:{klass}" if per_class else user_id
 
-    result = _check_redis(key, limit)
+    result = _check_redis(key, policy)
     if result is None:
-        result = _check_memory(key, limit)
+        result = _memory.check(key, policy)
 
-    if not result:
+    if not result.allowed:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"Rate limit exceeded. Max {limit} requests per {WINDOW_SECONDS}s.",
-            headers={"Retry-After": str(WINDOW_SECONDS)},
+            detail=f"Rate limit exceeded. Max {policy.limit} requests per {policy.period:g}s.",
+            headers=result.headers(),
         )
+    if request is not None:
+        request.state.rate_limit = result
+    return result
 
 
 def check_ip_rate_limit(request: Request, limit: int = 30) -> None:
     """Rate limit by IP for unauthenticated/public endpoints."""
     client_ip = request.client.host if request.client else "unknown"
-    check_rate_limit(f"ip:{client_ip}", limit=limit)
+    check_rate_limit(f"ip:{client_ip}", limit=limit, request=request)
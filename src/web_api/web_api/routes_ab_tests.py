@@ -6,12 +6,13 @@ from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
-from shared.db_sqlalchemy import (
+from shared.db_sqlalchemy import get_integration_with_token, get_job_item
+from shared.db_sqlalchemy_async import (
     create_ab_test, get_ab_test, list_ab_tests, update_ab_test,
     get_ab_test_metrics, upsert_ab_test_metric, get_ab_test_aggregated_metrics,
-    get_integration, get_integration_with_token, get_job_item,
-    create_variant_log_entry,
+    get_integration, create_variant_log_entry,
 )
 from shared.encryption import decrypt
 from shared.storage import download_file
@@ -46,7 +47,7 @@ async def create_test(
 ):
     """Create a new A/B test for a product image."""
     # Validate integration
-    integ = get_integration(body.integration_id, user["user_id"])
+    integ = await get_integration(body.integration_id, user["user_id"])
     if not integ:
         raise HTTPException(status_code=404, detail="Integration not found")
 
@@ -58,15 +59,15 @@ async def create_test(
 
     # Validate job items if provided
     if body.variant_a_job_item_id:
-        item_a = get_job_item(body.variant_a_job_item_id)
+        item_a = await run_in_threadpool(get_job_item, body.variant_a_job_item_id)
         if not item_a or not item_a.get("output_blob_path"):
             raise HTTPException(status_code=400, detail="Variant A image not found or not processed")
     if body.variant_b_job_item_id:
-        item_b = get_job_item(body.variant_b_job_item_id)
+        item_b = await run_in_threadpool(get_job_item, body.variant_b_job_item_id)
         if not item_b or not item_b.get("output_blob_path"):
             raise HTTPException(status_code=400, detail="Variant B image not found or not processed")
 
-    test = create_ab_test({
+    test = await create_ab_test({
         "id": new_id("abtest"),
         "user_id": user["user_id"],
         "integration_id": body.integration_id,
@@ -94,7 +95,7 @@ async def list_tests(
     status: str | None = Query(None),
     user: dict = Depends(get_current_user),
 ):
-    tests = list_ab_tests(user["user_id"], integration_id=integration_id, status=status)
+    tests = await list_ab_tests(user["user_id"], integration_id=integration_id, status=status)
     return {"tests": tests}
 
 
@@ -103,12 +104,12 @@ async def get_test(
     test_id: str,
     user: dict = Depends(get_current_user),
 ):
-    test = get_ab_test(test_id, user["user_id"])
+    test = await get_ab_test(test_id, user["user_id"])
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
 
-    metrics = get_ab_test_aggregated_metrics(test_id)
-    daily_metrics = get_ab_test_metrics(test_id)
+    metrics = await get_ab_test_aggregated_metrics(test_id)
+    daily_metrics = await get_ab_test_metrics(test_id)
 
     # Compute statistical significance
     significance = _compute_significance(metrics)
@@ -134,7 +135,7 @@ async def start_test(
     user: dict = Depends(get_current_user),
 ):
     """Start a test: push variant A to the store as the live image."""
-    test = get_ab_test(test_id, user["user_id"])
+    test = await get_ab_test(test_id, user["user_id"])
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
     if test["status"] not in ("created",):
@@ -144,14 +145,14 @@ async def start_test(
     if not body.skip_push:
         await _push_variant_to_store(test, "a", user["user_id"])
 
-    update_ab_test(test_id, {
+    await update_ab_test(test_id, {
         "status": "running",
         "active_variant": "a",
         "started_at": datetime.utcnow(),
     })
 
     # Log variant activation for pixel event attribution
-    create_variant_log_entry(test_id, "a")
+    await create_variant_log_entry(test_id, "a")
 
     return {"ok": True, "active_variant": "a"}
 
@@ -167,7 +168,7 @@ async def swap_variant(
     user: dict = Depends(get_current_user),
 ):
     """Swap which variant is live on the store."""
-    test = get_ab_test(test_id, user["user_id"])
+    test = await get_ab_test(test_id, user["user_id"])
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
     if test["status"] != "running":
@@ -178,10 +179,10 @@ async def swap_variant(
     if not body.skip_push:
         await _push_variant_to_store(test, new_variant, user["user_id"])
 
-    update_ab_test(test_id, {"active_variant": new_variant})
+    await update_ab_test(test_id, {"active_variant": new_variant})
 
     # Log variant activation for pixel event attribution
-    create_variant_log_entry(test_id, new_variant)
+    await create_variant_log_entry(test_id, new_variant)
 
     return {"ok": True, "active_variant": new_variant}
 
@@ -197,7 +198,7 @@ async def conclude_test(
     user: dict = Depends(get_current_user),
 ):
     """End the test, pick a winner, and set the winning variant as permanent."""
-    test = get_ab_test(test_id, user["user_id"])
+    test = await get_ab_test(test_id, user["user_id"])
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
     if test["status"] != "running":
@@ -206,7 +207,7 @@ async def conclude_test(
     # Push the winner to the store
     await _push_variant_to_store(test, body.winner, user["user_id"])
 
-    update_ab_test(test_id, {
+    await update_ab_test(test_id, {
         "status": "concluded",
         "winner": body.winner,
         "active_variant": body.winner,
@@ -222,13 +223,13 @@ async def cancel_test(
     user: dict = Depends(get_current_user),
 ):
     """Cancel a test. If original_image_id is set, restore it."""
-    test = get_ab_test(test_id, user["user_id"])
+    test = await get_ab_test(test_id, user["user_id"])
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
     if test["status"] not in ("created", "running"):
         raise HTTPException(status_code=400, detail=f"Cannot cancel test in {test['status']} state")
 
-    update_ab_test(test_id, {
+    await update_ab_test(test_id, {
         "status": "canceled",
         "ended_at": datetime.utcnow(),
     })
@@ -255,11 +256,11 @@ async def record_metric(
     user: dict = Depends(get_current_user),
 ):
     """Record or update metrics for a variant on a specific date."""
-    test = get_ab_test(test_id, user["user_id"])
+    test = await get_ab_test(test_id, user["user_id"])
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
 
-    metric = upsert_ab_test_metric({
+    metric = await upsert_ab_test_metric({
         "id": new_id("abm"),
         "ab_test_id": test_id,
         "variant": body.variant,
@@ -279,12 +280,12 @@ async def get_metrics(
     test_id: str,
     user: dict = Depends(get_current_user),
 ):
-    test = get_ab_test(test_id, user["user_id"])
+    test = await get_ab_test(test_id, user["user_id"])
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
 
-    daily = get_ab_test_metrics(test_id)
-    aggregated = get_ab_test_aggregated_metrics(test_id)
+    daily = await get_ab_test_metrics(test_id)
+    aggregated = await get_ab_test_aggregated_metrics(test_id)
     significance = _compute_significance(aggregated)
 
     return {
@@ -304,10 +305,10 @@ async def _push_variant_to_store(test: dict, variant: str, user_id: str):
     image_url = test.get(f"variant_{variant}_image_url")
 
     if item_id:
-        item = get_job_item(item_id)
+        item = await run_in_threadpool(get_job_item, item_id)
         if not item or not item.get("output_blob_path"):
             raise HTTPException(status_code=400, detail=f"Variant {variant} image not available")
-        image_bytes = download_file("outputs", item["output_blob_path"])
+        image_bytes = await run_in_threadpool(download_file, "outputs", item["output_blob_path"])
         filename = f"opal_ab_{variant}_{item['filename']}"
     elif image_url:
         async with httpx.AsyncClient(timeout=30) as client:
@@ -320,7 +321,7 @@ async def _push_variant_to_store(test: dict, variant: str, user_id: str):
     else:
         raise HTTPException(status_code=400, detail=f"Variant {variant} has no image source")
 
-    integ = get_integration_with_token(test["integration_id"], user_id)
+    integ = await run_in_threadpool(get_integration_with_token, test["integration_id"], user_id)
     if not integ:
         raise HTTPException(status_code=404, detail="Integration not found")
 
@@ -11,9 +11,11 @@ from shared.db_sqlalchemy import (
     platform_stats, list_all_jobs, list_all_integrations,
     list_all_token_packages, update_token_package, create_token_package, delete_token_package,
     list_all_transactions, list_all_payments,
-    get_jobs_older_than, delete_job_cascade,
+    get_jobs_older_than, delete_job_cascade, evict_step_cache_entries,
+    enqueue_blob_deletions, get_blob_deletion_stats, requeue_dead_blob_deletions,
     get_pipeline_performance,
 )
+from shared.config import settings
 from shared.util import new_id
 from web_api.auth import get_current_user
 
@@ -431,33 +433,74 @@ async def cleanup_old_jobs(body: CleanupRequest, admin: dict = Depends(require_a
         }
 
     deleted_count = 0
-    blobs_deleted = 0
+    blobs_queued = 0
     errors = []
 
     for job in old_jobs:
         try:
-            result = delete_job_cascade(job["id"])
+            # Blobs are queued in the same transaction and deleted in the
+            # background (shared.blob_deletion)
+            result = delete_job_cascade(job["id"], reason="retention")
             deleted_count += 1
-
-            # Delete associated blobs
-            for container, path in result.get("blob_paths", []):
-                try:
-                    from shared.storage import delete_blob
-                    delete_blob(container, path)
-                    blobs_deleted += 1
-                except Exception as e:
-                    LOG.warning("Failed to delete blob %s/%s: %s", container, path, e)
+            blobs_queued += result["blobs_queued"]
         except Exception as e:
             errors.append({"job_id": job["id"], "error": str(e)})
             LOG.error("Cleanup failed for job %s: %s", job["id"], e)
 
-    LOG.info("Cleanup: deleted %d jobs, %d blobs (retention=%d days)",
-             deleted_count, blobs_deleted, body.retention_days)
+    LOG.info("Cleanup: deleted %d jobs, queued %d blobs (retention=%d days)",
+             deleted_count, blobs_queued, body.retention_days)
 
     return {
         "dry_run": False,
         "jobs_deleted": deleted_count,
-        "blobs_deleted": blobs_deleted,
+        # blobs_deleted kept for existing clients; deletion completes in the background
+        "blobs_deleted": blobs_queued,
+        "blobs_queued": blobs_queued,
         "errors": errors,
         "retention_days": body.retention_days,
     }
+
+
+@router.post("/step-cache/evict")
+async def evict_step_cache(admin: dict = Depends(require_admin)):
+    """Drop expired step-cache entries and trim tenants over the entry cap."""
+    blob_paths = evict_step_cache_entries(settings.STEP_CACHE_MAX_ENTRIES_PER_TENANT)
+    blobs_queued = enqueue_blob_deletions(blob_paths, reason="step_cache")
+
+    LOG.info("Step cache eviction: %d entries, %d blobs queued", len(blob_paths), blobs_queued)
+    return {"entries_evicted": len(blob_paths), "blobs_deleted": blobs_queued, "blobs_queued": blobs_queued}
+
+
+@router.post("/tmp/sweep")
+async def sweep_tmp_blobs_endpoint(admin: dict = Depends(require_admin)):
+    """Delete outputs/_tmp/ blobs older than TMP_BLOB_MAX_AGE_MINUTES.
+
+    Pipeline workers run the same sweep periodically; this triggers one now.
+    """
+    from shared.storage import sweep_tmp_blobs
+    deleted = sweep_tmp_blobs(settings.TMP_BLOB_MAX_AGE_MINUTES)
+    LOG.info("Tmp sweep: %d blobs deleted", deleted)
+    return {"blobs_deleted": deleted, "max_age_minutes": settings.TMP_BLOB_MAX_AGE_MINUTES}
+
+
+@router.get("/blob-deletions")
+async def blob_deletion_status(admin: dict = Depends(require_admin)):
+    """Backlog of the background blob deletion queue, including dead letters."""
+    return get_blob_deletion_stats()
+
+
+@router.post("/blob-deletions/requeue")
+async def requeue_blob_deletions(admin: dict = Depends(require_admin)):
+    """Retry dead-lettered blob deletions with a fresh attempt budget."""
+    requeued = requeue_dead_blob_deletions()
+    LOG.info("Requeued %d dead-lettered blob deletions", requeued)
+    return {"requeued": requeued}
+
+
+@router.post("/jobs/repair-counters")
+async def repair_job_counters_endpoint(admin: dict = Depends(require_admin)):
+    """Recount item counters for jobs whose counters drifted from job_items."""
+    from shared.db_sqlalchemy import repair_job_counters
+    repaired = repair_job_counters()
+    LOG.info("Job counter repair: %d jobs", len(repaired))
+    return {"jobs_repaired": len(repaired), "job_ids": repaired[:100]}
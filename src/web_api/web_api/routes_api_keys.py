@@ -10,6 +10,7 @@ from pydantic import BaseModel, Field
 from sqlalchemy import text
 
 from shared.db import SessionLocal
+from shared.principal_cache import invalidate_principal, notify_principal_changed
 from shared.util import new_id
 from web_api.auth import get_current_user
 
@@ -133,7 +134,11 @@ def revoke_api_key(key_id: str, user: dict = Depends(get_current_user)):
             """),
             {"kid": key_id, "uid": user["user_id"]},
         )
+        if result.rowcount:
+            notify_principal_changed(session, user["user_id"])
         session.commit()
+    if result.rowcount:
+        invalidate_principal(user["user_id"])
 
     if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="API key not found")
@@ -4,17 +4,23 @@ from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
 from shared.db_sqlalchemy import (
-    create_catalog_job, get_catalog_job, list_catalog_jobs, update_catalog_job,
+    create_catalog_job,
     increment_catalog_job_counts, create_catalog_job_products,
-    get_catalog_job_products, update_catalog_job_product,
+    update_catalog_job_product,
     get_pending_catalog_products,
-    get_integration, get_integration_with_token, get_integration_cost,
+    get_integration_with_token, get_integration_cost,
     create_job_record, create_job_item_records, update_job_status, debit_tokens,
     get_job_by_id, get_job_items,
 )
+from shared.db_sqlalchemy_async import (
+    get_catalog_job, list_catalog_jobs, update_catalog_job, get_catalog_job_products,
+    get_integration,
+)
 from shared.encryption import decrypt
+from shared.output_encoding import with_extension
 from shared.storage import upload_file, build_raw_blob_path, download_file
 from shared.queue_database import send_job_message
 from shared.util import new_id, new_correlation_id
@@ -33,7 +39,7 @@ async def estimate_catalog(
     user: dict = Depends(get_current_user),
 ):
     """Count products and images, estimate token cost for full catalog processing."""
-    integ = get_integration(integration_id, user["user_id"])
+    integ = await get_integration(integration_id, user["user_id"])
     if not integ:
         raise HTTPException(status_code=404, detail="Integration not found")
 
@@ -43,7 +49,7 @@ async def estimate_catalog(
     total_images = sum(len(p.get("images", [])) for p in products)
     products_with_images = [p for p in products if p.get("images")]
 
-    cost_per_image = get_integration_cost(integ["provider"], "process_image")
+    cost_per_image = await run_in_threadpool(get_integration_cost, integ["provider"], "process_image")
 
     return {
         "total_products": len(products),
@@ -83,7 +89,7 @@ async def start_catalog_job(
     user: dict = Depends(get_current_user),
 ):
     """Start bulk catalog processing. Creates a catalog job and processes products in background."""
-    integ = get_integration(integration_id, user["user_id"])
+    integ = await get_integration(integration_id, user["user_id"])
     if not integ:
         raise HTTPException(status_code=404, detail="Integration not found")
 
@@ -103,13 +109,13 @@ async def start_catalog_job(
         raise HTTPException(status_code=400, detail="No products with images found")
 
     total_images = sum(len(p.get("images", [])) for p in products)
-    cost_per_image = get_integration_cost(integ["provider"], "process_image")
+    cost_per_image = await run_in_threadpool(get_integration_cost, integ["provider"], "process_image")
     tokens_required = total_images * cost_per_image
 
     # Check token balance (skip for API key users)
     if user["user_id"] != "apikey" and tokens_required > 0:
         from shared.db_sqlalchemy import get_user_by_id
-        u = get_user_by_id(user["user_id"])
+        u = await run_in_threadpool(get_user_by_id, user["user_id"])
         if not u or u["token_balance"] < tokens_required:
             raise HTTPException(
                 status_code=402,
@@ -118,7 +124,7 @@ async def start_catalog_job(
 
     # Create catalog job
     catalog_job_id = new_id("catjob")
-    catalog_job = create_catalog_job({
+    catalog_job = await run_in_threadpool(create_catalog_job, {
         "id": catalog_job_id,
         "user_id": user["user_id"],
         "integration_id": integration_id,
@@ -145,7 +151,7 @@ async def start_catalog_job(
             "product_title": _product_title(p, integ["provider"]),
             "image_count": len(p.get("images", [])),
         })
-    create_catalog_job_products(product_records)
+    await run_in_threadpool(create_catalog_job_products, product_records)
 
     # Process in background
     background_tasks.add_task(
@@ -172,7 +178,7 @@ async def list_catalog_jobs_endpoint(
     user: dict = Depends(get_current_user),
 ):
     """List catalog jobs for this integration."""
-    jobs = list_catalog_jobs(user["user_id"])
+    jobs = await list_catalog_jobs(user["user_id"])
     # Filter to this integration
     jobs = [j for j in jobs if j["integration_id"] == integration_id]
     return {"catalog_jobs": jobs}
@@ -185,11 +191,11 @@ async def get_catalog_job_status(
     user: dict = Depends(get_current_user),
 ):
     """Get detailed status of a catalog job including per-product progress."""
-    cj = get_catalog_job(catalog_job_id, user["user_id"])
+    cj = await get_catalog_job(catalog_job_id, user["user_id"])
     if not cj:
         raise HTTPException(status_code=404, detail="Catalog job not found")
 
-    products = get_catalog_job_products(catalog_job_id)
+    products = await get_catalog_job_products(catalog_job_id)
     return {**cj, "products": products}
 
 
@@ -200,13 +206,13 @@ async def cancel_catalog_job(
     user: dict = Depends(get_current_user),
 ):
     """Cancel a running catalog job. Already-queued items will still process."""
-    cj = get_catalog_job(catalog_job_id, user["user_id"])
+    cj = await get_catalog_job(catalog_job_id, user["user_id"])
     if not cj:
         raise HTTPException(status_code=404, detail="Catalog job not found")
     if cj["status"] not in ("created", "processing"):
         raise HTTPException(status_code=400, detail=f"Cannot cancel job in {cj['status']} state")
 
-    update_catalog_job(catalog_job_id, {"status": "canceled"})
+    await update_catalog_job(catalog_job_id, {"status": "canceled"})
     return {"ok": True, "catalog_job_id": catalog_job_id}
 
 
@@ -222,7 +228,7 @@ async def _process_catalog_job(
     import httpx
 
     try:
-        cj = get_catalog_job(catalog_job_id, user_id)
+        cj = await get_catalog_job(catalog_job_id, user_id)
         if not cj or cj["status"] == "canceled":
             return
 
@@ -232,28 +238,28 @@ async def _process_catalog_job(
         processing_options = settings.get("processing_options", {})
         auto_push_back = settings.get("auto_push_back", False)
 
-        integ = get_integration_with_token(integration_id, user_id)
+        integ = await run_in_threadpool(get_integration_with_token, integration_id, user_id)
         if not integ:
-            update_catalog_job(catalog_job_id, {"status": "failed", "error_message": "Integration not found"})
+            await update_catalog_job(catalog_job_id, {"status": "failed", "error_message": "Integration not found"})
             return
 
         client = await _get_provider_client(integ)
-        cost_per_image = get_integration_cost(provider, "process_image")
+        cost_per_image = await run_in_threadpool(get_integration_cost, provider, "process_image")
 
         # Process products in batches
         while True:
             # Re-check cancellation
-            cj = get_catalog_job(catalog_job_id, user_id)
+            cj = await get_catalog_job(catalog_job_id, user_id)
             if not cj or cj["status"] == "canceled":
                 return
 
-            pending = get_pending_catalog_products(catalog_job_id, limit=5)
+            pending = await run_in_threadpool(get_pending_catalog_products, catalog_job_id, limit=5)
             if not pending:
                 break
 
             for product_entry in pending:
                 # Re-check cancellation per product
-                cj_check = get_catalog_job(catalog_job_id, user_id)
+                cj_check = await get_catalog_job(catalog_job_id, user_id)
                 if not cj_check or cj_check["status"] == "canceled":
                     return
 
@@ -272,16 +278,16 @@ async def _process_catalog_job(
                 )
 
         # Mark catalog job complete
-        cj = get_catalog_job(catalog_job_id, user_id)
+        cj = await get_catalog_job(catalog_job_id, user_id)
         if cj and cj["status"] == "processing":
             final_status = "completed" if cj["failed_count"] == 0 else "completed"
-            update_catalog_job(catalog_job_id, {"status": final_status})
+            await update_catalog_job(catalog_job_id, {"status": final_status})
             LOG.info("Catalog job %s completed: %d processed, %d failed",
                      catalog_job_id, cj["processed_count"], cj["failed_count"])
 
     except Exception as e:
         LOG.error("Catalog job %s failed: %s", catalog_job_id, e, exc_info=True)
-        update_catalog_job(catalog_job_id, {"status": "failed", "error_message": "Catalog processing failed unexpectedly"})
+        await update_catalog_job(catalog_job_id, {"status": "failed", "error_message": "Catalog processing failed unexpectedly"})
 
 
 async def _process_single_product(
@@ -301,32 +307,34 @@ async def _process_single_product(
     import httpx
 
     product_id = product_entry["product_id"]
-    update_catalog_job_product(product_entry["id"], {"status": "processing"})
+    await run_in_threadpool(update_catalog_job_product, product_entry["id"], {"status": "processing"})
 
     try:
         # Fetch product images from store
         images = await _fetch_product_images(client, provider, int(product_id))
         if not images:
-            update_catalog_job_product(product_entry["id"], {"status": "skipped", "error_message": "No images"})
-            increment_catalog_job_counts(catalog_job_id, skipped=1)
+            await run_in_threadpool(update_catalog_job_product, product_entry["id"],
+                                    {"status": "skipped", "error_message": "No images"})
+            await run_in_threadpool(increment_catalog_job_counts, catalog_job_id, skipped=1)
             return
 
         # Debit tokens
         total_cost = cost_per_image * len(images)
         if user_id != "apikey" and total_cost > 0:
-            new_balance = debit_tokens(
+            new_balance = await run_in_threadpool(
+                debit_tokens,
                 user_id=user_id,
                 amount=total_cost,
                 description=f"Catalog: {product_entry.get('product_title', product_id)} ({len(images)} images)",
             )
             if new_balance is None:
-                update_catalog_job_product(product_entry["id"], {
+                await run_in_threadpool(update_catalog_job_product, product_entry["id"], {
                     "status": "failed",
                     "error_message": "Insufficient tokens",
                 })
-                increment_catalog_job_counts(catalog_job_id, failed=1)
+                await run_in_threadpool(increment_catalog_job_counts, catalog_job_id, failed=1)
                 # Cancel remaining — no tokens left
-                update_catalog_job(catalog_job_id, {
+                await update_catalog_job(catalog_job_id, {
                     "status": "failed",
                     "error_message": "Insufficient tokens to continue processing",
                 })
@@ -336,7 +344,7 @@ async def _process_single_product(
         job_id = new_id("job")
         corr = new_correlation_id()
 
-        create_job_record({
+        await run_in_threadpool(create_job_record, {
             "id": job_id,
             "tenant_id": tenant_id,
             "brand_profile_id": brand_profile_id,
@@ -359,7 +367,7 @@ async def _process_single_product(
                     resp = await http.get(img_url)
                     resp.raise_for_status()
                     content_type = resp.headers.get("content-type", "image/jpeg")
-                    upload_file("raw", raw_path, resp.content, content_type)
+                    await run_in_threadpool(upload_file, "raw", raw_path, resp.content, content_type)
 
                     items_data.append({
                         "id": item_id,
@@ -373,32 +381,32 @@ async def _process_single_product(
                     LOG.warning("Failed to download image %s for product %s: %s", img_ext_id, product_id, e)
 
         if not items_data:
-            update_catalog_job_product(product_entry["id"], {
+            await run_in_threadpool(update_catalog_job_product, product_entry["id"], {
                 "status": "failed",
                 "error_message": "Failed to download images",
             })
-            increment_catalog_job_counts(catalog_job_id, failed=1)
+            await run_in_threadpool(increment_catalog_job_counts, catalog_job_id, failed=1)
             return
 
-        create_job_item_records(items_data)
+        await run_in_threadpool(create_job_item_records, items_data)
 
         # Enqueue for processing
         for item in items_data:
-            send_job_message({
+            await run_in_threadpool(send_job_message, {
                 "tenant_id": tenant_id,
                 "job_id": job_id,
                 "item_id": item["id"],
                 "correlation_id": corr,
                 "processing_options": processing_options,
             })
-        update_job_status(job_id, "processing")
+        await run_in_threadpool(update_job_status, job_id, "processing")
 
         # Update product entry
-        update_catalog_job_product(product_entry["id"], {
+        await run_in_threadpool(update_catalog_job_product, product_entry["id"], {
             "status": "completed",
             "job_id": job_id,
         })
-        increment_catalog_job_counts(catalog_job_id, processed=1, tokens=total_cost)
+        await run_in_threadpool(increment_catalog_job_counts, catalog_job_id, processed=1, tokens=total_cost)
 
         LOG.info("Catalog product %s: job %s created with %d items", product_id, job_id, len(items_data))
 
@@ -416,11 +424,11 @@ async def _process_single_product(
 
     except Exception as e:
         LOG.error("Failed to process catalog product %s: %s", product_id, e, exc_info=True)
-        update_catalog_job_product(product_entry["id"], {
+        await run_in_threadpool(update_catalog_job_product, product_entry["id"], {
             "status": "failed",
             "error_message": "Product processing failed unexpectedly",
         })
-        increment_catalog_job_counts(catalog_job_id, failed=1)
+        await run_in_threadpool(increment_catalog_job_counts, catalog_job_id, failed=1)
 
 
 # ── Auto Push-Back ────────────────────────────────────────────────────
@@ -440,7 +448,7 @@ async def _wait_and_push_back(
     # Poll job status (max 10 min, check every 5s)
     for _ in range(120):
         await asyncio.sleep(5)
-        job = get_job_by_id(job_id, tenant_id)
+        job = await run_in_threadpool(get_job_by_id, job_id, tenant_id)
         if not job:
             break
         if job["status"] in ("completed", "partial", "failed"):
@@ -450,7 +458,7 @@ async def _wait_and_push_back(
         return
 
     # Get completed items with output
-    completed_items = get_job_items(job_id)
+    completed_items = await run_in_threadpool(get_job_items, job_id)
     items_with_output = [it for it in completed_items if it.get("output_blob_path") and it["status"] == "completed"]
 
     if not items_with_output:
@@ -465,8 +473,8 @@ async def _wait_and_push_back(
     pushed = 0
     for item in items_with_output:
         try:
-            image_bytes = download_file("outputs", item["output_blob_path"])
-            filename = f"opal_{item['filename']}"
+            image_bytes = await run_in_threadpool(download_file, "outputs", item["output_blob_path"])
+            filename = f"opal_{with_extension(item['filename'], item['output_blob_path'])}"
 
             # Extract original image ext ID from filename pattern: {provider}_{product_id}_{img_ext_id}.jpg
             parts = item["filename"].rsplit("_", 1)
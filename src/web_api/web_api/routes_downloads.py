@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from pydantic import BaseModel, Field
-from shared.db_sqlalchemy import get_job_item, get_job_by_id
-from shared.storage import generate_download_url
+from shared.config import settings
+from shared.db_sqlalchemy import get_job_item, get_job_by_id, get_job_items
+from shared.previews import ensure_preview, snap_width
+from shared.storage import generate_download_url, generate_read_sas
 from shared.export_presets import list_presets, get_preset
 from web_api.auth import get_tenant_from_api_key, get_current_user
 
@@ -41,6 +43,41 @@ def get_download_url(
     return {"download_url": download_url}
 
 
+@router.get("/downloads/{item_id}/preview")
+def get_preview_url(
+    item_id: str,
+    response: Response,
+    width: int = Query(default=320, ge=1, le=4096),
+    format: str = Query(default="webp", pattern="^(webp|jpeg)$"),
+    bucket: str = Query(default="outputs", pattern="^(raw|outputs)$"),
+    tenant_id: str = Depends(get_tenant_from_api_key)
+):
+    """SAS URL of a small gallery preview of an item's output (or raw upload).
+
+    Widths snap up to the fixed preview sizes.  The first request renders and
+    stores the preview; later ones only sign the stored copy.
+    """
+    item = get_job_item(item_id)
+
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    if item["tenant_id"] != tenant_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    width = snap_width(width)
+    blob_path = ensure_preview(item, bucket, width, format)
+    if not blob_path:
+        detail = "Output not ready yet" if bucket == "outputs" else "Raw file not found"
+        raise HTTPException(status_code=404, detail=detail)
+
+    ttl = settings.PREVIEW_URL_TTL_MINUTES
+    preview_url = generate_read_sas(container="outputs", blob_path=blob_path, expiry_minutes=ttl)
+    # Clients may reuse the URL until shortly before its signature expires
+    response.headers["Cache-Control"] = f"private, max-age={max(0, ttl * 60 - 300)}"
+    return {"preview_url": preview_url, "width": width, "format": format}
+
+
 @router.get("/downloads/jobs/{job_id}/export")
 def get_export_download_url(
     job_id: str,
@@ -60,6 +97,38 @@ def get_export_download_url(
     return {"download_url": download_url}
 
 
+@router.get("/downloads/jobs/{job_id}/urls")
+def get_job_download_urls(
+    job_id: str,
+    bucket: str = Query(default="outputs", pattern="^(raw|outputs)$"),
+    tenant_id: str = Depends(get_tenant_from_api_key)
+):
+    """SAS download URLs for every item of a job in one call.
+
+    Items without a blob in *bucket* yet (e.g. still processing) get a null
+    ``download_url``.  All URLs are signed with one cached delegation key.
+    """
+    job = get_job_by_id(job_id, tenant_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    path_field = "output_blob_path" if bucket == "outputs" else "raw_blob_path"
+    expires_in = 3600
+    items = []
+    for item in get_job_items(job_id):
+        blob_path = item.get(path_field)
+        items.append({
+            "item_id": item["id"],
+            "filename": item.get("filename"),
+            "status": item.get("status"),
+            "download_url": generate_download_url(bucket=bucket, path=blob_path, expires_in=expires_in)
+            if blob_path else None,
+        })
+
+    return {"job_id": job_id, "bucket": bucket, "expires_in": expires_in, "items": items}
+
+
 @router.get("/export-presets")
 def get_export_presets():
     """List available marketplace export presets (platform-specific sizes)."""
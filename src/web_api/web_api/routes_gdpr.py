@@ -5,7 +5,6 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 
 from shared.db_sqlalchemy import export_user_data, delete_user_data
-from shared.storage import delete_blob
 from web_api.auth import get_current_user
 
 LOG = logging.getLogger(__name__)
@@ -43,17 +42,10 @@ def delete_my_account(body: DeleteConfirmIn, user: dict = Depends(get_current_us
     if not result.get("deleted"):
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Clean up blob storage
-    blob_paths = result.pop("blob_paths", [])
-    blobs_deleted = 0
-    for container, path in blob_paths:
-        try:
-            delete_blob(container, path)
-            blobs_deleted += 1
-        except Exception as e:
-            LOG.warning("Failed to delete blob %s/%s: %s", container, path, e)
-
-    result["blobs_deleted"] = blobs_deleted
+    # Blobs were queued with the deletion and are erased in the background
+    # (shared.blob_deletion); blobs_deleted kept for existing clients
+    result.pop("blob_paths", None)
+    result["blobs_deleted"] = result.get("blobs_queued", 0)
     LOG.info("GDPR deletion completed for user %s: %s", user["user_id"], result)
     return result
 
@@ -21,6 +21,7 @@ from shared.encryption import encrypt, decrypt
 from shared.shopify_client import (
     build_oauth_url, exchange_token, verify_hmac, verify_webhook_hmac, ShopifyClient,
 )
+from shared.output_encoding import with_extension
 from shared.storage import download_file
 from shared.util import new_id
 from web_api.auth import get_current_user
@@ -514,6 +515,7 @@ async def process_images(
 
             multi = items_per_image > 1
             idx = 0
+            raw_path = None
 
             if templates:
                 # Template mode
@@ -521,8 +523,10 @@ async def process_images(
                     saved_bg = tmpl.get("preview_blob_path") if body.use_saved_background else None
                     for angle in angle_list:
                         item_id = new_id("item")
-                        raw_path = build_raw_blob_path(user["tenant_id"], job_id, item_id, filename)
-                        upload_file("raw", raw_path, image_bytes, content_type)
+                        if raw_path is None:
+                            # One raw blob per source image, shared by all its scenes/angles
+                            raw_path = build_raw_blob_path(user["tenant_id"], job_id, item_id, filename)
+                            upload_file("raw", raw_path, image_bytes, content_type)
 
                         items_data.append({
                             "id": item_id,
@@ -556,8 +560,10 @@ async def process_images(
 
                     for angle in angle_list:
                         item_id = new_id("item")
-                        raw_path = build_raw_blob_path(user["tenant_id"], job_id, item_id, filename)
-                        upload_file("raw", raw_path, image_bytes, content_type)
+                        if raw_path is None:
+                            # One raw blob per source image, shared by all its scenes/angles
+                            raw_path = build_raw_blob_path(user["tenant_id"], job_id, item_id, filename)
+                            upload_file("raw", raw_path, image_bytes, content_type)
 
                         items_data.append({
                             "id": item_id,
@@ -654,7 +660,7 @@ async def push_back_images(
             continue
 
         image_bytes = download_file("outputs", job_item["output_blob_path"])
-        filename = f"opal_{job_item['filename']}"
+        filename = f"opal_{with_extension(job_item['filename'], job_item['output_blob_path'])}"
 
         try:
             if mode == "replace" and image_id:
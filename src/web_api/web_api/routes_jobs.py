@@ -40,6 +40,7 @@ class ProcessingOptions(BaseModel):
     remove_background: bool = True
     generate_scene: bool = True
     upscale: bool = False
+    output_format: str | None = Field(default=None, pattern=r'^(png|png-max|webp|webp-lossless|jpeg|avif)$')
 
 
 class CreateJobIn(BaseModel):
@@ -5,17 +5,24 @@ Events are attributed to the correct variant via timestamp lookup in ab_test_var
 """
 import logging
 import math
+from collections import Counter, defaultdict
 from datetime import datetime
 from typing import Literal, Optional
 
 import httpx
 from fastapi import APIRouter, Depends, HTTPException, Header
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
 from shared.db_sqlalchemy import (
+    ensure_pixel_key,
+    update_integration_event_limit,
+    get_integration_ga_config,
+    set_integration_ga_config,
+)
+from shared.db_sqlalchemy_async import (
     get_integration_by_pixel_key,
     get_integration,
-    ensure_pixel_key,
     find_running_test,
     get_active_variant_at,
     increment_ab_test_metric,
@@ -23,9 +30,6 @@ from shared.db_sqlalchemy import (
     update_ab_test,
     get_monthly_view_count,
     get_integration_event_limit,
-    update_integration_event_limit,
-    get_integration_ga_config,
-    set_integration_ga_config,
 )
 from web_api.auth import get_current_user
 
@@ -64,7 +68,7 @@ async def receive_pixel_events(
     Returns 202 Accepted (fire-and-forget from pixel's perspective).
     """
     # 1. Validate pixel key → find integration
-    integration = get_integration_by_pixel_key(x_pixel_key)
+    integration = await get_integration_by_pixel_key(x_pixel_key)
     if not integration:
         raise HTTPException(status_code=401, detail="Invalid pixel key")
 
@@ -73,9 +77,9 @@ async def receive_pixel_events(
     skipped = 0
 
     # 2. Check monthly view limit
-    event_limit = get_integration_event_limit(integration_id)
+    event_limit = await get_integration_event_limit(integration_id)
     if event_limit is not None:
-        monthly_views = get_monthly_view_count(integration_id)
+        monthly_views = await get_monthly_view_count(integration_id)
         if monthly_views >= event_limit:
             LOG.info("Pixel events: integration=%s over monthly limit (%d/%d), dropping batch",
                      integration_id, monthly_views, event_limit)
@@ -83,9 +87,14 @@ async def receive_pixel_events(
 
     # 3. Process each event
     is_free_tier = event_limit is not None
+    running_tests: dict[str, Optional[dict]] = {}
+    variants: dict[tuple[str, datetime], Optional[str]] = {}
+    increments: dict[tuple[str, str, str], Counter] = defaultdict(Counter)
     for event in body.events:
-        # Find running test for this product
-        test = find_running_test(integration_id, event.product_id)
+        # Find running test for this product (once per product per batch)
+        if event.product_id not in running_tests:
+            running_tests[event.product_id] = await find_running_test(integration_id, event.product_id)
+        test = running_tests[event.product_id]
         if not test:
             skipped += 1
             continue
@@ -106,7 +115,9 @@ async def receive_pixel_events(
             continue
 
         # Determine which variant was active at event time
-        variant = get_active_variant_at(test["id"], event_time)
+        if (test["id"], event_time) not in variants:
+            variants[test["id"], event_time] = await get_active_variant_at(test["id"], event_time)
+        variant = variants[test["id"], event_time]
         if not variant:
             # No variant log entry found — use current active variant as fallback
             variant = test["active_variant"]
@@ -114,20 +125,24 @@ async def receive_pixel_events(
         # Date for metric rollup (UTC date of the event)
         event_date = event_time.strftime("%Y-%m-%d")
 
-        # Increment the appropriate metric
+        # Tally the appropriate metric; written once per test/variant/date below
+        counts = increments[test["id"], variant, event_date]
         if event.event_type == "view":
-            increment_ab_test_metric(test["id"], variant, event_date, views=1)
+            counts["views"] += 1
         elif event.event_type == "add_to_cart":
-            increment_ab_test_metric(test["id"], variant, event_date, add_to_carts=1)
+            counts["add_to_carts"] += 1
         elif event.event_type == "conversion":
-            revenue = event.revenue_cents or 0
-            increment_ab_test_metric(test["id"], variant, event_date, conversions=1, revenue_cents=revenue)
+            counts["conversions"] += 1
+            counts["revenue_cents"] += event.revenue_cents or 0
 
         processed += 1
 
+    for (test_id, variant, event_date), counts in increments.items():
+        await increment_ab_test_metric(test_id, variant, event_date, **counts)
+
     # 3. Check auto-conclude for any tests that received events
     # (lightweight — only runs significance check, not a full background job)
-    _check_auto_conclude_batch(integration_id, body.events)
+    await _check_auto_conclude_batch(integration_id, body.events)
 
     # 4. Relay events to GA4 if configured (fire-and-forget, non-blocking)
     ga_config = integration.get("provider_metadata") or {}
@@ -149,7 +164,7 @@ MIN_VIEWS_FOR_AUTO_CONCLUDE = 200
 CONFIDENCE_THRESHOLD = 0.05  # p-value
 
 
-def _check_auto_conclude_batch(integration_id: str, events: list[PixelEvent]) -> None:
+async def _check_auto_conclude_batch(integration_id: str, events: list[PixelEvent]) -> None:
     """Check if any tests that received events should be auto-concluded.
 
     Only checks tests with enough data to potentially be significant.
@@ -159,11 +174,11 @@ def _check_auto_conclude_batch(integration_id: str, events: list[PixelEvent]) ->
     product_ids = {e.product_id for e in events}
 
     for product_id in product_ids:
-        test = find_running_test(integration_id, product_id)
+        test = await find_running_test(integration_id, product_id)
         if not test or not test.get("auto_conclude"):
             continue
 
-        aggregated = get_ab_test_aggregated_metrics(test["id"])
+        aggregated = await get_ab_test_aggregated_metrics(test["id"])
         a = aggregated.get("a", {})
         b = aggregated.get("b", {})
 
@@ -175,7 +190,7 @@ def _check_auto_conclude_batch(integration_id: str, events: list[PixelEvent]) ->
         if significance["confident"] and significance["recommended_winner"]:
             LOG.info("Auto-concluding test %s: winner=%s p=%.4f",
                      test["id"], significance["recommended_winner"], significance["p_value"])
-            update_ab_test(test["id"], {
+            await update_ab_test(test["id"], {
                 "status": "concluded",
                 "winner": significance["recommended_winner"],
                 "ended_at": datetime.utcnow(),
@@ -235,10 +250,10 @@ async def get_pixel_key(
     user: dict = Depends(get_current_user),
 ):
     """Get or create a pixel key for an integration."""
-    integ = get_integration(integration_id, user["user_id"])
+    integ = await get_integration(integration_id, user["user_id"])
     if not integ:
         raise HTTPException(status_code=404, detail="Integration not found")
-    key = ensure_pixel_key(integration_id)
+    key = await run_in_threadpool(ensure_pixel_key, integration_id)
     return {"pixel_key": key, "integration_id": integration_id}
 
 
@@ -253,10 +268,10 @@ async def set_event_limit(
     user: dict = Depends(get_current_user),
 ):
     """Set the monthly event limit for an integration. null = unlimited (paid plans)."""
-    integ = get_integration(integration_id, user["user_id"])
+    integ = await get_integration(integration_id, user["user_id"])
     if not integ:
         raise HTTPException(status_code=404, detail="Integration not found")
-    update_integration_event_limit(integration_id, body.monthly_event_limit)
+    await run_in_threadpool(update_integration_event_limit, integration_id, body.monthly_event_limit)
     return {"ok": True, "monthly_event_limit": body.monthly_event_limit}
 
 
@@ -266,11 +281,11 @@ async def get_view_usage(
     user: dict = Depends(get_current_user),
 ):
     """Get monthly view usage and limit for an integration."""
-    integ = get_integration(integration_id, user["user_id"])
+    integ = await get_integration(integration_id, user["user_id"])
     if not integ:
         raise HTTPException(status_code=404, detail="Integration not found")
-    monthly_views = get_monthly_view_count(integration_id)
-    monthly_limit = get_integration_event_limit(integration_id)
+    monthly_views = await get_monthly_view_count(integration_id)
+    monthly_limit = await get_integration_event_limit(integration_id)
     return {
         "monthly_views": monthly_views,
         "monthly_limit": monthly_limit,
@@ -356,10 +371,10 @@ async def get_ga_config(
     user: dict = Depends(get_current_user),
 ):
     """Get GA4 Measurement Protocol config for an integration."""
-    integ = get_integration(integration_id, user["user_id"])
+    integ = await get_integration(integration_id, user["user_id"])
     if not integ:
         raise HTTPException(status_code=404, detail="Integration not found")
-    config = get_integration_ga_config(integration_id)
+    config = await run_in_threadpool(get_integration_ga_config, integration_id)
     return {
         "configured": config is not None,
         "ga_measurement_id": config["ga_measurement_id"] if config else None,
@@ -375,9 +390,9 @@ async def update_ga_config(
     user: dict = Depends(get_current_user),
 ):
     """Set or clear GA4 Measurement Protocol config for an integration."""
-    integ = get_integration(integration_id, user["user_id"])
+    integ = await get_integration(integration_id, user["user_id"])
     if not integ:
         raise HTTPException(status_code=404, detail="Integration not found")
-    set_integration_ga_config(integration_id, body.ga_measurement_id, body.ga_api_secret)
+    await run_in_threadpool(set_integration_ga_config, integration_id, body.ga_measurement_id, body.ga_api_secret)
     configured = bool(body.ga_measurement_id and body.ga_api_secret)
     return {"ok": True, "configured": configured}
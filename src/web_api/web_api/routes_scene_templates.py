@@ -108,19 +108,16 @@ def delete(template_id: str, tenant_id: str = Depends(get_tenant_from_api_key)):
 def generate_preview(body: PreviewRequest, tenant_id: str = Depends(get_tenant_from_api_key)):
     """Generate a scene preview image from a prompt using the image generation provider."""
     try:
-        from shared.image_generation import get_image_gen_provider
+        from shared.provider_registry import resolve_image_gen_provider
     except ImportError:
         raise HTTPException(status_code=503, detail="Image generation not available")
 
-    from shared.settings_service import get_setting
     provider_name = settings.IMAGE_GEN_PROVIDER
-    api_key_attr = f'{provider_name.upper().replace(".", "_")}_API_KEY'
-    api_key = get_setting(api_key_attr)
-    if not api_key:
+    # Long-lived instance: rebuilt only when the provider's API key changes
+    provider = resolve_image_gen_provider(provider_name)
+    if provider is None:
         raise HTTPException(status_code=503, detail=f"No API key configured for {provider_name}")
 
-    provider = get_image_gen_provider(provider_name, api_key=api_key)
-
     # Sanitize prompt for logging (strip newlines to prevent log injection)
     safe_prompt = body.prompt[:50].replace("\n", " ").replace("\r", "")
     LOG.info("Generating scene preview for tenant=%s prompt=%s...", tenant_id, safe_prompt)
@@ -1,12 +1,14 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 import logging
 
+from shared.config import settings
 from shared.db_sqlalchemy import get_job_by_id, get_job_item, update_job_item, get_job_items_by_filename
 from shared.storage import (
     build_raw_blob_path,
     generate_upload_url,
-    upload_file as storage_upload_file,
+    open_blob_writer,
 )
 from shared.queue_database import send_job_message, send_job_messages_batch
 from web_api.auth import get_tenant_from_api_key
@@ -27,6 +29,7 @@ class ProcessingOptions(BaseModel):
     remove_background: bool = True
     generate_scene: bool = True
     upscale: bool = False
+    output_format: str | None = Field(default=None, pattern=r'^(png|png-max|webp|webp-lossless|jpeg|avif)$')
 
 
 class UploadComplete(BaseModel):
@@ -78,19 +81,27 @@ async def upload_direct(
     # Build storage path
     raw_path = build_raw_blob_path(tenant_id, job_id, item_id, file.filename or item["filename"])
 
-    # Read file content (50 MB limit)
+    # Stream to storage in parallel staged blocks (50 MB limit); only a few
+    # blocks are held in memory, and nothing is committed if the limit is hit
     MAX_UPLOAD_BYTES = 50 * 1024 * 1024
-    file_content = await file.read(MAX_UPLOAD_BYTES + 1)
-    if len(file_content) > MAX_UPLOAD_BYTES:
-        raise HTTPException(status_code=413, detail="File too large (max 50 MB)")
-
-    # Upload to storage
-    storage_upload_file(
-        bucket="raw",
-        path=raw_path,
-        data=file_content,
-        content_type=file.content_type or "application/octet-stream"
+    block_size = settings.BLOB_TRANSFER_CHUNK_MB * 1024 * 1024
+    writer = open_blob_writer(
+        "raw", raw_path,
+        content_type=file.content_type or "application/octet-stream",
+        block_size=block_size,
+        concurrency=settings.BLOB_TRANSFER_CONCURRENCY,
     )
+    try:
+        size = 0
+        while chunk := await file.read(block_size):
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="File too large (max 50 MB)")
+            await run_in_threadpool(writer.write, chunk)
+        await run_in_threadpool(writer.close)
+    except BaseException:
+        await run_in_threadpool(writer.abort)
+        raise
 
     # Set raw_blob_path on this item AND all siblings with same filename (multi-scene)
     siblings = get_job_items_by_filename(job_id, item["filename"])
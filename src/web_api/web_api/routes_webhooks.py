@@ -0,0 +1,58 @@
+"""
+Provider callbacks for asynchronous work.
+
+fal.ai POSTs here when a queued scene generation finishes (the pipeline
+worker passes this URL as ``fal_webhook`` when SCENE_GEN_ASYNC is on).  The
+body is never trusted: it only names the request.  We enqueue a resume
+message and the pipeline worker fetches the real result from fal's queue
+API with our API key — the same approach as the Mollie webhook.
+"""
+import logging
+import re
+
+from fastapi import APIRouter, HTTPException, Request
+
+from shared.config import settings
+from shared.db_sqlalchemy import claim_provider_resume, get_item_by_provider_request
+from shared.queue_database import send_job_message
+from web_api.rate_limit import check_ip_rate_limit
+
+LOG = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/v1/webhooks", tags=["webhooks"])
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,100}$")
+
+
+@router.post("/fal")
+async def fal_webhook(request: Request):
+    """Resume the item waiting on the finished fal request (idempotent)."""
+    check_ip_rate_limit(request, limit=600)
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+
+    request_id = body.get("request_id") if isinstance(body, dict) else None
+    if not isinstance(request_id, str) or not _REQUEST_ID_RE.match(request_id):
+        raise HTTPException(status_code=400, detail="Missing request_id")
+
+    item = get_item_by_provider_request(request_id)
+    if not item:
+        # Already resumed (webhook retry, poller won) or unknown — 200 stops fal retrying
+        LOG.info("fal webhook for unknown/finished request %s", request_id)
+        return {"ok": True}
+    if not claim_provider_resume(item["item_id"], request_id, settings.SCENE_GEN_RESUME_RETRY_SECONDS):
+        # Webhook retry, or the poller already enqueued it
+        LOG.info("fal webhook: resume of %s already enqueued", request_id)
+        return {"ok": True}
+
+    send_job_message({
+        "tenant_id": item["tenant_id"],
+        "job_id": item["job_id"],
+        "item_id": item["item_id"],
+        "resume_request_id": request_id,
+    })
+    LOG.info("fal webhook: resuming item %s (request %s, status=%s)",
+             item["item_id"], request_id, body.get("status"))
+    return {"ok": True}
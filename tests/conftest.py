@@ -86,3 +86,11 @@ def mock_user():
 @pytest.fixture
 def mock_admin():
     return MOCK_ADMIN.copy()
+
+
+@pytest.fixture(autouse=True)
+def _fresh_settings_cache():
+    """Admin settings are cached per process; don't leak them between tests."""
+    from shared.settings_service import invalidate_settings
+    invalidate_settings()
+    yield
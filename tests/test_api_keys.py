@@ -3,6 +3,7 @@ Tests for user API key management routes (routes_api_keys.py)
 and the auth.py user-key lookup flow.
 """
 
+import asyncio
 import hashlib
 import secrets
 from datetime import datetime, timezone
@@ -200,12 +201,13 @@ class TestAuthUserKeyLookup:
         from web_api.auth import _resolve_api_key_user
 
         with patch("web_api.auth.get_valid_api_keys", return_value={"dev_testkey123"}):
-            result = _resolve_api_key_user("dev_testkey123")
+            result = asyncio.run(_resolve_api_key_user("dev_testkey123"))
         assert result["token_balance"] == 999999
         assert result["user_id"] == "apikey"
 
-    @patch("web_api.auth.SessionLocal")
-    def test_user_key_returns_real_balance(self, mock_sl):
+    @patch("web_api.auth.AsyncSessionLocal")
+    @patch("web_api.auth.get_api_key_user")
+    def test_user_key_returns_real_balance(self, mock_lookup, mock_sl):
         """User-generated key returns the actual user's token balance."""
         from web_api.auth import _resolve_api_key_user
         import uuid
@@ -214,43 +216,34 @@ class TestAuthUserKeyLookup:
         key_hash = hashlib.sha256(test_key.encode()).hexdigest()
         user_id = str(uuid.uuid4())
 
-        ctx, session = _make_session_mock()
-        mock_sl.return_value = ctx
-
-        # First call: SELECT returns user row
-        # Second call: UPDATE last_used_at
-        session.execute.side_effect = [
-            _mappings_first({
-                "key_id": str(uuid.uuid4()),
-                "user_id": user_id,
-                "tenant_id": "tenant_xyz",
-                "email": "user@shop.com",
-                "token_balance": 42,
-                "is_admin": False,
-            }),
-            MagicMock(),  # update
-        ]
+        mock_lookup.return_value = {
+            "key_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "tenant_id": "tenant_xyz",
+            "email": "user@shop.com",
+            "token_balance": 42,
+            "is_admin": False,
+        }
 
         with patch("web_api.auth.get_valid_api_keys", return_value=set()):
-            result = _resolve_api_key_user(test_key)
+            result = asyncio.run(_resolve_api_key_user(test_key))
 
         assert result["user_id"] == user_id
         assert result["token_balance"] == 42  # real balance, not 999999
         assert result["email"] == "user@shop.com"
-        session.commit.assert_called_once()
+        assert mock_lookup.await_args.args == (key_hash,)
 
-    @patch("web_api.auth.SessionLocal")
-    def test_invalid_key_raises_403(self, mock_sl):
+    @patch("web_api.auth.AsyncSessionLocal")
+    @patch("web_api.auth.get_api_key_user")
+    def test_invalid_key_raises_403(self, mock_lookup, mock_sl):
         """Unknown key raises 403."""
         from web_api.auth import _resolve_api_key_user
 
-        ctx, session = _make_session_mock()
-        mock_sl.return_value = ctx
-        session.execute.return_value = _mappings_first(None)  # no match
+        mock_lookup.return_value = None  # no match
 
         with patch("web_api.auth.get_valid_api_keys", return_value=set()):
             with pytest.raises(HTTPException) as exc_info:
-                _resolve_api_key_user("opal_bogus_key")
+                asyncio.run(_resolve_api_key_user("opal_bogus_key"))
             assert exc_info.value.status_code == 403
 
     def test_key_hash_is_consistent(self):
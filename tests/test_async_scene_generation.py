@@ -0,0 +1,327 @@
+"""
+Tests for asynchronous (submit-and-callback) scene generation against a
+local fake fal.ai queue: provider queue API, pipeline parking/resuming,
+webhook + poller delivery and at-most-once resume.
+"""
+import itertools
+from datetime import datetime, timedelta
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared.config import settings
+from shared.db import Base
+from shared.image_generation import AsyncImageGenerationProvider, FalFlux2ProEditProvider, FalProvider
+from shared.models import Job, JobItem, JobStatus, ItemStatus
+from shared.provider_http import ProviderTransport
+from pipeline_worker.handoff import ProductHandoff
+from pipeline_worker.job_context import JobContextCache
+from pipeline_worker.pipeline import execute_pipeline, resume_pipeline
+
+
+def _png(color=(0, 0, 255, 255), size=(8, 8)):
+    buf = BytesIO()
+    Image.new("RGBA", size, color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class FakeFal:
+    """In-process stand-in for queue.fal.run + the fal CDN."""
+
+    QUEUE = "https://queue.fal.test/fal-ai"
+
+    def __init__(self):
+        self.requests = {}
+        self._ids = itertools.count(1)
+        self.transport = ProviderTransport(transport=httpx.MockTransport(self.handle),
+                                           sleep=lambda s: None)
+
+    def finish(self, request_id):
+        self.requests[request_id]["status"] = "COMPLETED"
+
+    def fail(self, request_id):
+        self.requests[request_id].update(status="COMPLETED", error=True)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if request.url.host == "cdn.fal.test":
+            return httpx.Response(200, content=_png((0, 200, 0, 255), size=(16, 16)))
+        if request.method == "POST" and path == "/fal-ai/flux-2-pro/edit":
+            rid = f"req-{next(self._ids)}"
+            self.requests[rid] = {
+                "status": "IN_QUEUE",
+                "webhook": request.url.params.get("fal_webhook"),
+                "payload": request.read(),
+            }
+            return httpx.Response(200, json={"request_id": rid})
+        parts = path.split("/")
+        rid = parts[4] if len(parts) > 4 else None
+        if rid not in self.requests:
+            return httpx.Response(404)
+        entry = self.requests[rid]
+        if path.endswith("/status"):
+            return httpx.Response(200, json={"status": entry["status"]})
+        if entry.get("error"):
+            return httpx.Response(422, json={"detail": "content policy"})
+        return httpx.Response(200, json={"images": [{"url": f"https://cdn.fal.test/{rid}.png"}]})
+
+    def provider(self):
+        return FalFlux2ProEditProvider("key", queue_url=self.QUEUE)
+
+
+@pytest.fixture
+def fal():
+    fake = FakeFal()
+    with patch("shared.image_generation.get_provider_transport", return_value=fake.transport):
+        yield fake
+
+
+class TestProviderQueueApi:
+    def test_submit_then_collect(self, fal):
+        provider = fal.provider()
+        rid = provider.submit("studio", image_urls=["https://blob/p.png"],
+                              webhook_url="https://api.test/v1/webhooks/fal", image_size="square_hd")
+
+        assert fal.requests[rid]["webhook"] == "https://api.test/v1/webhooks/fal"
+        assert b'"image_size":"square_hd"' in fal.requests[rid]["payload"].replace(b" ", b"")
+        assert provider.fetch_result(rid) is None
+
+        fal.finish(rid)
+        assert provider.request_status(rid) == "COMPLETED"
+        assert Image.open(BytesIO(provider.fetch_result(rid))).size == (16, 16)
+
+    def test_only_queue_capable_providers_have_async_api(self):
+        assert isinstance(FalFlux2ProEditProvider("key"), AsyncImageGenerationProvider)
+        sync = FalProvider("key")
+        assert sync.supports_async is False
+        assert not hasattr(sync, "submit")
+
+    def test_failed_request_raises(self, fal):
+        provider = fal.provider()
+        rid = provider.submit("studio")
+        fal.fail(rid)
+        with pytest.raises(httpx.HTTPStatusError):
+            provider.fetch_result(rid)
+
+
+class TestPipelineParking:
+    def _edit_provider(self):
+        edit = MagicMock()
+        edit.name = "fal.ai/flux2-pro-edit"
+        edit.supports_edit = True
+        return edit
+
+    def test_parks_after_submit_and_resumes(self):
+        edit = self._edit_provider()
+        upscaler = MagicMock()
+        upscaler.name = "up"
+        upscaler.upscale.side_effect = lambda b: b
+        submit = MagicMock(return_value={"request_id": "r1", "provider": edit.name,
+                                         "product_blob_path": "_tmp/p.png"})
+
+        result = execute_pipeline(
+            raw_bytes=_png(size=(8, 6)), remove_background=False, generate_scene=True,
+            upscale=True, scene_prompt="marble", img_gen_provider=edit, upscale_provider=upscaler,
+            submit_scene_edit=submit,
+        )
+
+        edit.generate.assert_not_called()
+        upscaler.upscale.assert_not_called()
+        assert result.pending["request_id"] == "r1"
+        assert submit.call_args.args[2] == {"image_size": "landscape_4_3"}
+
+        resumed = resume_pipeline(
+            result.output_bytes, _png((0, 255, 0, 255), size=(8, 6)), upscale=True,
+            upscale_provider=upscaler, timings=result.step_timings,
+        )
+        upscaler.upscale.assert_called_once()
+        assert "preserve_details" in resumed.step_timings
+        assert resumed.step_timings["total"] >= result.step_timings["total"]
+
+    def test_scene_edit_is_submitted_even_with_step_cache(self):
+        edit = self._edit_provider()
+        cache = MagicMock()
+        submit = MagicMock(return_value={"request_id": "r1", "provider": edit.name,
+                                         "product_blob_path": "_tmp/p.png"})
+
+        result = execute_pipeline(
+            raw_bytes=_png(), remove_background=False, generate_scene=True, upscale=False,
+            scene_prompt="marble", img_gen_provider=edit, step_cache=cache,
+            submit_scene_edit=submit,
+        )
+
+        submit.assert_called_once()
+        cache.lookup.assert_not_called()
+        assert result.pending == {"request_id": "r1", "provider": edit.name,
+                                  "product_blob_path": "_tmp/p.png"}
+
+
+# ---------------------------------------------------------------------------
+# Worker + webhook end to end (SQLite, in-memory blobs, fake fal)
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def env(fal):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Job.__table__, JobItem.__table__])
+    Session = sessionmaker(bind=engine)
+    with Session() as s:
+        s.add(Job(id="job1", tenant_id="t1", brand_profile_id="default", correlation_id="c",
+                  status=JobStatus.processing))
+        for item_id in ("item1", "item2"):
+            s.add(JobItem(id=item_id, job_id="job1", tenant_id="t1", filename="shoe.jpg",
+                          status=ItemStatus.uploaded, raw_blob_path=f"t1/raw/{item_id}.png"))
+        s.commit()
+
+    blobs = {"t1/raw/item1.png": _png(size=(8, 8)), "t1/raw/item2.png": _png(size=(8, 8))}
+    sent = []
+    provider = fal.provider()
+
+    from pipeline_worker import worker
+    from shared import db, db_sqlalchemy
+    with patch.object(db, "SessionLocal", Session), \
+            patch.object(db_sqlalchemy, "SessionLocal", Session), \
+            patch.object(worker, "SessionLocal", Session), \
+            patch.object(worker, "generate_read_sas", lambda container, blob_path, **kw: blob_path), \
+            patch.object(worker, "generate_write_sas", lambda container, blob_path, **kw: blob_path), \
+            patch.object(worker, "download_blob", blobs.__getitem__), \
+            patch.object(worker, "upload_blob", lambda url, data, **kw: blobs.__setitem__(url, data)), \
+            patch.object(worker, "product_handoff", ProductHandoff(
+                lambda container, blob_path, **kw: blob_path, lambda container, blob_path, **kw: blob_path,
+                lambda url, data, **kw: blobs.__setitem__(url, data))), \
+            patch.object(worker, "send_job_message", sent.append), \
+            patch("shared.pipeline._send_export_message"), \
+            patch.object(worker, "_resolve_img_gen_provider", return_value=provider), \
+            patch.object(worker, "bg_provider", None), \
+            patch.object(worker, "job_contexts", JobContextCache(lambda job_id, tenant_id: None)), \
+            patch("shared.seo_metadata.generate_seo_metadata", side_effect=RuntimeError("offline")), \
+            patch.object(settings, "SCENE_GEN_ASYNC", True), \
+            patch.object(settings, "SCENE_GEN_WEBHOOK_URL", "https://api.test/v1/webhooks/fal"), \
+            patch.object(settings, "STEP_CACHE_ENABLED", False):
+        yield {"Session": Session, "blobs": blobs, "sent": sent, "worker": worker, "fal": fal}
+
+
+def _message(item_id):
+    return {
+        "tenant_id": "t1", "job_id": "job1", "item_id": item_id, "correlation_id": "c",
+        "processing_options": {"remove_background": False, "generate_scene": True, "upscale": False},
+    }
+
+
+def _item(env, item_id):
+    with env["Session"]() as s:
+        return s.get(JobItem, item_id)
+
+
+class TestWorkerAsyncFlow:
+    def test_park_webhook_resume(self, env):
+        worker, fal = env["worker"], env["fal"]
+
+        worker.process_message(_message("item1"))
+        parked = _item(env, "item1")
+        rid = parked.provider_request_id
+        assert parked.status == ItemStatus.processing
+        assert fal.requests[rid]["webhook"] == "https://api.test/v1/webhooks/fal"
+        assert parked.pending_state["product_blob_path"] in env["blobs"]
+
+        # fal calls back — web_api enqueues a resume (body is not trusted)
+        from fastapi.testclient import TestClient
+        from web_api.main import app
+        with patch("web_api.routes_webhooks.send_job_message") as enqueue:
+            r = TestClient(app).post("/v1/webhooks/fal", json={"request_id": rid, "status": "OK"})
+        assert r.status_code == 200
+        resume = enqueue.call_args.args[0]
+        assert resume == {"tenant_id": "t1", "job_id": "job1", "item_id": "item1",
+                          "resume_request_id": rid}
+
+        # Early delivery: still running at fal → item stays parked
+        worker.process_message(resume)
+        assert _item(env, "item1").provider_request_id == rid
+
+        fal.finish(rid)
+        worker.process_message(resume)
+        done = _item(env, "item1")
+        assert done.status == ItemStatus.completed
+        assert done.provider_request_id is None
+        assert done.output_blob_path in env["blobs"]
+        assert "scene_edit" in done.step_timings and "preserve_details" in done.step_timings
+
+        # Duplicate delivery (poller + webhook) is a no-op
+        worker.process_message(resume)
+        assert _item(env, "item1").status == ItemStatus.completed
+
+    def test_webhook_unknown_request_is_acknowledged(self, env):
+        from fastapi.testclient import TestClient
+        from web_api.main import app
+        with patch("web_api.routes_webhooks.send_job_message") as enqueue:
+            r = TestClient(app).post("/v1/webhooks/fal", json={"request_id": "nope"})
+            bad = TestClient(app).post("/v1/webhooks/fal", json={"request_id": "../x"})
+        assert r.status_code == 200
+        assert bad.status_code == 400
+        enqueue.assert_not_called()
+
+    def test_failed_generation_fails_item(self, env):
+        worker, fal = env["worker"], env["fal"]
+        worker.process_message(_message("item1"))
+        rid = _item(env, "item1").provider_request_id
+        fal.fail(rid)
+
+        worker.process_message({"tenant_id": "t1", "job_id": "job1", "item_id": "item1",
+                                "resume_request_id": rid})
+        item = _item(env, "item1")
+        assert item.status == ItemStatus.failed
+        assert "Scene generation failed" in item.error_message
+
+    def test_poller_resumes_finished_and_times_out_stale(self, env):
+        worker, fal = env["worker"], env["fal"]
+        worker.process_message(_message("item1"))
+        worker.process_message(_message("item2"))
+        rid1 = _item(env, "item1").provider_request_id
+        fal.finish(rid1)
+
+        # Too young: left for the webhook
+        assert worker.poll_pending_scene_edits() == 0
+
+        later = datetime.utcnow() + timedelta(seconds=settings.SCENE_GEN_POLL_INTERVAL + 1)
+        assert worker.poll_pending_scene_edits(now=later) == 1
+        assert env["sent"][0]["resume_request_id"] == rid1
+
+        much_later = datetime.utcnow() + timedelta(seconds=settings.SCENE_GEN_ASYNC_TIMEOUT + 1)
+        worker.poll_pending_scene_edits(now=much_later)
+        stale = _item(env, "item2")
+        assert stale.status == ItemStatus.failed
+        assert "timed out" in stale.error_message
+
+    def test_finished_request_is_enqueued_once(self, env):
+        worker, fal = env["worker"], env["fal"]
+        worker.process_message(_message("item1"))
+        rid = _item(env, "item1").provider_request_id
+        fal.finish(rid)
+
+        later = datetime.utcnow() + timedelta(seconds=settings.SCENE_GEN_POLL_INTERVAL + 1)
+        assert worker.poll_pending_scene_edits(now=later) == 1
+        # Next pass, or another replica's poller
+        assert worker.poll_pending_scene_edits(now=later + timedelta(seconds=1)) == 0
+
+        # The webhook arriving after the poller does not enqueue it again
+        from fastapi.testclient import TestClient
+        from web_api.main import app
+        with patch("web_api.routes_webhooks.send_job_message") as enqueue:
+            assert TestClient(app).post("/v1/webhooks/fal", json={"request_id": rid}).status_code == 200
+        enqueue.assert_not_called()
+
+        # A resume that never completed is enqueued again after the retry window
+        retry = later + timedelta(seconds=settings.SCENE_GEN_RESUME_RETRY_SECONDS + 1)
+        assert worker.poll_pending_scene_edits(now=retry) == 1
+        assert [m["resume_request_id"] for m in env["sent"]] == [rid, rid]
+
+        worker.process_message(env["sent"][-1])
+        assert _item(env, "item1").status == ItemStatus.completed
+        assert _item(env, "item1").provider_resume_enqueued_at is None
@@ -1,9 +1,11 @@
 """Tests for authentication: API key validation, JIT provisioning, admin bootstrap."""
-from collections import defaultdict
+import asyncio
 from unittest.mock import patch, MagicMock, AsyncMock
 import pytest
 from fastapi.testclient import TestClient
 
+from web_api.rate_limit import MemoryGCRA
+
 
 def _get_app():
     from web_api.main import app
@@ -13,7 +15,7 @@ def _get_app():
 
 
 class TestApiKeyAuth:
-    @patch("web_api.rate_limit._requests", defaultdict(list))
+    @patch("web_api.rate_limit._memory", MemoryGCRA())
     @patch("web_api.auth.settings")
     def test_valid_api_key(self, mock_settings):
         mock_settings.API_KEYS = "dev_testkey123"
@@ -33,7 +35,7 @@ class TestApiKeyAuth:
             resp = client.get("/v1/billing/balance", headers={"X-API-Key": "dev_testkey123"})
             assert resp.status_code == 200
 
-    @patch("web_api.rate_limit._requests", defaultdict(list))
+    @patch("web_api.rate_limit._memory", MemoryGCRA())
     @patch("web_api.auth.settings")
     def test_invalid_api_key_403(self, mock_settings):
         mock_settings.API_KEYS = "dev_testkey123"
@@ -46,7 +48,7 @@ class TestApiKeyAuth:
         resp = client.get("/v1/billing/balance", headers={"X-API-Key": "wrong_key"})
         assert resp.status_code == 403
 
-    @patch("web_api.rate_limit._requests", defaultdict(list))
+    @patch("web_api.rate_limit._memory", MemoryGCRA())
     @patch("web_api.auth.settings")
     def test_no_auth_401(self, mock_settings):
         mock_settings.API_KEYS = "dev_testkey123"
@@ -59,7 +61,7 @@ class TestApiKeyAuth:
         resp = client.get("/v1/billing/balance")
         assert resp.status_code == 401
 
-    @patch("web_api.rate_limit._requests", defaultdict(list))
+    @patch("web_api.rate_limit._memory", MemoryGCRA())
     @patch("web_api.auth.settings")
     def test_dev_mode_no_auth_configured(self, mock_settings):
         """When no API keys and no Entra config, allow anonymous access."""
@@ -75,7 +77,7 @@ class TestApiKeyAuth:
             resp = client.get("/v1/billing/balance")
             assert resp.status_code == 200
 
-    @patch("web_api.rate_limit._requests", defaultdict(list))
+    @patch("web_api.rate_limit._memory", MemoryGCRA())
     @patch("web_api.auth.settings")
     def test_api_key_extracts_tenant(self, mock_settings):
         mock_settings.API_KEYS = "acme_key456"
@@ -98,7 +100,7 @@ class TestApiKeyUserProperties:
         from web_api.auth import _resolve_api_key_user
         with patch("web_api.auth.settings") as mock_settings:
             mock_settings.API_KEYS = "dev_testkey123"
-            user = _resolve_api_key_user("dev_testkey123")
+            user = asyncio.run(_resolve_api_key_user("dev_testkey123"))
             assert user["token_balance"] == 999999
             assert user["user_id"] == "apikey"
 
@@ -108,12 +110,12 @@ class TestApiKeyUserProperties:
         with patch("web_api.auth.settings") as mock_settings:
             mock_settings.API_KEYS = "dev_testkey123"
             with pytest.raises(HTTPException) as exc_info:
-                _resolve_api_key_user("wrong")
+                asyncio.run(_resolve_api_key_user("wrong"))
             assert exc_info.value.status_code == 403
 
 
 class TestRateLimit:
-    @patch("web_api.rate_limit._requests", defaultdict(list))
+    @patch("web_api.rate_limit._memory", MemoryGCRA())
     @patch("web_api.auth.settings")
     def test_rate_limit_exceeded(self, mock_settings):
         mock_settings.API_KEYS = "dev_testkey123"
@@ -0,0 +1,113 @@
+"""
+Tests for micro-batched background removal: concurrent requests are stacked
+into one forward pass and each caller gets its own result back.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from shared.background_removal import BatchedBackgroundRemoval, with_batching
+from shared.batching import MicroBatcher
+
+
+class FakeBatchProvider:
+    """Mimics BiRefNetProvider's preprocess / predict_masks / postprocess split."""
+
+    name = "birefnet"
+    runs_locally = True
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def preprocess(self, image_bytes):
+        return image_bytes.decode(), len(image_bytes)
+
+    def predict_masks(self, tensors):
+        self.batch_sizes.append(len(tensors))
+        return [t * 10 for t in tensors]
+
+    def postprocess(self, image, mask, input_size=0):
+        return f"{image}:{mask}".encode()
+
+
+class TestMicroBatcher:
+    def test_concurrent_submissions_share_a_batch(self):
+        sizes = []
+        gate = threading.Barrier(4, timeout=5)
+
+        def batch_fn(items):
+            sizes.append(len(items))
+            return [i * 2 for i in items]
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=200)
+
+        def call(i):
+            gate.wait()
+            return batcher.submit(i)
+
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(call, range(4)))
+
+        assert results == [0, 2, 4, 6]
+        assert sum(sizes) == 4
+        assert max(sizes) > 1
+
+    def test_max_batch_size_respected(self):
+        sizes = []
+        batcher = MicroBatcher(lambda items: sizes.append(len(items)) or items,
+                               max_batch_size=2, max_wait_ms=50)
+        with ThreadPoolExecutor(6) as pool:
+            list(pool.map(batcher.submit, range(6)))
+        assert all(n <= 2 for n in sizes)
+        assert sum(sizes) == 6
+
+    def test_single_request_not_delayed_beyond_wait(self):
+        batcher = MicroBatcher(lambda items: items, max_batch_size=8, max_wait_ms=5)
+        assert batcher.submit("only") == "only"
+        assert batcher.mean_batch_size == 1
+
+    def test_batch_failure_reaches_every_caller(self):
+        def batch_fn(items):
+            raise RuntimeError("CUDA OOM")
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=5)
+        with pytest.raises(RuntimeError, match="CUDA OOM"):
+            batcher.submit(1)
+        # Dispatcher survives and keeps serving
+        batcher.batch_fn = lambda items: items
+        assert batcher.submit(2) == 2
+
+    def test_result_count_mismatch_is_an_error(self):
+        batcher = MicroBatcher(lambda items: [], max_batch_size=4, max_wait_ms=5)
+        with pytest.raises(RuntimeError, match="returned 0 results"):
+            batcher.submit(1)
+
+
+class TestBatchedBackgroundRemoval:
+    def test_each_caller_gets_its_own_cutout(self):
+        provider = FakeBatchProvider()
+        batched = BatchedBackgroundRemoval(provider, max_batch_size=8, max_wait_ms=100)
+        inputs = [b"a", b"bb", b"ccc", b"dddd"]
+
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(batched.remove_background, inputs))
+
+        assert results == [b"a:10", b"bb:20", b"ccc:30", b"dddd:40"]
+        assert sum(provider.batch_sizes) == 4
+
+    def test_delegates_provider_properties(self):
+        batched = BatchedBackgroundRemoval(FakeBatchProvider(), max_batch_size=2)
+        assert batched.name == "birefnet"
+        assert batched.runs_locally is True
+
+    def test_with_batching_wraps_only_batch_capable_providers(self):
+        class ApiProvider:
+            name = "remove.bg"
+
+        api = ApiProvider()
+        assert with_batching(api, max_batch_size=4, max_wait_ms=10) is api
+
+        local = FakeBatchProvider()
+        assert isinstance(with_batching(local, 4, 10), BatchedBackgroundRemoval)
+        assert with_batching(local, max_batch_size=1, max_wait_ms=10) is local
@@ -0,0 +1,173 @@
+"""
+Tests for the background blob deletion queue: enqueue, batched parallel
+deletes, missing blobs, retry with backoff, giving up, and leases.
+"""
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared import db_sqlalchemy
+from shared.blob_deletion import BATCH_LIMIT, BlobDeleter
+from shared.db import Base
+from shared.models import BlobDeletion, ExportRendition, ItemStatus, Job, JobItem, JobStatus
+
+
+class FakeContainer:
+    def __init__(self, service, name):
+        self.service = service
+        self.name = name
+
+    def delete_blobs(self, *paths, raise_on_any_failure=True):
+        assert not raise_on_any_failure
+        assert len(paths) <= BATCH_LIMIT
+        with self.service.lock:
+            self.service.batches.append((self.name, len(paths)))
+        if self.name in self.service.broken:
+            raise ConnectionError("batch rejected")
+        out = []
+        for path in paths:
+            key = (self.name, path)
+            if key in self.service.failing:
+                out.append(SimpleNamespace(status_code=500, reason="Internal Error"))
+            elif key in self.service.blobs:
+                self.service.blobs.discard(key)
+                out.append(SimpleNamespace(status_code=202, reason="Accepted"))
+            else:
+                out.append(SimpleNamespace(status_code=404, reason="BlobNotFound"))
+        return iter(out)
+
+
+class FakeBlobService:
+    def __init__(self):
+        self.blobs = set()
+        self.failing = set()
+        self.broken = set()
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def get_container_client(self, name):
+        return FakeContainer(self, name)
+
+
+@pytest.fixture
+def env():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[BlobDeletion.__table__])
+    Session = sessionmaker(bind=engine)
+    with patch.object(db_sqlalchemy, "SessionLocal", Session):
+        yield {"Session": Session, "service": FakeBlobService()}
+
+
+def _rows(Session):
+    with Session() as s:
+        return s.query(BlobDeletion).order_by(BlobDeletion.id).all()
+
+
+def test_drain_deletes_in_parallel_batches(env):
+    svc = env["service"]
+    paths = [("raw", f"t1/jobs/j1/items/i{n}/raw/a.jpg") for n in range(600)]
+    paths += [("outputs", f"t1/jobs/j1/items/i{n}/outputs/a.png") for n in range(300)]
+    svc.blobs.update(paths)
+    assert db_sqlalchemy.enqueue_blob_deletions(paths, reason="retention") == 900
+
+    deleter = BlobDeleter(client=svc, concurrency=4)
+    assert deleter.drain() == 900
+    assert svc.blobs == set()
+    assert all(n <= BATCH_LIMIT for _, n in svc.batches)
+    assert len(svc.batches) == 5  # raw 256+256+88, outputs 256+44
+    assert _rows(env["Session"]) == []
+    assert deleter.snapshot()["deleted"] == 900
+
+
+def test_missing_blobs_count_as_done(env):
+    db_sqlalchemy.enqueue_blob_deletions([("raw", "gone.jpg")])
+    deleter = BlobDeleter(client=env["service"])
+    deleter.drain()
+    assert _rows(env["Session"]) == []
+    assert deleter.snapshot()["missing"] == 1
+
+
+def test_failures_are_retried_with_backoff(env):
+    svc = env["service"]
+    svc.blobs.update({("raw", "a.jpg"), ("raw", "b.jpg")})
+    svc.failing.add(("raw", "b.jpg"))
+    db_sqlalchemy.enqueue_blob_deletions([("raw", "a.jpg"), ("raw", "b.jpg")], reason="gdpr")
+
+    BlobDeleter(client=svc).drain()
+    rows = _rows(env["Session"])
+    assert [r.blob_path for r in rows] == ["b.jpg"]
+    assert rows[0].attempts == 1
+    assert "500" in rows[0].last_error
+    assert rows[0].available_at > datetime.utcnow() + timedelta(seconds=30)
+
+    # Not due yet: nothing is claimed
+    assert BlobDeleter(client=svc).run_once() == 0
+    stats = db_sqlalchemy.get_blob_deletion_stats()
+    assert stats["pending"] == 1 and stats["retrying"] == 1
+    assert stats["by_reason"] == {"gdpr": 1}
+
+
+def test_whole_batch_failure_is_dead_lettered(env):
+    svc = env["service"]
+    svc.broken.add("exports")
+    db_sqlalchemy.enqueue_blob_deletions([("exports", "j1.zip")], reason="gdpr")
+    deleter = BlobDeleter(client=svc, max_attempts=2)
+
+    deleter.run_once()
+    with env["Session"]() as s:
+        s.query(BlobDeletion).update({"available_at": datetime.utcnow() - timedelta(seconds=1)})
+        s.commit()
+    deleter.run_once()
+    assert deleter.snapshot()["given_up"] == 1
+
+    # Kept, never claimed again, and reported
+    [row] = _rows(env["Session"])
+    assert row.dead_lettered_at is not None
+    with env["Session"]() as s:
+        s.query(BlobDeletion).update({"available_at": datetime.utcnow() - timedelta(seconds=1)})
+        s.commit()
+    assert deleter.run_once() == 0
+    stats = db_sqlalchemy.get_blob_deletion_stats()
+    assert stats["pending"] == 0
+    assert stats["dead_lettered"] == 1
+    assert stats["dead_lettered_by_reason"] == {"gdpr": 1}
+
+    # Requeue gives it a fresh budget
+    svc.broken.clear()
+    assert db_sqlalchemy.requeue_dead_blob_deletions() == 1
+    deleter.drain()
+    assert _rows(env["Session"]) == []
+
+
+def test_claims_are_leased(env):
+    db_sqlalchemy.enqueue_blob_deletions([("raw", f"{n}.jpg") for n in range(5)])
+    first = db_sqlalchemy.claim_blob_deletions(3, lease_seconds=300)
+    second = db_sqlalchemy.claim_blob_deletions(10, lease_seconds=300)
+    assert len(first) == 3 and len(second) == 2
+    assert {r["id"] for r in first}.isdisjoint(r["id"] for r in second)
+    assert db_sqlalchemy.claim_blob_deletions(10) == []
+
+
+def test_cascade_and_queue_share_one_transaction():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    # No blob_deletions table: queueing fails, so the job must survive
+    Base.metadata.create_all(engine, tables=[Job.__table__, JobItem.__table__, ExportRendition.__table__])
+    Session = sessionmaker(bind=engine)
+    with Session() as s:
+        s.add(Job(id="j1", tenant_id="t1", brand_profile_id="default", correlation_id="c",
+                  status=JobStatus.completed))
+        s.add(JobItem(id="i1", job_id="j1", tenant_id="t1", filename="a.jpg",
+                      status=ItemStatus.completed, raw_blob_path="t1/raw/a.jpg"))
+        s.commit()
+
+    with patch.object(db_sqlalchemy, "SessionLocal", Session), pytest.raises(Exception, match="blob_deletions"):
+        db_sqlalchemy.delete_job_cascade("j1")
+    with Session() as s:
+        assert s.get(Job, "j1") is not None
+        assert s.get(JobItem, "i1") is not None
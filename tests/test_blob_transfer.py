@@ -0,0 +1,148 @@
+"""
+Tests for chunked blob transfer: ranged parallel downloads and block
+uploads over SAS URLs (against an in-memory fake of the Blob service), and
+parallel block staging in BlockBlobWriter.
+"""
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+
+from shared import blob_transfer
+from shared.storage import BlockBlobWriter
+
+SAS = "https://acct.blob.core.windows.net/outputs/t1/a.png?sv=2021&sig=x"
+
+
+class FakeBlobService:
+    """Enough of Get Blob / Put Blob / Put Block / Put Block List."""
+
+    def __init__(self, content: bytes = b""):
+        self.content = content
+        self.blocks = {}
+        self.requests = []
+        self.content_type = None
+        self.lock = threading.Lock()
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        params = parse_qs(urlparse(str(request.url)).query)
+        comp = params.get("comp", [None])[0]
+        with self.lock:
+            self.requests.append((request.method, comp, request.headers.get("x-ms-range")))
+        if request.method == "GET":
+            rng = request.headers.get("x-ms-range")
+            if not rng or not self.content:
+                return httpx.Response(200, content=self.content)
+            start, end = map(int, re.match(r"bytes=(\d+)-(\d+)", rng).groups())
+            end = min(end, len(self.content) - 1)
+            return httpx.Response(206, content=self.content[start:end + 1], headers={
+                "content-range": f"bytes {start}-{end}/{len(self.content)}",
+            })
+        if comp == "block":
+            with self.lock:
+                self.blocks[params["blockid"][0]] = request.content
+            return httpx.Response(201)
+        if comp == "blocklist":
+            ids = re.findall(r"<Latest>(.*?)</Latest>", request.content.decode())
+            self.content = b"".join(self.blocks[i] for i in ids)
+            self.content_type = request.headers.get("x-ms-blob-content-type")
+            return httpx.Response(201)
+        assert request.headers["x-ms-blob-type"] == "BlockBlob"
+        self.content = request.content
+        self.content_type = request.headers.get("x-ms-blob-content-type")
+        return httpx.Response(201)
+
+    def client(self) -> httpx.Client:
+        return httpx.Client(transport=httpx.MockTransport(self.handler))
+
+
+DATA = bytes(range(256)) * 41  # 10496 bytes
+
+
+class TestDownload:
+    def test_large_blob_in_parallel_ranges(self):
+        svc = FakeBlobService(DATA)
+        assert blob_transfer.download(svc.client(), SAS, chunk_size=1024, concurrency=4) == DATA
+        ranges = sorted(r[2] for r in svc.requests)
+        assert len(ranges) == 11
+        assert "bytes=10240-10495" in ranges  # last range ends at the blob size
+
+    def test_small_blob_single_request(self):
+        svc = FakeBlobService(b"tiny")
+        assert blob_transfer.download(svc.client(), SAS, chunk_size=1024) == b"tiny"
+        assert len(svc.requests) == 1
+
+    def test_empty_blob(self):
+        assert blob_transfer.download(FakeBlobService(b"").client(), SAS, chunk_size=1024) == b""
+
+    def test_failed_range_raises(self):
+        svc = FakeBlobService(DATA)
+
+        def flaky(request):
+            if request.headers.get("x-ms-range", "").startswith("bytes=2048-"):
+                return httpx.Response(500)
+            return svc.handler(request)
+
+        client = httpx.Client(transport=httpx.MockTransport(flaky))
+        with pytest.raises(httpx.HTTPStatusError):
+            blob_transfer.download(client, SAS, chunk_size=1024)
+
+
+class TestUpload:
+    def test_large_blob_in_blocks(self):
+        svc = FakeBlobService()
+        blob_transfer.upload(svc.client(), SAS, DATA, content_type="image/tiff", chunk_size=1024, concurrency=4)
+        assert svc.content == DATA
+        assert svc.content_type == "image/tiff"
+        assert sum(1 for r in svc.requests if r[1] == "block") == 11
+        assert svc.requests[-1][1] == "blocklist"
+
+    def test_small_blob_single_put(self):
+        svc = FakeBlobService()
+        blob_transfer.upload(svc.client(), SAS, b"tiny", content_type="image/png", chunk_size=1024)
+        assert svc.content == b"tiny"
+        assert svc.requests == [("PUT", None, None)]
+
+
+class SlowBlockBlob:
+    def __init__(self, fail_block=None):
+        self.staged = {}
+        self.committed = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fail_block = fail_block
+        self.lock = threading.Lock()
+
+    def stage_block(self, block_id, data):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        if data == self.fail_block:
+            raise IOError("stage failed")
+        self.staged[block_id] = bytes(data)
+
+    def commit_block_list(self, blocks, content_settings=None):
+        self.committed = b"".join(self.staged[b.id] for b in blocks)
+
+
+class TestParallelBlockBlobWriter:
+    def test_blocks_staged_concurrently_in_order(self):
+        blob = SlowBlockBlob()
+        with BlockBlobWriter(blob, block_size=4, concurrency=3) as out:
+            for i in range(10):
+                out.write(f"{i:02d}".encode() * 3)
+        assert blob.committed == b"".join(f"{i:02d}".encode() * 3 for i in range(10))
+        assert 1 < blob.max_in_flight <= 3
+
+    def test_failed_block_fails_close_without_commit(self):
+        blob = SlowBlockBlob(fail_block=b"bbbb")
+        with pytest.raises(IOError):
+            with BlockBlobWriter(blob, block_size=4, concurrency=2) as out:
+                out.write(b"aaaabbbbcc")
+        assert blob.committed is None
@@ -45,17 +45,19 @@ def test_cleanup_execute(mock_get_jobs, mock_delete):
         "items_deleted": 3,
         "job_deleted": True,
         "blob_paths": [("raw", "t1/jobs/job-1/item-1/raw/photo.jpg")],
+        "blobs_queued": 1,
     }
 
     client = _make_client()
-    with patch("shared.storage.delete_blob", return_value=True):
-        resp = client.post("/v1/admin/cleanup", json={"retention_days": 30, "dry_run": False})
+    resp = client.post("/v1/admin/cleanup", json={"retention_days": 30, "dry_run": False})
 
     assert resp.status_code == 200
     data = resp.json()
     assert data["dry_run"] is False
     assert data["jobs_deleted"] == 1
-    assert data["blobs_deleted"] == 1
+    assert data["blobs_queued"] == 1
+    assert data["blobs_deleted"] == 1  # pre-queue key kept for existing clients
+    mock_delete.assert_called_once_with("job-1", reason="retention")
 
 
 def test_cleanup_validation():
@@ -0,0 +1,178 @@
+"""
+Tests for the async database path: URL mapping in shared.db_async and the
+helpers in shared.db_sqlalchemy_async, run against aiosqlite.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("greenlet")
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from shared import db_sqlalchemy_async as adb
+from shared.db import Base
+from shared.db_async import async_database_url
+from shared.models import ABTest, ABTestMetric, ABTestVariantLog, Integration, User
+
+
+class TestAsyncDatabaseUrl:
+    def test_postgres_uses_psycopg_async(self):
+        url = async_database_url("postgresql://opal:s3cret@db:5432/opal?sslmode=require")
+        assert url == "postgresql+psycopg_async://opal:s3cret@db:5432/opal?sslmode=require"
+
+    def test_explicit_sync_driver_is_replaced(self):
+        assert async_database_url("postgresql+psycopg://u@h/d").startswith("postgresql+psycopg_async://")
+
+    def test_sqlite_uses_aiosqlite(self):
+        assert async_database_url("sqlite:///tmp/x.db") == "sqlite+aiosqlite:///tmp/x.db"
+
+    def test_unknown_backend_rejected(self):
+        with pytest.raises(ValueError):
+            async_database_url("mysql://u@h/d")
+
+
+TABLES = [User.__table__, Integration.__table__, ABTest.__table__,
+          ABTestMetric.__table__, ABTestVariantLog.__table__]
+
+
+@pytest.fixture
+def db():
+    """Run each test's coroutine on an in-memory aiosqlite database."""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda c: Base.metadata.create_all(c, tables=TABLES))
+            await conn.execute(text("""
+                CREATE TABLE user_api_keys (
+                    id TEXT PRIMARY KEY, user_id TEXT, key_hash TEXT,
+                    is_active BOOLEAN, last_used_at TIMESTAMP
+                )
+            """))
+        async with Session() as s:
+            s.add(User(id="u1", email="a@shop.com", tenant_id="t1", token_balance=7,
+                       entra_subject_id="sub-1"))
+            s.add(Integration(id="int1", user_id="u1", tenant_id="t1", provider="shopify",
+                              store_url="shop.example", access_token_encrypted="x", pixel_key="pk_1"))
+            await s.commit()
+
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+
+    asyncio.run(setup())
+    with patch.object(adb, "AsyncSessionLocal", Session):
+        yield run
+
+
+def _test_row(**kw):
+    return {"id": "ab1", "user_id": "u1", "integration_id": "int1", "product_id": "p1",
+            "active_variant": "a", "status": "created", **kw}
+
+
+class TestUserLookups:
+    def test_user_by_subject_and_email(self, db):
+        async def go():
+            return (await adb.get_user_by_entra_subject("sub-1"), await adb.get_user_by_email("a@shop.com"),
+                    await adb.get_user_by_email("nobody@shop.com"))
+        by_sub, by_email, missing = db(go())
+        assert by_sub["id"] == by_email["id"] == "u1"
+        assert missing is None
+
+    def test_api_key_user_is_read_only(self, db):
+        async def go():
+            async with adb.AsyncSessionLocal() as s:
+                await s.execute(text("INSERT INTO user_api_keys VALUES ('k1', 'u1', 'h1', TRUE, NULL)"))
+                await s.execute(text("INSERT INTO user_api_keys VALUES ('k2', 'u1', 'h2', FALSE, NULL)"))
+                await s.commit()
+            row = await adb.get_api_key_user("h1")
+            revoked = await adb.get_api_key_user("h2")
+            async with adb.AsyncSessionLocal() as s:
+                used = (await s.execute(text("SELECT last_used_at FROM user_api_keys WHERE id = 'k1'"))).scalar()
+            return row, revoked, used
+
+        row, revoked, used = db(go())
+        assert row["user_id"] == "u1"
+        assert row["tenant_id"] == "t1"
+        assert row["token_balance"] == 7
+        assert revoked is None
+        assert used is None  # written behind by shared.principal_cache
+
+
+class TestPixelHelpers:
+    def test_integration_and_running_test(self, db):
+        async def go():
+            integ = await adb.get_integration_by_pixel_key("pk_1")
+            await adb.create_ab_test(_test_row(status="running", auto_conclude=True))
+            return integ, await adb.find_running_test("int1", "p1"), await adb.find_running_test("int1", "p2")
+        integ, running, none = db(go())
+        assert integ["id"] == "int1"
+        assert running["id"] == "ab1"
+        assert none is None
+
+    def test_active_variant_at_follows_log(self, db):
+        t0 = datetime(2026, 3, 1)
+
+        async def go():
+            await adb.create_ab_test(_test_row())
+            await adb.create_variant_log_entry("ab1", "a", activated_at=t0)
+            await adb.create_variant_log_entry("ab1", "b", activated_at=t0 + timedelta(days=2))
+            return [await adb.get_active_variant_at("ab1", t0 + timedelta(days=d)) for d in (-1, 1, 3)]
+        assert db(go()) == [None, "a", "b"]
+
+
+class TestABTestHelpers:
+    def test_create_get_update_list(self, db):
+        async def go():
+            created = await adb.create_ab_test(_test_row())
+            updated = await adb.update_ab_test("ab1", {"status": "running", "active_variant": "b"})
+            fetched = await adb.get_ab_test("ab1", "u1")
+            other_user = await adb.get_ab_test("ab1", "u2")
+            listed = await adb.list_ab_tests("u1", status="running")
+            return created, updated, fetched, other_user, listed
+        created, updated, fetched, other_user, listed = db(go())
+        assert created["status"] == "created"
+        assert created["created_at"] is not None
+        assert updated["active_variant"] == "b"
+        assert fetched["status"] == "running"
+        assert other_user is None
+        assert [t["id"] for t in listed] == ["ab1"]
+
+    def test_increment_metric_adds_to_existing_row(self, db):
+        async def go():
+            await adb.create_ab_test(_test_row())
+            await adb.increment_ab_test_metric("ab1", "a", "2026-03-01", views=3)
+            await adb.increment_ab_test_metric("ab1", "a", "2026-03-01", views=2, conversions=1, revenue_cents=990)
+            await adb.increment_ab_test_metric("ab1", "b", "2026-03-01", add_to_carts=1)
+            return await adb.get_ab_test_aggregated_metrics("ab1")
+        totals = db(go())
+        assert totals["a"] == {"views": 5, "clicks": 0, "add_to_carts": 0, "conversions": 1, "revenue_cents": 990}
+        assert totals["b"]["add_to_carts"] == 1
+
+    def test_metrics_upsert_and_aggregate(self, db):
+        day1, day2 = datetime(2026, 3, 1), datetime(2026, 3, 2)
+
+        async def go():
+            await adb.create_ab_test(_test_row())
+            await adb.upsert_ab_test_metric({"id": "m1", "ab_test_id": "ab1", "variant": "a", "date": day1, "views": 5})
+            await adb.upsert_ab_test_metric({"id": "m2", "ab_test_id": "ab1", "variant": "a", "date": day1, "views": 8})
+            await adb.upsert_ab_test_metric({"id": "m3", "ab_test_id": "ab1", "variant": "a", "date": day2,
+                                             "views": 2, "conversions": 1})
+            await adb.upsert_ab_test_metric({"id": "m4", "ab_test_id": "ab1", "variant": "b", "date": day1, "views": 4})
+            return await adb.get_ab_test_metrics("ab1"), await adb.get_ab_test_aggregated_metrics("ab1")
+        daily, totals = db(go())
+        assert len(daily) == 3
+        assert totals["a"]["views"] == 10
+        assert totals["a"]["conversions"] == 1
+        assert totals["b"] == {"views": 4, "clicks": 0, "add_to_carts": 0, "conversions": 0, "revenue_cents": 0}
@@ -0,0 +1,164 @@
+"""
+Tests for streaming ZIP exports: staged block-blob writer, bounded parallel
+downloads, per-entry compression and no session held during I/O.
+"""
+import io
+import threading
+import zipfile
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared.db import Base
+from shared.export_presets import get_preset
+from shared.models import ItemStatus, Job, JobItem, JobStatus
+from shared.renditions import RenditionPool
+from shared.storage import BlockBlobWriter
+from export_worker import worker as export_worker
+from export_worker.worker import ExportItem, _fetch_outputs
+
+
+class FakeBlockBlob:
+    """Records stage_block/commit_block_list like azure BlobClient."""
+
+    def __init__(self):
+        self.staged = {}
+        self.committed = None
+        self.content_type = None
+
+    def stage_block(self, block_id, data):
+        self.staged[block_id] = bytes(data)
+
+    def commit_block_list(self, blocks, content_settings=None):
+        self.committed = b"".join(self.staged[b.id] for b in blocks)
+        self.content_type = content_settings.content_type
+
+
+class TestBlockBlobWriter:
+    def test_stages_full_blocks_and_commits_tail(self):
+        blob = FakeBlockBlob()
+        with BlockBlobWriter(blob, block_size=4, content_type="application/zip") as out:
+            out.write(b"abcdefghij")
+            assert len(blob.staged) == 2 and len(out._buffer) == 2
+            assert blob.committed is None
+        assert blob.committed == b"abcdefghij"
+        assert blob.content_type == "application/zip"
+
+    def test_exception_abandons_upload(self):
+        blob = FakeBlockBlob()
+        with pytest.raises(RuntimeError):
+            with BlockBlobWriter(blob, block_size=4) as out:
+                out.write(b"abcdefgh")
+                raise RuntimeError("download failed")
+        assert blob.committed is None
+
+    def test_zipfile_streams_into_writer(self):
+        blob = FakeBlockBlob()
+        with BlockBlobWriter(blob, block_size=64) as out:
+            with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+                export_worker._write_entry(zf, "a.png", b"\x89PNG" * 100)
+                export_worker._write_entry(zf, "notes.txt", b"hello " * 100)
+        with zipfile.ZipFile(io.BytesIO(blob.committed)) as zf:
+            assert zf.read("a.png") == b"\x89PNG" * 100
+            assert zf.getinfo("a.png").compress_type == zipfile.ZIP_STORED
+            assert zf.getinfo("notes.txt").compress_type == zipfile.ZIP_DEFLATED
+
+
+class TestFetchOutputs:
+    def test_order_and_bounded_window(self):
+        items = [ExportItem(f"i{n}", f"{n}.png", f"out/{n}.png") for n in range(10)]
+        lock = threading.Lock()
+        state = {"in_flight": 0, "peak": 0}
+
+        def download(container, path):
+            with lock:
+                state["in_flight"] += 1
+                state["peak"] = max(state["peak"], state["in_flight"])
+            with lock:
+                state["in_flight"] -= 1
+            if path == "out/3.png":
+                raise IOError("gone")
+            return path.encode()
+
+        with patch.object(export_worker, "download_blob", side_effect=download):
+            results = list(_fetch_outputs(items, concurrency=3))
+
+        assert [item.id for item, _ in results] == [f"i{n}" for n in range(10)]
+        assert results[0][1] == b"out/0.png" and results[3][1] is None
+        assert state["peak"] <= 3
+
+
+@pytest.fixture
+def Session():
+    engine = create_engine("sqlite://", poolclass=StaticPool,
+                           connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[Job.__table__, JobItem.__table__])
+    Session = sessionmaker(bind=engine)
+    with Session() as s:
+        s.add(Job(id="job1", tenant_id="t1", brand_profile_id="default", correlation_id="c",
+                  status=JobStatus.completed))
+        s.add_all(JobItem(id=f"i{n}", job_id="job1", tenant_id="t1", filename="shoe.jpg",
+                          status=ItemStatus.completed, output_blob_path=f"t1/out/{n}.png",
+                          scene_index=n, scene_type="marble" if n == 0 else None)
+                  for n in range(3))
+        s.commit()
+    return Session
+
+
+def _run_with_fake_storage(Session, fn, *args):
+    blob = FakeBlockBlob()
+    sessions_open = []
+    real_session = Session
+
+    def session_factory():
+        session = real_session()
+        sessions_open.append(session)
+        return session
+
+    def download(container, path):
+        # No DB session may be open while blobs are transferred
+        assert all(not s.in_transaction() for s in sessions_open)
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.new("RGB", (40, 30), "red").save(buf, "PNG")
+        return buf.getvalue()
+
+    with patch.object(export_worker, "SessionLocal", session_factory), \
+            patch.object(export_worker, "_renditions", RenditionPool(1)), \
+            patch.object(export_worker.settings, "EXPORT_RENDITION_CACHE", False), \
+            patch.object(export_worker, "download_blob", side_effect=download), \
+            patch.object(export_worker, "open_blob_writer",
+                         lambda container, path, **kw: BlockBlobWriter(blob, block_size=256)):
+        result = fn(*args)
+    return result, zipfile.ZipFile(io.BytesIO(blob.committed)) if blob.committed else None
+
+
+class TestProcessExport:
+    def test_streams_all_entries(self, Session):
+        _, zf = _run_with_fake_storage(Session, export_worker.process_export, "job1", "t1")
+        assert sorted(zf.namelist()) == ["shoe_marble.png", "shoe_scene1.png", "shoe_scene2.png"]
+        with Session() as s:
+            assert s.get(Job, "job1").export_blob_path == "t1/jobs/job1/export.zip"
+
+    def test_format_export(self, Session):
+        keys = ["amazon_main", "instagram_feed"]
+        assert all(get_preset(k) for k in keys)
+        path, zf = _run_with_fake_storage(Session, export_worker.process_format_export,
+                                          "job1", "t1", keys)
+        assert path == "t1/jobs/job1/export_amazon_main_instagram_feed.zip"
+        assert len(zf.namelist()) == 6
+        assert {n.split("/")[0] for n in zf.namelist()} == set(keys)
+
+    def test_format_export_nothing_downloaded(self, Session):
+        blob = FakeBlockBlob()
+        with patch.object(export_worker, "SessionLocal", Session), \
+                patch.object(export_worker, "_renditions", RenditionPool(1)), \
+                patch.object(export_worker.settings, "EXPORT_RENDITION_CACHE", False), \
+                patch.object(export_worker, "download_blob", side_effect=IOError("gone")), \
+                patch.object(export_worker, "open_blob_writer",
+                             lambda container, path, **kw: BlockBlobWriter(blob)):
+            assert export_worker.process_format_export("job1", "t1", ["amazon_main"]) is None
+        assert blob.committed is None
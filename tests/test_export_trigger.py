@@ -0,0 +1,163 @@
+"""
+Tests for coalesced export triggering: one export message per job, sent by
+the transaction that turns the job terminal.
+"""
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared.db import Base
+from shared.models import ItemStatus, Job, JobItem, JobStatus
+from shared.storage import BlockBlobWriter
+from shared.pipeline import complete_item, finalize_job_status, mark_item_failed, request_missing_exports
+
+
+def _session_factory(url="sqlite://"):
+    kwargs = {"poolclass": StaticPool} if url == "sqlite://" else {}
+    engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30}, **kwargs)
+    Base.metadata.create_all(engine, tables=[Job.__table__, JobItem.__table__])
+    Session = sessionmaker(bind=engine)
+    with Session() as s:
+        s.add(Job(id="job1", tenant_id="t1", brand_profile_id="default", correlation_id="c1",
+                  status=JobStatus.processing))
+        s.add_all(JobItem(id=f"i{n}", job_id="job1", tenant_id="t1", filename="x.png",
+                          status=ItemStatus.processing) for n in range(3))
+        s.commit()
+    return Session
+
+
+@pytest.fixture
+def Session():
+    Session = _session_factory()
+    with patch("shared.db.SessionLocal", Session), patch("shared.pipeline._fire_webhook"):
+        yield Session
+
+
+def _export_requested(Session):
+    with Session() as s:
+        return s.get(Job, "job1").export_requested_at is not None
+
+
+class TestSingleTrigger:
+    def test_only_last_item_requests_export(self, Session):
+        with patch("shared.pipeline._send_export_message") as send:
+            complete_item("job1", "i0", {"output_blob_path": "a.png"})
+            complete_item("job1", "i1", {"output_blob_path": "b.png"})
+            send.assert_not_called()
+            mark_item_failed("job1", "i2", "boom")
+        send.assert_called_once_with(
+            {"tenant_id": "t1", "job_id": "job1", "correlation_id": "c1"},
+            message_id="export-job1",
+        )
+        assert _export_requested(Session)
+
+    def test_refinalize_does_not_resend(self, Session):
+        with patch("shared.pipeline._send_export_message") as send:
+            for n in range(3):
+                complete_item("job1", f"i{n}", {"output_blob_path": f"{n}.png"})
+            finalize_job_status("job1")
+            finalize_job_status("job1")
+        assert send.call_count == 1
+
+    def test_all_failed_has_nothing_to_export(self, Session):
+        with patch("shared.pipeline._send_export_message") as send:
+            for n in range(3):
+                mark_item_failed("job1", f"i{n}", "boom")
+        send.assert_not_called()
+        assert not _export_requested(Session)
+
+    def test_send_is_retried_with_backoff(self, Session):
+        with patch("shared.pipeline._send_export_message",
+                   side_effect=[RuntimeError("bus down"), None]) as send, \
+                patch("shared.pipeline.time.sleep") as sleep:
+            for n in range(3):
+                complete_item("job1", f"i{n}", {"output_blob_path": f"{n}.png"})
+        assert send.call_count == 2
+        sleep.assert_called_once_with(1.0)
+        assert _export_requested(Session)
+
+    def test_sweeper_requests_export_after_failed_sends(self, Session):
+        with patch("shared.pipeline._send_export_message", side_effect=RuntimeError("bus down")) as send, \
+                patch("shared.pipeline.time.sleep"):
+            for n in range(3):
+                complete_item("job1", f"i{n}", {"output_blob_path": f"{n}.png"})
+        assert send.call_count == 3
+        assert not _export_requested(Session)
+
+        # No later finalize comes; the periodic sweep picks the job up once
+        with patch("shared.pipeline._send_export_message") as send:
+            assert request_missing_exports() == 1
+            assert request_missing_exports() == 0
+        send.assert_called_once_with(
+            {"tenant_id": "t1", "job_id": "job1", "correlation_id": "c1"},
+            message_id="export-job1",
+        )
+        assert _export_requested(Session)
+
+    def test_sweeper_skips_unfinished_jobs(self, Session):
+        with patch("shared.pipeline._send_export_message") as send:
+            complete_item("job1", "i0", {"output_blob_path": "a.png"})
+            assert request_missing_exports() == 0
+        send.assert_not_called()
+
+
+class TestExportRouting:
+    def test_send_goes_through_queue_backend_routing(self):
+        from shared import pipeline
+        with patch("shared.queue_database.send_message") as db_send, \
+                patch("shared.queue_database.settings") as settings:
+            settings.QUEUE_BACKEND = "database"
+            pipeline._send_export_message({"job_id": "job1"}, message_id="export-job1")
+        db_send.assert_called_once_with("exports", {"job_id": "job1"})
+
+
+class TestConcurrentCompletions:
+    def test_one_export_for_parallel_last_items(self, tmp_path):
+        Session = _session_factory(f"sqlite:///{tmp_path / 'jobs.db'}")
+        barrier = threading.Barrier(3)
+
+        def finish(n):
+            barrier.wait()
+            complete_item("job1", f"i{n}", {"output_blob_path": f"{n}.png"})
+
+        with patch("shared.db.SessionLocal", Session), \
+                patch("shared.pipeline._fire_webhook"), \
+                patch("shared.pipeline._send_export_message") as send:
+            threads = [threading.Thread(target=finish, args=(n,)) for n in range(3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        assert send.call_count == 1
+
+
+class TestProcessExport:
+    def test_skips_until_terminal_without_scanning_items(self, Session):
+        from export_worker import worker as export_worker
+
+        with patch.object(export_worker, "SessionLocal", Session), \
+                patch.object(export_worker, "open_blob_writer") as writer, \
+                patch.object(Job, "items", property(lambda self: pytest.fail("items loaded"))):
+            export_worker.process_export("job1", "t1")
+        writer.assert_not_called()
+
+    def test_zips_completed_items(self, Session):
+        from export_worker import worker as export_worker
+
+        with patch("shared.pipeline._send_export_message"):
+            complete_item("job1", "i0", {"output_blob_path": "a.png"})
+            complete_item("job1", "i1", {"output_blob_path": "b.png"})
+            mark_item_failed("job1", "i2", "boom")
+
+        with patch.object(export_worker, "SessionLocal", Session), \
+                patch.object(export_worker, "download_blob", return_value=b"png"), \
+                patch.object(export_worker, "open_blob_writer",
+                             side_effect=lambda *a, **kw: BlockBlobWriter(MagicMock())) as writer:
+            export_worker.process_export("job1", "t1")
+        assert writer.call_args[0][:2] == ("exports", "t1/jobs/job1/export.zip")
+        with Session() as s:
+            assert s.get(Job, "job1").export_blob_path == "t1/jobs/job1/export.zip"
@@ -72,7 +72,8 @@ def _run_finalize(db_engine, job_id="job_1"):
             s.close()
 
     with patch("shared.db.SessionLocal", fake_session_local), \
-         patch("shared.pipeline._fire_webhook") as mock_wh:
+         patch("shared.pipeline._fire_webhook") as mock_wh, \
+         patch("shared.pipeline._send_export_message"):
         from shared.pipeline import finalize_job_status
         finalize_job_status(job_id)
         return mock_wh
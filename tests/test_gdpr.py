@@ -81,14 +81,13 @@ class TestDataExport:
 # ── Account Deletion (GDPR Art. 17) ────────────────────────────────
 
 class TestAccountDeletion:
-    @patch("web_api.routes_gdpr.delete_blob")
     @patch("web_api.routes_gdpr.delete_user_data")
-    def test_delete_account_success(self, mock_delete, mock_blob):
+    def test_delete_account_success(self, mock_delete):
         mock_delete.return_value = {
             "deleted": True,
             "blob_paths": [("raw", "tenant/jobs/j1/items/i1/raw/file.jpg")],
+            "blobs_queued": 1,
         }
-        mock_blob.return_value = True
         resp = client.post(
             "/v1/privacy/delete-account",
             headers=AUTH,
@@ -113,10 +112,9 @@ class TestAccountDeletion:
         resp = client.post("/v1/privacy/delete-account", json={"confirm": True})
         assert resp.status_code in (401, 403)
 
-    @patch("web_api.routes_gdpr.delete_blob")
     @patch("web_api.routes_gdpr.delete_user_data")
     @patch("web_api.auth._resolve_jwt_user")
-    def test_delete_account_as_jwt_user(self, mock_jwt, mock_delete, mock_blob):
+    def test_delete_account_as_jwt_user(self, mock_jwt, mock_delete):
         """A real JWT user (not apikey) should be able to delete their account."""
         mock_jwt.return_value = {
             "user_id": "user_real123",
@@ -128,8 +126,8 @@ class TestAccountDeletion:
         mock_delete.return_value = {
             "deleted": True,
             "blob_paths": [("raw", "t/j/i/raw/f.jpg"), ("outputs", "t/j/i/outputs/f.jpg")],
+            "blobs_queued": 2,
         }
-        mock_blob.return_value = True
         resp = client.post(
             "/v1/privacy/delete-account",
             headers={"Authorization": "Bearer fake_jwt_token"},
@@ -138,7 +136,9 @@ class TestAccountDeletion:
         assert resp.status_code == 200
         data = resp.json()
         assert data["deleted"] is True
-        assert data["blobs_deleted"] == 2
+        assert data["blobs_queued"] == 2
+        assert data["blobs_deleted"] == 2  # pre-queue key kept for existing clients
+        assert "blob_paths" not in data
 
     @patch("web_api.routes_gdpr.delete_user_data")
     @patch("web_api.auth._resolve_jwt_user")
@@ -0,0 +1,126 @@
+"""
+Tests for in-memory image handles: lazy decode/encode and that the pipeline
+no longer round-trips PNGs between local steps.
+"""
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+import pytest
+from PIL import Image
+
+from pipeline_worker.image_handle import ImageHandle
+from pipeline_worker.pipeline import execute_pipeline
+
+
+def _png(color=(255, 0, 0, 255), size=(8, 6), mode="RGBA"):
+    buf = BytesIO()
+    Image.new(mode, size, color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class TestImageHandle:
+    def test_source_bytes_returned_untouched(self):
+        data = _png()
+        handle = ImageHandle.from_bytes(data)
+        assert handle.to_bytes() is data
+        assert handle.size == (8, 6)
+
+    def test_decodes_once(self):
+        handle = ImageHandle.from_bytes(_png())
+        assert handle.image is handle.image
+
+    def test_image_encoded_on_demand_and_cached(self):
+        handle = ImageHandle.from_image(Image.new("RGB", (4, 4), (0, 255, 0)))
+        assert not handle.is_encoded
+        first = handle.to_bytes()
+        assert handle.is_encoded
+        assert handle.to_bytes() is first
+        assert Image.open(BytesIO(first)).format == "PNG"
+
+    def test_explicit_format_reencodes(self):
+        handle = ImageHandle.from_bytes(_png(mode="RGB", color=(1, 2, 3)))
+        assert Image.open(BytesIO(handle.to_bytes(format="JPEG"))).format == "JPEG"
+
+    def test_fingerprint_is_content_based(self):
+        a = ImageHandle.from_image(Image.new("RGB", (4, 4), (0, 0, 0)))
+        b = ImageHandle.from_image(Image.new("RGB", (4, 4), (0, 0, 0)))
+        c = ImageHandle.from_image(Image.new("RGB", (4, 4), (9, 0, 0)))
+        assert a.fingerprint() == b.fingerprint() != c.fingerprint()
+
+    def test_wrap(self):
+        img = Image.new("RGB", (2, 2))
+        assert ImageHandle.wrap(img).image is img
+        assert ImageHandle.wrap(b"x").to_bytes() == b"x"
+        handle = ImageHandle.from_bytes(b"x")
+        assert ImageHandle.wrap(handle) is handle
+
+    def test_requires_content(self):
+        with pytest.raises(ValueError):
+            ImageHandle()
+
+
+class ImageBgProvider:
+    """Local provider that works on decoded images, like BiRefNet."""
+
+    name = "local-bg"
+    runs_locally = True
+    accepts_images = True
+
+    def remove_background_image(self, image):
+        out = image.convert("RGBA")
+        out.putalpha(200)
+        return out
+
+    def remove_background(self, image_bytes):
+        raise AssertionError("bytes path should not be used")
+
+
+class ImageUpscaler:
+    name = "local-upscale"
+    runs_locally = True
+    accepts_images = True
+
+    def upscale_image(self, image, scale=2):
+        return image.resize((image.width * scale, image.height * scale))
+
+    def upscale(self, image_bytes, scale=2):
+        raise AssertionError("bytes path should not be used")
+
+
+class TestPipelineEncodes:
+    def test_local_steps_encode_only_final_output(self):
+        scene = MagicMock()
+        scene.name = "mock-scene"
+        scene.supports_edit = False
+        scene.generate.return_value = _png((0, 0, 255, 255), size=(16, 12))
+        raw = _png()
+
+        saves = []
+        real_save = Image.Image.save
+
+        def counting_save(self, fp, *args, **kwargs):
+            saves.append(kwargs.get("format"))
+            return real_save(self, fp, *args, **kwargs)
+
+        with patch.object(Image.Image, "save", counting_save):
+            result = execute_pipeline(
+                raw_bytes=raw, remove_background=True, generate_scene=True, upscale=True,
+                scene_prompt="marble", bg_provider=ImageBgProvider(),
+                img_gen_provider=scene, upscale_provider=ImageUpscaler(),
+            )
+            assert saves == []
+            output = result.output_bytes
+
+        assert len(saves) == 1
+        assert Image.open(BytesIO(output)).size == (32, 24)
+
+    def test_bytes_providers_still_supported(self):
+        bg = MagicMock()
+        bg.name = "remote-bg"
+        bg.remove_background.return_value = _png((1, 1, 1, 128))
+
+        result = execute_pipeline(
+            raw_bytes=_png(), remove_background=True, generate_scene=False,
+            upscale=False, scene_prompt=None, bg_provider=bg,
+        )
+        assert result.output_bytes == bg.remove_background.return_value
@@ -0,0 +1,198 @@
+"""
+Tests for the pipeline worker's consolidated item/job database access:
+item claiming, the per-job context (brand profile, style context,
+watermark eligibility), its cache, and single-transaction completion.
+"""
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared import db_sqlalchemy
+from shared.db import Base
+from shared.models import (
+    BrandProfile, BrandReferenceImage, ItemStatus, Job, JobItem, JobStatus, User, UserSubscription,
+)
+from shared.pipeline import complete_item, mark_item_failed
+from pipeline_worker.job_context import JobContext, JobContextCache
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[
+        Job.__table__, JobItem.__table__, User.__table__, UserSubscription.__table__,
+        BrandReferenceImage.__table__,
+    ])
+    # brand_profiles uses Postgres ARRAY columns; plain TEXT is enough here
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE brand_profiles (id TEXT PRIMARY KEY, tenant_id TEXT, name TEXT, "
+            "default_scene_prompt TEXT, style_keywords TEXT, color_palette TEXT, mood TEXT, "
+            "product_category TEXT, default_scene_count INTEGER, default_scene_types TEXT, "
+            "created_at DATETIME, updated_at DATETIME)"
+        ))
+    Session = sessionmaker(bind=engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    with Session() as s:
+        s.add(Job(id="job1", tenant_id="t1", brand_profile_id="bp1", correlation_id="c",
+                  status=JobStatus.processing, callback_url="https://example.com/hook"))
+        s.add(BrandProfile(id="bp1", tenant_id="t1", name="Acme", mood="calm",
+                           product_category="Shoes & Footwear"))
+        s.add(BrandReferenceImage(id="ref1", brand_profile_id="bp1", tenant_id="t1", blob_path="r.png",
+                                  extracted_style={"lighting": "soft daylight"}))
+        for item_id in ("i1", "i2"):
+            s.add(JobItem(id=item_id, job_id="job1", tenant_id="t1", filename="shoe.jpg",
+                          status=ItemStatus.uploaded, raw_blob_path=f"t1/raw/{item_id}.png",
+                          scene_index=0))
+        s.commit()
+
+    with patch.object(db_sqlalchemy, "SessionLocal", Session), \
+            patch("shared.db.SessionLocal", Session), \
+            patch("shared.pipeline._fire_webhook") as webhook, \
+            patch("shared.pipeline._send_export_message"):
+        statements.clear()
+        yield {"Session": Session, "statements": statements, "webhook": webhook}
+
+
+def _add(db, *rows):
+    with db["Session"]() as s:
+        s.add_all(rows)
+        s.commit()
+
+
+class TestClaimJobItem:
+    def test_claims_and_marks_processing(self, db):
+        claimed = db_sqlalchemy.claim_job_item("i1")
+        assert claimed["raw_blob_path"] == "t1/raw/i1.png" and claimed["is_fan_out"] is True
+        with db["Session"]() as s:
+            assert s.get(JobItem, "i1").status == ItemStatus.processing
+
+    def test_skips_finished_items_and_terminated_jobs(self, db):
+        with db["Session"]() as s:
+            s.get(JobItem, "i1").status = ItemStatus.completed
+            s.get(Job, "job1").status = JobStatus.partial
+            s.commit()
+        assert db_sqlalchemy.claim_job_item("i1") is None
+        assert db_sqlalchemy.claim_job_item("i2") is None
+        assert db_sqlalchemy.claim_job_item("missing") is None
+
+    def test_missing_raw_blob_fails_item(self, db):
+        _add(db, JobItem(id="i3", job_id="job1", tenant_id="t1", filename="x.jpg",
+                         status=ItemStatus.uploaded))
+        assert db_sqlalchemy.claim_job_item("i3") is None
+        with db["Session"]() as s:
+            assert s.get(JobItem, "i3").status == ItemStatus.failed
+
+
+class TestJobContext:
+    def test_brand_profile_and_style_in_two_statements(self, db):
+        ctx = db_sqlalchemy.get_job_context("job1", "t1")
+        assert ctx["brand_profile"]["name"] == "Acme"
+        assert ctx["style_context"] == "lighting: soft daylight"
+        assert len(db["statements"]) == 2
+
+    def test_default_brand_profile_is_one_statement(self, db):
+        with db["Session"]() as s:
+            s.get(Job, "job1").brand_profile_id = "default"
+            s.commit()
+        db["statements"].clear()
+        ctx = db_sqlalchemy.get_job_context("job1", "t1")
+        assert ctx["brand_profile"] is None and ctx["style_context"] is None
+        assert len(db["statements"]) == 1
+
+    def test_other_tenant_gets_nothing(self, db):
+        assert db_sqlalchemy.get_job_context("job1", "t2") is None
+
+
+class TestWatermarkEligibility:
+    def _watermark(self):
+        return db_sqlalchemy.get_job_context("job1", "t1")["watermark"]
+
+    def test_no_user_is_not_watermarked(self, db):
+        """Unknown tenant (e.g. API key user) should not be watermarked."""
+        assert self._watermark() is False
+
+    def test_free_tier_user_is_watermarked(self, db):
+        _add(db, User(id="u1", email="a@b.c", tenant_id="t1", token_balance=0))
+        assert self._watermark() is True
+
+    def test_token_balance_skips_watermark(self, db):
+        _add(db, User(id="u1", email="a@b.c", tenant_id="t1", token_balance=50))
+        assert self._watermark() is False
+
+    def test_active_subscription_skips_watermark(self, db):
+        _add(db, User(id="u1", email="a@b.c", tenant_id="t1", token_balance=0),
+             UserSubscription(id="s1", user_id="u1", plan_id="p", status="active"))
+        assert self._watermark() is False
+
+    def test_pending_subscription_is_watermarked(self, db):
+        _add(db, User(id="u1", email="a@b.c", tenant_id="t1", token_balance=0),
+             UserSubscription(id="s1", user_id="u1", plan_id="p", status="pending"))
+        assert self._watermark() is True
+
+
+class TestJobContextCache:
+    def test_siblings_share_one_load(self):
+        loads = []
+        cache = JobContextCache(lambda j, t: loads.append(j) or {"job_id": j, "tenant_id": t,
+                                                                  "watermark": True})
+        first = cache.get("job1", "t1")
+        assert cache.get("job1", "t1") is first
+        assert first.watermark is True
+        assert loads == ["job1"]
+
+    def test_lookup_failure_falls_back_and_is_not_cached(self):
+        calls = []
+
+        def loader(job_id, tenant_id):
+            calls.append(job_id)
+            if len(calls) == 1:
+                raise RuntimeError("db down")
+            return {"job_id": job_id, "tenant_id": tenant_id, "watermark": True}
+
+        cache = JobContextCache(loader)
+        assert cache.get("job1", "t1") == JobContext("job1", "t1")
+        assert cache.get("job1", "t1").watermark is True
+        assert calls == ["job1", "job1"]
+
+    def test_ttl_and_tenant_mismatch_reload(self):
+        now = [0.0]
+        loads = []
+        cache = JobContextCache(lambda j, t: loads.append(t), ttl=10, clock=lambda: now[0])
+        assert cache.get("job1", "t1") == JobContext("job1", "t1")
+        cache.get("job1", "t2")
+        now[0] = 11
+        cache.get("job1", "t2")
+        assert loads == ["t1", "t2", "t2"]
+
+
+class TestCompleteItem:
+    def test_completion_and_job_status_in_one_transaction(self, db):
+        with db["Session"]() as s:
+            s.get(JobItem, "i2").status = ItemStatus.completed
+            s.commit()
+        commits = []
+        event.listen(db["Session"], "after_commit", lambda session: commits.append(1))
+
+        complete_item("job1", "i1", {"output_blob_path": "out.png", "seo_filename": "shoe.png"})
+
+        assert commits == [1]
+        with db["Session"]() as s:
+            item = s.get(JobItem, "i1")
+            assert item.status == ItemStatus.completed and item.seo_filename == "shoe.png"
+            assert s.get(Job, "job1").status == JobStatus.completed
+        db["webhook"].assert_called_once_with("https://example.com/hook", "job1", "completed")
+
+    def test_failure_with_sibling_pending_keeps_processing(self, db):
+        mark_item_failed("job1", "i1", "boom")
+        with db["Session"]() as s:
+            assert s.get(JobItem, "i1").error_message == "boom"
+            assert s.get(Job, "job1").status == JobStatus.processing
+        db["webhook"].assert_not_called()
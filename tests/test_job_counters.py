@@ -0,0 +1,147 @@
+"""
+Tests for incremental job item counters: ORM-maintained deltas, status
+derivation, drift repair, and concurrent completions of one job.
+"""
+import threading
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared import db_sqlalchemy
+from shared.db import Base
+from shared.job_counters import derive_job_status
+from shared.models import ItemStatus, Job, JobItem, JobStatus
+from shared.pipeline import complete_item, finalize_job_status, mark_item_failed
+
+
+def _engine(url="sqlite://"):
+    kwargs = {"poolclass": StaticPool} if url == "sqlite://" else {}
+    engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30}, **kwargs)
+    Base.metadata.create_all(engine, tables=[Job.__table__, JobItem.__table__])
+    return engine
+
+
+def _seed(Session, n_items, status=ItemStatus.processing, callback_url=None):
+    with Session() as s:
+        s.add(Job(id="job1", tenant_id="t1", brand_profile_id="default", correlation_id="c",
+                  status=JobStatus.processing, callback_url=callback_url))
+        s.add_all(JobItem(id=f"i{n}", job_id="job1", tenant_id="t1", filename="x.png", status=status)
+                  for n in range(n_items))
+        s.commit()
+
+
+def _counters(Session):
+    with Session() as s:
+        job = s.get(Job, "job1")
+        return job.items_total, job.items_completed, job.items_failed, job.items_processing
+
+
+@pytest.fixture
+def Session():
+    Session = sessionmaker(bind=_engine())
+    with patch("shared.db.SessionLocal", Session), \
+            patch.object(db_sqlalchemy, "SessionLocal", Session), \
+            patch("shared.pipeline._fire_webhook"), \
+            patch("shared.pipeline._send_export_message"):
+        yield Session
+
+
+class TestDeriveJobStatus:
+    def test_matrix(self):
+        assert derive_job_status(0, 0, 0, 0) is None
+        assert derive_job_status(3, 3, 0, 0) == "completed"
+        assert derive_job_status(3, 1, 0, 1) == "processing"
+        assert derive_job_status(3, 1, 1, 0) == "processing"  # one still uploaded
+        assert derive_job_status(3, 0, 3, 0) == "failed"
+        assert derive_job_status(3, 2, 1, 0) == "partial"
+
+
+class TestOrmDeltas:
+    def test_insert_transition_delete(self, Session):
+        _seed(Session, 3, status=ItemStatus.uploaded)
+        assert _counters(Session) == (3, 0, 0, 0)
+
+        with Session() as s:
+            s.get(JobItem, "i0").status = ItemStatus.processing
+            s.get(JobItem, "i1").status = ItemStatus.failed
+            s.commit()
+        assert _counters(Session) == (3, 0, 1, 1)
+
+        with Session() as s:
+            item = s.get(JobItem, "i0")
+            item.status = ItemStatus.completed
+            s.flush()
+            # Same-session reads see the new counters
+            assert s.get(Job, "job1").items_completed == 1
+            s.delete(s.get(JobItem, "i1"))
+            s.commit()
+        assert _counters(Session) == (2, 1, 0, 0)
+
+    def test_rollback_discards_deltas(self, Session):
+        _seed(Session, 1)
+        with Session() as s:
+            s.get(JobItem, "i0").status = ItemStatus.completed
+            s.flush()
+            s.rollback()
+        assert _counters(Session) == (1, 0, 0, 1)
+
+    def test_finalize_reads_counters_not_items(self, Session):
+        _seed(Session, 2, status=ItemStatus.completed)
+        with patch.object(Job, "items", property(lambda self: pytest.fail("items loaded"))):
+            finalize_job_status("job1")
+        with Session() as s:
+            assert s.get(Job, "job1").status == JobStatus.completed
+
+
+class TestRepair:
+    def test_bulk_update_drift_is_repaired(self, Session):
+        _seed(Session, 3)
+        with Session() as s:
+            # Bulk update bypasses the ORM hooks
+            s.query(JobItem).update({JobItem.status: ItemStatus.completed}, synchronize_session=False)
+            s.commit()
+        assert _counters(Session) == (3, 0, 0, 3)
+
+        assert db_sqlalchemy.repair_job_counters() == ["job1"]
+        assert _counters(Session) == (3, 3, 0, 0)
+        with Session() as s:
+            assert s.get(Job, "job1").status == JobStatus.completed
+        assert db_sqlalchemy.repair_job_counters(["job1"]) == []
+
+
+class TestConcurrentCompletions:
+    def test_last_completion_finalizes_exactly_once(self, tmp_path):
+        """REGRESSION: parallel item completions must leave the job completed, not processing."""
+        Session = sessionmaker(bind=_engine(f"sqlite:///{tmp_path / 'jobs.db'}"))
+        n = 24
+        _seed(Session, n, callback_url="https://example.com/hook")
+        barrier = threading.Barrier(n)
+        errors = []
+
+        def finish(i):
+            try:
+                barrier.wait()
+                if i % 6 == 0:
+                    mark_item_failed("job1", f"i{i}", "boom")
+                else:
+                    complete_item("job1", f"i{i}", {"output_blob_path": f"out{i}.png"})
+            except Exception as e:  # pragma: no cover - surfaced below
+                errors.append(e)
+
+        with patch("shared.db.SessionLocal", Session), \
+                patch("shared.pipeline._fire_webhook") as webhook, \
+                patch("shared.pipeline._send_export_message"):
+            threads = [threading.Thread(target=finish, args=(i,)) for i in range(n)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        assert errors == []
+        assert _counters(Session) == (n, n - 4, 4, 0)
+        with Session() as s:
+            assert s.get(Job, "job1").status == JobStatus.partial
+        webhook.assert_called_once_with("https://example.com/hook", "job1", "partial")
@@ -0,0 +1,111 @@
+"""
+Tests for output encoding policies: lookup/fallback, alpha handling,
+source-byte reuse and that output names follow the chosen encoding.
+"""
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+
+from shared import output_encoding
+from shared.output_encoding import (
+    POLICIES,
+    content_type_for,
+    encode_image,
+    get_output_encoding,
+    parse_tenant_formats,
+    resolve_output_encoding,
+    with_extension,
+)
+from pipeline_worker.image_handle import ImageHandle
+
+
+def _rgba(size=(8, 8)):
+    img = Image.new("RGBA", size, (255, 0, 0, 0))
+    img.putpixel((0, 0), (0, 0, 255, 255))
+    return img
+
+
+class TestPolicyLookup:
+    def test_known_policies(self):
+        assert get_output_encoding("webp").pil_format == "WEBP"
+        assert get_output_encoding(" JPEG ").extension == "jpg"
+
+    def test_unknown_and_empty_fall_back_to_png(self):
+        assert get_output_encoding("tiff").name == "png"
+        assert get_output_encoding(None).name == "png"
+
+    def test_avif_falls_back_to_webp_without_encoder(self):
+        with patch.object(output_encoding, "_avif_available", return_value=False):
+            assert get_output_encoding("avif").name == "webp"
+
+    def test_job_option_overrides_setting(self):
+        with patch("shared.settings_service.get_setting", return_value="jpeg"):
+            assert resolve_output_encoding(None).name == "jpeg"
+            assert resolve_output_encoding("webp-lossless").name == "webp-lossless"
+
+    def test_precedence_job_then_tenant_then_global(self):
+        values = {"OUTPUT_FORMAT": "jpeg", "OUTPUT_FORMAT_TENANT_OVERRIDES": "t_web=webp, t_bad=tiff"}
+        with patch("shared.settings_service.get_setting", side_effect=values.get):
+            assert resolve_output_encoding("png-max", "t_web").name == "png-max"
+            assert resolve_output_encoding(None, "t_web").name == "webp"
+            assert resolve_output_encoding(None, "t_other").name == "jpeg"
+            assert resolve_output_encoding(None, "t_bad").name == "jpeg"
+            assert resolve_output_encoding(None).name == "jpeg"
+
+    def test_parse_tenant_formats(self):
+        assert parse_tenant_formats(" t1=WebP, t2=, =jpeg, t3=tiff,t4=jpeg") == {"t1": "webp", "t4": "jpeg"}
+
+
+class TestEncodeImage:
+    def test_every_policy_round_trips(self):
+        img = _rgba()
+        for name in POLICIES:
+            enc = get_output_encoding(name)
+            decoded = Image.open(BytesIO(encode_image(img, enc)))
+            assert decoded.format == enc.pil_format
+            assert decoded.size == img.size
+
+    def test_jpeg_flattens_alpha_onto_white(self):
+        decoded = Image.open(BytesIO(encode_image(_rgba(), POLICIES["jpeg"])))
+        assert decoded.mode == "RGB"
+        r, g, b = decoded.getpixel((7, 7))
+        assert min(r, g, b) > 240
+
+    def test_lossless_webp_keeps_transparency(self):
+        decoded = Image.open(BytesIO(encode_image(_rgba(), POLICIES["webp-lossless"])))
+        assert decoded.convert("RGBA").getpixel((7, 7))[3] == 0
+        assert decoded.convert("RGBA").getpixel((0, 0)) == (0, 0, 255, 255)
+
+
+class TestImageHandleEncode:
+    def test_reuses_matching_lossless_source(self):
+        data = ImageHandle.from_image(_rgba()).to_bytes()
+        assert ImageHandle.from_bytes(data).encode(POLICIES["png"]) is data
+
+    def test_reencodes_other_formats(self):
+        data = ImageHandle.from_image(_rgba()).to_bytes()
+        out = ImageHandle.from_bytes(data).encode(POLICIES["webp"])
+        assert Image.open(BytesIO(out)).format == "WEBP"
+
+
+class TestOutputNames:
+    def test_content_type_for(self):
+        assert content_type_for("a/b/out.webp") == "image/webp"
+        assert content_type_for("shoe.JPG") == "image/jpeg"
+        assert content_type_for("noext") == "image/png"
+
+    def test_with_extension(self):
+        assert with_extension("shoe.jpg", "t/jobs/j/items/i/outputs/o.webp") == "shoe.webp"
+        assert with_extension("shoe.jpg", "") == "shoe.jpg"
+
+    def test_zip_entry_follows_output_encoding(self):
+        from export_worker.worker import _build_zip_filename
+
+        class Item:
+            filename = "shoe.jpg"
+            output_blob_path = "t/jobs/j/items/i/outputs/o.avif"
+            scene_index = 1
+            scene_type = "marble"
+
+        assert _build_zip_filename(Item()) == "shoe_marble.avif"
@@ -0,0 +1,202 @@
+"""
+Tests for stage-pipelined execution: step routing to cpu/io pools,
+backpressure on full stages and per-stage utilization reporting.
+"""
+import threading
+import time
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pipeline_worker.pipeline import execute_pipeline
+from pipeline_worker.stages import PipelineStages, Stage, stage_for_provider, CPU, IO
+from shared.config import settings
+
+
+def _png(color, mode="RGBA", size=(2, 2)):
+    from PIL import Image
+    buf = BytesIO()
+    Image.new(mode, size, color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+RAW_PNG = _png((255, 0, 0), mode="RGB")
+RGBA_PNG = _png((255, 0, 0, 128))
+SCENE_PNG = _png((0, 0, 255, 255))
+
+
+class RecordingStages:
+    """Runs steps inline but records which stage each one was sent to."""
+
+    def __init__(self):
+        self.calls = []
+
+    def run(self, stage, fn, *args, **kwargs):
+        self.calls.append((stage, getattr(fn, "__name__", repr(fn))))
+        return fn(*args, **kwargs)
+
+
+def _providers(bg_local=True, upscale_local=True):
+    bg = MagicMock()
+    bg.name = "mock-bg"
+    bg.runs_locally = bg_local
+    bg.remove_background.return_value = RGBA_PNG
+    bg.remove_background.__name__ = "remove_background"
+
+    scene = MagicMock()
+    scene.name = "mock-scene"
+    scene.supports_edit = False
+    scene.generate.return_value = SCENE_PNG
+    scene.generate.__name__ = "generate"
+
+    up = MagicMock()
+    up.name = "mock-upscale"
+    up.runs_locally = upscale_local
+    up.upscale.return_value = b"upscaled"
+    up.upscale.__name__ = "upscale"
+    return bg, scene, up
+
+
+class TestStageRouting:
+    def test_local_models_on_cpu_remote_calls_on_io(self):
+        bg, scene, up = _providers()
+        stages = RecordingStages()
+
+        result = execute_pipeline(
+            raw_bytes=RAW_PNG,
+            remove_background=True, generate_scene=True, upscale=True,
+            scene_prompt="marble", bg_provider=bg, img_gen_provider=scene,
+            upscale_provider=up, stages=stages,
+        )
+
+        assert result.output_bytes == b"upscaled"
+        assert stages.calls == [
+            (CPU, "remove_background"),
+            (IO, "generate"),
+            (CPU, "composite_product_image"),
+            (CPU, "upscale"),
+        ]
+
+    def test_remote_bg_provider_goes_to_io(self):
+        bg, _, _ = _providers(bg_local=False)
+        stages = RecordingStages()
+        execute_pipeline(
+            raw_bytes=RAW_PNG,
+            remove_background=True, generate_scene=False, upscale=False,
+            scene_prompt=None, bg_provider=bg, stages=stages,
+        )
+        assert stages.calls == [(IO, "remove_background")]
+
+    def test_edit_mode_routing(self):
+        bg, _, _ = _providers()
+        edit = MagicMock()
+        edit.name = "fal.ai/flux2-pro-edit"
+        edit.supports_edit = True
+        edit.generate.return_value = SCENE_PNG
+        edit.generate.__name__ = "generate"
+        upload = MagicMock(return_value="https://blob.test/p.png")
+        upload.__name__ = "upload_tmp_image"
+        stages = RecordingStages()
+
+        execute_pipeline(
+            raw_bytes=RAW_PNG,
+            remove_background=True, generate_scene=True, upscale=False,
+            scene_prompt="studio", bg_provider=bg, img_gen_provider=edit,
+            upload_tmp_image=upload, stages=stages,
+        )
+
+        assert stages.calls == [
+            (CPU, "remove_background"),
+            (IO, "upload_tmp_image"),
+            (IO, "generate"),
+            (CPU, "_preserve_product_details_image"),
+        ]
+
+    def test_stage_for_provider_ignores_mock_truthiness(self):
+        assert stage_for_provider(MagicMock()) == IO
+        assert stage_for_provider(None) == IO
+
+
+class TestStage:
+    def test_bounded_queue_applies_backpressure(self):
+        """A stage with 1 worker and no queue admits one item at a time."""
+        stage = Stage("cpu", workers=1, queue_size=0)
+        release = threading.Event()
+        order = []
+
+        def slow():
+            order.append("slow-start")
+            release.wait(5)
+
+        t = threading.Thread(target=stage.run, args=(slow,))
+        t.start()
+        time.sleep(0.05)
+
+        blocked = threading.Thread(target=stage.run, args=(lambda: order.append("second"),))
+        blocked.start()
+        time.sleep(0.05)
+        assert order == ["slow-start"]
+        assert stage.snapshot()["queued"] == 0  # still waiting for a slot
+
+        release.set()
+        t.join(2)
+        blocked.join(2)
+        assert order == ["slow-start", "second"]
+
+    def test_overlaps_cpu_and_io_work(self):
+        """An I/O wait on one item does not stop the CPU stage serving another."""
+        stages = PipelineStages(cpu_workers=1, io_workers=2, queue_size=2)
+        io_started = threading.Event()
+        release_io = threading.Event()
+
+        def remote_call():
+            io_started.set()
+            release_io.wait(5)
+
+        t = threading.Thread(target=stages.run, args=(IO, remote_call))
+        t.start()
+        io_started.wait(2)
+
+        assert stages.run(CPU, lambda: "mask") == "mask"
+        release_io.set()
+        t.join(2)
+
+    def test_utilization_snapshot(self):
+        stage = Stage("io", workers=2, queue_size=4)
+        stage.run(time.sleep, 0.05)
+        stats = stage.snapshot(reset=True)
+
+        assert stats["tasks"] == 1
+        assert stats["workers"] == 2
+        assert 0 < stats["utilization"] <= 1.0
+        assert stage.snapshot()["tasks"] == 0
+
+    def test_exceptions_propagate_to_caller(self):
+        stage = Stage("cpu", workers=1, queue_size=0)
+
+        def boom():
+            raise ValueError("bad image")
+
+        with pytest.raises(ValueError, match="bad image"):
+            stage.run(boom)
+        # Slot was released — stage still usable
+        assert stage.run(lambda: 1) == 1
+
+
+class TestStageSizing:
+    def _sizes(self, concurrency, cpu, io, cores=8):
+        with patch.object(settings, "WORKER_CONCURRENCY", concurrency), \
+                patch.object(settings, "PIPELINE_CPU_WORKERS", cpu), \
+                patch.object(settings, "PIPELINE_IO_WORKERS", io), \
+                patch("pipeline_worker.stages.os.cpu_count", return_value=cores):
+            stages = PipelineStages.from_settings()
+        return stages.stages[CPU].workers, stages.stages[IO].workers
+
+    def test_defaults_follow_worker_concurrency(self):
+        assert self._sizes(4, 0, 0) == (4, 4)
+        assert self._sizes(16, 0, 0, cores=8) == (8, 16)
+
+    def test_sizes_above_items_in_flight_are_capped(self):
+        assert self._sizes(4, 0, 16) == (4, 4)
+        assert self._sizes(4, 2, 3) == (2, 3)
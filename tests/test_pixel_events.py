@@ -1,4 +1,5 @@
 """Tests for pixel event ingestion, variant attribution, auto-conclude, and pixel key generation."""
+import asyncio
 import math
 from datetime import datetime, timedelta, timezone
 from unittest.mock import patch, MagicMock
@@ -85,16 +86,42 @@ def test_pixel_events_valid_key(pixel_client):
         assert resp.status_code == 202
         data = resp.json()
         assert data["accepted"] == 2
-        assert mock_inc.call_count == 2
 
-        # First call: view — only views=1 is passed
-        call1 = mock_inc.call_args_list[0]
-        assert call1.kwargs.get("views", 0) == 1
+        # Same test, variant and day: one write carrying both events
+        mock_inc.assert_called_once()
+        call = mock_inc.call_args_list[0]
+        assert call.args == ("abtest_001", "a", "2026-03-12")
+        assert call.kwargs.get("views", 0) == 1
+        assert call.kwargs.get("conversions", 0) == 1
+        assert call.kwargs.get("revenue_cents", 0) == 1990
+
+
+def test_pixel_events_batch_writes_once_per_variant_and_day(pixel_client):
+    """A batch is folded into one increment per test/variant/date and one variant lookup per timestamp."""
+    with patch("web_api.routes_pixel_events.get_integration_by_pixel_key", return_value=MOCK_INTEGRATION), \
+         patch("web_api.routes_pixel_events.get_integration_event_limit", return_value=None), \
+         patch("web_api.routes_pixel_events.find_running_test", return_value=MOCK_RUNNING_TEST), \
+         patch("web_api.routes_pixel_events.get_active_variant_at", return_value="a") as mock_variant, \
+         patch("web_api.routes_pixel_events.increment_ab_test_metric") as mock_inc:
+
+        resp = pixel_client.post("/v1/ab-tests/pixel-events", json={
+            "shop_domain": "test-store.myshopify.com",
+            "events": [
+                {"event_type": "view", "product_id": "12345", "timestamp": "2026-03-12T20:00:00Z"},
+                {"event_type": "view", "product_id": "12345", "timestamp": "2026-03-12T20:00:00Z"},
+                {"event_type": "add_to_cart", "product_id": "12345", "timestamp": "2026-03-12T20:00:00Z"},
+                {"event_type": "view", "product_id": "12345", "timestamp": "2026-03-13T09:00:00Z"},
+            ],
+        }, headers={"X-Pixel-Key": "pk_test_key_123"})
 
-        # Second call: conversion with revenue
-        call2 = mock_inc.call_args_list[1]
-        assert call2.kwargs.get("conversions", 0) == 1
-        assert call2.kwargs.get("revenue_cents", 0) == 1990
+        assert resp.status_code == 202
+        assert resp.json()["accepted"] == 4
+        assert mock_variant.call_count == 2
+        calls = {c.args[2]: c.kwargs for c in mock_inc.call_args_list}
+        assert calls == {
+            "2026-03-12": {"views": 2, "add_to_carts": 1},
+            "2026-03-13": {"views": 1},
+        }
 
 
 def test_pixel_events_invalid_key(pixel_client):
@@ -239,7 +266,7 @@ def test_auto_conclude_triggers_when_significant():
          patch("web_api.routes_pixel_events.get_ab_test_aggregated_metrics", return_value=aggregated), \
          patch("web_api.routes_pixel_events.update_ab_test") as mock_update:
 
-        _check_auto_conclude_batch("int_abc", events)
+        asyncio.run(_check_auto_conclude_batch("int_abc", events))
 
         mock_update.assert_called_once()
         call_args = mock_update.call_args
@@ -263,7 +290,7 @@ def test_auto_conclude_skips_when_not_enough_views():
          patch("web_api.routes_pixel_events.get_ab_test_aggregated_metrics", return_value=aggregated), \
          patch("web_api.routes_pixel_events.update_ab_test") as mock_update:
 
-        _check_auto_conclude_batch("int_abc", events)
+        asyncio.run(_check_auto_conclude_batch("int_abc", events))
         mock_update.assert_not_called()
 
 
@@ -282,7 +309,7 @@ def test_auto_conclude_skips_when_not_significant():
          patch("web_api.routes_pixel_events.get_ab_test_aggregated_metrics", return_value=aggregated), \
          patch("web_api.routes_pixel_events.update_ab_test") as mock_update:
 
-        _check_auto_conclude_batch("int_abc", events)
+        asyncio.run(_check_auto_conclude_batch("int_abc", events))
         mock_update.assert_not_called()
 
 
@@ -295,7 +322,7 @@ def test_auto_conclude_skips_when_disabled():
          patch("web_api.routes_pixel_events.get_ab_test_aggregated_metrics") as mock_agg, \
          patch("web_api.routes_pixel_events.update_ab_test") as mock_update:
 
-        _check_auto_conclude_batch("int_abc", events)
+        asyncio.run(_check_auto_conclude_batch("int_abc", events))
         # Should not even check metrics when auto_conclude is off
         mock_agg.assert_not_called()
         mock_update.assert_not_called()
@@ -346,6 +373,22 @@ def test_pixel_key_get(pixel_client):
         assert data["integration_id"] == "int_abc"
 
 
+def test_sync_db_helpers_run_off_the_event_loop(pixel_client):
+    """Sync helpers are run in the threadpool, not on the event loop."""
+    def on_loop(*args):
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    with patch("web_api.routes_pixel_events.get_integration", return_value={"id": "int_abc"}), \
+         patch("web_api.routes_pixel_events.ensure_pixel_key", side_effect=on_loop), \
+         patch("web_api.routes_pixel_events.get_integration_ga_config", side_effect=on_loop):
+        assert pixel_client.get("/v1/ab-tests/pixel-key/int_abc").json()["pixel_key"] is False
+        assert pixel_client.get("/v1/ab-tests/ga-config/int_abc").json()["ga_measurement_id"] is None
+
+
 def test_pixel_key_not_found(pixel_client):
     """GET /pixel-key/{id} returns 404 for missing integration."""
     with patch("web_api.routes_pixel_events.get_integration", return_value=None):
@@ -0,0 +1,158 @@
+"""
+Tests for gallery previews: rendering, storage-backed reuse, invalidation on
+a new source image, and GET /v1/downloads/{item_id}/preview.
+"""
+import io
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared import db_sqlalchemy, storage
+from shared.db import Base
+from shared.models import BlobDeletion, ExportRendition
+from shared.previews import ensure_preview, parse_widths, render_preview, snap_width
+
+
+def _image(size=(1200, 800), mode="RGB", fmt="PNG") -> bytes:
+    color = (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)
+    buf = io.BytesIO()
+    Image.new(mode, size, color).save(buf, fmt)
+    return buf.getvalue()
+
+
+class TestRenderPreview:
+    def test_webp_at_width_keeps_aspect(self):
+        img = Image.open(io.BytesIO(render_preview(_image(), 320, "webp")))
+        assert img.format == "WEBP"
+        assert img.size == (320, 213)
+
+    def test_jpeg_flattens_alpha(self):
+        img = Image.open(io.BytesIO(render_preview(_image(mode="RGBA"), 160, "jpeg")))
+        assert img.format == "JPEG"
+        assert img.mode == "RGB"
+        assert img.size == (160, 107)
+
+    def test_webp_keeps_alpha(self):
+        img = Image.open(io.BytesIO(render_preview(_image(mode="RGBA"), 160, "webp")))
+        assert img.mode == "RGBA"
+
+    def test_never_upscales(self):
+        img = Image.open(io.BytesIO(render_preview(_image(size=(100, 50), fmt="JPEG"), 640, "webp")))
+        assert img.size == (100, 50)
+
+    def test_snap_and_parse_widths(self):
+        assert snap_width(1) == 160
+        assert snap_width(320) == 320
+        assert snap_width(321) == 640
+        assert snap_width(5000) == 1024
+        assert parse_widths(" 300, 320,x,1024 ,") == [320, 1024]
+        assert parse_widths("") == []
+
+
+@pytest.fixture
+def env():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[ExportRendition.__table__, BlobDeletion.__table__])
+    Session = sessionmaker(bind=engine)
+    blobs = {"t1/out/a.png": _image()}
+    calls = {"download": 0, "upload": []}
+
+    def download(container, path):
+        calls["download"] += 1
+        return blobs[path]
+
+    def upload(container, path, data, content_type=None, cache_control=None):
+        calls["upload"].append((path, content_type, cache_control))
+        blobs[path] = data
+
+    with patch.object(db_sqlalchemy, "SessionLocal", Session), \
+            patch.object(storage, "download_blob", side_effect=download), \
+            patch.object(storage, "upload_blob", side_effect=upload):
+        yield {"blobs": blobs, "calls": calls, "Session": Session}
+
+
+ITEM = {"id": "i1", "job_id": "job1", "tenant_id": "t1",
+        "output_blob_path": "t1/out/a.png", "raw_blob_path": None}
+
+
+class TestEnsurePreview:
+    def test_generates_once_then_reuses(self, env):
+        first = ensure_preview(ITEM, "outputs", 320, "webp")
+        assert first.startswith("t1/jobs/job1/items/i1/renditions/preview-outputs-w320-")
+        assert first.endswith(".webp")
+        assert env["calls"]["upload"] == [(first, "image/webp", "public, max-age=31536000, immutable")]
+
+        assert ensure_preview(ITEM, "outputs", 320, "webp") == first
+        assert env["calls"]["download"] == 1
+        assert len(env["calls"]["upload"]) == 1
+
+    def test_formats_and_widths_are_separate_entries(self, env):
+        webp = ensure_preview(ITEM, "outputs", 320, "webp")
+        jpeg = ensure_preview(ITEM, "outputs", 320, "jpeg")
+        wide = ensure_preview(ITEM, "outputs", 640, "webp")
+        assert len({webp, jpeg, wide}) == 3
+        with env["Session"]() as s:
+            assert s.query(ExportRendition).count() == 3
+
+    def test_new_output_renders_to_a_new_blob(self, env):
+        old = ensure_preview(ITEM, "outputs", 160, "webp")
+        env["blobs"]["t1/out/b.png"] = _image(size=(400, 400))
+        path = ensure_preview({**ITEM, "output_blob_path": "t1/out/b.png"}, "outputs", 160, "webp")
+        assert env["calls"]["download"] == 2
+        assert Image.open(io.BytesIO(env["blobs"][path])).size == (160, 160)
+        # Immutable blobs: the new preview never overwrites the old URL's content
+        assert path != old
+        with env["Session"]() as s:
+            queued = s.query(BlobDeletion).one()
+        assert (queued.container, queued.blob_path, queued.reason) == ("outputs", old, "preview")
+
+    def test_in_memory_source_skips_download(self, env):
+        ensure_preview(ITEM, "outputs", 160, "webp", image_bytes=_image())
+        assert env["calls"]["download"] == 0
+
+    def test_missing_source_returns_none(self, env):
+        assert ensure_preview(ITEM, "raw", 160, "webp") is None
+        assert env["calls"]["upload"] == []
+
+
+# ── GET /v1/downloads/{item_id}/preview ───────────────────────────
+
+class TestPreviewRoute:
+    @patch("web_api.routes_downloads.generate_read_sas")
+    @patch("web_api.routes_downloads.ensure_preview")
+    @patch("web_api.routes_downloads.get_job_item")
+    def test_preview_url(self, mock_item, mock_ensure, mock_sas, client):
+        mock_item.return_value = {"id": "item_1", "tenant_id": "tenant_test",
+                                  "output_blob_path": "tenant_test/out.png"}
+        mock_ensure.return_value = "tenant_test/jobs/j1/items/item_1/renditions/preview.webp"
+        mock_sas.return_value = "https://example.com/preview.webp?sig=abc"
+
+        resp = client.get("/v1/downloads/item_1/preview?width=300")
+        assert resp.status_code == 200
+        assert resp.json() == {"preview_url": "https://example.com/preview.webp?sig=abc",
+                               "width": 320, "format": "webp"}
+        mock_ensure.assert_called_once_with(mock_item.return_value, "outputs", 320, "webp")
+        assert mock_sas.call_args.kwargs["expiry_minutes"] == 1440
+        assert resp.headers["cache-control"] == "private, max-age=86100"
+
+    @patch("web_api.routes_downloads.ensure_preview")
+    @patch("web_api.routes_downloads.get_job_item")
+    def test_preview_not_ready_404(self, mock_item, mock_ensure, client):
+        mock_item.return_value = {"id": "item_1", "tenant_id": "tenant_test", "output_blob_path": None}
+        mock_ensure.return_value = None
+        resp = client.get("/v1/downloads/item_1/preview")
+        assert resp.status_code == 404
+
+    @patch("web_api.routes_downloads.get_job_item")
+    def test_preview_wrong_tenant_403(self, mock_item, client):
+        mock_item.return_value = {"id": "item_1", "tenant_id": "other_tenant"}
+        resp = client.get("/v1/downloads/item_1/preview")
+        assert resp.status_code == 403
+
+    def test_preview_rejects_unknown_format(self, client):
+        resp = client.get("/v1/downloads/item_1/preview?format=gif")
+        assert resp.status_code == 422
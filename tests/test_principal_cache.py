@@ -0,0 +1,194 @@
+"""
+Tests for the auth principal cache: TTL/LRU behaviour, invalidation on
+balance changes and key revocation, and write-behind last_used_at.
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared import db_sqlalchemy, principal_cache
+from shared.db import Base
+from shared.models import User
+from shared.principal_cache import LastUsedBuffer, PrincipalCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPrincipalCache:
+    def test_expires_after_ttl(self):
+        clock = FakeClock()
+        cache = PrincipalCache(ttl=30, clock=clock)
+        cache.put("key:a", "u1", {"user_id": "u1"})
+        assert cache.get("key:a") == {"user_id": "u1"}
+        clock.now += 31
+        assert cache.get("key:a") is None
+        assert len(cache) == 0
+
+    def test_evicts_least_recently_used(self):
+        cache = PrincipalCache(ttl=30, max_entries=2)
+        cache.put("key:a", "u1", 1)
+        cache.put("key:b", "u2", 2)
+        cache.get("key:a")
+        cache.put("key:c", "u3", 3)
+        assert cache.get("key:b") is None
+        assert cache.get("key:a") == 1
+        assert cache.get("key:c") == 3
+
+    def test_invalidate_user_drops_all_their_entries(self):
+        cache = PrincipalCache(ttl=30)
+        cache.put("key:a", "u1", 1)
+        cache.put("sub:s1", "u1", 2)
+        cache.put("key:b", "u2", 3)
+        cache.invalidate_user("u1")
+        assert cache.get("key:a") is None
+        assert cache.get("sub:s1") is None
+        assert cache.get("key:b") == 3
+
+    def test_put_after_racing_invalidation_is_dropped(self):
+        cache = PrincipalCache(ttl=30)
+        generation = cache.generation
+        cache.invalidate_user("u1")  # e.g. a balance change during the lookup
+        cache.put("key:a", "u1", 1, generation=generation)
+        assert cache.get("key:a") is None
+
+
+class TestLastUsedBuffer:
+    def test_flush_writes_latest_time_per_key(self):
+        written = []
+        buf = LastUsedBuffer(written.append, interval=3600)
+        t0 = datetime(2026, 3, 1, 12, 0)
+        buf.record("k1", t0)
+        buf.record("k1", t0 + timedelta(seconds=5))
+        buf.record("k1", t0 - timedelta(seconds=5))
+        buf.record("k2", t0)
+        assert written == []
+        assert buf.flush() == 2
+        assert written == [{"k1": t0 + timedelta(seconds=5), "k2": t0}]
+        assert buf.flush() == 0
+
+    def test_failed_flush_is_retried(self):
+        calls = []
+
+        def writer(batch):
+            calls.append(dict(batch))
+            if len(calls) == 1:
+                raise RuntimeError("db down")
+
+        buf = LastUsedBuffer(writer, interval=3600)
+        buf.record("k1", datetime(2026, 3, 1))
+        assert buf.flush() == 0
+        assert buf.flush() == 1
+        assert calls[0] == calls[1]
+
+
+@pytest.fixture
+def fresh_cache():
+    written = []
+    cache = PrincipalCache(ttl=30)
+    buf = LastUsedBuffer(written.append, interval=3600)
+    with patch.object(principal_cache, "_cache", cache), \
+            patch.object(principal_cache, "_last_used", buf), \
+            patch.object(principal_cache, "_listener_started", True):
+        yield cache, buf, written
+
+
+KEY_ROW = {"key_id": "k1", "user_id": "u1", "tenant_id": "t1", "email": "a@shop.com",
+           "token_balance": 42, "is_admin": False}
+
+
+class TestApiKeyResolution:
+    @patch("web_api.auth.AsyncSessionLocal")
+    @patch("web_api.auth.get_api_key_user")
+    def test_second_request_skips_database(self, mock_lookup, _sl, fresh_cache):
+        from web_api.auth import _resolve_api_key_user
+        _, buf, written = fresh_cache
+        mock_lookup.return_value = dict(KEY_ROW)
+
+        with patch("web_api.auth.get_valid_api_keys", return_value=set()):
+            first = asyncio.run(_resolve_api_key_user("opal_abc"))
+            second = asyncio.run(_resolve_api_key_user("opal_abc"))
+
+        assert first == second
+        assert first["token_balance"] == 42
+        mock_lookup.assert_awaited_once_with(hashlib.sha256(b"opal_abc").hexdigest())
+        # Both uses buffered, one row to write
+        buf.flush()
+        assert list(written[0]) == ["k1"]
+
+    @patch("web_api.auth.AsyncSessionLocal")
+    @patch("web_api.auth.get_api_key_user")
+    def test_revocation_takes_effect_immediately(self, mock_lookup, _sl, fresh_cache):
+        from web_api.auth import _resolve_api_key_user
+        mock_lookup.return_value = dict(KEY_ROW)
+
+        with patch("web_api.auth.get_valid_api_keys", return_value=set()):
+            asyncio.run(_resolve_api_key_user("opal_abc"))
+            principal_cache.invalidate_principal("u1")  # what revoke_api_key does
+            mock_lookup.return_value = None
+            with pytest.raises(HTTPException) as exc_info:
+                asyncio.run(_resolve_api_key_user("opal_abc"))
+        assert exc_info.value.status_code == 403
+
+    @patch("web_api.routes_api_keys.invalidate_principal")
+    @patch("web_api.routes_api_keys.SessionLocal")
+    def test_revoke_route_invalidates_user(self, mock_sl, mock_invalidate, client):
+        session = mock_sl.return_value.__enter__.return_value
+        session.execute.return_value.rowcount = 1
+        resp = client.delete("/v1/account/api-keys/k1")
+        assert resp.status_code == 204
+        mock_invalidate.assert_called_once()
+
+
+# ── Database side: balance changes invalidate, batched last_used_at ───
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[User.__table__])
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE user_api_keys (id TEXT PRIMARY KEY, last_used_at TIMESTAMP)"))
+    Session = sessionmaker(bind=engine)
+    with Session() as s:
+        s.add(User(id="u1", email="a@shop.com", tenant_id="t1", token_balance=10))
+        s.commit()
+    with patch.object(db_sqlalchemy, "SessionLocal", Session):
+        yield Session
+
+
+class TestDatabaseHooks:
+    def test_balance_change_drops_cached_principal(self, db, fresh_cache):
+        cache, _, _ = fresh_cache
+        cache.put("key:a", "u1", dict(KEY_ROW))
+        db_sqlalchemy.set_user_token_balance("u1", 500)
+        assert cache.get("key:a") is None
+
+    def test_admin_flag_change_drops_cached_principal(self, db, fresh_cache):
+        cache, _, _ = fresh_cache
+        cache.put("sub:s1", "u1", {"user_id": "u1"})
+        db_sqlalchemy.set_user_admin("u1", True)
+        assert cache.get("sub:s1") is None
+
+    def test_touch_api_keys_never_moves_backwards(self, db):
+        t0 = datetime(2026, 3, 1, 12, 0)
+        with db() as s:
+            s.execute(text("INSERT INTO user_api_keys VALUES ('k1', NULL), ('k2', :t)"),
+                      {"t": t0 + timedelta(hours=1)})
+            s.commit()
+        db_sqlalchemy.touch_api_keys({"k1": t0, "k2": t0})
+        with db() as s:
+            rows = dict(s.execute(text("SELECT id, last_used_at FROM user_api_keys")).all())
+        assert str(rows["k1"]).startswith("2026-03-01 12:00")
+        assert str(rows["k2"]).startswith("2026-03-01 13:00")
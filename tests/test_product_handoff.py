@@ -0,0 +1,101 @@
+"""
+Tests for the edit-mode product handoff (inline data URIs, content-addressed
+reuse, URL validity) and the ``_tmp/`` blob sweeper.
+"""
+import base64
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from shared.storage import sweep_tmp_blobs
+from pipeline_worker.handoff import HANDOFF_PREFIX, ProductHandoff
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _handoff(**kwargs):
+    uploads = {}
+    clock = FakeClock()
+    handoff = ProductHandoff(
+        lambda container, blob_path, expiry_minutes: f"read://{blob_path}?m={expiry_minutes}",
+        lambda container, blob_path, expiry_minutes: blob_path,
+        lambda url, data, **kw: uploads.__setitem__(url, data),
+        clock=clock, **kwargs,
+    )
+    return handoff, uploads, clock
+
+
+class TestInline:
+    def test_small_image_is_data_uri(self):
+        handoff, uploads, _ = _handoff(inline_max_bytes=64)
+        url = handoff(b"x" * 10)
+        assert url.startswith("data:image/png;base64,")
+        assert base64.b64decode(url.split(",", 1)[1]) == b"x" * 10
+        assert uploads == {} and handoff.inlined == 1
+
+    def test_large_image_uploaded(self):
+        handoff, uploads, _ = _handoff(inline_max_bytes=4)
+        url = handoff(b"x" * 10)
+        assert url.startswith(f"read://{HANDOFF_PREFIX}/")
+        assert list(uploads.values()) == [b"x" * 10]
+
+
+class TestReuse:
+    def test_siblings_share_one_upload(self):
+        handoff, uploads, _ = _handoff(inline_max_bytes=0)
+        first = handoff(b"cutout")
+        second = handoff(b"cutout")
+        assert first == second
+        assert handoff.uploads == 1 and handoff.reused == 1
+        assert handoff(b"other") != first
+        assert len(uploads) == 2
+
+    def test_expiring_url_is_resigned(self):
+        handoff, _, clock = _handoff(inline_max_bytes=0, url_minutes=15)
+        handoff(b"cutout")
+        clock.now += 14 * 60
+        handoff(b"cutout")
+        assert handoff.uploads == 2
+
+    def test_async_publish_needs_longer_validity(self):
+        handoff, _, clock = _handoff(inline_max_bytes=0, url_minutes=15)
+        handoff(b"cutout")
+        path, url = handoff.publish(b"cutout", expiry_minutes=30)
+        assert handoff.uploads == 2
+        assert url.endswith("m=45")
+        clock.now += 10 * 60
+        assert handoff.publish(b"cutout", expiry_minutes=30) == (path, url)
+        assert handoff.reused == 1
+
+    def test_lru_bound(self):
+        handoff, _, _ = _handoff(inline_max_bytes=0, max_entries=2)
+        for data in (b"a", b"b", b"c"):
+            handoff(data)
+        handoff(b"a")
+        assert handoff.uploads == 4
+
+
+class TestSweepTmpBlobs:
+    def test_deletes_only_old_blobs(self):
+        now = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+        def blob(name, age_minutes):
+            b = MagicMock()
+            b.name = name
+            b.last_modified = now - timedelta(minutes=age_minutes)
+            return b
+
+        client = MagicMock()
+        container = client.get_container_client.return_value
+        container.list_blobs.return_value = [
+            blob("_tmp/handoff/old.png", 300), blob("_tmp/handoff/new.png", 5),
+        ]
+
+        assert sweep_tmp_blobs(180, client=client, now=now) == 1
+        container.list_blobs.assert_called_once_with(name_starts_with="_tmp/")
+        container.delete_blob.assert_called_once_with("_tmp/handoff/old.png")
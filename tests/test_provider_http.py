@@ -0,0 +1,129 @@
+"""
+Tests for the shared provider HTTP transport: retry policy, Retry-After,
+connection reuse and that providers route through it.
+"""
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from shared.provider_http import ProviderTransport, parse_retry_after
+
+
+def _transport(handler, **kwargs):
+    sleeps = []
+    t = ProviderTransport(transport=httpx.MockTransport(handler), sleep=sleeps.append,
+                          backoff_base=0.1, **kwargs)
+    return t, sleeps
+
+
+def _sequence(*responses):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        item = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    return handler, calls
+
+
+class TestRetries:
+    def test_retries_5xx_then_succeeds(self):
+        handler, calls = _sequence(httpx.Response(503), httpx.Response(200, content=b"ok"))
+        t, sleeps = _transport(handler)
+        assert t.get("https://fal.run/x").content == b"ok"
+        assert len(calls) == 2
+        assert len(sleeps) == 1 and 0.05 <= sleeps[0] <= 0.1
+
+    def test_honours_retry_after(self):
+        handler, _ = _sequence(httpx.Response(429, headers={"Retry-After": "7"}), httpx.Response(200))
+        t, sleeps = _transport(handler)
+        t.post("https://fal.run/x", json={})
+        assert sleeps == [7.0]
+
+    def test_retry_after_capped(self):
+        handler, _ = _sequence(httpx.Response(429, headers={"Retry-After": "3600"}), httpx.Response(200))
+        t, sleeps = _transport(handler, backoff_max=5)
+        t.get("https://fal.run/x")
+        assert sleeps == [5]
+
+    def test_gives_up_and_returns_last_response(self):
+        handler, calls = _sequence(httpx.Response(502))
+        t, _ = _transport(handler, max_retries=2)
+        assert t.get("https://fal.run/x").status_code == 502
+        assert len(calls) == 3
+
+    def test_client_errors_not_retried(self):
+        handler, calls = _sequence(httpx.Response(400))
+        t, sleeps = _transport(handler)
+        assert t.get("https://fal.run/x").status_code == 400
+        assert len(calls) == 1 and sleeps == []
+
+    def test_connect_errors_retried_then_raised(self):
+        handler, calls = _sequence(httpx.ConnectError("refused"))
+        t, _ = _transport(handler, max_retries=1)
+        with pytest.raises(httpx.ConnectError):
+            t.get("https://fal.run/x")
+        assert len(calls) == 2
+
+    def test_dropped_connection_retried_for_get(self):
+        handler, calls = _sequence(httpx.RemoteProtocolError("peer closed"), httpx.Response(200))
+        t, _ = _transport(handler)
+        assert t.get("https://queue.fal.run/x/requests/r1/status").status_code == 200
+        assert len(calls) == 2
+
+    def test_dropped_connection_not_retried_for_post(self):
+        # fal may already have accepted the submit; resending could bill twice
+        handler, calls = _sequence(httpx.RemoteProtocolError("peer closed"), httpx.Response(200))
+        t, _ = _transport(handler)
+        with pytest.raises(httpx.RemoteProtocolError):
+            t.post("https://queue.fal.run/x", json={})
+        assert len(calls) == 1
+
+    def test_read_timeout_not_retried(self):
+        handler, calls = _sequence(httpx.ReadTimeout("slow"))
+        t, _ = _transport(handler)
+        with pytest.raises(httpx.ReadTimeout):
+            t.post("https://fal.run/x")
+        assert len(calls) == 1
+
+
+class TestRetryAfterParsing:
+    def test_seconds_and_dates(self):
+        now = datetime(2025, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+        assert parse_retry_after("12") == 12.0
+        assert parse_retry_after("Wed, 01 Jan 2025 12:00:30 GMT", now=now) == 30.0
+        assert parse_retry_after("garbage") is None
+        assert parse_retry_after(None) is None
+
+
+class TestProvidersUseTransport:
+    def test_fal_generate_and_download_share_one_client(self):
+        def handler(request):
+            if request.url.host == "fal.run":
+                return httpx.Response(200, json={"images": [{"url": "https://v3.fal.media/out.png"}]})
+            return httpx.Response(200, content=b"png-bytes")
+
+        t, _ = _transport(handler)
+        from shared.image_generation import FalFlux2ProEditProvider
+
+        with patch("shared.image_generation.get_provider_transport", return_value=t), \
+                patch.object(t.client, "request", wraps=t.client.request) as spy:
+            out = FalFlux2ProEditProvider("key").generate("studio", image_url="https://blob/x.png")
+
+        assert out == b"png-bytes"
+        assert [c.args[0] for c in spy.call_args_list] == ["POST", "GET"]
+        assert spy.call_args_list[0].kwargs["timeout"].read == FalFlux2ProEditProvider.TIMEOUT
+
+    def test_remove_bg_uses_transport(self):
+        handler, calls = _sequence(httpx.Response(503), httpx.Response(200, content=b"cutout"))
+        t, _ = _transport(handler)
+        from shared.background_removal import RemoveBgProvider
+
+        with patch("shared.provider_http.get_provider_transport", return_value=t):
+            assert RemoveBgProvider("key").remove_background(b"img") == b"cutout"
+        assert len(calls) == 2
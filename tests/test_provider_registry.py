@@ -0,0 +1,125 @@
+"""
+Tests for the provider registry: instance reuse, rebuild on config change,
+metrics/concurrency proxy and image-gen resolution from settings.
+"""
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from shared import provider_registry
+from shared.provider_registry import (
+    InstrumentedProvider,
+    ProviderRegistry,
+    get_provider_registry,
+    image_gen_api_key_setting,
+    parse_limits,
+    resolve_image_gen_provider,
+)
+
+
+class FakeProvider:
+    supports_async = True
+
+    def __init__(self, name, api_key):
+        self.name = name
+        self.api_key = api_key
+
+    def generate(self, prompt, **kwargs):
+        if prompt == "boom":
+            raise RuntimeError("provider down")
+        return b"img"
+
+
+class TestRegistry:
+    def test_same_config_reuses_instance(self):
+        registry = ProviderRegistry()
+        a = registry.get("image_gen", "fal", FakeProvider, api_key="k1")
+        b = registry.get("image_gen", "fal", FakeProvider, api_key="k1")
+        assert a is b
+        assert registry.builds == 1 and registry.hits == 1
+
+    def test_config_change_rebuilds(self):
+        registry = ProviderRegistry()
+        a = registry.get("image_gen", "fal", FakeProvider, api_key="k1")
+        b = registry.get("image_gen", "fal", FakeProvider, api_key="k2")
+        assert a is not b and b.api_key == "k2"
+        assert registry.get("image_gen", "fal", FakeProvider, api_key="k2") is b
+
+    def test_snapshot_does_not_expose_credentials(self):
+        registry = ProviderRegistry()
+        registry.get("image_gen", "fal", FakeProvider, api_key="secret-key")
+        assert "secret-key" not in repr(registry._slots) + repr(registry.snapshot())
+
+
+class TestConcurrencyLimits:
+    def test_parse_limits(self):
+        assert parse_limits(" fal-flux2=8, replicate=x, =3, hf=0") == {"fal-flux2": 8, "hf": 0}
+
+    def test_per_name_limits_come_from_settings(self):
+        from shared.config import settings
+        with patch.object(settings, "PROVIDER_MAX_CONCURRENCY", 4), \
+                patch.object(settings, "PROVIDER_CONCURRENCY_LIMITS", "fal-flux2=8,replicate=0"), \
+                patch.object(provider_registry, "_registry", None):
+            registry = get_provider_registry()
+            fal = registry.get("image_gen", "fal-flux2", FakeProvider, api_key="k")
+            replicate = registry.get("image_gen", "replicate", FakeProvider, api_key="k")
+            other = registry.get("image_gen", "hf", FakeProvider, api_key="k")
+        assert (fal.max_concurrency, replicate.max_concurrency, other.max_concurrency) == (8, 0, 4)
+
+
+class TestInstrumentedProvider:
+    def test_delegates_and_meters(self):
+        p = InstrumentedProvider(FakeProvider("fal", "k"))
+        assert p.name == "fal"
+        assert getattr(p, "supports_async", False) is True
+        assert p.generate("studio") == b"img"
+        with pytest.raises(RuntimeError):
+            p.generate("boom")
+        snap = p.snapshot()
+        assert snap["calls"] == 2 and snap["errors"] == 1 and snap["in_flight"] == 0
+
+    def test_caps_concurrency(self):
+        release = threading.Event()
+        peak, active, lock = [0], [0], threading.Lock()
+
+        class Slow(FakeProvider):
+            def generate(self, prompt, **kwargs):
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                release.wait(1)
+                with lock:
+                    active[0] -= 1
+                return b"img"
+
+        p = InstrumentedProvider(Slow("fal", "k"), max_concurrency=2)
+        threads = [threading.Thread(target=p.generate, args=("x",)) for _ in range(5)]
+        for t in threads:
+            t.start()
+        release.set()
+        for t in threads:
+            t.join()
+        assert peak[0] <= 2
+        assert p.snapshot()["calls"] == 5
+
+
+class TestResolveImageGenProvider:
+    def test_api_key_setting_names(self):
+        assert image_gen_api_key_setting("fal-flux2") == "FAL_API_KEY"
+        assert image_gen_api_key_setting("replicate") == "REPLICATE_API_KEY"
+
+    def test_resolves_from_settings_and_reuses(self):
+        values = {"IMAGE_GEN_PROVIDER": "fal-flux2", "FAL_API_KEY": "k1"}
+        with patch("shared.settings_service.get_setting", side_effect=lambda k: values.get(k, "")), \
+                patch.object(provider_registry, "_registry", ProviderRegistry()):
+            first = resolve_image_gen_provider()
+            assert first.name == "fal.ai/flux2-pro-edit"
+            assert resolve_image_gen_provider() is first
+
+            values["FAL_API_KEY"] = "k2"
+            rotated = resolve_image_gen_provider()
+            assert rotated is not first and rotated.api_key == "k2"
+
+            values["FAL_API_KEY"] = ""
+            assert resolve_image_gen_provider() is None
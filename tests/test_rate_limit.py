@@ -0,0 +1,136 @@
+"""
+Tests for the GCRA rate limiter: burst and refill, bounded memory, policy
+resolution per tenant and route class, Redis script results and
+RateLimit-* headers.
+"""
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from web_api import rate_limit
+from web_api.rate_limit import MemoryGCRA, RatePolicy, check_rate_limit, parse_policies, resolve_policy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 500.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMemoryGCRA:
+    def test_allows_burst_then_rejects(self):
+        store = MemoryGCRA(clock=FakeClock())
+        policy = RatePolicy(5, 60)
+        results = [store.check("u1", policy) for _ in range(6)]
+        assert [r.allowed for r in results] == [True] * 5 + [False]
+        assert [r.remaining for r in results[:5]] == [4, 3, 2, 1, 0]
+        assert results[5].retry_after == pytest.approx(12.0)
+        assert results[5].reset_after == pytest.approx(60.0)
+
+    def test_refills_at_sustained_rate(self):
+        clock = FakeClock()
+        store = MemoryGCRA(clock=clock)
+        policy = RatePolicy(5, 60)  # one request every 12s
+        for _ in range(5):
+            store.check("u1", policy)
+        clock.now += 11.9
+        assert not store.check("u1", policy).allowed
+        clock.now += 0.1
+        assert store.check("u1", policy).allowed
+        assert not store.check("u1", policy).allowed
+
+    def test_uneven_interval_still_allows_full_burst(self):
+        store = MemoryGCRA(clock=FakeClock())
+        policy = RatePolicy(7, 60)
+        assert sum(store.check("u1", policy).allowed for _ in range(8)) == 7
+
+    def test_memory_is_bounded(self):
+        store = MemoryGCRA(max_keys=3, clock=FakeClock())
+        policy = RatePolicy(1, 60)
+        for ip in ("a", "b", "c"):
+            store.check(ip, policy)
+        store.check("a", policy)  # rejected, but marks "a" recently seen
+        store.check("d", policy)
+        assert len(store) == 3
+        # "b" was evicted and starts fresh; "a" is still limited
+        assert store.check("b", policy).allowed
+        assert not store.check("a", policy).allowed
+
+
+class TestPolicies:
+    def test_parse(self):
+        policies = parse_policies(" uploads=30, pixel=600/10,bad=x, =5, jobs=0")
+        assert policies == {"uploads": RatePolicy(30, 60), "pixel": RatePolicy(600, 10)}
+
+    def test_resolution_order(self):
+        with patch.object(rate_limit, "_route_policies", {"uploads": RatePolicy(10)}), \
+                patch.object(rate_limit, "_tenant_policies",
+                             {"t_big": RatePolicy(600), "t_big:uploads": RatePolicy(100)}):
+            assert resolve_policy("t_big", "uploads", 60) == (RatePolicy(100), True)
+            assert resolve_policy("t_small", "uploads", 60) == (RatePolicy(10), True)
+            assert resolve_policy("t_big", "jobs", 60) == (RatePolicy(600), False)
+            assert resolve_policy("t_small", "jobs", 60) == (RatePolicy(60), False)
+
+    def test_route_class_gets_own_bucket(self):
+        request = MagicMock()
+        request.url.path = "/v1/uploads/sas"
+        with patch.object(rate_limit, "_memory", MemoryGCRA()), \
+                patch.object(rate_limit, "_route_policies", {"uploads": RatePolicy(1)}):
+            check_rate_limit("u1", request=request)
+            with pytest.raises(HTTPException) as exc_info:
+                check_rate_limit("u1", request=request)
+            # Other routes still have the default budget
+            check_rate_limit("u1")
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.headers["RateLimit-Limit"] == "1"
+        assert exc_info.value.headers["Retry-After"] == "60"
+
+
+class TestRedisBackend:
+    def test_uses_single_script_call(self):
+        script = MagicMock(return_value=[1, 2000, 0])
+        with patch.object(rate_limit, "_get_redis", return_value=MagicMock()), \
+                patch.object(rate_limit, "_redis_script", script):
+            result = check_rate_limit("u1", limit=30)
+        script.assert_called_once_with(keys=["gcra:u1"], args=[2000, 60000])
+        assert result.allowed
+        assert result.remaining == 29
+
+    def test_rejection_carries_retry_after(self):
+        script = MagicMock(return_value=[0, 60000, 1500])
+        with patch.object(rate_limit, "_get_redis", return_value=MagicMock()), \
+                patch.object(rate_limit, "_redis_script", script):
+            with pytest.raises(HTTPException) as exc_info:
+                check_rate_limit("u1", limit=30)
+        assert exc_info.value.headers["Retry-After"] == "2"
+        assert exc_info.value.headers["RateLimit-Remaining"] == "0"
+
+    def test_redis_error_falls_back_to_memory(self):
+        script = MagicMock(side_effect=ConnectionError("down"))
+        with patch.object(rate_limit, "_get_redis", return_value=MagicMock()), \
+                patch.object(rate_limit, "_redis_script", script), \
+                patch.object(rate_limit, "_memory", MemoryGCRA()) as store:
+            assert check_rate_limit("u1", limit=30).allowed
+        assert len(store) == 1
+
+
+@patch("web_api.rate_limit._memory", MemoryGCRA())
+@patch("web_api.auth.settings")
+def test_responses_carry_ratelimit_headers(mock_settings):
+    from web_api.main import app
+    app.dependency_overrides.clear()
+    mock_settings.API_KEYS = "dev_testkey123"
+    mock_settings.ENTRA_ISSUER = ""
+    client = TestClient(app)
+
+    with patch("web_api.routes_billing.get_user_by_id", return_value={"token_balance": 999999, "is_admin": True}):
+        first = client.get("/v1/billing/balance", headers={"X-API-Key": "dev_testkey123"})
+        second = client.get("/v1/billing/balance", headers={"X-API-Key": "dev_testkey123"})
+    assert first.headers["RateLimit-Limit"] == "60"
+    assert first.headers["RateLimit-Remaining"] == "59"
+    assert second.headers["RateLimit-Remaining"] == "58"
+    assert int(second.headers["RateLimit-Reset"]) == 2
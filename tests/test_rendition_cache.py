@@ -0,0 +1,158 @@
+"""
+Tests for cached format-export renditions: reuse across exports, preset
+versioning, invalidation on a new item output, and cleanup with the job.
+"""
+import io
+import zipfile
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared import db_sqlalchemy
+from shared.db import Base
+from shared.export_presets import ExportPreset, get_preset
+from shared.models import BlobDeletion, ExportRendition, ItemStatus, Job, JobItem, JobStatus
+from shared.renditions import RenditionPool, rendition_version
+from shared.storage import BlockBlobWriter
+from export_worker import worker as export_worker
+from export_worker import rendition_cache
+
+
+class FakeBlockBlob:
+    def __init__(self):
+        self.staged = {}
+        self.committed = None
+
+    def stage_block(self, block_id, data):
+        self.staged[block_id] = bytes(data)
+
+    def commit_block_list(self, blocks, content_settings=None):
+        self.committed = b"".join(self.staged[b.id] for b in blocks)
+
+
+def _png() -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (60, 40), "red").save(buf, "PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def env():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[Job.__table__, JobItem.__table__, ExportRendition.__table__,
+                                            BlobDeletion.__table__])
+    Session = sessionmaker(bind=engine)
+    with Session() as s:
+        s.add(Job(id="job1", tenant_id="t1", brand_profile_id="default", correlation_id="c",
+                  status=JobStatus.completed))
+        s.add_all(JobItem(id=f"i{n}", job_id="job1", tenant_id="t1", filename=f"shoe{n}.jpg",
+                          status=ItemStatus.completed, output_blob_path=f"t1/out/{n}.png")
+                  for n in range(2))
+        s.commit()
+
+    blobs = {"t1/out/0.png": _png(), "t1/out/1.png": _png()}
+    downloads = []
+
+    def download(container, path):
+        downloads.append(path)
+        return blobs[path]
+
+    def upload(container, path, data, content_type=None):
+        blobs[path] = data
+
+    state = {"zip": None}
+
+    def writer(container, path, **kw):
+        blob = FakeBlockBlob()
+        state["zip"] = blob
+        return BlockBlobWriter(blob)
+
+    with patch.object(export_worker, "SessionLocal", Session), \
+            patch.object(db_sqlalchemy, "SessionLocal", Session), \
+            patch.object(export_worker, "_renditions", RenditionPool(1)), \
+            patch.object(export_worker, "download_blob", side_effect=download), \
+            patch.object(rendition_cache, "upload_blob", side_effect=upload), \
+            patch.object(export_worker, "open_blob_writer", side_effect=writer):
+        yield {"Session": Session, "blobs": blobs, "downloads": downloads, "state": state}
+
+
+def _export(env, keys):
+    env["downloads"].clear()
+    rendered = []
+    real = rendition_cache.RenditionCache.store
+
+    def spy(self, item, preset, data):
+        rendered.append((item.id, preset.key))
+        return real(self, item, preset, data)
+
+    with patch.object(rendition_cache.RenditionCache, "store", spy):
+        path = export_worker.process_format_export("job1", "t1", keys)
+    names = zipfile.ZipFile(io.BytesIO(env["state"]["zip"].committed)).namelist()
+    return path, sorted(rendered), sorted(names)
+
+
+class TestReuse:
+    def test_second_export_only_renders_new_preset(self, env):
+        _, rendered, _ = _export(env, ["shopify", "amazon_main"])
+        assert len(rendered) == 4
+
+        _, rendered, names = _export(env, ["shopify", "amazon_main", "etsy"])
+        assert rendered == [("i0", "etsy"), ("i1", "etsy")]
+        assert len(names) == 6
+        # Outputs are only downloaded for items with a preset to render
+        assert sum(p.startswith("t1/out/") for p in env["downloads"]) == 2
+
+        _, rendered, names = _export(env, ["etsy"])
+        assert rendered == [] and names == ["etsy/shoe0.jpg", "etsy/shoe1.jpg"]
+        assert not any(p.startswith("t1/out/") for p in env["downloads"])
+
+    def test_rendition_blob_layout(self, env):
+        _export(env, ["web_large"])
+        version = rendition_version(get_preset("web_large"))
+        assert f"t1/jobs/job1/items/i0/renditions/web_large-{version}.png" in env["blobs"]
+
+    def test_new_item_output_invalidates(self, env):
+        _export(env, ["shopify"])
+        with env["Session"]() as s:
+            s.get(JobItem, "i0").output_blob_path = "t1/out/0b.png"
+            s.commit()
+        env["blobs"]["t1/out/0b.png"] = _png()
+        _, rendered, _ = _export(env, ["shopify"])
+        assert rendered == [("i0", "shopify")]
+
+    def test_unreadable_cached_blob_is_rerendered(self, env):
+        _export(env, ["shopify"])
+        version = rendition_version(get_preset("shopify"))
+        del env["blobs"][f"t1/jobs/job1/items/i1/renditions/shopify-{version}.jpg"]
+        _, rendered, names = _export(env, ["shopify"])
+        assert rendered == [("i1", "shopify")] and len(names) == 2
+
+
+class TestVersioning:
+    def test_version_tracks_preset_spec(self):
+        a = ExportPreset("A", "a", 100, 100, "white", "contain", 90)
+        assert rendition_version(a) == rendition_version(ExportPreset("B", "a", 100, 100, "white", "contain", 90))
+        assert rendition_version(a) != rendition_version(ExportPreset("A", "a", 100, 100, "white", "contain", 80))
+
+    def test_lookup_ignores_other_versions(self, env):
+        _export(env, ["shopify"])
+        versions = {"shopify": "0" * 12}
+        assert db_sqlalchemy.get_export_renditions("job1", versions) == {}
+
+
+class TestCleanup:
+    def test_delete_job_cascade_returns_rendition_blobs(self, env):
+        _export(env, ["shopify", "web_large"])
+        result = db_sqlalchemy.delete_job_cascade("job1")
+        renditions = [p for c, p in result["blob_paths"] if "/renditions/" in p]
+        assert len(renditions) == 4
+        with env["Session"]() as s:
+            assert s.query(ExportRendition).count() == 0
+            # Queued in the cascade's own transaction
+            queued = {(r.container, r.blob_path) for r in s.query(BlobDeletion).all()}
+        assert queued == set(result["blob_paths"])
+        assert result["blobs_queued"] == len(result["blob_paths"])
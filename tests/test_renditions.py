@@ -0,0 +1,156 @@
+"""Tests for the decode-once rendition engine (shared.renditions)."""
+import io
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+from shared.export_presets import PRESETS, ExportPreset, get_preset
+from shared.image_resize import resize_image
+from shared.renditions import Pyramid, RenditionPool, render_presets
+
+
+def _product_png(width=2600, height=2200) -> bytes:
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGBA")
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((width * 0.2, height * 0.2, width * 0.8, height * 0.9), fill=(200, 40, 50, 255))
+    for x in range(0, width, 37):
+        draw.line((x, 0, x, height), fill=(20, 120, 200, 180), width=3)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class FakeExecutor:
+    """Renders inline; ``broken`` fails results like a pool whose worker died,
+    ``submit_error`` is raised from submit itself."""
+
+    def __init__(self, broken=False, submit_error=None):
+        self.broken = broken
+        self.submit_error = submit_error
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        if self.submit_error is not None:
+            raise self.submit_error
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("worker died"))
+        else:
+            future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def _mean_diff(a: bytes, b: bytes) -> float:
+    ia = Image.open(io.BytesIO(a)).convert("RGBA")
+    ib = Image.open(io.BytesIO(b)).convert("RGBA")
+    assert ia.size == ib.size
+    return max(ImageStat.Stat(ImageChops.difference(ia, ib)).mean)
+
+
+class TestPyramid:
+    def test_picks_smallest_level_at_least_twice_target(self):
+        pyramid = Pyramid(Image.new("RGB", (4001, 3000)))
+        level, factor = pyramid.level_for(400, 300)
+        assert factor == 4 and level.size == (1001, 750)
+        level, factor = pyramid.level_for(1600, 1600)
+        assert factor == 1
+
+    def test_levels_built_once(self):
+        pyramid = Pyramid(Image.new("RGB", (4000, 4000)))
+        pyramid.level_for(400, 400)
+        built = list(pyramid.levels)
+        pyramid.level_for(900, 900)
+        assert pyramid.levels == built
+
+    def test_resize_maps_odd_edges_exactly(self):
+        img = Image.new("RGB", (2001, 1001), "white")
+        img.paste((0, 0, 0), (2000, 0, 2001, 1001))  # 1px black right edge
+        out = Pyramid(img).resize(img, (500, 250))
+        assert out.size == (500, 250)
+        assert out.getpixel((0, 125)) == (255, 255, 255)
+
+
+class TestRenderPresets:
+    def test_matches_resize_image_for_every_preset(self):
+        data = _product_png()
+        renditions = render_presets(data, list(PRESETS.values()))
+        assert list(renditions) == list(PRESETS)
+        for key, preset in PRESETS.items():
+            # Thin stripes are a worst case for the box reduce; product shots stay < 0.3
+            assert _mean_diff(renditions[key], resize_image(data, preset)) < 2.0, key
+
+    def test_decodes_once(self):
+        data = _product_png(800, 800)
+        with patch("shared.renditions.Image.open", wraps=Image.open) as opened:
+            render_presets(data, list(PRESETS.values()))
+        assert opened.call_count == 1
+
+    def test_failed_preset_is_skipped(self):
+        bad = ExportPreset("Bad", "bad", 100, 100, "#zz", "contain", 90)
+        renditions = render_presets(_product_png(300, 300), [bad, get_preset("web_thumb")])
+        assert list(renditions) == ["web_thumb"]
+
+    def test_undecodable_image_raises(self):
+        with pytest.raises(Exception):
+            render_presets(b"not an image", [get_preset("web_thumb")])
+
+
+class TestRenditionPool:
+    def test_in_process_keeps_order_and_passes_failures_through(self):
+        presets = [get_preset("web_thumb"), get_preset("web_large")]
+        sources = [("a", _product_png(300, 300)), ("b", None), ("c", b"junk")]
+        results = list(RenditionPool(1).render_many(sources, presets))
+        assert [key for key, _ in results] == ["a", "b", "c"]
+        assert list(results[0][1]) == ["web_thumb", "web_large"]
+        assert results[1][1] is None
+        assert isinstance(results[2][1], Exception)
+
+    def test_process_pool_splits_presets_for_small_batches(self):
+        presets = [get_preset(k) for k in ("web_thumb", "web_large", "facebook_ad")]
+        data = _product_png(600, 600)
+        pool = RenditionPool(2)
+        try:
+            results = list(pool.render_many([("a", data), ("b", None)], presets, total=1))
+        finally:
+            pool.shutdown()
+        assert [key for key, _ in results] == ["a", "b"]
+        assert list(results[0][1]) == ["web_thumb", "web_large", "facebook_ad"]
+        for preset in presets:
+            assert _mean_diff(results[0][1][preset.key], resize_image(data, preset)) < 1.0
+
+    def test_broken_pool_fails_its_items_and_is_rebuilt(self):
+        presets = [get_preset("web_thumb")]
+        data = _product_png(300, 300)
+        executors = [FakeExecutor(broken=True), FakeExecutor()]
+        pool = RenditionPool(2)
+        with patch.object(pool, "_new_executor", side_effect=executors):
+            first = list(pool.render_many([("a", data)], presets))
+            second = list(pool.render_many([("b", data)], presets))
+        assert isinstance(first[0][1], BrokenProcessPool)
+        assert executors[0].shut_down
+        assert list(second[0][1]) == ["web_thumb"]
+
+    def test_submit_errors_are_returned_per_item(self):
+        presets = [get_preset("web_thumb")]
+        data = _product_png(300, 300)
+        # A pool found broken at submit is replaced and the submit retried
+        executors = [FakeExecutor(submit_error=BrokenProcessPool("worker died")), FakeExecutor()]
+        pool = RenditionPool(2)
+        with patch.object(pool, "_new_executor", side_effect=executors):
+            results = list(pool.render_many([("a", data)], presets))
+        assert list(results[0][1]) == ["web_thumb"]
+
+        # Any other submit error is that item's result; the generator goes on
+        pool = RenditionPool(2)
+        failing = FakeExecutor(submit_error=RuntimeError("cannot pickle"))
+        with patch.object(pool, "_new_executor", return_value=failing):
+            results = list(pool.render_many([("a", data), ("b", None)], presets))
+        assert [key for key, _ in results] == ["a", "b"]
+        assert isinstance(results[0][1], RuntimeError)
+        assert results[1][1] is None
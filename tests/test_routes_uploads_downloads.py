@@ -146,3 +146,90 @@ class TestExportDownload:
         mock_job.return_value = None
         resp = client.get("/v1/downloads/jobs/job_missing/export")
         assert resp.status_code == 404
+
+
+# ── GET /v1/downloads/jobs/{job_id}/urls ──────────────────────────
+
+class TestJobDownloadUrls:
+    @patch("web_api.routes_downloads.generate_download_url")
+    @patch("web_api.routes_downloads.get_job_items")
+    @patch("web_api.routes_downloads.get_job_by_id")
+    def test_urls_for_all_items(self, mock_job, mock_items, mock_sas, client):
+        mock_job.return_value = {"id": "job_1", "tenant_id": "tenant_test"}
+        mock_items.return_value = [
+            {"id": "i1", "filename": "a.jpg", "status": "completed", "output_blob_path": "t/out/a.png"},
+            {"id": "i2", "filename": "b.jpg", "status": "processing", "output_blob_path": None},
+        ]
+        mock_sas.side_effect = lambda bucket, path, expires_in: f"https://example.com/{path}?sig=abc"
+
+        resp = client.get("/v1/downloads/jobs/job_1/urls")
+        assert resp.status_code == 200
+        items = resp.json()["items"]
+        assert items[0]["download_url"] == "https://example.com/t/out/a.png?sig=abc"
+        assert items[1]["download_url"] is None
+        assert mock_sas.call_count == 1
+
+    @patch("web_api.routes_downloads.get_job_by_id")
+    def test_urls_job_not_found(self, mock_job, client):
+        mock_job.return_value = None
+        resp = client.get("/v1/downloads/jobs/job_missing/urls")
+        assert resp.status_code == 404
+
+
+# ── POST /v1/uploads/direct ───────────────────────────────────────
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b""
+        self.committed = False
+        self.aborted = False
+
+    def write(self, chunk):
+        self.data += chunk
+
+    def close(self):
+        self.committed = True
+
+    def abort(self):
+        self.aborted = True
+
+
+class TestUploadDirect:
+    @patch("web_api.routes_uploads.update_job_item")
+    @patch("web_api.routes_uploads.get_job_items_by_filename")
+    @patch("web_api.routes_uploads.open_blob_writer")
+    @patch("web_api.routes_uploads.get_job_item")
+    @patch("web_api.routes_uploads.get_job_by_id")
+    def test_streams_file_to_staged_blocks(self, mock_job, mock_item, mock_writer, mock_siblings,
+                                           mock_update, client):
+        mock_job.return_value = {"id": "job_1", "tenant_id": "tenant_test"}
+        mock_item.return_value = {"id": "item_1", "tenant_id": "tenant_test", "job_id": "job_1",
+                                  "filename": "test.jpg"}
+        mock_siblings.return_value = [{"id": "item_1"}]
+        writer = FakeWriter()
+        mock_writer.return_value = writer
+        body = b"\xff\xd8" + b"x" * (9 * 1024 * 1024)
+
+        resp = client.post("/v1/uploads/direct", data={"job_id": "job_1", "item_id": "item_1"},
+                           files={"file": ("test.jpg", body, "image/jpeg")})
+        assert resp.status_code == 200
+        assert writer.data == body and writer.committed and not writer.aborted
+        assert mock_writer.call_args.kwargs["content_type"] == "image/jpeg"
+        mock_update.assert_called_once_with("item_1", {"raw_blob_path": ANY, "status": "uploaded"})
+
+    @patch("web_api.routes_uploads.update_job_item")
+    @patch("web_api.routes_uploads.open_blob_writer")
+    @patch("web_api.routes_uploads.get_job_item")
+    @patch("web_api.routes_uploads.get_job_by_id")
+    def test_too_large_aborts_without_commit(self, mock_job, mock_item, mock_writer, mock_update, client):
+        mock_job.return_value = {"id": "job_1", "tenant_id": "tenant_test"}
+        mock_item.return_value = {"id": "item_1", "tenant_id": "tenant_test", "job_id": "job_1",
+                                  "filename": "test.jpg"}
+        writer = FakeWriter()
+        mock_writer.return_value = writer
+
+        resp = client.post("/v1/uploads/direct", data={"job_id": "job_1", "item_id": "item_1"},
+                           files={"file": ("test.jpg", b"x" * (50 * 1024 * 1024 + 1), "image/jpeg")})
+        assert resp.status_code == 413
+        assert writer.aborted and not writer.committed
+        mock_update.assert_not_called()
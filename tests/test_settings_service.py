@@ -0,0 +1,113 @@
+"""
+Tests for the cached settings service: TTL snapshot, env fallback, and
+invalidation on admin setting writes.
+"""
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared import db_sqlalchemy, settings_service
+from shared.db import Base
+from shared.models import AdminSetting
+from shared.settings_service import SettingsCache, get_setting
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSettingsCache:
+    def test_one_load_per_ttl(self):
+        loads = []
+        clock = FakeClock()
+        cache = SettingsCache(lambda: loads.append(1) or {"A": "1"}, ttl=30, clock=clock)
+        assert cache.get("A") == "1"
+        assert cache.get("B") is None
+        clock.now = 29
+        cache.get("A")
+        assert len(loads) == 1
+        clock.now = 31
+        cache.get("A")
+        assert len(loads) == 2
+
+    def test_invalidate_forces_reload(self):
+        values = {"A": "1"}
+        cache = SettingsCache(lambda: dict(values), ttl=30, clock=FakeClock())
+        assert cache.get("A") == "1"
+        values["A"] = "2"
+        assert cache.get("A") == "1"
+        cache.invalidate()
+        assert cache.get("A") == "2"
+
+    def test_loader_failure_keeps_last_snapshot(self):
+        clock = FakeClock()
+        state = {"fail": False}
+
+        def loader():
+            if state["fail"]:
+                raise RuntimeError("db down")
+            return {"A": "1"}
+
+        cache = SettingsCache(loader, ttl=30, clock=clock)
+        assert cache.get("A") == "1"
+        state["fail"] = True
+        clock.now = 60
+        assert cache.get("A") == "1"
+
+    def test_failed_first_load_is_retried_on_next_call(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("db down")
+            return {"A": "1"}
+
+        cache = SettingsCache(loader, ttl=30, clock=FakeClock())
+        assert cache.get("A") is None  # env fallback, not cached
+        assert cache.get("A") == "1"
+        assert len(calls) == 2
+
+    def test_invalidation_during_load_is_not_cached(self):
+        cache = SettingsCache(lambda: cache.invalidate() or {"A": "old"}, ttl=30, clock=FakeClock())
+        assert cache.get("A") == "old"
+        assert cache.loads == 1
+        cache.get("A")
+        assert cache.loads == 2
+
+
+class TestGetSetting:
+    def _db(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False},
+                               poolclass=StaticPool)
+        Base.metadata.create_all(engine, tables=[AdminSetting.__table__])
+        return sessionmaker(bind=engine)
+
+    def test_writes_invalidate_and_hot_path_skips_db(self):
+        Session = self._db()
+        with patch.object(db_sqlalchemy, "SessionLocal", Session), \
+                patch.object(settings_service._cache, "ttl", 3600):
+            assert get_setting("FAL_ENDPOINT") == ""
+
+            db_sqlalchemy.upsert_admin_setting("FAL_ENDPOINT", "flux-2-pro", user_id=None)
+            assert get_setting("FAL_ENDPOINT") == "flux-2-pro"
+
+            loads = settings_service._cache.loads
+            with patch.object(db_sqlalchemy, "SessionLocal", side_effect=AssertionError("DB hit")):
+                for _ in range(10):
+                    assert get_setting("FAL_ENDPOINT") == "flux-2-pro"
+            assert settings_service._cache.loads == loads
+
+            db_sqlalchemy.delete_admin_setting("FAL_ENDPOINT")
+            assert get_setting("FAL_ENDPOINT") == ""
+
+    def test_falls_back_to_env(self):
+        with patch.object(db_sqlalchemy, "SessionLocal", side_effect=RuntimeError("no db")):
+            assert get_setting("OUTPUT_FORMAT") == "png"
+            assert get_setting("NOT_A_SETTING") == ""
@@ -0,0 +1,255 @@
+"""
+Tests for shared bg-removal cutouts: items fanned out from one source image
+compute the cutout once and every sibling reuses it.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from shared.db import Base
+from shared.models import BlobDeletion, CutoutClaim, ExportRendition, Job, JobItem, JobStatus, ItemStatus
+from shared.storage import build_cutout_blob_path
+from pipeline_worker.cutouts import SharedCutoutStore
+from pipeline_worker.pipeline import execute_pipeline
+
+RAW_PATH = "t1/jobs/job_1/items/item_a/raw/shoe.jpg"
+
+
+def _png(color=(255, 0, 0, 128)):
+    from PIL import Image
+    buf = BytesIO()
+    Image.new("RGBA", (2, 2), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class FakeBlobs:
+    """In-memory blob container addressed by 'container/path' URLs."""
+
+    def __init__(self):
+        self.blobs = {}
+        self.uploads = 0
+
+    def read_url(self, container, blob_path):
+        return f"{container}/{blob_path}"
+
+    write_url = read_url
+
+    def download(self, url):
+        if url not in self.blobs:
+            request = httpx.Request("GET", url)
+            raise httpx.HTTPStatusError("404", request=request,
+                                        response=httpx.Response(404, request=request))
+        return self.blobs[url]
+
+    def upload(self, url, data):
+        self.uploads += 1
+        self.blobs[url] = data
+
+
+class FakeClaims:
+    """Cross-replica claim table: path -> holder."""
+
+    def __init__(self):
+        self.held = {}
+        self.calls = []
+
+    def claim(self, path):
+        self.calls.append(path)
+        return self.held.setdefault(path, "us") == "us"
+
+    def release(self, path):
+        if self.held.get(path) == "us":
+            del self.held[path]
+
+
+def _store(blobs, claims=None, **kw):
+    claims = claims or FakeClaims()
+    return SharedCutoutStore(blobs.read_url, blobs.write_url, blobs.download, blobs.upload,
+                             claim=claims.claim, release=claims.release, **kw)
+
+
+class TestCutoutPath:
+    def test_maps_raw_blob_to_bg_cutout(self):
+        assert build_cutout_blob_path(RAW_PATH) == "t1/jobs/job_1/items/item_a/bg/shoe_cutout.png"
+
+    def test_rejects_non_raw_path(self):
+        with pytest.raises(ValueError):
+            build_cutout_blob_path("t1/jobs/job_1/items/item_a/outputs/out.png")
+
+
+class TestSharedCutoutStore:
+    def test_second_sibling_reuses_stored_cutout(self):
+        blobs = FakeBlobs()
+        store = _store(blobs)
+        compute = MagicMock(return_value=b"cutout")
+
+        assert store.get_or_create(RAW_PATH, compute) == b"cutout"
+        assert store.get_or_create(RAW_PATH, compute) == b"cutout"
+
+        compute.assert_called_once()
+        assert blobs.uploads == 1
+        assert (store.hits, store.misses) == (1, 1)
+
+    def test_concurrent_siblings_compute_once(self):
+        blobs = FakeBlobs()
+        store = _store(blobs)
+        calls = []
+        gate = threading.Barrier(4, timeout=5)
+
+        def compute():
+            calls.append(1)
+            return b"cutout"
+
+        def sibling(_):
+            gate.wait()
+            return store.get_or_create(RAW_PATH, compute)
+
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(sibling, range(4)))
+
+        assert results == [b"cutout"] * 4
+        assert len(calls) == 1
+        assert store._local_locks == {}
+
+    def test_upload_failure_still_returns_cutout(self):
+        blobs = FakeBlobs()
+        blobs.upload = MagicMock(side_effect=RuntimeError("storage down"))
+        store = _store(blobs)
+        assert store.get_or_create(RAW_PATH, lambda: b"cutout") == b"cutout"
+
+    def test_non_404_download_error_propagates(self):
+        request = httpx.Request("GET", "x")
+        error = httpx.HTTPStatusError("503", request=request, response=httpx.Response(503, request=request))
+        store = SharedCutoutStore(lambda **kw: "x", lambda **kw: "x",
+                                  MagicMock(side_effect=error), MagicMock(),
+                                  claim=lambda path: True, release=lambda path: None)
+        with pytest.raises(httpx.HTTPStatusError):
+            store.get_or_create(RAW_PATH, lambda: b"cutout")
+
+    def test_claim_is_released_after_compute(self):
+        blobs, claims = FakeBlobs(), FakeClaims()
+        store = _store(blobs, claims)
+        store.get_or_create(RAW_PATH, lambda: b"cutout")
+        assert claims.calls == [build_cutout_blob_path(RAW_PATH)]
+        assert claims.held == {}
+
+        with pytest.raises(RuntimeError):
+            store.get_or_create("t1/jobs/job_1/items/item_b/raw/hat.jpg", MagicMock(side_effect=RuntimeError))
+        assert claims.held == {}
+
+    def test_waits_for_sibling_on_another_replica(self):
+        blobs, claims = FakeBlobs(), FakeClaims()
+        path = build_cutout_blob_path(RAW_PATH)
+        claims.held[path] = "other replica"
+        polls = []
+
+        def sleep(seconds):
+            polls.append(seconds)
+            if len(polls) == 2:  # the other replica finishes
+                blobs.blobs[f"outputs/{path}"] = b"theirs"
+                del claims.held[path]
+
+        compute = MagicMock()
+        store = _store(blobs, claims, poll_interval=0.5, sleep=sleep)
+        assert store.get_or_create(RAW_PATH, compute) == b"theirs"
+        compute.assert_not_called()
+        assert polls == [0.5, 0.5]
+
+    def test_claim_failure_computes_anyway(self):
+        blobs = FakeBlobs()
+        store = SharedCutoutStore(blobs.read_url, blobs.write_url, blobs.download, blobs.upload,
+                                  claim=MagicMock(side_effect=RuntimeError("db down")),
+                                  release=MagicMock(side_effect=RuntimeError("db down")))
+        assert store.get_or_create(RAW_PATH, lambda: b"cutout") == b"cutout"
+
+
+class TestCutoutClaims:
+    @pytest.fixture
+    def db(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(engine, tables=[CutoutClaim.__table__])
+        Session = sessionmaker(bind=engine)
+        from shared import db_sqlalchemy
+        with patch.object(db_sqlalchemy, "SessionLocal", Session):
+            yield Session
+
+    def test_one_owner_at_a_time(self, db):
+        from shared.db_sqlalchemy import claim_cutout, release_cutout_claim
+        assert claim_cutout("p", "w1", 300)
+        assert not claim_cutout("p", "w2", 300)
+        release_cutout_claim("p", "w2")  # not the holder: no-op
+        assert not claim_cutout("p", "w2", 300)
+        release_cutout_claim("p", "w1")
+        assert claim_cutout("p", "w2", 300)
+
+    def test_expired_lease_is_taken_over(self, db):
+        from shared.db_sqlalchemy import claim_cutout, release_cutout_claim
+        with db() as s:
+            s.add(CutoutClaim(blob_path="p", owner="dead", expires_at=datetime.utcnow() - timedelta(seconds=1)))
+            s.commit()
+        assert claim_cutout("p", "w1", 300)
+        release_cutout_claim("p", "dead")  # the old holder waking up does not drop it
+        with db() as s:
+            assert s.get(CutoutClaim, "p").owner == "w1"
+
+
+class TestPipelineSharedCutout:
+    def test_reused_cutout_skips_bg_provider(self):
+        bg = MagicMock()
+        bg.name = "mock-bg"
+        cutout = _png()
+
+        result = execute_pipeline(
+            raw_bytes=b"raw", remove_background=True, generate_scene=False, upscale=False,
+            scene_prompt=None, bg_provider=bg,
+            shared_cutout=lambda compute: cutout,
+        )
+
+        bg.remove_background.assert_not_called()
+        assert result.output_bytes == cutout
+
+    def test_first_sibling_computes_through_provider(self):
+        bg = MagicMock()
+        bg.name = "mock-bg"
+        bg.remove_background.return_value = b"fresh"
+
+        result = execute_pipeline(
+            raw_bytes=b"raw", remove_background=True, generate_scene=False, upscale=False,
+            scene_prompt=None, bg_provider=bg,
+            shared_cutout=lambda compute: compute(),
+        )
+
+        bg.remove_background.assert_called_once_with(b"raw")
+        assert result.output_bytes == b"fresh"
+        assert "bg_removal" in result.step_timings
+
+
+def test_delete_job_cascade_includes_shared_cutouts():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine, tables=[Job.__table__, JobItem.__table__, ExportRendition.__table__,
+                                            BlobDeletion.__table__])
+    Session = sessionmaker(bind=engine)
+    now = datetime.utcnow()
+    with Session() as s:
+        s.add(Job(id="job_1", tenant_id="t1", brand_profile_id="default", correlation_id="c",
+                  status=JobStatus.completed, created_at=now, updated_at=now))
+        for idx in range(3):
+            s.add(JobItem(id=f"item_{idx}", job_id="job_1", tenant_id="t1", filename="shoe.jpg",
+                          status=ItemStatus.completed, raw_blob_path=RAW_PATH, scene_index=idx,
+                          created_at=now, updated_at=now))
+        s.commit()
+
+    from shared import db_sqlalchemy
+    with patch.object(db_sqlalchemy, "SessionLocal", Session):
+        result = db_sqlalchemy.delete_job_cascade("job_1")
+
+    assert result["items_deleted"] == 3
+    assert result["blob_paths"].count(("outputs", build_cutout_blob_path(RAW_PATH))) == 1
+    assert result["blob_paths"].count(("raw", RAW_PATH)) == 1
@@ -0,0 +1,231 @@
+"""
+Tests for the content-addressed step result cache: keying, hit/miss
+accounting in step_timings, provider skipping, TTL and eviction.
+"""
+from datetime import datetime, timedelta
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from shared.db import Base
+from shared.models import StepCacheEntry
+from pipeline_worker.pipeline import execute_pipeline
+from pipeline_worker.step_cache import HitBuffer, StepCache, step_cache_key
+
+
+def _png(color=(255, 0, 0, 128), size=(4, 4)):
+    from PIL import Image
+    buf = BytesIO()
+    Image.new("RGBA", size, color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class MemoryCache:
+    """StepCache backed by dicts instead of blob storage + the index table."""
+
+    def __init__(self, tenant_id="t1"):
+        self.blobs = {}
+        self.index = {}
+        self.hits = []
+        self.cache = StepCache(
+            tenant_id,
+            read_url=lambda container, blob_path: blob_path,
+            write_url=lambda container, blob_path: blob_path,
+            download=self.blobs.__getitem__,
+            upload=self.blobs.__setitem__,
+            ttl_days=30,
+            lookup=lambda tenant, key: self.index.get((tenant, key)),
+            record=lambda tenant, key, step, path, size, ttl: self.index.__setitem__((tenant, key), path),
+            hits=HitBuffer(self.hits.append),
+        )
+
+
+def _bg_provider(output):
+    bg = MagicMock()
+    bg.name = "mock-bg"
+    bg.remove_background.return_value = output
+    return bg
+
+
+class TestCacheKey:
+    def test_depends_on_bytes_and_params(self):
+        base = step_cache_key("bg_removal", b"img", {"provider": "birefnet"})
+        assert base == step_cache_key("bg_removal", b"img", {"provider": "birefnet"})
+        assert base != step_cache_key("bg_removal", b"img2", {"provider": "birefnet"})
+        assert base != step_cache_key("bg_removal", b"img", {"provider": "rembg"})
+        assert base != step_cache_key("upscale", b"img", {"provider": "birefnet"})
+
+    def test_param_order_irrelevant(self):
+        a = step_cache_key("scene_edit", b"x", {"prompt": "p", "angle": "front"})
+        b = step_cache_key("scene_edit", b"x", {"angle": "front", "prompt": "p"})
+        assert a == b
+
+
+class TestPipelineCaching:
+    def test_retry_wraps_execute_pipeline_not_cache_helper(self):
+        from pipeline_worker import pipeline
+        assert hasattr(pipeline.execute_pipeline, "retry")
+        assert not hasattr(pipeline._cached_step, "retry")
+
+    def test_repeat_upload_skips_provider(self):
+        mem = MemoryCache()
+        bg = _bg_provider(_png())
+        kwargs = dict(raw_bytes=b"raw", remove_background=True, generate_scene=False,
+                      upscale=False, scene_prompt=None, bg_provider=bg, step_cache=mem.cache)
+
+        first = execute_pipeline(**kwargs)
+        second = execute_pipeline(**kwargs)
+
+        bg.remove_background.assert_called_once()
+        assert first.output_bytes == second.output_bytes
+        assert first.step_timings["cache_misses"] == 1
+        assert second.step_timings["cache_hits"] == 1
+        assert "cache_misses" not in second.step_timings
+
+    def test_scenes_with_same_prompt_are_each_generated(self):
+        """scene_count=3 with a fixed prompt: siblings share the cutout, not the scene."""
+        mem = MemoryCache()
+        bg = _bg_provider(_png())
+        edit = MagicMock()
+        edit.name = "fal.ai/flux2-pro-edit"
+        edit.supports_edit = True
+        scenes = [_png((0, 0, c, 255)) for c in (100, 150, 200)]
+        edit.generate.side_effect = scenes
+        upload = MagicMock(return_value="https://blob.test/p.png")
+        kwargs = dict(raw_bytes=_png((1, 2, 3, 255), size=(8, 4)), remove_background=True,
+                      generate_scene=True, upscale=False, scene_prompt="studio",
+                      bg_provider=bg, img_gen_provider=edit, upload_tmp_image=upload,
+                      step_cache=mem.cache)
+
+        results = [execute_pipeline(**kwargs) for _ in range(3)]
+
+        assert edit.generate.call_count == 3
+        assert len({r.output_bytes for r in results}) == 3
+        bg.remove_background.assert_called_once()
+        assert [r.step_timings.get("cache_hits", 0) for r in results] == [0, 1, 1]
+
+    def test_tenants_are_isolated(self):
+        blobs, index = {}, {}
+
+        def cache_for(tenant):
+            return StepCache(
+                tenant, lambda **kw: kw["blob_path"], lambda **kw: kw["blob_path"],
+                blobs.__getitem__, blobs.__setitem__, ttl_days=1,
+                lookup=lambda t, k: index.get((t, k)),
+                record=lambda t, k, step, path, size, ttl: index.__setitem__((t, k), path),
+            )
+
+        compute = MagicMock(return_value=b"cutout")
+        cache_for("t1").run("bg_removal", b"img", {}, compute)
+        cache_for("t2").run("bg_removal", b"img", {}, compute)
+        assert compute.call_count == 2
+
+    def test_storage_failure_falls_back_to_provider(self):
+        cache = StepCache(
+            "t1", lambda **kw: "url", lambda **kw: "url",
+            download=MagicMock(side_effect=RuntimeError("storage down")),
+            upload=MagicMock(side_effect=RuntimeError("storage down")),
+            ttl_days=1, lookup=lambda t, k: "t1/cache/bg_removal/x", record=MagicMock(),
+        )
+        assert cache.run("bg_removal", b"img", {}, lambda: b"fresh") == b"fresh"
+
+
+@pytest.fixture
+def cache_db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine, tables=[StepCacheEntry.__table__])
+    Session = sessionmaker(bind=engine)
+    from shared import db_sqlalchemy
+    with patch.object(db_sqlalchemy, "SessionLocal", Session):
+        yield Session
+
+
+class TestHitBuffer:
+    def test_hits_are_batched(self):
+        mem = MemoryCache()
+        mem.cache.run("upscale", b"x", {}, lambda: b"out")
+        for _ in range(3):
+            assert mem.cache.run("upscale", b"x", {}, lambda: b"other") == b"out"
+
+        assert mem.hits == []  # nothing written per hit
+        buf = mem.cache._hits
+        assert buf.flush() == 1
+        [(entry, (count, _))] = mem.hits[0].items()
+        assert entry == ("t1", step_cache_key("upscale", b"x", {}))
+        assert count == 3
+        assert buf.flush() == 0
+
+    def test_failed_flush_is_retried(self):
+        calls = []
+
+        def writer(batch):
+            calls.append(dict(batch))
+            if len(calls) == 1:
+                raise RuntimeError("db down")
+
+        buf = HitBuffer(writer)
+        buf.record("t1", "k1", datetime(2026, 3, 1))
+        assert buf.flush() == 0
+        buf.record("t1", "k1", datetime(2026, 3, 2))
+        assert buf.flush() == 1
+        assert calls[1] == {("t1", "k1"): (2, datetime(2026, 3, 2))}
+
+
+class TestCacheIndex:
+    def test_hit_counts_and_ttl(self, cache_db):
+        from shared.db_sqlalchemy import get_step_cache_entry, put_step_cache_entry, record_step_cache_hits
+
+        put_step_cache_entry("t1", "k1", "bg_removal", "t1/cache/bg_removal/k1", 10, ttl_days=1)
+        assert get_step_cache_entry("t1", "k1") == "t1/cache/bg_removal/k1"
+        assert get_step_cache_entry("t2", "k1") is None
+        with cache_db() as s:
+            assert s.get(StepCacheEntry, ("t1", "k1")).hit_count == 0  # lookups don't write
+
+        later = datetime.utcnow() + timedelta(minutes=5)
+        record_step_cache_hits({("t1", "k1"): (3, later)})
+        with cache_db() as s:
+            entry = s.get(StepCacheEntry, ("t1", "k1"))
+            assert entry.hit_count == 3
+            assert entry.last_used_at == later
+            entry.expires_at = datetime.utcnow() - timedelta(seconds=1)
+            s.commit()
+        assert get_step_cache_entry("t1", "k1") is None
+
+    def test_evicts_expired_and_over_cap(self, cache_db):
+        from shared.db_sqlalchemy import evict_step_cache_entries
+
+        now = datetime.utcnow()
+        with cache_db() as s:
+            s.add(StepCacheEntry(tenant_id="t1", cache_key="old", step="upscale",
+                                 blob_path="t1/cache/upscale/old", created_at=now,
+                                 last_used_at=now, expires_at=now - timedelta(days=1)))
+            for i in range(3):
+                s.add(StepCacheEntry(tenant_id="t2", cache_key=f"k{i}", step="bg_removal",
+                                     blob_path=f"t2/cache/bg_removal/k{i}", created_at=now,
+                                     last_used_at=now - timedelta(hours=3 - i),
+                                     expires_at=now + timedelta(days=1)))
+            s.commit()
+
+        evicted = evict_step_cache_entries(max_entries_per_tenant=2)
+
+        assert sorted(evicted) == [("outputs", "t1/cache/upscale/old"),
+                                   ("outputs", "t2/cache/bg_removal/k0")]
+        with cache_db() as s:
+            assert s.query(StepCacheEntry).count() == 2
+
+
+@patch("pipeline_worker.worker.enqueue_blob_deletions")
+@patch("pipeline_worker.worker.evict_step_cache_entries", return_value=[("outputs", "t1/cache/upscale/k")])
+@patch("pipeline_worker.worker.flush_step_cache_hits")
+def test_worker_eviction_pass_flushes_hits_first(mock_flush, mock_evict, mock_enqueue):
+    from pipeline_worker import worker
+    calls = []
+    mock_flush.side_effect = lambda: calls.append("flush")
+    mock_evict.side_effect = lambda cap: calls.append("evict") or [("outputs", "t1/cache/upscale/k")]
+
+    assert worker.evict_step_cache() == 1
+    assert calls == ["flush", "evict"]
+    mock_enqueue.assert_called_once_with([("outputs", "t1/cache/upscale/k")], reason="step_cache")
@@ -0,0 +1,78 @@
+"""
+Tests for SAS signing in shared.storage: one blob client per process and a
+cached user delegation key that is refreshed before it expires or when a
+SAS needs to outlive it.
+"""
+import base64
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from azure.storage.blob import UserDelegationKey
+
+from shared import storage
+
+
+def _key() -> UserDelegationKey:
+    key = UserDelegationKey()
+    key.signed_oid = key.signed_tid = "00000000-0000-0000-0000-000000000000"
+    key.signed_start = "2026-01-01T00:00:00Z"
+    key.signed_expiry = "2026-01-02T00:00:00Z"
+    key.signed_service = "b"
+    key.signed_version = "2021-08-06"
+    key.value = base64.b64encode(b"k" * 32).decode()
+    return key
+
+
+@pytest.fixture
+def client():
+    client = MagicMock()
+    client.get_user_delegation_key.side_effect = lambda **kw: _key()
+    with patch.object(storage, "_client", client), \
+            patch.object(storage, "_delegation_key", None), \
+            patch.object(storage, "_delegation_key_expiry", None):
+        yield client
+
+
+def _expiry(url: str) -> datetime:
+    se = parse_qs(urlparse(url).query)["se"][0]
+    return datetime.strptime(se, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+
+
+def test_blob_client_is_a_singleton():
+    with patch.object(storage, "_client", None), \
+            patch.object(storage, "DefaultAzureCredential") as cred, \
+            patch.object(storage, "BlobServiceClient") as bsc:
+        assert storage.get_blob_service_client() is storage.get_blob_service_client()
+    assert cred.call_count == 1
+    assert bsc.call_count == 1
+
+
+def test_many_urls_share_one_delegation_key(client):
+    urls = [storage.generate_download_url("outputs", f"t1/jobs/j1/items/i{n}/out.png") for n in range(100)]
+    storage.generate_write_sas("raw", "t1/jobs/j1/items/i0/raw/a.png")
+    assert client.get_user_delegation_key.call_count == 1
+    assert len(set(urls)) == 100
+    assert "sp=r" in urls[0]
+
+
+def test_longer_sas_refreshes_key_to_cover_it(client):
+    storage.generate_read_sas("outputs", "a.png", expiry_minutes=30)
+    url = storage.generate_read_sas("outputs", "a.png", expiry_minutes=3 * 24 * 60)
+    assert client.get_user_delegation_key.call_count == 2
+    key_expiry = client.get_user_delegation_key.call_args.kwargs["key_expiry_time"]
+    assert key_expiry >= _expiry(url)
+    assert _expiry(url) > datetime.now(timezone.utc) + timedelta(days=2)
+
+
+def test_key_near_expiry_is_refreshed(client):
+    storage.generate_read_sas("outputs", "a.png")
+    storage._delegation_key_expiry = datetime.now(timezone.utc) + timedelta(minutes=2)
+    storage.generate_read_sas("outputs", "a.png")
+    assert client.get_user_delegation_key.call_count == 2
+
+
+def test_sas_is_capped_by_the_seven_day_key_limit(client):
+    url = storage.generate_read_sas("outputs", "a.png", expiry_minutes=30 * 24 * 60)
+    assert _expiry(url) <= datetime.now(timezone.utc) + timedelta(days=7)
@@ -1,7 +1,6 @@
 """Tests for watermark functionality."""
 import io
 import pytest
-from unittest.mock import patch, MagicMock
 from PIL import Image
 
 
@@ -61,87 +60,13 @@ def test_apply_watermark_small_image():
     assert img.size == (50, 50)
 
 
-# ── _should_watermark logic tests ──
-
-
-def _mock_session_with_user(mock_user):
-    """Helper to create a mock SessionLocal context manager returning mock_user."""
-    mock_s = MagicMock()
-    mock_s.query.return_value.filter.return_value.first.return_value = mock_user
-    mock_ctx = MagicMock()
-    mock_ctx.__enter__ = MagicMock(return_value=mock_s)
-    mock_ctx.__exit__ = MagicMock(return_value=False)
-    return mock_ctx
-
-
-def test_should_watermark_no_user_returns_false():
-    """Unknown tenant (e.g. API key user) should not be watermarked."""
-    from pipeline_worker.worker import _should_watermark
-
-    mock_ctx = _mock_session_with_user(None)
-    with patch("pipeline_worker.worker.SessionLocal", return_value=mock_ctx):
-        assert _should_watermark({"tenant_id": "unknown"}) is False
-
-
-def test_should_watermark_user_with_balance_returns_false():
-    """User with positive token balance should not be watermarked."""
-    from pipeline_worker.worker import _should_watermark
-
-    mock_user = MagicMock()
-    mock_user.id = "user-123"
-    mock_user.token_balance = 50
-
-    mock_ctx = _mock_session_with_user(mock_user)
-    with patch("pipeline_worker.worker.SessionLocal", return_value=mock_ctx), \
-         patch("pipeline_worker.worker.get_user_subscription", return_value=None):
-        assert _should_watermark({"tenant_id": "tenant-123"}) is False
-
-
-def test_should_watermark_user_with_subscription_returns_false():
-    """User with active subscription should not be watermarked."""
-    from pipeline_worker.worker import _should_watermark
-
-    mock_user = MagicMock()
-    mock_user.id = "user-123"
-    mock_user.token_balance = 0
-
-    mock_ctx = _mock_session_with_user(mock_user)
-    with patch("pipeline_worker.worker.SessionLocal", return_value=mock_ctx), \
-         patch("pipeline_worker.worker.get_user_subscription", return_value={"status": "active"}):
-        assert _should_watermark({"tenant_id": "tenant-123"}) is False
-
-
-def test_should_watermark_free_tier_user_returns_true():
-    """User with no subscription and zero balance should be watermarked."""
-    from pipeline_worker.worker import _should_watermark
-
-    mock_user = MagicMock()
-    mock_user.id = "user-123"
-    mock_user.token_balance = 0
-
-    mock_ctx = _mock_session_with_user(mock_user)
-    with patch("pipeline_worker.worker.SessionLocal", return_value=mock_ctx), \
-         patch("pipeline_worker.worker.get_user_subscription", return_value=None):
-        assert _should_watermark({"tenant_id": "tenant-123"}) is True
-
-
-def test_should_watermark_pending_subscription_returns_true():
-    """User with pending (not active) subscription should be watermarked."""
-    from pipeline_worker.worker import _should_watermark
-
-    mock_user = MagicMock()
-    mock_user.id = "user-123"
-    mock_user.token_balance = 0
-
-    mock_ctx = _mock_session_with_user(mock_user)
-    with patch("pipeline_worker.worker.SessionLocal", return_value=mock_ctx), \
-         patch("pipeline_worker.worker.get_user_subscription", return_value={"status": "pending"}):
-        assert _should_watermark({"tenant_id": "tenant-123"}) is True
-
-
 def test_should_watermark_exception_returns_false():
-    """If anything fails during the check, don't watermark (safe default)."""
-    from pipeline_worker.worker import _should_watermark
+    """A failing eligibility lookup must not watermark (or fail) the item."""
+    from pipeline_worker.job_context import JobContextCache
+
+    def failing_lookup(job_id, tenant_id):
+        raise RuntimeError("DB connection failed")
 
-    with patch("pipeline_worker.worker.SessionLocal", side_effect=Exception("db error")):
-        assert _should_watermark({"tenant_id": "tenant-123"}) is False
+    ctx = JobContextCache(failing_lookup).get("job1", "t1")
+    assert ctx.watermark is False
+    assert ctx.brand_profile is None
@@ -0,0 +1,174 @@
+"""
+Tests for the shared queue worker runtime: bounded concurrency, prefetch
+sizing and message settlement.
+"""
+import json
+import threading
+from unittest.mock import MagicMock
+
+from shared.worker_runtime import QueueWorker
+
+
+class FakeMessage:
+    def __init__(self, body: str):
+        self.body = body
+
+    def __str__(self):
+        return self.body
+
+
+class FakeReceiver:
+    """Hands out queued messages and records every settlement call."""
+
+    def __init__(self, messages):
+        self.pending = list(messages)
+        self.requested = []
+        self.completed = []
+        self.abandoned = []
+        self.dead_lettered = []
+
+    def receive_messages(self, max_message_count, max_wait_time):
+        self.requested.append(max_message_count)
+        batch = self.pending[:max_message_count]
+        self.pending = self.pending[max_message_count:]
+        return batch
+
+    def complete_message(self, m):
+        self.completed.append(m)
+
+    def abandon_message(self, m):
+        self.abandoned.append(m)
+
+    def dead_letter_message(self, m, reason, error_description):
+        self.dead_lettered.append((m, reason))
+
+
+def _msg(**data):
+    return FakeMessage(json.dumps(data))
+
+
+class PermanentTestError(Exception):
+    pass
+
+
+class TestConcurrency:
+    def test_keeps_n_items_in_flight(self):
+        """Four slow handlers run at the same time on a concurrency-4 worker."""
+        started = threading.Barrier(4, timeout=5)
+
+        def handler(data):
+            started.wait()  # only passes once 4 handlers run concurrently
+
+        receiver = FakeReceiver([_msg(item_id=f"i{n}") for n in range(4)])
+        worker = QueueWorker("jobs", handler, concurrency=4, client=MagicMock())
+        worker.pump(receiver, MagicMock(), max_iterations=20)
+
+        assert len(receiver.completed) == 4
+        assert receiver.requested[0] == 4
+
+    def test_prefetch_sized_to_free_capacity(self):
+        release = threading.Event()
+
+        def handler(data):
+            if data["item_id"] == "slow":
+                release.wait(5)
+
+        receiver = FakeReceiver([_msg(item_id="slow"), _msg(item_id="fast")])
+        worker = QueueWorker("jobs", handler, concurrency=3, client=MagicMock())
+        worker.BUSY_WAIT_SECONDS = 0.01
+        threading.Timer(0.2, release.set).start()
+        worker.pump(receiver, MagicMock(), max_iterations=5)
+
+        # First receive asks for all 3 slots; afterwards the slow item
+        # still holds one slot, so at most 2 are requested.
+        assert receiver.requested[0] == 3
+        assert all(n <= 2 for n in receiver.requested[1:])
+
+    def test_drains_in_flight_before_returning(self):
+        """Messages still running when the pump stops are settled, not dropped."""
+        release = threading.Event()
+        threading.Timer(0.05, release.set).start()
+
+        receiver = FakeReceiver([_msg(item_id="i1")])
+        worker = QueueWorker("jobs", lambda d: release.wait(5), concurrency=2, client=MagicMock())
+        worker.pump(receiver, MagicMock(), max_iterations=1)
+
+        assert len(receiver.completed) == 1
+
+    def test_registers_lock_renewal_per_message(self):
+        renewer = MagicMock()
+        receiver = FakeReceiver([_msg(item_id="a"), _msg(item_id="b")])
+        worker = QueueWorker("jobs", lambda d: None, concurrency=2,
+                             max_lock_renewal_duration=321, client=MagicMock())
+        worker.pump(receiver, renewer, max_iterations=3)
+
+        assert renewer.register.call_count == 2
+        for call in renewer.register.call_args_list:
+            assert call.kwargs["max_lock_renewal_duration"] == 321
+
+
+class TestSettlement:
+    def _run(self, handler, messages, **kwargs):
+        receiver = FakeReceiver(messages)
+        worker = QueueWorker("jobs", handler, concurrency=2, client=MagicMock(), **kwargs)
+        worker.pump(receiver, MagicMock(), max_iterations=5)
+        return receiver
+
+    def test_success_completes(self):
+        receiver = self._run(lambda d: None, [_msg(job_id="j", item_id="i")])
+        assert len(receiver.completed) == 1
+        assert not receiver.abandoned and not receiver.dead_lettered
+
+    def test_permanent_error_dead_letters(self):
+        failures = []
+
+        def handler(data):
+            raise PermanentTestError("bad image")
+
+        receiver = self._run(
+            handler, [_msg(job_id="j", item_id="i")],
+            permanent_errors=(PermanentTestError,),
+            on_failure=lambda data, exc: failures.append((data["item_id"], str(exc))),
+        )
+        assert receiver.dead_lettered[0][1] == "PermanentTestError"
+        assert failures == [("i", "bad image")]
+
+    def test_other_error_abandons_for_retry(self):
+        failures = []
+
+        def handler(data):
+            raise RuntimeError("timeout")
+
+        receiver = self._run(
+            handler, [_msg(job_id="j", item_id="i")],
+            permanent_errors=(PermanentTestError,),
+            on_failure=lambda data, exc: failures.append(data["item_id"]),
+        )
+        assert len(receiver.abandoned) == 1
+        assert not receiver.dead_lettered
+        assert failures == ["i"]
+
+    def test_invalid_json_dead_lettered_without_dispatch(self):
+        handler = MagicMock()
+        receiver = self._run(handler, [FakeMessage("{not json")])
+        assert receiver.dead_lettered[0][1] == "InvalidJSON"
+        handler.assert_not_called()
+
+    def test_failing_on_failure_hook_still_settles(self):
+        def on_failure(data, exc):
+            raise RuntimeError("db down")
+
+        def handler(data):
+            raise RuntimeError("boom")
+
+        receiver = self._run(handler, [_msg(item_id="i")], on_failure=on_failure)
+        assert len(receiver.abandoned) == 1
+
+    def test_custom_decoder(self):
+        seen = []
+        receiver = self._run(
+            seen.append, [FakeMessage("job_123")],
+            decode=lambda m: {"job_id": str(m)},
+        )
+        assert seen == [{"job_id": "job_123"}]
+        assert len(receiver.completed) == 1